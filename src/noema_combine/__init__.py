@@ -1,3 +1,7 @@
 # Licensed under a MIT style license - see LICENSE
-from .data_handler import line_prepare_merge, line_reduce_30m  # type: ignore[reportUnusedImport]
+from .data_handler import (  # type: ignore[reportUnusedImport]
+    line_prepare_merge,
+    line_reduce_30m,
+    line_reduce_30m_batch,
+)
 from .generate_uvt import process_source  # type: ignore[reportUnusedImport]
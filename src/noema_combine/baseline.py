@@ -0,0 +1,292 @@
+import numpy as np
+from numpy.typing import NDArray
+
+# Velocity axis of a CLASS spectrum (channels are 1-based):
+#   v(i) = voff + (i - rchan) * vres
+# Spectra with the same (nchan, rchan, vres, voff) share their velocity axis,
+# and are reduced together as a 2-D block (n_spectra, nchan).
+
+
+def change_rest_frequency(
+    restf: float, rchan: float, fres: float, restf_new: float
+) -> float:
+    """
+    Function to compute the reference channel after changing the rest frequency,
+    as CLASS 'modify frequency' does: the frequency axis is unchanged and the
+    new rest frequency is at the velocity offset of the spectrum.
+
+    returns:
+    --------
+    rchan_new: float
+        Reference channel of the new rest frequency.
+    """
+    return rchan + (restf_new - restf) / fres
+
+
+def velocity_axis(
+    nchan: int, rchan: float, vres: float, voff: float
+) -> NDArray[np.float64]:
+    """
+    Function to compute the velocity (km/s) of each channel of a spectrum.
+    """
+    return voff + (np.arange(1, nchan + 1) - rchan) * vres
+
+
+def extract_channels(
+    nchan: int, rchan: float, vres: float, voff: float, v_min: float, v_max: float
+) -> tuple[int, int]:
+    """
+    Function to find the channels within a velocity range, as CLASS
+    'extract v_min v_max velocity' does.
+
+    returns:
+    --------
+    first: int
+        First channel to keep (0-based).
+    last: int
+        Last channel to keep (0-based, exclusive).
+    """
+    c_1 = rchan + (v_min - voff) / vres
+    c_2 = rchan + (v_max - voff) / vres
+    first = max(int(np.rint(min(c_1, c_2))), 1)
+    last = min(int(np.rint(max(c_1, c_2))), nchan)
+    if last < first:
+        raise ValueError(f"Velocity range {v_min} {v_max} is outside the spectrum")
+    return first - 1, last
+
+
+def window_mask(
+    velocity: NDArray[np.float64], windows: list[tuple[float, float]]
+) -> NDArray[np.bool_]:
+    """
+    Function to select the channels used to fit the baseline, i.e., the channels
+    outside all the line windows (as CLASS 'set window').
+    """
+    mask = np.ones(len(velocity), dtype=bool)
+    for v_1, v_2 in windows:
+        mask &= ~((velocity >= min(v_1, v_2)) & (velocity <= max(v_1, v_2)))
+    return mask
+
+
+def fit_baseline(
+    spectra: NDArray[np.floating],
+    velocity: NDArray[np.float64],
+    windows: list[tuple[float, float]],
+    order: int = 1,
+    bad: float | None = None,
+) -> tuple[NDArray[np.float32], NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Function to fit and subtract a polynomial baseline from a block of spectra
+    sharing the same velocity axis, as CLASS 'base order' does for one spectrum.
+    All the fits are solved at once: if no channel is blanked, with one
+    least-squares solve for the whole block, otherwise with the normal equations
+    of each spectrum, solved as a batch.
+
+    parameters:
+    -----------
+    spectra: NDArray
+        Block of spectra, with shape (n_spectra, nchan).
+    velocity: NDArray[np.float64]
+        Velocity of each channel (km/s).
+    windows: list[tuple[float, float]]
+        Velocity ranges of the line emission, excluded from the fit.
+    order: int
+        Order of the polynomial baseline.
+    bad: float | None
+        Value of the blanked channels (CLASS 'bad' header value). Blanked channels
+        (and NaN) are not used in the fit, and are kept blanked in the output.
+    returns:
+    --------
+    reduced: NDArray[np.float32]
+        Spectra after subtracting the baseline.
+    coefficients: NDArray[np.float64]
+        Polynomial coefficients of each baseline, with shape (n_spectra, order + 1),
+        for the velocity scaled to [-1, 1] over the spectrum.
+    rms: NDArray[np.float64]
+        Noise of each spectrum, from the residuals in the baseline channels
+        (NaN if there are not enough channels to fit).
+    """
+    spectra = np.atleast_2d(spectra)
+    n_spectra, nchan = spectra.shape
+    # scaled velocity, to keep the design matrix well conditioned
+    v_mid = 0.5 * (velocity[0] + velocity[-1])
+    v_half = 0.5 * abs(velocity[-1] - velocity[0]) or 1.0
+    design = np.vander((velocity - v_mid) / v_half, order + 1, increasing=True)
+    fit_channels = window_mask(velocity, windows)
+    values = spectra.astype(np.float64)
+    blanked = ~np.isfinite(values)
+    if bad is not None:
+        blanked |= values == bad
+    coefficients = np.full((n_spectra, order + 1), np.nan)
+    rms = np.full(n_spectra, np.nan)
+    if not np.any(blanked[:, fit_channels]):
+        n_fit = int(np.sum(fit_channels))
+        if n_fit > order:
+            solution, _, _, _ = np.linalg.lstsq(
+                design[fit_channels], values[:, fit_channels].T, rcond=None
+            )
+            coefficients = solution.T
+    else:
+        weight = (~blanked & fit_channels).astype(np.float64)
+        values_fit = np.where(weight > 0, values, 0.0)
+        normal = np.einsum("sc,ci,cj->sij", weight, design, design)
+        rhs = np.einsum("sc,ci->si", values_fit, design)
+        n_fit = np.sum(weight, axis=1)
+        ok = n_fit > order
+        if np.any(ok):
+            coefficients[ok] = np.linalg.solve(normal[ok], rhs[ok, :, None])[..., 0]
+    baselines = coefficients @ design.T
+    reduced = values - baselines
+    residuals = np.where(~blanked & fit_channels, reduced, np.nan)
+    valid = np.all(np.isfinite(coefficients), axis=1)
+    if np.any(valid):
+        rms[valid] = np.sqrt(np.nanmean(residuals[valid] ** 2, axis=1))
+    reduced = np.where(blanked, values, reduced)
+    # spectra without a valid fit are kept unchanged
+    reduced[~valid] = values[~valid]
+    return reduced.astype(np.float32), coefficients, rms
+
+
+def reduce_block(
+    spectra: NDArray[np.floating],
+    nchan: int,
+    rchan: float,
+    vres: float,
+    voff: float,
+    v_extract: tuple[float, float],
+    windows: list[tuple[float, float]],
+    order: int = 1,
+    bad: float | None = None,
+) -> tuple[NDArray[np.float32], float, NDArray[np.float64]]:
+    """
+    Function to cut a block of spectra sharing the same velocity axis to a
+    velocity range and subtract their baselines, as the CLASS commands
+    'extract v_min v_max velocity', 'set window ...' and 'base order' do.
+
+    parameters:
+    -----------
+    spectra: NDArray
+        Block of spectra, with shape (n_spectra, nchan).
+    nchan, rchan, vres, voff:
+        Velocity axis of the spectra.
+    v_extract: tuple[float, float]
+        Velocity range to keep (km/s).
+    windows: list[tuple[float, float]]
+        Velocity ranges of the line emission, excluded from the baseline fit.
+    order: int
+        Order of the polynomial baseline.
+    bad: float | None
+        Value of the blanked channels.
+    returns:
+    --------
+    reduced: NDArray[np.float32]
+        Cut spectra after subtracting the baselines.
+    rchan_new: float
+        Reference channel of the cut spectra.
+    rms: NDArray[np.float64]
+        Noise of each spectrum.
+    """
+    first, last = extract_channels(nchan, rchan, vres, voff, *v_extract)
+    rchan_new = rchan - first
+    velocity = velocity_axis(last - first, rchan_new, vres, voff)
+    block = np.atleast_2d(spectra)[:, first:last]
+    reduced, _, rms = fit_baseline(block, velocity, windows, order=order, bad=bad)
+    return reduced, rchan_new, rms
+
+
+def resample_band(
+    axis_in: tuple[int, float, float, float],
+    axis_out: tuple[int, float, float, float],
+) -> tuple[NDArray[np.int64], NDArray[np.float64]]:
+    """
+    Function to compute the weights resampling spectra from one velocity axis onto
+    another, as CLASS 'resample' does: each output channel is the average of the
+    input channels weighted by the overlap of their velocity ranges.
+    Only the overlapping channels are kept, as a band of input channels for each
+    output channel, so the size is nchan_out times the number of input channels
+    per output channel, instead of nchan_out * nchan_in.
+
+    parameters:
+    -----------
+    axis_in: tuple[int, float, float, float]
+        (nchan, rchan, vres, voff) of the input spectra.
+    axis_out: tuple[int, float, float, float]
+        (nchan, rchan, vres, voff) of the output spectra.
+    returns:
+    --------
+    first: NDArray[np.int64]
+        First input channel (0-based) of the band of each output channel.
+    band: NDArray[np.float64]
+        Overlap fraction of the input channels first + k (columns k) with each
+        output channel (rows), with shape (nchan_out, width). Rows of output
+        channels fully covered by the input spectra add up to 1.
+    """
+    nchan_in, rchan_in, vres_in, voff_in = axis_in
+    v_out = velocity_axis(*axis_out)
+    half_out = 0.5 * abs(axis_out[2])
+    # edges of the output channels in (0-based) input channels
+    edges = (
+        rchan_in
+        - 1.0
+        + (np.stack([v_out - half_out, v_out + half_out]) - voff_in) / vres_in
+    )
+    low = np.floor(np.min(edges, axis=0) + 0.5).astype(np.int64)
+    high = np.floor(np.max(edges, axis=0) + 0.5).astype(np.int64)
+    low = np.clip(low, 0, nchan_in - 1)
+    high = np.clip(high, -1, nchan_in - 1)
+    width = max(1, int(np.max(high - low + 1, initial=1)))
+    channels = low[:, None] + np.arange(width)[None, :]
+    inside = channels <= high[:, None]
+    channels = np.minimum(channels, nchan_in - 1)
+    v_in = voff_in + (channels + 1 - rchan_in) * vres_in
+    half_in = 0.5 * abs(vres_in)
+    overlap = np.minimum(v_out[:, None] + half_out, v_in + half_in) - np.maximum(
+        v_out[:, None] - half_out, v_in - half_in
+    )
+    band = np.where(inside, np.clip(overlap, 0.0, None) / (2.0 * half_out), 0.0)
+    return low, band
+
+
+def resample_spectra(
+    spectra: NDArray[np.floating],
+    axis_in: tuple[int, float, float, float],
+    axis_out: tuple[int, float, float, float],
+    valid: NDArray[np.bool_] | None = None,
+) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Function to resample a block of spectra sharing the same velocity axis onto
+    another axis (see resample_band), one band offset at a time for the whole
+    block.
+
+    parameters:
+    -----------
+    spectra: NDArray
+        Block of spectra, with shape (n_spectra, nchan_in).
+    axis_in, axis_out: tuple[int, float, float, float]
+        (nchan, rchan, vres, voff) of the input and output spectra.
+    valid: NDArray[np.bool_] | None
+        Channels used in the average (e.g., not blanked). If None, all of them.
+    returns:
+    --------
+    resampled: NDArray[np.float64]
+        Resampled spectra, with shape (n_spectra, nchan_out), NaN where no valid
+        input channel overlaps.
+    coverage: NDArray[np.float64]
+        Fraction of each output channel covered by valid input channels.
+    """
+    spectra = np.atleast_2d(spectra).astype(np.float64)
+    if valid is None:
+        valid = np.isfinite(spectra)
+    values = np.where(valid, spectra, 0.0)
+    weights = valid.astype(np.float64)
+    first, band = resample_band(axis_in, axis_out)
+    total = np.zeros((len(spectra), len(first)))
+    coverage = np.zeros((len(spectra), len(first)))
+    for k in range(band.shape[1]):
+        # channels past the end of the input have a zero weight in the band
+        channels = np.minimum(first + k, spectra.shape[1] - 1)
+        total += values[:, channels] * band[:, k]
+        coverage += weights[:, channels] * band[:, k]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        resampled = np.where(coverage > 0, total / coverage, np.nan)
+    return resampled, coverage
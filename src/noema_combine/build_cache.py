@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+
+fingerprint_ext = ".fingerprint"
+
+
+def file_signature(file_name: str, content_hash: bool = False) -> list[object]:
+    """
+    Function to describe the state of an input file.
+    By default the size and modification time are used; if content_hash is True,
+    the SHA-256 of the file content is used instead.
+    A missing file is described by its name only, so that its creation makes the
+    products depending on it stale.
+    """
+    if not os.path.exists(file_name):
+        return [file_name, None]
+    if content_hash:
+        sha = hashlib.sha256()
+        with open(file_name, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                sha.update(block)
+        return [file_name, sha.hexdigest()]
+    stat = os.stat(file_name)
+    return [file_name, stat.st_size, stat.st_mtime]
+
+
+def fingerprint(
+    script: str,
+    inputs: list[str],
+    catalogue_rows: list[str],
+    content_hash: bool = False,
+) -> str:
+    """
+    Function to compute the fingerprint of a GILDAS product.
+
+    parameters:
+    -----------
+    script: str
+        Text of the script that produces the product.
+    inputs: list[str]
+        Files read by the script.
+    catalogue_rows: list[str]
+        Catalogue entries (line and source) used to produce the product.
+    content_hash: bool
+        If True, hash the content of the input files instead of using
+        their size and modification time.
+    returns:
+    --------
+    fingerprint: str
+        SHA-256 hex digest.
+    """
+    description = {
+        "script": script,
+        "inputs": [file_signature(name, content_hash) for name in inputs],
+        "catalogue": catalogue_rows,
+    }
+    text = json.dumps(description, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def fingerprint_file(product: str) -> str:
+    """
+    Function to generate the name of the file storing the fingerprint of a product.
+    """
+    return f"{product}{fingerprint_ext}"
+
+
+def is_up_to_date(product: str, fingerprint_product: str) -> bool:
+    """
+    Function to check if a product exists and was built with the same fingerprint.
+    """
+    file_fp = fingerprint_file(product)
+    if not (os.path.exists(product) and os.path.isfile(file_fp)):
+        return False
+    with open(file_fp, "r") as fh:
+        return fh.read().strip() == fingerprint_product
+
+
+def save_fingerprint(product: str, fingerprint_product: str) -> None:
+    """
+    Function to store the fingerprint next to a product.
+    """
+    with open(fingerprint_file(product), "w") as fh:
+        fh.write(f"{fingerprint_product}\n")
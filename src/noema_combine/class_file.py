@@ -0,0 +1,834 @@
+import os
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from typing import Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+
+# Native access to CLASS single files (Type 2 format, written by CLASS since 2013).
+#
+# The file is a sequence of records of `reclen` 4-byte words; addresses are 1-based
+# (record, word) pairs. The first record holds the file descriptor, followed by the
+# entry index, split in extensions of `lex1` entries of `lind` words each. Each
+# observation starts with an entry descriptor, which gives the address of its
+# sections (general, position, spectroscopic, ...) and of its data, relative to
+# the start of the observation.
+#
+# Only the sections needed to locate and describe spectra are decoded.
+
+word_size = 4
+
+# file codes: Type 2, little-endian (A) or big-endian (B) IEEE
+file_codes: dict[bytes, str] = {b"2A  ": "<", b"2B  ": ">"}
+entry_code = b"2   "
+
+# section codes
+section_general = -2
+section_position = -3
+section_spectro = -4
+
+# growth rule of the index extensions: constant size (10) or doubling (20)
+gex_constant = 10
+gex_double = 20
+
+# number of records read at once by ClassFile._gather
+gather_batch = 65536
+
+# observation kinds
+kind_spectrum = 0
+kind_continuum = 1
+
+
+def _dtype(
+    fields: list[tuple[str, str, int]], itemsize: int, byteorder: str
+) -> np.dtype:
+    return np.dtype(
+        {
+            "names": [name for name, _, _ in fields],
+            "formats": [np.dtype(fmt).newbyteorder(byteorder) for _, fmt, _ in fields],
+            "offsets": [offset for _, _, offset in fields],
+            "itemsize": itemsize,
+        }
+    )
+
+
+# (name, format, byte offset)
+file_desc_fields: list[tuple[str, str, int]] = [
+    ("code", "S4", 0),
+    ("reclen", "i4", 4),
+    ("kind", "i4", 8),
+    ("vind", "i4", 12),
+    ("lind", "i4", 16),
+    ("flags", "i4", 20),
+    ("xnext", "i8", 24),
+    ("nextrec", "i8", 32),
+    ("nextword", "i4", 40),
+    ("lex1", "i4", 44),
+    ("nex", "i4", 48),
+    ("gex", "i4", 52),
+]
+file_desc_size = 56  # followed by nex int64 extension addresses (records)
+
+index_fields: list[tuple[str, str, int]] = [
+    ("bloc", "i8", 0),
+    ("word", "i4", 8),
+    ("num", "i8", 12),
+    ("ver", "i4", 20),
+    ("source", "S12", 24),
+    ("line", "S12", 36),
+    ("telescope", "S12", 48),
+    ("dobs", "i4", 60),
+    ("dred", "i4", 64),
+    ("off1", "f4", 68),
+    ("off2", "f4", 72),
+    ("typec", "i4", 76),
+    ("kind", "i4", 80),
+    ("qual", "i4", 84),
+    ("posa", "f4", 88),
+    ("scan", "i8", 92),
+    ("subscan", "i4", 100),
+]
+index_lind = 64  # words per index entry
+
+entry_desc_fields: list[tuple[str, str, int]] = [
+    ("code", "S4", 0),
+    ("version", "i4", 4),
+    ("nsec", "i4", 8),
+    ("nword", "i8", 12),
+    ("adata", "i8", 20),
+    ("ldata", "i8", 28),
+    ("xnum", "i8", 36),
+]
+entry_desc_size = 44  # followed by nsec int32 codes, int64 lengths, int64 addresses
+
+general_fields: list[tuple[str, str, int]] = [
+    ("ut", "f8", 0),
+    ("st", "f8", 8),
+    ("az", "f4", 16),
+    ("el", "f4", 20),
+    ("tau", "f4", 24),
+    ("tsys", "f4", 28),
+    ("time", "f4", 32),
+    ("parang", "f8", 36),
+    ("xunit", "i4", 44),
+]
+position_fields: list[tuple[str, str, int]] = [
+    ("sourc", "S12", 0),
+    ("system", "i4", 12),
+    ("equinox", "f4", 16),
+    ("proj", "i4", 20),
+    ("lam", "f8", 24),
+    ("bet", "f8", 32),
+    ("projang", "f8", 40),
+    ("lamof", "f4", 48),
+    ("betof", "f4", 52),
+]
+spectro_fields: list[tuple[str, str, int]] = [
+    ("line", "S12", 0),
+    ("restf", "f8", 12),
+    ("nchan", "i4", 20),
+    ("rchan", "f8", 24),
+    ("fres", "f8", 32),
+    ("vres", "f8", 40),
+    ("voff", "f8", 48),
+    ("bad", "f4", 56),
+    ("image", "f8", 60),
+    ("vtype", "i4", 68),
+    ("vconv", "i4", 72),
+    ("doppler", "f8", 76),
+]
+section_fields: dict[int, list[tuple[str, str, int]]] = {
+    section_general: general_fields,
+    section_position: position_fields,
+    section_spectro: spectro_fields,
+}
+
+
+def _section_size(fields: list[tuple[str, str, int]]) -> int:
+    _, fmt, offset = fields[-1]
+    return offset + np.dtype(fmt).itemsize
+
+
+@dataclass
+class ClassObservation:
+    """
+    Header and spectrum of a CLASS observation.
+    Frequencies are in MHz, offsets and coordinates in radians, velocities in km/s.
+    The frequency of channel i (1-based) is restf + (i - rchan) * fres.
+    """
+
+    source: str
+    line: str
+    telescope: str
+    scan: int
+    restf: float
+    fres: float
+    data: NDArray[np.float32]
+    rchan: float = 1.0
+    vres: float = 0.0
+    voff: float = 0.0
+    subscan: int = 1
+    num: int = 0
+    off1: float = 0.0
+    off2: float = 0.0
+    lam: float = 0.0
+    bet: float = 0.0
+    dobs: int = 0
+    qual: int = 0
+    bad: float = -1000.0
+    image: float = 0.0
+    ut: float = 0.0
+    az: float = 0.0
+    el: float = 0.0
+    tau: float = 0.0
+    tsys: float = 0.0
+    time: float = 0.0
+    kind: int = kind_spectrum
+
+    @property
+    def nchan(self) -> int:
+        return len(self.data)
+
+    def frequency(self) -> NDArray[np.float64]:
+        """
+        Rest frequency of each channel in MHz.
+        """
+        return self.restf + (np.arange(1, self.nchan + 1) - self.rchan) * self.fres
+
+
+# headers (see ClassFile.headers) of the ClassObservation fields
+observation_headers: tuple[str, ...] = (
+    "source",
+    "line",
+    "telescope",
+    "scan",
+    "subscan",
+    "num",
+    "restf",
+    "fres",
+    "rchan",
+    "vres",
+    "voff",
+    "off1",
+    "off2",
+    "lam",
+    "bet",
+    "dobs",
+    "qual",
+    "bad",
+    "image",
+    "ut",
+    "az",
+    "el",
+    "tau",
+    "tsys",
+    "time",
+    "kind",
+)
+
+
+class ClassFile:
+    """
+    Memory-mapped reader of a CLASS single file (Type 2).
+
+    The entry index is read when the file is opened, so that the observations
+    can be listed and selected without reading their spectra. Spectra are
+    returned as read-only NumPy views of the file.
+
+    parameters:
+    -----------
+    file_name: str
+        CLASS file, e.g., "raw_data/B5_Setup1.30m".
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        if os.path.getsize(file_name) < file_desc_size:
+            raise ValueError(f"File too short for a CLASS file: {file_name}")
+        self._map = np.memmap(file_name, dtype=np.uint8, mode="r")
+        code = bytes(self._map[:4])
+        if code not in file_codes:
+            raise ValueError(
+                f"Unsupported CLASS file format (code {code!r}): {file_name}"
+            )
+        self.byteorder = file_codes[code]
+        desc = self._read(file_desc_fields, file_desc_size, 0)
+        self.reclen = int(desc["reclen"])
+        self.lind = int(desc["lind"])
+        self.lex1 = int(desc["lex1"])
+        self.gex = int(desc["gex"])
+        self.n_obs = int(desc["xnext"]) - 1
+        nex = int(desc["nex"])
+        aex = np.frombuffer(
+            self._map,
+            dtype=np.dtype("i8").newbyteorder(self.byteorder),
+            count=nex,
+            offset=file_desc_size,
+        )
+        self.index = self._read_index(aex)
+        self._headers: dict[str, NDArray] | None = None
+        self._entry_table: dict[str, NDArray[np.int64]] | None = None
+
+    def __enter__(self) -> "ClassFile":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.n_obs
+
+    def close(self) -> None:
+        """
+        Release the memory map. Spectra views returned before must not be used.
+        """
+        mmap = getattr(self._map, "_mmap", None)
+        self._map = np.empty(0, dtype=np.uint8)
+        if mmap is not None:
+            try:
+                mmap.close()
+            except BufferError:
+                # views are still referenced, the map is closed when they are freed
+                pass
+
+    def _read(
+        self, fields: list[tuple[str, str, int]], size: int, offset: int
+    ) -> np.void:
+        dtype = _dtype(fields, size, self.byteorder)
+        if offset + size > len(self._map):
+            raise ValueError(f"Truncated CLASS file: {self.file_name}")
+        return np.frombuffer(self._map, dtype=dtype, count=1, offset=offset)[0]
+
+    def _address(self, bloc: int, word: int) -> int:
+        return ((bloc - 1) * self.reclen + (word - 1)) * word_size
+
+    def _read_index(self, aex: NDArray[np.int64]) -> NDArray:
+        dtype = _dtype(index_fields, self.lind * word_size, self.byteorder)
+        parts = []
+        remaining = self.n_obs
+        for i, record in enumerate(aex):
+            if remaining <= 0:
+                break
+            size = self.lex1 if self.gex != gex_double else self.lex1 * 2**i
+            count = min(size, remaining)
+            offset = self._address(int(record), 1)
+            if offset + count * dtype.itemsize > len(self._map):
+                raise ValueError(f"Truncated CLASS index: {self.file_name}")
+            parts.append(
+                np.frombuffer(self._map, dtype=dtype, count=count, offset=offset)
+            )
+            remaining -= count
+        if remaining > 0:
+            raise ValueError(f"Incomplete CLASS index: {self.file_name}")
+        if len(parts) == 1:
+            return parts[0]
+        if len(parts) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.concatenate(parts)
+
+    def _gather(self, offsets: NDArray[np.int64], dtype: np.dtype) -> NDArray:
+        """
+        Read one record of a structured dtype at each byte offset, with indexed
+        reads of the memory map.
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if len(offsets) == 0:
+            return np.zeros(0, dtype=dtype)
+        if np.min(offsets) < 0 or np.max(offsets) + dtype.itemsize > len(self._map):
+            raise ValueError(f"Truncated CLASS file: {self.file_name}")
+        values = np.empty(len(offsets), dtype=dtype)
+        raw = values.view(np.uint8).reshape(len(offsets), dtype.itemsize)
+        columns = np.arange(dtype.itemsize)[None, :]
+        # in batches, to bound the memory of the byte indices
+        for first in range(0, len(offsets), gather_batch):
+            batch = offsets[first : first + gather_batch]
+            raw[first : first + len(batch)] = self._map[batch[:, None] + columns]
+        return values
+
+    def _entries(self) -> dict[str, NDArray[np.int64]]:
+        """
+        Start and data address (bytes) of each observation, and the address of
+        each of its decoded sections (-1 if absent). The entry descriptors and the
+        section tables of all the observations are read at once, grouped by their
+        number of sections.
+        """
+        if self._entry_table is not None:
+            return self._entry_table
+        index = self.index
+        start = (
+            (index["bloc"].astype(np.int64) - 1) * self.reclen
+            + index["word"].astype(np.int64)
+            - 1
+        ) * word_size
+        desc = self._gather(
+            start, _dtype(entry_desc_fields, entry_desc_size, self.byteorder)
+        )
+        invalid = np.flatnonzero(desc["code"] != entry_code)
+        if len(invalid) > 0:
+            raise ValueError(
+                f"Invalid entry descriptor for observation {invalid[0]}: "
+                f"{self.file_name}"
+            )
+        entries = {
+            "start": start,
+            "adata": start + (desc["adata"].astype(np.int64) - 1) * word_size,
+        }
+        addresses = {
+            code: np.full(self.n_obs, -1, dtype=np.int64) for code in section_fields
+        }
+        nsec = desc["nsec"].astype(np.int64)
+        for n in np.unique(nsec):
+            members = np.flatnonzero(nsec == n)
+            n = int(n)
+            # nsec codes (int32), then nsec lengths and nsec addresses (int64)
+            table = self._gather(
+                start[members] + entry_desc_size,
+                np.dtype(
+                    [
+                        ("codes", np.dtype("i4").newbyteorder(self.byteorder), (n,)),
+                        ("lengths", np.dtype("i8").newbyteorder(self.byteorder), (n,)),
+                        (
+                            "addresses",
+                            np.dtype("i8").newbyteorder(self.byteorder),
+                            (n,),
+                        ),
+                    ]
+                ),
+            )
+            codes = table["codes"].reshape(len(members), n)
+            words = table["addresses"].reshape(len(members), n).astype(np.int64)
+            for code, address in addresses.items():
+                found = codes == code
+                has = np.any(found, axis=1)
+                column = np.argmax(found, axis=1)
+                address[members[has]] = (
+                    start[members[has]] + (words[has, column[has]] - 1) * word_size
+                )
+        for code, address in addresses.items():
+            entries[f"section{code}"] = address
+        self._entry_table = entries
+        return entries
+
+    def _read_sections(self, code: int) -> tuple[NDArray[np.bool_], NDArray]:
+        """
+        Decode a section of all the observations that have it.
+
+        returns:
+        --------
+        has: NDArray[np.bool_]
+            Observations with the section.
+        values: NDArray
+            Decoded section of these observations.
+        """
+        address = self._entries()[f"section{code}"]
+        has = address >= 0
+        fields = section_fields[code]
+        dtype = _dtype(fields, _section_size(fields), self.byteorder)
+        return has, self._gather(address[has], dtype)
+
+    def section(self, i: int, code: int) -> np.void | None:
+        """
+        Decode a section (general, position or spectroscopic) of observation i.
+        Returns None if the observation does not have the section.
+        """
+        address = int(self._entries()[f"section{code}"][i])
+        if address < 0:
+            return None
+        fields = section_fields[code]
+        return self._read(fields, _section_size(fields), address)
+
+    def headers(self) -> dict[str, NDArray]:
+        """
+        Headers of all the observations, without reading the spectra.
+        The index gives num, scan, subscan, source, line, telescope, off1, off2,
+        kind, qual and dobs; the spectroscopic section gives restf, nchan, rchan,
+        fres, vres and voff (NaN or 0 for observations without it), bad and image;
+        the position section gives lam and bet; the general section gives ut, az,
+        el, tau, tsys and time. Missing values of these last sections have the
+        defaults of ClassObservation.
+        Each section is decoded for all the observations at once.
+        """
+        if self._headers is not None:
+            return self._headers
+        index = self.index
+        headers: dict[str, NDArray] = {
+            "num": index["num"].astype(np.int64),
+            "scan": index["scan"].astype(np.int64),
+            "subscan": index["subscan"].astype(np.int32),
+            "source": np.char.strip(np.char.decode(index["source"], "latin-1")),
+            "line": np.char.strip(np.char.decode(index["line"], "latin-1")),
+            "telescope": np.char.strip(np.char.decode(index["telescope"], "latin-1")),
+            "off1": index["off1"].astype(np.float32),
+            "off2": index["off2"].astype(np.float32),
+            "kind": index["kind"].astype(np.int32),
+            "qual": index["qual"].astype(np.int32),
+            "dobs": index["dobs"].astype(np.int32),
+        }
+        defaults = {
+            section_spectro: {
+                "restf": np.nan,
+                "rchan": np.nan,
+                "fres": np.nan,
+                "vres": np.nan,
+                "voff": np.nan,
+                "nchan": 0,
+                "bad": ClassObservation.bad,
+                "image": ClassObservation.image,
+            },
+            section_position: {"lam": 0.0, "bet": 0.0},
+            section_general: {
+                name: 0.0 for name in ("ut", "az", "el", "tau", "tsys", "time")
+            },
+        }
+        for code, fields in defaults.items():
+            has, values = self._read_sections(code)
+            for name, default in fields.items():
+                dtype = np.int64 if name == "nchan" else np.float64
+                column = np.full(self.n_obs, default, dtype=dtype)
+                column[has] = values[name]
+                headers[name] = column
+        headers["_adata"] = self._entries()["adata"]
+        self._headers = headers
+        return headers
+
+    def frequency_range(self) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+        """
+        Minimum and maximum rest frequency (MHz) covered by each observation.
+        """
+        headers = self.headers()
+        f_first = headers["restf"] + (1 - headers["rchan"]) * headers["fres"]
+        f_last = (
+            headers["restf"] + (headers["nchan"] - headers["rchan"]) * headers["fres"]
+        )
+        return np.minimum(f_first, f_last), np.maximum(f_first, f_last)
+
+    def find(
+        self,
+        source: str | None = None,
+        line: str | None = None,
+        telescope: str | None = None,
+        frequency: float | None = None,
+    ) -> NDArray[np.int64]:
+        """
+        Select observations, as CLASS 'set source/line/telescope' and
+        'find /frequency' do.
+
+        parameters:
+        -----------
+        source: str | None
+            Source name(s) with wildcards, e.g., "B5*" or "B5-Box1 B5-Box2".
+        line: str | None
+            Line name(s) with wildcards.
+        telescope: str | None
+            Telescope name(s) with wildcards, e.g., "30ME0HLI-*".
+        frequency: float | None
+            Rest frequency in MHz that must be covered by the observation.
+        returns:
+        --------
+        indices: NDArray[np.int64]
+            Indices of the selected observations.
+        """
+        headers = self.headers()
+        selected = np.ones(self.n_obs, dtype=bool)
+        for key, patterns in (
+            ("source", source),
+            ("line", line),
+            ("telescope", telescope),
+        ):
+            if patterns is None:
+                continue
+            selected &= _match(headers[key], patterns)
+        if frequency is not None:
+            f_min, f_max = self.frequency_range()
+            selected &= (f_min <= frequency) & (frequency <= f_max)
+        return np.flatnonzero(selected)
+
+    def spectrum(self, i: int) -> NDArray[np.float32]:
+        """
+        Spectrum of observation i, as a read-only view of the file.
+        """
+        headers = self.headers()
+        if headers["kind"][i] != kind_spectrum:
+            raise ValueError(f"Observation {i} is not a spectrum: {self.file_name}")
+        count = int(headers["nchan"][i])
+        offset = int(headers["_adata"][i])
+        if offset + count * word_size > len(self._map):
+            raise ValueError(f"Truncated CLASS observation {i}: {self.file_name}")
+        return np.frombuffer(
+            self._map,
+            dtype=np.dtype("f4").newbyteorder(self.byteorder),
+            count=count,
+            offset=offset,
+        )
+
+    def spectra(
+        self,
+        indices: NDArray[np.int64] | list[int] | None = None,
+        batch_size: int = 1024,
+    ):
+        """
+        Iterate over the spectra of a list of observations in batches.
+        Each batch is (indices, spectra), with the spectra as read-only views of
+        the file. If indices is None, all the observations are used.
+        """
+        if indices is None:
+            indices = np.arange(self.n_obs)
+        indices = np.asarray(indices, dtype=np.int64)
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start : start + batch_size]
+            yield batch, [self.spectrum(int(i)) for i in batch]
+
+    def spectra_block(
+        self, indices: NDArray[np.int64] | list[int] | None = None
+    ) -> NDArray[np.float32]:
+        """
+        Spectra of a list of observations with the same number of channels, as a
+        2-D array (n_obs, nchan). If the observations are evenly spaced in the file
+        (e.g., consecutive observations written by write_class_file), the array is
+        a read-only view of the file, otherwise the spectra are copied.
+        """
+        headers = self.headers()
+        if indices is None:
+            indices = np.arange(self.n_obs)
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        nchan = headers["nchan"][indices]
+        if np.any(nchan != nchan[0]) or np.any(
+            headers["kind"][indices] != kind_spectrum
+        ):
+            raise ValueError(
+                f"Observations have different number of channels: {self.file_name}"
+            )
+        offsets = headers["_adata"][indices]
+        steps = np.diff(offsets)
+        if len(indices) > 1 and (steps[0] <= 0 or np.any(steps != steps[0])):
+            return np.stack([self.spectrum(int(i)) for i in indices])
+        first = self.spectrum(int(indices[0]))
+        if len(indices) == 1:
+            return first[None, :]
+        end = int(offsets[-1]) + int(nchan[0]) * word_size
+        if end > len(self._map):
+            raise ValueError(f"Truncated CLASS file: {self.file_name}")
+        return np.lib.stride_tricks.as_strided(
+            first,
+            shape=(len(indices), int(nchan[0])),
+            strides=(int(steps[0]), word_size),
+            writeable=False,
+        )
+
+    def observation(self, i: int) -> ClassObservation:
+        """
+        Header and spectrum (view of the file) of observation i.
+        """
+        headers = self.headers()
+        values = {name: headers[name][i].item() for name in observation_headers}
+        return ClassObservation(**values, data=self.spectrum(i))
+
+
+def spectrum_weights(headers: dict[str, NDArray]) -> NDArray[np.float64]:
+    """
+    Function to compute the weight of each observation, time * |fres| / Tsys^2,
+    as CLASS 'table' does (1 if Tsys or the integration time is unknown).
+
+    parameters:
+    -----------
+    headers: dict[str, NDArray]
+        Headers of the observations (see ClassFile.headers).
+    """
+    tsys = headers["tsys"].astype(np.float64)
+    time = headers["time"].astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weights = time * np.abs(headers["fres"]) / tsys**2
+    known = (tsys > 0) & (time > 0) & np.isfinite(weights)
+    return np.where(known, weights, 1.0)
+
+
+def reproject_offsets(
+    lam: float, bet: float, off1: float, off2: float, lam0: float, bet0: float
+) -> tuple[float, float]:
+    """
+    Function to compute the offsets of a position relative to a new centre, as
+    CLASS 'modify projection' does, for the radio projection of the 30m
+    observations (off1 = (lambda - lambda0) * cos(beta0), off2 = beta - beta0).
+    All the angles are in radians.
+    """
+    lam_abs = lam + off1 / np.cos(bet)
+    bet_abs = bet + off2
+    d_lam = (lam_abs - lam0 + np.pi) % (2 * np.pi) - np.pi
+    return float(d_lam * np.cos(bet0)), float(bet_abs - bet0)
+
+
+def _match(values: NDArray[np.str_], patterns: str) -> NDArray[np.bool_]:
+    """
+    Case-insensitive wildcard match of an array of names against space-separated
+    patterns. Each distinct name is only matched once.
+    """
+    pattern_list = [pattern.upper() for pattern in patterns.split()]
+    unique, inverse = np.unique(values, return_inverse=True)
+    matched = np.array(
+        [any(fnmatch(str(name).upper(), p) for p in pattern_list) for name in unique],
+        dtype=bool,
+    )
+    return matched[inverse.reshape(-1)] if len(unique) > 0 else matched
+
+
+def write_class_file(
+    file_name: str,
+    observations: Sequence[ClassObservation],
+    reclen: int = 1024,
+    lex1: int = 256,
+) -> None:
+    """
+    Function to write spectra to a CLASS single file (Type 2, little-endian).
+    Each observation has a general, position and spectroscopic section.
+    The index extensions double in size (lex1, 2*lex1, 4*lex1, ...).
+
+    parameters:
+    -----------
+    file_name: str
+        Output CLASS file. It is overwritten if it exists.
+    observations: Sequence[ClassObservation]
+        Observations to write, numbered from 1 if their num is 0.
+        They are written one at a time, so the sequence can create them on demand.
+    reclen: int
+        Record length in words.
+    lex1: int
+        Number of entries in the first index extension.
+    """
+    byteorder = "<"
+    n_obs = len(observations)
+    nex = 1
+    while lex1 * (2**nex - 1) < n_obs:
+        nex += 1
+    if file_desc_size + 8 * nex > reclen * word_size:
+        raise ValueError("Too many index extensions for the record length")
+    # records of each index extension, after the file descriptor
+    aex: list[int] = []
+    record = 2
+    for k in range(nex):
+        aex.append(record)
+        record += -(-lex1 * 2**k * index_lind // reclen)
+    index = np.zeros(
+        lex1 * (2**nex - 1),
+        dtype=_dtype(index_fields, index_lind * word_size, byteorder),
+    )
+    nsec = 3
+    head_words = (entry_desc_size + 20 * nsec) // word_size
+    sections = [
+        (section_general, general_fields),
+        (section_position, position_fields),
+        (section_spectro, spectro_fields),
+    ]
+    section_words = [-(-_section_size(fields) // word_size) for _, fields in sections]
+    section_dtypes = [
+        _dtype(fields, words * word_size, byteorder)
+        for (_, fields), words in zip(sections, section_words)
+    ]
+    section_addresses = list(
+        head_words + 1 + np.concatenate([[0], np.cumsum(section_words)[:-1]])
+    )
+    adata = head_words + 1 + sum(section_words)
+    # entry descriptor followed by the section codes, lengths and addresses
+    head_dtype = np.dtype(
+        {
+            "names": [name for name, _, _ in entry_desc_fields]
+            + ["seccod", "seclen", "secadr"],
+            "formats": [
+                np.dtype(fmt).newbyteorder(byteorder) for _, fmt, _ in entry_desc_fields
+            ]
+            + [
+                (byteorder + "i4", nsec),
+                (byteorder + "i8", nsec),
+                (byteorder + "i8", nsec),
+            ],
+            "offsets": [offset for _, _, offset in entry_desc_fields]
+            + [
+                entry_desc_size,
+                entry_desc_size + 4 * nsec,
+                entry_desc_size + 12 * nsec,
+            ],
+            "itemsize": (adata - 1) * word_size,
+        }
+    )
+    head = np.zeros(1, dtype=head_dtype)
+    head["code"] = entry_code
+    head["version"] = 2
+    head["nsec"] = nsec
+    head["adata"] = adata
+    head["seccod"] = [code for code, _ in sections]
+    head["seclen"] = section_words
+    head["secadr"] = section_addresses
+    section_values = [np.zeros(1, dtype=dtype) for dtype in section_dtypes]
+    general, position, spectro = section_values
+    position["equinox"] = 2000.0
+    word = (record - 1) * reclen  # 0-based word address of next observation
+    tmp_file = f"{file_name}.tmp"
+    with open(tmp_file, "wb") as fh:
+        # the file descriptor and the index are written at the end
+        fh.seek(word * word_size)
+        for i, obs in enumerate(observations):
+            data = np.asarray(obs.data, dtype=byteorder + "f4")
+            num = obs.num if obs.num > 0 else i + 1
+            nword = adata - 1 + len(data)
+            head["nword"] = nword
+            head["ldata"] = len(data)
+            head["xnum"] = num
+            for name in ("ut", "az", "el", "tau", "tsys", "time"):
+                general[name] = getattr(obs, name)
+            position["sourc"] = obs.source.encode("ascii")
+            position["lam"] = obs.lam
+            position["bet"] = obs.bet
+            position["lamof"] = obs.off1
+            position["betof"] = obs.off2
+            spectro["line"] = obs.line.encode("ascii")
+            spectro["nchan"] = len(data)
+            for name in ("restf", "rchan", "fres", "vres", "voff", "bad", "image"):
+                spectro[name] = getattr(obs, name)
+            blob = bytearray(head.tobytes())
+            for address, value in zip(section_addresses, section_values):
+                start = (address - 1) * word_size
+                blob[start : start + value.itemsize] = value.tobytes()
+            fh.write(blob)
+            fh.write(data.tobytes())
+            entry = index[i]
+            entry["bloc"] = word // reclen + 1
+            entry["word"] = word % reclen + 1
+            entry["num"] = num
+            entry["ver"] = 1
+            entry["source"] = obs.source.encode("ascii")
+            entry["line"] = obs.line.encode("ascii")
+            entry["telescope"] = obs.telescope.encode("ascii")
+            entry["dobs"] = obs.dobs
+            entry["off1"] = obs.off1
+            entry["off2"] = obs.off2
+            entry["kind"] = obs.kind
+            entry["qual"] = obs.qual
+            entry["scan"] = obs.scan
+            entry["subscan"] = obs.subscan
+            word += nword
+        # pad the last record
+        fh.write(b"\0" * (-word % reclen * word_size))
+        desc = np.zeros(1, dtype=_dtype(file_desc_fields, file_desc_size, byteorder))
+        desc["code"] = b"2A  "
+        desc["reclen"] = reclen
+        desc["kind"] = 1  # spectroscopic file
+        desc["vind"] = 2
+        desc["lind"] = index_lind
+        desc["flags"] = 1  # single file
+        desc["xnext"] = n_obs + 1
+        desc["nextrec"] = word // reclen + 1
+        desc["nextword"] = word % reclen + 1
+        desc["lex1"] = lex1
+        desc["nex"] = nex
+        desc["gex"] = gex_double
+        fh.seek(0)
+        fh.write(desc.tobytes())
+        fh.write(np.array(aex, dtype=byteorder + "i8").tobytes())
+        start = 0
+        for k in range(nex):
+            fh.seek((aex[k] - 1) * reclen * word_size)
+            fh.write(index[start : start + lex1 * 2**k].tobytes())
+            start += lex1 * 2**k
+    os.replace(tmp_file, file_name)
@@ -0,0 +1,141 @@
+import os
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .uv_table import UVHeader, _encode, _make_header, header_dtype, header_size
+
+# Native access to CLASS tables (.tab), as written by CLASS 'table' and read by
+# 'xy_map' and by the short-spacing merge in MAPPING.
+#
+# A table is a GDF image with one row per spectrum, Fortran dims (ncol, nspec):
+# the X and Y offsets (radians) and the weight, followed by one value per channel.
+# It shares the header layout of the UV tables (see uv_table), described by a
+# UVHeader with table_ndaps leading columns and one value per channel (natom 1).
+# The conversion formula of the first axis refers to the columns, so its
+# reference channel is shifted by the leading columns.
+
+table_code = b"GILDAS_IMAGE"
+table_ndaps = 3
+table_bad = -1000.0
+
+# Ruze fit of the IRAM 30m forward and main-beam efficiencies,
+#   eff = eff_0 * exp(-(4 pi sigma / lambda)^2), with sigma in mm
+ruze_feff = (0.955, 0.028)
+ruze_beff = (0.863, 0.066)
+
+
+def ruze_efficiency(
+    frequency: float | NDArray[np.float64], eff_0: float, sigma: float
+) -> float | NDArray[np.float64]:
+    """
+    Function to compute an antenna efficiency with the Ruze formula.
+
+    parameters:
+    -----------
+    frequency: float | NDArray[np.float64]
+        Frequency in MHz.
+    eff_0: float
+        Efficiency at long wavelengths.
+    sigma: float
+        rms of the surface errors in mm.
+    """
+    wavelength = 299792.458 / np.asarray(frequency, dtype=np.float64)  # mm
+    return eff_0 * np.exp(-((4.0 * np.pi * sigma / wavelength) ** 2))
+
+
+def tmb_factor(
+    frequency: float | NDArray[np.float64],
+) -> float | NDArray[np.float64]:
+    """
+    Function to compute the factor converting the 30m spectra from Ta* to Tmb,
+    Feff / Beff, with both efficiencies from the Ruze formula
+    (as CLASS 'modify beam_eff /ruze').
+
+    parameters:
+    -----------
+    frequency: float | NDArray[np.float64]
+        Frequency in MHz.
+    """
+    return ruze_efficiency(frequency, *ruze_feff) / ruze_efficiency(
+        frequency, *ruze_beff
+    )
+
+
+def write_class_table(
+    file_name: str, header: UVHeader, data: NDArray[np.floating]
+) -> None:
+    """
+    Function to write a CLASS table.
+
+    parameters:
+    -----------
+    file_name: str
+        Output table, e.g., "D30m/L09/B5_N2H+_1_0_L09.tab". It is overwritten if
+        it exists.
+    header: UVHeader
+        Description of the table, with nvis the number of spectra, table_ndaps
+        leading columns and natom 1.
+    data: NDArray
+        Offsets, weights and spectra, with shape (nspec, table_ndaps + nchan).
+        Blanked channels are set to table_bad.
+    """
+    if header.ndaps != table_ndaps or header.natom != 1:
+        raise ValueError(f"Not a CLASS table header: {header}")
+    if data.shape != (header.nvis, header.ncol):
+        raise ValueError(
+            f"Data shape {data.shape} does not match the header "
+            f"({header.nvis}, {header.ncol})"
+        )
+    dtype = header_dtype("<")
+    values = np.frombuffer(_make_header(header), dtype=dtype).copy()
+    values["code"] = table_code
+    values["code1"] = _encode("")
+    values["code2"] = _encode("")
+    values["ref1"] = header.rchan + table_ndaps
+    values["bval"] = table_bad
+    values["eval"] = 0.0
+    values["uvda_words"] = 0
+    tmp_file = f"{file_name}.tmp"
+    with open(tmp_file, "wb") as fh:
+        fh.write(values.tobytes())
+        np.ascontiguousarray(data, dtype="<f4").tofile(fh)
+    os.replace(tmp_file, file_name)
+
+
+def read_class_table(file_name: str) -> tuple[UVHeader, NDArray[np.float32]]:
+    """
+    Function to read a CLASS table written by write_class_table.
+
+    returns:
+    --------
+    header: UVHeader
+        Description of the table (nvis is the number of spectra).
+    data: NDArray[np.float32]
+        Offsets, weights and spectra, with shape (nspec, table_ndaps + nchan).
+    """
+    with open(file_name, "rb") as fh:
+        raw_header = fh.read(header_size)
+        if raw_header[:12] != table_code:
+            raise ValueError(f"Unsupported CLASS table: {file_name}")
+        values = np.frombuffer(raw_header, dtype=header_dtype("<"))[0]
+        ncol, nspec = int(values["dim"][0]), int(values["dim"][1])
+        data = np.fromfile(fh, dtype="<f4", count=ncol * nspec)
+    if len(data) != ncol * nspec:
+        raise ValueError(f"Truncated CLASS table: {file_name}")
+    header = UVHeader(
+        nvis=nspec,
+        nchan=ncol - table_ndaps,
+        rchan=float(values["ref1"]) - table_ndaps,
+        voff=float(values["val1"]),
+        vres=float(values["inc1"]),
+        restf=float(values["restf"]),
+        fres=float(values["fres"]),
+        source=values["source"].decode("latin-1").strip(),
+        line=values["line"].decode("latin-1").strip(),
+        ra=float(values["ra"]),
+        dec=float(values["dec"]),
+        ndaps=table_ndaps,
+        natom=1,
+    )
+    return header, data.reshape(nspec, ncol)
@@ -1,100 +1,249 @@
-import tempfile
+import io
+import hashlib
 import os
-from glob import glob
+import json
+from glob import glob, escape as glob_escape
 import yaml
 import numpy as np
 from numpy.typing import NDArray
 import configparser
+from dataclasses import replace
+from typing import TextIO
 from importlib.resources import files
-from astropy.coordinates import SkyCoord  # type: ignore
-import astropy.units as u  # type: ignore
+from .manifest import ManifestEntry, update_manifest, file_matches, ignore_matcher
+from .build_cache import fingerprint, is_up_to_date, save_fingerprint
+from .runner import run_gildas
+from .line_catalogue import LineCatalogue
+from .source_catalogue import SourceEntry, build_source_table
+from .class_file import (
+    ClassFile,
+    ClassObservation,
+    kind_spectrum,
+    observation_headers,
+    reproject_offsets,
+    spectrum_weights,
+    write_class_file,
+)
+from .baseline import change_rest_frequency, reduce_block, resample_spectra
+from .gridding import grid_30m_file
+from .uv_table import (
+    UVHeader,
+    UVTable,
+    extract_velocities,
+    shift_phase_center,
+    subtract_continuum,
+)
+from .class_table import table_bad, table_ndaps, tmb_factor, write_class_table
+from .short_spacing import short_spacing_uvt
+from .quality import (
+    ScanTableEntry,
+    excluded_mask,
+    exclusions_by_telescope,
+    good_ranges,
+    update_scan_table,
+)
 
 # from typing import Any
 
+# name, qn(filename), freq (GHz), mol(plot), qn(plot), Aul (log s^-1), Eul (K), cat, NOEMAbb, unit, width (km/s), 30msetup, 30mbb, 30mwidth (km/s), 30mline (km/s)
+line_columns: tuple[str, ...] = (
+    "line_name",
+    "qn",
+    "freq",
+    "name_str",
+    "qn_str",
+    "Lid",
+    "vel_width",
+    "setup_30m",
+    "vel_width_30m",
+    "vel_width_base_30m",
+)
 
-config = configparser.ConfigParser()
-config_file = "config.ini"
-if os.path.isfile(config_file):
-    config.read(config_file)
-else:
-    pack_file = str(files("noema_combine").joinpath(config_file))
-    config.read(pack_file)
-
-file_source_catalogue = config["catalogues"]["source_catalogue"]
-if not os.path.isfile(file_source_catalogue):
-    file_source_catalogue = str(files("noema_combine").joinpath(file_source_catalogue))
-    if not os.path.isfile(file_source_catalogue):
-        raise FileNotFoundError(
-            f"File not found: {config['catalogues']['source_catalogue']}"
-        )
 
-# file extenstions from congig file
-selfcal_ext = config.get("file_extensions", "selfcal", fallback="_sc")
-uvsub_ext = config.get("file_extensions", "uvsub", fallback="_uvsub")
+class LazySettings:
+    """
+    Configuration file and catalogues, loaded on first access and cached.
+
+    The configuration file is read from the current folder, or from the package
+    if it is not present. Each group of attributes is loaded when one of its
+    attributes is first used:
+
+    - config: config, file_source_catalogue, file_line_catalogue, selfcal_ext,
+      uvsub_ext, manifest_file, bad_scans_file, ignorefiles, uvt_dir, dir_30m,
+      uvt_dir_out, inputdir, log_dir, gildas_timeout, gildas_retries
+    - regions: region_catalogue
+    - lines: the columns of the line catalogue (line_columns)
+    """
+
+    groups: dict[str, tuple[str, ...]] = {
+        "config": (
+            "config",
+            "file_source_catalogue",
+            "file_line_catalogue",
+            "selfcal_ext",
+            "uvsub_ext",
+            "manifest_file",
+            "bad_scans_file",
+            "ignorefiles",
+            "uvt_dir",
+            "dir_30m",
+            "uvt_dir_out",
+            "inputdir",
+            "log_dir",
+            "gildas_timeout",
+            "gildas_retries",
+        ),
+        "regions": ("region_catalogue",),
+        "lines": line_columns,
+    }
 
-file_line_catalogue = config["catalogues"]["line_catalogue"]
-if not os.path.isfile(file_line_catalogue):
-    file_line_catalogue = str(files("noema_combine").joinpath(file_line_catalogue))
-    if not os.path.isfile(file_line_catalogue):
-        raise FileNotFoundError(
-            f"File not found: {config['catalogues']['line_catalogue']}"
+    config: configparser.ConfigParser
+    file_source_catalogue: str
+    file_line_catalogue: str
+    selfcal_ext: str
+    uvsub_ext: str
+    manifest_file: str
+    bad_scans_file: str
+    ignorefiles: list[str]
+    uvt_dir: str
+    dir_30m: str
+    uvt_dir_out: str
+    inputdir: list[str]
+    log_dir: str
+    gildas_timeout: float
+    gildas_retries: int
+    region_catalogue: dict[str, dict[str, str]]
+    line_name: NDArray[np.str_]
+    qn: NDArray[np.str_]
+    freq: NDArray[np.str_]
+    name_str: NDArray[np.str_]
+    qn_str: NDArray[np.str_]
+    Lid: NDArray[np.str_]
+    vel_width: NDArray[np.str_]
+    setup_30m: NDArray[np.str_]
+    vel_width_30m: NDArray[np.str_]
+    vel_width_base_30m: NDArray[np.str_]
+
+    def __init__(self, config_file: str = "config.ini"):
+        self.config_file = config_file
+        self._values: dict[str, object] = {}
+
+    def __getattr__(self, name: str) -> object:
+        for group, names in self.groups.items():
+            if name in names:
+                if names[0] not in self._values:
+                    self._values.update(getattr(self, f"_load_{group}")())
+                value = self._values[name]
+                setattr(self, name, value)
+                return value
+        raise AttributeError(f"{type(self).__name__!r} has no attribute {name!r}")
+
+    def reset(self) -> None:
+        """
+        Discard the cached values, so that they are read again on next use
+        (e.g., after changing the working directory).
+        """
+        for names in self.groups.values():
+            for name in names:
+                self.__dict__.pop(name, None)
+        self._values.clear()
+
+    def _load_config(self) -> dict[str, object]:
+        config = configparser.ConfigParser()
+        if os.path.isfile(self.config_file):
+            config.read(self.config_file)
+        else:
+            pack_file = str(files("noema_combine").joinpath(self.config_file))
+            config.read(pack_file)
+        # files to be ignored
+        ignorefiles: list[str] = []
+        for key, item in config.items("file_handling"):
+            if key.startswith("ignorefiles"):
+                ignorefiles.append(item)
+        inputdir_str = config["folders"]["inputdir"]
+        return {
+            "config": config,
+            "file_source_catalogue": config["catalogues"]["source_catalogue"],
+            "file_line_catalogue": config["catalogues"]["line_catalogue"],
+            # file extenstions from congig file
+            "selfcal_ext": config.get("file_extensions", "selfcal", fallback="_sc"),
+            "uvsub_ext": config.get("file_extensions", "uvsub", fallback="_uvsub"),
+            # optional manifest of the raw 30m files
+            "manifest_file": config.get("file_handling", "manifest", fallback=""),
+            # optional table of the bad scans of the raw 30m files
+            "bad_scans_file": config.get("file_handling", "bad_scans", fallback=""),
+            "ignorefiles": ignorefiles,
+            "uvt_dir": config["folders"]["uvt_dir"],
+            "dir_30m": config["folders"]["dir_30m"],
+            "uvt_dir_out": config["folders"]["uvt_dir_out"],
+            "inputdir": [path.strip() for path in inputdir_str.split(",")],
+            # GILDAS sessions: log folder, timeout (s, 0 = no limit) and retries
+            "log_dir": config.get("runner", "log_dir", fallback="logs/"),
+            "gildas_timeout": config.getfloat("runner", "timeout", fallback=0.0),
+            "gildas_retries": config.getint("runner", "retries", fallback=0),
+        }
+
+    def _load_regions(self) -> dict[str, object]:
+        file_name = _catalogue_path(self.file_source_catalogue)
+        with open(file_name, "r") as fh:
+            return {"region_catalogue": yaml.safe_load(fh)}
+
+    def _load_lines(self) -> dict[str, object]:
+        file_name = _catalogue_path(self.file_line_catalogue)
+        columns = np.loadtxt(
+            file_name,
+            dtype="U",
+            delimiter=",",
+            quotechar='"',
+            comments="#",
+            skiprows=1,
+            usecols=(0, 1, 2, 3, 4, 9, 10, 11, 13, 14),
+            unpack=True,
         )
+        return dict(zip(line_columns, columns))
 
 
-list_source_name: NDArray[np.str_]
-list_source_key: NDArray[np.str_]
-list_source_out: NDArray[np.str_]
-list_RA: NDArray[np.str_]
-list_Dec: NDArray[np.str_]
-list_Vlsr: NDArray[np.str_]
-
-with open(file_source_catalogue, "r") as fh:
-    region_catalogue: dict[str, dict[str, str]] = yaml.safe_load(fh)
-
-ignorefiles: list[str] = []
-for key, item in config.items("file_handling"):
-    if key.startswith("ignorefiles"):
-        ignorefiles.append(item)
-
-
-# load parameters used for the preparation of the data
-line_name: NDArray[np.str_]
-qn: NDArray[np.str_]
-freq: NDArray[np.str_]
-name_str: NDArray[np.str_]
-qn_str: NDArray[np.str_]
-Lid: NDArray[np.str_]
-vel_width: NDArray[np.str_]
-vel_width_30m: NDArray[np.str_]
-vel_width_base_30m: NDArray[np.str_]
-
-(
-    line_name,
-    qn,
-    freq,
-    name_str,
-    qn_str,
-    Lid,
-    vel_width,
-    vel_width_30m,
-    vel_width_base_30m,
-) = np.loadtxt(
-    file_line_catalogue,
-    dtype="U",
-    delimiter=",",
-    quotechar='"',
-    comments="#",
-    skiprows=1,
-    usecols=(0, 1, 2, 3, 4, 9, 10, 13, 14),
-    unpack=True,
-)
-# name, qn(filename), freq (GHz), mol(plot), qn(plot), Aul (log s^-1), Eul (K), cat, NOEMAbb, unit, width (km/s), 30msetup, 30mbb, 30mwidth (km/s), 30mline (km/s)
+def _catalogue_path(file_name: str) -> str:
+    """
+    Function to find a catalogue file, either in the current folder or in the package.
+    """
+    if not os.path.isfile(file_name):
+        pack_file = str(files("noema_combine").joinpath(file_name))
+        if not os.path.isfile(pack_file):
+            raise FileNotFoundError(f"File not found: {file_name}")
+        return pack_file
+    return file_name
+
 
-uvt_dir = config["folders"]["uvt_dir"]
-dir_30m = config["folders"]["dir_30m"]
-uvt_dir_out = config["folders"]["uvt_dir_out"]
-inputdir_str = config["folders"]["inputdir"]
-inputdir: list[str] = [path.strip() for path in inputdir_str.split(",")]
+settings = LazySettings()
+
+
+def __getattr__(name: str) -> object:
+    # module attributes from previous versions, e.g., data_handler.line_name
+    for names in LazySettings.groups.values():
+        if name in names:
+            return getattr(settings, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_line_catalogue: LineCatalogue | None = None
+_line_catalogue_columns: tuple[object, ...] = ()
+
+
+def get_line_catalogue() -> LineCatalogue:
+    """
+    Function to get the index of the line catalogue.
+    The index is built on first use, and again if the catalogue columns change
+    (e.g., after settings.reset()).
+    """
+    global _line_catalogue, _line_catalogue_columns
+    columns = (settings.line_name, settings.qn_str, settings.freq, settings.Lid)
+    if _line_catalogue is None or any(
+        column is not cached for column, cached in zip(columns, _line_catalogue_columns)
+    ):
+        _line_catalogue = LineCatalogue(*columns)
+        _line_catalogue_columns = columns
+    return _line_catalogue
 
 
 def get_line_param(line_name_i: str, qn_i: str | None) -> int:
@@ -103,18 +252,72 @@ def get_line_param(line_name_i: str, qn_i: str | None) -> int:
     If the Quantum number is not given, it will return the line only if there is a single entry in the catalogue.
     In the case of multiple line entried for the same molecule, an error is raised.
     """
-    if qn_i is None:
-        idx = np.where(line_name == line_name_i)[0]
-        if len(idx) > 1:
-            raise ValueError(
-                f"Line name is not unique: {line_name_i}, add the Quantum number (qn)."
-            )
-    else:
-        print(f"line_name: {line_name_i}, qn: {qn_i}")
-        idx = np.where((line_name == line_name_i) & (qn_str == qn_i))[0]
-    if len(idx) == 0:
-        raise ValueError(f"Line not found in the catalogue: {line_name_i}")
-    return int(idx[0])
+    return get_line_catalogue().index(line_name_i, qn_i)
+
+
+def _line_catalogue_row(index: int) -> str:
+    """
+    Function to describe the catalogue entry of a line, used in the fingerprints.
+    """
+    columns = (
+        settings.line_name,
+        settings.qn,
+        settings.freq,
+        settings.name_str,
+        settings.qn_str,
+        settings.Lid,
+        settings.vel_width,
+    )
+    columns += (settings.setup_30m, settings.vel_width_30m, settings.vel_width_base_30m)
+    return ",".join(str(column[index]) for column in columns)
+
+
+def _source_catalogue_row(source_name: str) -> str:
+    """
+    Function to describe the catalogue entry of a source, used in the fingerprints.
+    """
+    return json.dumps(
+        settings.region_catalogue[source_name], sort_keys=True, default=str
+    )
+
+
+_source_table: dict[str, SourceEntry] = {}
+_source_errors: dict[str, str] = {}
+_source_snapshot: dict[str, tuple[object, ...]] = {}
+
+
+def _source_key(entry: dict[str, str]) -> tuple[object, ...]:
+    return tuple(
+        entry.get(key, None)
+        for key in ("RA0", "Dec0", "Vlsr", "source_30m", "source_out")
+    )
+
+
+def get_source_table() -> dict[str, SourceEntry]:
+    """
+    Function to get the parsed region catalogue, with coordinates in degrees.
+    The table is built on first use, converting the coordinates of all the regions
+    at once, and again if the region catalogue changes.
+    Regions with invalid entries raise a ValueError when they are requested.
+
+    returns:
+    --------
+    table: dict[str, SourceEntry]
+        (source_30m, source_out, ra0, dec0, vlsr) for each region.
+    """
+    global _source_table, _source_errors, _source_snapshot
+    catalogue = settings.region_catalogue
+    if len(catalogue) != len(_source_snapshot) or any(
+        _source_snapshot.get(name, None) != _source_key(entry)
+        for name, entry in catalogue.items()
+    ):
+        _source_table, _source_errors = build_source_table(catalogue)
+        _source_snapshot = {
+            name: _source_key(entry) for name, entry in catalogue.items()
+        }
+        for name, error in _source_errors.items():
+            print(f"[WARNING] Region '{name}' has invalid parameters: {error}")
+    return _source_table
 
 
 def get_source_param(source_name: str) -> tuple[str, str, str, float, float, float]:
@@ -142,46 +345,15 @@ def get_source_param(source_name: str) -> tuple[str, str, str, float, float, flo
         LSR velocity of the source in km/s.
     """
     print(f"source_name: {source_name}")
-    try:
-        region_catalogue[source_name]
-    except KeyError:
-        raise ValueError(f"Region '{source_name}' not found in region_catalogue")
-
-    if (":" in region_catalogue[source_name]["RA0"]) and (
-        ":" in region_catalogue[source_name]["Dec0"]
-    ):
-        skycoord: SkyCoord = SkyCoord(
-            region_catalogue[source_name]["RA0"]
-            + " "
-            + region_catalogue[source_name]["Dec0"],
-            frame="icrs",
-            unit=(u.hourangle, u.deg),  # type: ignore
-        )
-    elif ("h" in region_catalogue[source_name]["RA0"]) and (
-        "d" in region_catalogue[source_name]["Dec0"]
-    ):
-        skycoord: SkyCoord = SkyCoord(
-            ra=region_catalogue[source_name]["RA0"],
-            dec=region_catalogue[source_name]["Dec0"],
-            frame="icrs",
+    table = get_source_table()
+    if source_name in _source_errors:
+        raise ValueError(
+            f"Region '{source_name}' has invalid parameters: {_source_errors[source_name]}"
         )
-    else:
-        skycoord: SkyCoord = SkyCoord(
-            ra=float(region_catalogue[source_name]["RA0"]),
-            dec=float(region_catalogue[source_name]["Dec0"]),
-            frame="icrs",
-            unit=(u.deg, u.deg),  # type: ignore
-        )
-    ra_cat: float = skycoord.ra.degree  # type: ignore
-    dec_cat: float = skycoord.dec.degree  # type: ignore
-    return (
-        source_name,
-        region_catalogue[source_name]["source_30m"],
-        region_catalogue[source_name]["source_out"],
-        ra_cat,
-        dec_cat,
-        float(region_catalogue[source_name]["Vlsr"]),
-    )
+    if source_name not in table:
+        raise ValueError(f"Region '{source_name}' not found in region_catalogue")
+    source_30m, source_out, ra_cat, dec_cat, vlsr = table[source_name]
+    return (source_name, source_30m, source_out, ra_cat, dec_cat, vlsr)
 
 
 def get_uvt_window(
@@ -207,10 +379,12 @@ def get_uvt_window(
     """
     extension = ""
     if selfcal:
-        extension += selfcal_ext
+        extension += settings.selfcal_ext
     if uvsub:
-        extension += uvsub_ext
-    uvt_filename = os.path.join(uvt_dir, Lid, f"{source_name}_{Lid}{extension}.uvt")
+        extension += settings.uvsub_ext
+    uvt_filename = os.path.join(
+        settings.uvt_dir, Lid, f"{source_name}_{Lid}{extension}.uvt"
+    )
     return uvt_filename
 
 
@@ -237,9 +411,9 @@ def get_uvt_file(
         If True, the file will be saved in the merge folder, otherwise in the uvt folder.
     """
     if not merge:
-        dir_out = uvt_dir
+        dir_out = settings.uvt_dir
     else:
-        dir_out = uvt_dir_out
+        dir_out = settings.uvt_dir_out
     uvt_filename = os.path.join(
         dir_out, Lid, f"{source_name}_{line_name}_{qn}_{Lid}.uvt"
     )
@@ -274,11 +448,18 @@ def get_30m_file(
         name_out = f"{source_name}_{line_name}_{qn}_{Lid}.30m"
     else:
         name_out = f"{source_name}_{line_name}_{qn}.30m"
-    outputfile = os.path.join(dir_30m, name_out)
+    outputfile = os.path.join(settings.dir_30m, name_out)
     return outputfile
 
 
-def line_prepare_merge(source_name: str, line_i: str, qn_i: str) -> None:
+def line_prepare_merge(
+    source_name: str,
+    line_i: str,
+    qn_i: str,
+    scratch_dir: str = ".",
+    force: bool = False,
+    native: bool = False,
+) -> int:
     """
     Function to prepare the 30m data for the merging.
     It will ensure that the 30m data are in Tmb and in the correct frequency.
@@ -293,59 +474,427 @@ def line_prepare_merge(source_name: str, line_i: str, qn_i: str) -> None:
         Molecule to reduce, e.g., "CO", "13CO", "N2H+"
     qn: str
         Quantum numbers of the line to reduce, e.g., "1-0" or "N=1-0,J=3/2-1/2,F=1/2-1/2"
+    scratch_dir: str
+        Folder where the temporary CLASS script is written.
+    force: bool
+        If True, the product is rebuilt even if it is up to date.
+    native: bool
+        If True, the merge-ready table is written directly from the reduced
+        spectra (see _prepare_merge_native), without CLASS and without
+        rewriting them into an intermediate .30m file.
+    returns:
+    --------
+    status: int
+        Exit status of the CLASS session (-1 if it timed out),
+        0 if the product is up to date.
     """
-    _, _, source_out, _, _, _ = get_source_param(source_name)
+    _, _, source_out, ra0, dec0, _ = get_source_param(source_name)
 
     print(f"[INFO] Reducing line: {line_i} with qn: {qn_i}")
     index = get_line_param(line_i, qn_i)
-    qn_name_i = qn[index]
-    line_name_i = line_name[index]
-    freq_i = freq[index].astype(float) * 1e3
-    Lid_i = Lid[index]
+    qn_name_i = settings.qn[index]
+    line_name_i = settings.line_name[index]
+    freq_i = settings.freq[index].astype(float) * 1e3
+    Lid_i = settings.Lid[index]
     file_uvt = get_uvt_file(source_out, line_name_i, qn_name_i, Lid_i, merge=False)
     merge_uvt = get_uvt_file(source_out, line_name_i, qn_name_i, Lid_i, merge=True)
 
     file_30m = get_30m_file(source_out, line_name_i, qn_name_i, Lid_i, merge=False)
     merge_30m = get_30m_file(source_out, line_name_i, qn_name_i, Lid_i, merge=True)
 
-    os.system(f"rm {merge_30m[:-4]}.*")
-    fb = tempfile.NamedTemporaryFile(delete=True, mode="w+", dir=".", suffix=".class")
-    fb.write(f'file in "{file_30m}"\n')
-    fb.write(f'file out "{merge_30m}"  single /overwrite\n')
-    fb.write("say [INFO] Removing old output file\n")
-    fb.write(f'say "[INFO] Making new output file: {merge_30m}"\n')
-    fb.write("find\n")
-    fb.write("set mode x auto\n")
-    fb.write("set unit v f\n")
-    fb.write("get zero\n")
-    fb.write("sic message class s-i\n")
-    fb.write("for i 1 to found\n")
-    fb.write("  get next\n")
-    fb.write(f"  modify linename {name_str[index]}\n")
-    fb.write(f"  modify freq {freq_i}\n")
-    fb.write(f"  modify source {source_out}\n")
-    fb.write("  modify Beam_Eff /Ruze\n")
-    fb.write("  write\n")
-    fb.write("next\n")
-    fb.write("sic message class s+i\n")
-    fb.write(f'file in "{merge_30m}"\n')
-    fb.write("find /all\n")
-    fb.write("if found.eq.0 exit\n")
-    fb.write(f'table "{merge_uvt[:-4]}" new /NOCHECK source /like "{file_uvt}"\n')
-    fb.write("exit\n")
-    fb.flush()
+    script = io.StringIO()
+    script.write(f'file in "{file_30m}"\n')
+    script.write(f'file out "{merge_30m}"  single /overwrite\n')
+    script.write("say [INFO] Removing old output file\n")
+    script.write(f'say "[INFO] Making new output file: {merge_30m}"\n')
+    script.write("find\n")
+    script.write("set mode x auto\n")
+    script.write("set unit v f\n")
+    script.write("get zero\n")
+    script.write("sic message class s-i\n")
+    script.write("for i 1 to found\n")
+    script.write("  get next\n")
+    script.write(f"  modify linename {settings.name_str[index]}\n")
+    script.write(f"  modify freq {freq_i}\n")
+    script.write(f"  modify source {source_out}\n")
+    script.write("  modify Beam_Eff /Ruze\n")
+    script.write("  write\n")
+    script.write("next\n")
+    script.write("sic message class s+i\n")
+    script.write(f'file in "{merge_30m}"\n')
+    script.write("find /all\n")
+    script.write("if found.eq.0 exit\n")
+    script.write(f'table "{merge_uvt[:-4]}" new /NOCHECK source /like "{file_uvt}"\n')
+    script.write("exit\n")
+    # the native table replaces the CLASS product
+    product = f"{merge_uvt[:-4]}.tab" if native else merge_30m
+    fingerprint_i = fingerprint(
+        ("! native regrid\n" if native else "") + script.getvalue(),
+        [file_30m, file_uvt],
+        [_line_catalogue_row(index), _source_catalogue_row(source_name)],
+    )
+    if not force and is_up_to_date(product, fingerprint_i):
+        print(f"[INFO] Up to date: {product}")
+        return 0
+    _remove_outputs([merge_30m])
     merged_folder = os.path.dirname(merge_uvt)  # get path only
     if not os.path.exists(merged_folder):
         os.makedirs(merged_folder)
+    if native:
+        _prepare_merge_native(
+            file_30m,
+            file_uvt,
+            product,
+            source_out,
+            str(settings.name_str[index]),
+            ra0,
+            dec0,
+        )
+        os.system(f"cp {file_uvt} {merged_folder}/.")
+        save_fingerprint(product, fingerprint_i)
+        return 0
 
     # copy to folder for merging
     # os.system("cp {0}.tab {1}/.".format(outputfile, merged_folder))
-    os.system(f"class -nw @ {fb.name}")
-    fb.close()
+    status = _run_gildas(
+        "class", script.getvalue(), merge_30m, scratch_dir, [merge_30m]
+    )
     os.system(f"cp {file_uvt} {merged_folder}/.")
+    if status == 0:
+        save_fingerprint(merge_30m, fingerprint_i)
+    return status
+
+
+def _prepare_merge_native(
+    file_30m: str,
+    file_uvt: str,
+    table_file: str,
+    source_out: str,
+    line_name: str,
+    ra0: float,
+    dec0: float,
+) -> int:
+    """
+    Function to write the merge-ready CLASS table of a line with the native CLASS
+    reader, equivalent to the CLASS session of line_prepare_merge.
+    The spectra are converted from Ta* to Tmb (see class_table.tmb_factor) and
+    resampled onto the spectral axis of the uv-table (same rest frequency and
+    channels, as 'table /like'). Spectra sharing a velocity axis are resampled
+    as one block, with the banded resampling weights
+    (see baseline.resample_spectra). Output channels less than half covered by
+    valid input channels are blanked.
+    The weight of each spectrum is time * |fres| / Tsys^2 (1 if unknown).
+
+    returns:
+    --------
+    n_spec: int
+        Number of spectra in the table.
+    """
+    with UVTable(file_uvt) as uvt:
+        target = uvt.header
+    axis_out = (target.nchan, target.rchan, target.vres, target.voff)
+    with ClassFile(file_30m) as class_file:
+        headers = class_file.headers()
+        selected = np.flatnonzero(headers["kind"] == kind_spectrum)
+        data = np.full((len(selected), table_ndaps + target.nchan), table_bad)
+        data[:, 0] = headers["off1"][selected]
+        data[:, 1] = headers["off2"][selected]
+        data[:, 2] = 1.0
+        data[:, 2] = spectrum_weights(headers)[selected]
+        # velocity axis of each spectrum at the rest frequency of the uv-table
+        rchan = change_rest_frequency(
+            headers["restf"][selected],
+            headers["rchan"][selected],
+            headers["fres"][selected],
+            target.restf,
+        )
+        keys = np.stack(
+            [
+                headers["nchan"][selected],
+                rchan,
+                headers["vres"][selected],
+                headers["voff"][selected],
+            ],
+            axis=1,
+        )
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        for g, (nchan, rchan_g, vres, voff) in enumerate(unique):
+            members = np.flatnonzero(inverse == g)
+            block = class_file.spectra_block(selected[members]).astype(np.float64)
+            valid = np.isfinite(block) & (block != headers["bad"][selected[members[0]]])
+            resampled, coverage = resample_spectra(
+                block, (int(nchan), rchan_g, vres, voff), axis_out, valid
+            )
+            factor = tmb_factor(headers["restf"][selected[members]])
+            resampled *= np.asarray(factor)[:, None]
+            data[members, table_ndaps:] = np.where(
+                coverage >= 0.5, resampled, table_bad
+            )
+    header = replace(
+        target,
+        nvis=len(selected),
+        source=source_out,
+        line=line_name,
+        ra=np.radians(ra0),
+        dec=np.radians(dec0),
+        ndaps=table_ndaps,
+        natom=1,
+    )
+    write_class_table(table_file, header, data)
+    print(f"[INFO] Wrote {len(selected)} spectra into {table_file}")
+    return len(selected)
+
+
+def line_make_short_spacing(
+    source_name: str,
+    line_i: str,
+    qn_i: str,
+    weight_factor: float = 1.0,
+    force: bool = False,
+    n_threads: int | None = None,
+) -> str:
+    """
+    Function to compute the short-spacing pseudo-visibilities of a line natively
+    (see short_spacing.short_spacing_uvt), from the merge-ready 30m table and the
+    NOEMA uv-table written by line_prepare_merge(..., native=True).
+    The output, {merged uv-table}_short.uvt, has the spectral axis and columns of
+    the NOEMA uv-table, and can be concatenated with it
+    (see uv_table.append_uv_tables).
+
+    parameters:
+    -----------
+    source_name: str
+        Name of the source, e.g., "B5"
+    line_i: str
+        Molecule, e.g., "CO", "13CO", "N2H+"
+    qn_i: str
+        Quantum numbers of the line, e.g., "1-0"
+    weight_factor: float
+        Weight of the pseudo-visibilities relative to the NOEMA visibilities.
+    force: bool
+        If True, the product is rebuilt even if it is up to date.
+    n_threads: int | None
+        Number of threads. If None, the number of CPUs.
+    returns:
+    --------
+    file_short: str
+        uv-table of the pseudo-visibilities.
+    """
+    _, _, source_out, _, _, _ = get_source_param(source_name)
+    index = get_line_param(line_i, qn_i)
+    merge_uvt = get_uvt_file(
+        source_out,
+        settings.line_name[index],
+        settings.qn[index],
+        settings.Lid[index],
+        merge=True,
+    )
+    table_file = f"{merge_uvt[:-4]}.tab"
+    file_short = f"{merge_uvt[:-4]}_short.uvt"
+    for file_name in (table_file, merge_uvt):
+        if not os.path.isfile(file_name):
+            raise ValueError(
+                f"File not found: {file_name}, "
+                "run line_prepare_merge with native=True first"
+            )
+    fingerprint_i = fingerprint(
+        f"! native short spacings, weight factor {weight_factor}\n",
+        [table_file, merge_uvt],
+        [_line_catalogue_row(index), _source_catalogue_row(source_name)],
+    )
+    if not force and is_up_to_date(file_short, fingerprint_i):
+        print(f"[INFO] Up to date: {file_short}")
+        return file_short
+    short_spacing_uvt(
+        table_file,
+        merge_uvt,
+        file_short,
+        weight_factor=weight_factor,
+        n_threads=n_threads,
+    )
+    save_fingerprint(file_short, fingerprint_i)
+    return file_short
+
+
+def _run_gildas(
+    program: str, script: str, product: str, scratch_dir: str, outputs: list[str]
+) -> int:
+    """
+    Function to run a GILDAS script with the runner settings from the configuration
+    file. The output is stored in {log_dir}/{product name}.{program}.log
+    The scripts create their outputs from scratch, so the files of the outputs
+    (any extension) are removed before each retry.
+
+    parameters:
+    -----------
+    outputs: list[str]
+        Files written by the script.
+    returns:
+    --------
+    status: int
+        Exit status of the GILDAS session, -1 if it timed out.
+    """
+    product_name = os.path.splitext(os.path.basename(product))[0]
+    result = run_gildas(
+        program,
+        script,
+        log_file=os.path.join(settings.log_dir, f"{product_name}.{program}.log"),
+        scratch_dir=scratch_dir,
+        timeout=settings.gildas_timeout if settings.gildas_timeout > 0 else None,
+        retries=settings.gildas_retries,
+        cleanup=lambda: _remove_outputs(outputs),
+    )
+    return result.returncode
+
+
+def _remove_outputs(outputs: list[str]) -> None:
+    """
+    Function to remove the files of the outputs of a GILDAS script, i.e., all the
+    files sharing their name without extension.
+    """
+    for output in outputs:
+        for name in glob(f"{glob_escape(os.path.splitext(output)[0])}.*"):
+            os.remove(name)
 
 
-def line_reduce_30m(source_name: str, line_i: str, qn_i: str) -> None:
+def _batch_product(source_out: str, kind: str, products: list[str]) -> str:
+    """
+    Function to name a GILDAS session writing several products, used for its
+    log file (see _run_gildas). The name depends on the products, so that
+    parallel jobs of the same source write separate logs: a single product
+    keeps its own name, and long lists of products are replaced by a hash.
+    """
+    if len(products) == 1:
+        return products[0]
+    names = "_".join(os.path.splitext(os.path.basename(name))[0] for name in products)
+    if len(names) > 150:
+        names = hashlib.sha1(names.encode()).hexdigest()[:12]
+    return f"{source_out}_{kind}_batch_{names}.batch"
+
+
+def get_30m_inputfiles() -> list[str]:
+    """
+    Function to list the raw 30m files (*.30m) found in all the input directories.
+    The files matching the ignorefiles entries of the configuration file are
+    excluded (see manifest.ignore_matcher).
+    """
+    inputfiles: list[str] = []
+    for input_dir in settings.inputdir:
+        # Use glob to find all .30m files in each directory
+        files_in_dir = glob(os.path.join(input_dir, "*.30m"))
+        inputfiles.extend(files_in_dir)
+    if len(inputfiles) == 0:
+        raise ValueError(f"No files found in the input directory: {settings.inputdir}")
+    print(f"[INFO] Found {len(inputfiles)} files in input directories")
+    # files excluded in the configuration file (ignorefiles_*)
+    is_ignored = ignore_matcher(settings.ignorefiles)
+    ignored = {inputfile for inputfile in inputfiles if is_ignored(inputfile)}
+    if len(ignored) > 0:
+        size = sum(os.path.getsize(inputfile) for inputfile in ignored)
+        print(f"[INFO] Ignoring {len(ignored)} files ({size / 1e6:.1f} MB)")
+    return [inputfile for inputfile in inputfiles if inputfile not in ignored]
+
+
+def update_30m_manifest(
+    inputfiles: list[str] | None = None, scratch_dir: str = "."
+) -> dict[str, ManifestEntry] | None:
+    """
+    Function to update the manifest of the raw 30m files, if a manifest file is
+    set in the configuration file (see manifest.update_manifest).
+    It is called once before dispatching parallel jobs (see executor.run_jobs),
+    so that the jobs only read an up-to-date manifest.
+
+    parameters:
+    -----------
+    inputfiles: list[str] | None
+        Raw 30m files. If None, the ones from get_30m_inputfiles.
+    scratch_dir: str
+        Folder where the temporary CLASS script is written.
+    returns:
+    --------
+    manifest: dict[str, ManifestEntry] | None
+        The manifest, None if no manifest file is set.
+    """
+    if settings.manifest_file == "":
+        return None
+    if inputfiles is None:
+        inputfiles = get_30m_inputfiles()
+    return update_manifest(
+        inputfiles,
+        settings.manifest_file,
+        scratch_dir=scratch_dir,
+        log_file=os.path.join(settings.log_dir, "manifest.class.log"),
+    )
+
+
+def update_30m_scan_table(
+    inputfiles: list[str] | None = None,
+) -> dict[str, ScanTableEntry] | None:
+    """
+    Function to update the table of bad scans of the raw 30m files, detected once
+    per new or modified file, if a table file is set in the configuration file
+    (see quality.update_scan_table).
+    It is called once before dispatching parallel jobs (see executor.run_jobs),
+    so that the jobs only read an up-to-date table.
+
+    parameters:
+    -----------
+    inputfiles: list[str] | None
+        Raw 30m files. If None, the ones from get_30m_inputfiles.
+    returns:
+    --------
+    scan_table: dict[str, ScanTableEntry] | None
+        The table, None if no table file is set.
+    """
+    if settings.bad_scans_file == "":
+        return None
+    if inputfiles is None:
+        inputfiles = get_30m_inputfiles()
+    return update_scan_table(inputfiles, settings.bad_scans_file)
+
+
+def get_30m_lines(source_name: str) -> list[tuple[str, str]]:
+    """
+    Function to list all the lines in the catalogue covered by the 30m observations
+    of a source.
+    A line is covered if its 30msetup entry is defined. If the source has a
+    'setup_30m' entry in the region catalogue (a setup name or a list of names),
+    only lines observed with those setups are returned.
+
+    parameters:
+    -----------
+    source_name: str
+        Name of the source to reduce, e.g., "B5-IRS1"
+    returns:
+    --------
+    lines: list[tuple[str, str]]
+        List of (line, qn) pairs, with qn as used in get_line_param.
+    """
+    try:
+        setups = settings.region_catalogue[source_name].get("setup_30m", None)
+    except KeyError:
+        raise ValueError(f"Region '{source_name}' not found in region_catalogue")
+    if isinstance(setups, str):
+        setups = [setups]
+    lines: list[tuple[str, str]] = []
+    for i in range(len(settings.line_name)):
+        setup_i = settings.setup_30m[i].strip()
+        if setup_i == "":
+            continue
+        if (setups is not None) and (setup_i not in setups):
+            continue
+        lines.append((str(settings.line_name[i]), str(settings.qn_str[i])))
+    return lines
+
+
+def line_reduce_30m(
+    source_name: str,
+    line_i: str,
+    qn_i: str,
+    scratch_dir: str = ".",
+    native: bool = False,
+) -> int:
     """
     Function to perform a simple data reduction ot the 30m data.
     Output spectra will be stores in Ta* scale.
@@ -359,95 +908,581 @@ def line_reduce_30m(source_name: str, line_i: str, qn_i: str) -> None:
         Molecule to reduce, e.g., "CO", "13CO", "N2H+"
     qn_i: str
         Quantum numbers of the line to reduce, e.g., "1-0" or "N=1-0,J=3/2-1/2,F=1/2-1/2"
+    scratch_dir: str
+        Folder where the temporary CLASS script is written.
+    native: bool
+        If True, the spectra are reduced and gridded without CLASS
+        (see line_reduce_30m_batch).
+    returns:
+    --------
+    status: int
+        Exit status of the CLASS session (-1 if it timed out).
+    """
+    return line_reduce_30m_batch(
+        source_name, [(line_i, qn_i)], scratch_dir=scratch_dir, native=native
+    )
+
+
+# tolerance (arcsec) of the offsets of the 30m observations around the source centre
+match_30m = 500
+
+
+def _script_30m_file(script: TextIO, inputfile: str, source_find: str) -> None:
+    """
+    Function to write the CLASS commands opening a raw 30m file.
+    """
+    script.write(f'say "[INFO] Processing file: {inputfile}"\n')
+    # Load file and det defaults
+    script.write(f'file in "{inputfile}"\n')
+    script.write(f"set source {source_find}\n")
+    script.write("set offset 0 0\n")
+    script.write("set angle sec\n")
+    script.write(f"set match {match_30m}\n")
+    script.write("set tele *\n")
+    script.write("set line *\n")
+
+
+def _script_30m_line(
+    script: TextIO,
+    index: int,
+    file_30m: str,
+    vel_ext: str,
+    vel_win: str,
+    freq_corr: float,
+    source_out: str,
+    ra0: float,
+    dec0: float,
+    exclusions: ScanTableEntry | None = None,
+) -> None:
+    """
+    Function to write the CLASS commands reducing the observations of a line
+    in the current input file, and appending them to the output file of the line.
+    The scans excluded in the scan-exclusion entry of the file (exclusions) are
+    not selected (see _script_30m_find).
+    """
+    freq_i = settings.freq[index].astype(float) * 1e3
+    # append to the output file of this line
+    script.write(f"file out {file_30m}\n")
+    # Open and check file
+    # only observations with reference frequency
+    _script_30m_find(script, "/frequency {0}".format(freq_i * freq_corr), exclusions)
+    script.write("set mode x auto\n")
+    script.write("set unit v\n")
+    script.write("get zero\n")
+    script.write("sic message class s-i\n")
+    script.write("for i 1 to found\n")
+    script.write("  get next\n")
+    script.write(f"  modify linename {settings.name_str[index]}\n")
+    script.write(f"  modify freq {freq_i}\n")
+    script.write(f"  modify source {source_out}\n")
+    # RA and Dec centers are in hrs and degrees, respectively
+    script.write(f"  modify projection = {ra0/15.0} {dec0} =\n")
+    script.write("  modify telescope 30M-MRT\n")
+    script.write(f"  extract {vel_ext} velocity\n")  # cut out spectra
+    script.write(f"  set window {vel_win}\n")  # define baseline window
+    script.write("  base 1\n")  # first order baseline
+    script.write("  write\n")
+    script.write("next\n")
+    # ! Toggle back screen informational messages
+    script.write("sic message class s+i\n")
+
+
+def _script_30m_find(
+    script: TextIO, options: str, exclusions: ScanTableEntry | None = None
+) -> None:
+    """
+    Function to write the CLASS commands selecting the observations of the current
+    input file. Without excluded scans, a single 'find' is used. Otherwise the index
+    is built telescope by telescope with 'find append', over the ranges of scans
+    (and subscans) around the excluded ones, so the raw file is not copied.
+    """
+    if exclusions is None or len(exclusions.get("excluded", [])) == 0:  # type: ignore
+        script.write(f"find {options}\n")
+        return
+    find = "find"
+    for telescope, (scans, subscans) in exclusions_by_telescope(exclusions).items():
+        script.write(f"set telescope {telescope}\n")
+        for first, last in good_ranges(scans + list(subscans)):
+            script.write(f"set scan {first} {'*' if last is None else last}\n")
+            script.write(f"{find} {options}\n")
+            find = "find append"
+        for scan, excluded in sorted(subscans.items()):
+            if scan in scans:
+                continue
+            script.write(f"set scan {scan} {scan}\n")
+            for first, last in good_ranges(excluded):
+                script.write(f"set subscan {first} {'*' if last is None else last}\n")
+                script.write(f"{find} {options}\n")
+                find = "find append"
+            script.write("set subscan 0 *\n")
+    script.write("set telescope *\n")
+    script.write("set scan 0 *\n")
+
+
+def _script_30m_grid(script: TextIO, file_30m: str) -> None:
+    """
+    Function to write the CLASS commands gridding the reduced spectra of a line.
+    """
+    script.write(f"file in {file_30m}\n")
+    script.write("find /all\n")
+    script.write("if (found.gt.0) then\n")
+    script.write(f"  table {file_30m[:-4]} new /nocheck\n")
+    script.write(f"  xy_map {file_30m[:-4]}\n")
+    script.write("endif\n")
+
+
+def _reduce_30m_native(
+    inputfiles: list[str],
+    index: int,
+    file_30m: str,
+    vel_ext: str,
+    vel_win: str,
+    freq_corr: float,
+    source_find: str,
+    source_out: str,
+    ra0: float,
+    dec0: float,
+    scan_table: dict[str, ScanTableEntry] | None = None,
+) -> int:
+    """
+    Function to reduce the observations of a line with the native CLASS reader,
+    equivalent to the CLASS commands written by _script_30m_line.
+    The observations excluded in the scan-exclusion table (scan_table) are skipped.
+    The spectra sharing a velocity axis are cut and baseline subtracted as one block,
+    and the reduced spectra are written to file_30m, ready for 'table' and 'xy_map'.
+
+    returns:
+    --------
+    n_obs: int
+        Number of reduced spectra.
+    """
+    freq_i = settings.freq[index].astype(float) * 1e3
+    v_extract = tuple(float(value) for value in vel_ext.split())
+    windows = [tuple(float(value) for value in vel_win.split())]
+    lam0, bet0 = np.radians(ra0), np.radians(dec0)
+    match = np.radians(match_30m / 3600.0)
+    observations: list[ClassObservation] = []
+    for inputfile in inputfiles:
+        print(f"[INFO] Processing file: {inputfile}")
+        with ClassFile(inputfile) as class_file:
+            headers = class_file.headers()
+            selected = class_file.find(source=source_find, frequency=freq_i * freq_corr)
+            selected = selected[
+                (np.abs(headers["off1"][selected]) <= match)
+                & (np.abs(headers["off2"][selected]) <= match)
+                & (headers["kind"][selected] == kind_spectrum)
+            ]
+            if scan_table is not None and inputfile in scan_table:
+                excluded = excluded_mask(scan_table[inputfile], headers)
+                selected = selected[~excluded[selected]]
+            if len(selected) == 0:
+                continue
+            # group the spectra by velocity axis after changing the rest frequency
+            rchan = change_rest_frequency(
+                headers["restf"][selected],
+                headers["rchan"][selected],
+                headers["fres"][selected],
+                freq_i,
+            )
+            keys = np.stack(
+                [
+                    headers["nchan"][selected],
+                    rchan,
+                    headers["vres"][selected],
+                    headers["voff"][selected],
+                    headers["bad"][selected],
+                ],
+                axis=1,
+            )
+            unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            for g, (nchan, rchan_g, vres, voff, bad) in enumerate(unique):
+                members = selected[inverse == g]
+                reduced, rchan_new, _ = reduce_block(
+                    class_file.spectra_block(members),
+                    int(nchan),
+                    rchan_g,
+                    vres,
+                    voff,
+                    v_extract,  # type: ignore
+                    windows,  # type: ignore
+                    bad=bad,
+                )
+                for i, data in zip(members, reduced):
+                    obs = {
+                        name: headers[name][i].item() for name in observation_headers
+                    }
+                    off1, off2 = reproject_offsets(
+                        obs["lam"], obs["bet"], obs["off1"], obs["off2"], lam0, bet0
+                    )
+                    obs.update(
+                        source=source_out,
+                        line=str(settings.name_str[index]),
+                        telescope="30M-MRT",
+                        restf=freq_i,
+                        rchan=rchan_new,
+                        lam=lam0,
+                        bet=bet0,
+                        off1=off1,
+                        off2=off2,
+                        num=0,
+                    )
+                    observations.append(ClassObservation(**obs, data=data))
+    write_class_file(file_30m, observations)
+    print(f"[INFO] Reduced {len(observations)} spectra into {file_30m}")
+    return len(observations)
+
+
+def line_reduce_30m_batch(
+    source_name: str,
+    lines: list[tuple[str, str | None]] | None = None,
+    scratch_dir: str = ".",
+    force: bool = False,
+    native: bool = False,
+) -> int:
+    """
+    Function to reduce several lines of the 30m data in a single CLASS session.
+    Each input file is opened once, and the observations matching each line
+    (find /frequency) are written into the output file of that line.
+    The reduction applied to each line is the same as in line_reduce_30m.
+    Lines whose output is up to date (same script, input files and catalogue
+    entries as in the previous run) are not reduced again.
+
+    parameters:
+    -----------
+    source_name: str
+        Name of the source to reduce, e.g., "B5"
+    lines: list[tuple[str, str | None]] | None
+        List of (line, qn) pairs to reduce, e.g., [("CO", "1-0"), ("N2H+", "1-0")].
+        If None, all the lines covered by the 30m observations of the source
+        are reduced (see get_30m_lines).
+        If a manifest file is set in the configuration file, input files without
+        observations of the source at the frequency of a line are not read.
+        If a bad_scans file is set in the configuration file, the scans flagged
+        in it (see quality.update_scan_table) are not reduced.
+    scratch_dir: str
+        Folder where the temporary CLASS script is written.
+    force: bool
+        If True, all the lines are reduced even if they are up to date.
+    native: bool
+        If True, the raw files are read directly, and the spectra sharing a velocity
+        axis are cut and baseline subtracted together with NumPy. The reduced spectra
+        are gridded natively into {output file}.fits instead of running CLASS
+        'table' and 'xy_map' (see gridding.grid_30m_file).
+        The raw files must be in the CLASS Type 2 format.
+    returns:
+    --------
+    status: int
+        Exit status of the CLASS session (-1 if it timed out),
+        0 if all the lines are up to date.
     """
     _, source_find, source_out, ra0, dec0, vlsr = get_source_param(source_name)
+    if lines is None:
+        lines = get_30m_lines(source_name)
+    if len(lines) == 0:
+        raise ValueError(f"No lines to reduce for source: {source_name}")
 
     freq_corr = 1 - vlsr / 3e5
     # Get data files list from all input directories
-    inputfiles: list[str] = []
-    for input_dir in inputdir:
-        # Use glob to find all .30m files in each directory
-        files_in_dir = glob(os.path.join(input_dir, "*.30m"))
-        inputfiles.extend(files_in_dir)
-    if len(inputfiles) == 0:
-        raise ValueError(f"No files found in the input directory: {inputdir}")
+    inputfiles = get_30m_inputfiles()
 
-    print(f"[INFO] Found {len(inputfiles)} files in input directories")
-    print(f"[INFO] Reducing line: {line_i} with qn: {qn_i}")
-    index = get_line_param(line_i, qn_i)
-    print(source_out, line_name[index], qn[index])
-    # Get frequency
-    Lid_i = Lid[index]
-    qn_name_i = qn[index]
-    line_name_i = line_name[index]
-    freq_i = freq[index].astype(float) * 1e3
-    dv_base = vel_width_base_30m[index].astype(float)
-    dv = vel_width_30m[index].astype(float)
-    print(vlsr + 0.1, dv + 0.1, dv_base + 0.1)
-    vel_win = "{0:.2f}  {1:.2f}".format(vlsr - dv_base, vlsr + dv_base)
-    vel_ext = "{0:.2f}  {1:.2f}".format(vlsr - dv, vlsr + dv)
-    # Define output
-    file_30m = get_30m_file(source_out, line_name_i, qn_name_i, Lid_i, merge=False)
-    # outputfile = get_30m_file(
-    #     source_out, line_name[index][0], qn[index][0])
-    os.system(f"rm {file_30m[:-4]}.*")
-    fb = tempfile.NamedTemporaryFile(delete=True, mode="w+", dir=".", suffix=".class")
-    fb.write(f"file out {file_30m}  single\n")
-    fb.write("say [INFO] Removing old output file\n")
-    fb.write(f'say "[INFO] Making new output file: {file_30m}"\n')
+    manifest = update_30m_manifest(inputfiles, scratch_dir=scratch_dir)
+    scan_table = update_30m_scan_table(inputfiles)
+
+    # collect the parameters for each line:
+    # (index, output file, vel_ext, vel_win, input files, fingerprint)
+    line_params: list[tuple[int, str, str, str, list[str], str]] = []
+    for line_i, qn_i in lines:
+        print(f"[INFO] Reducing line: {line_i} with qn: {qn_i}")
+        index = get_line_param(line_i, qn_i)
+        print(source_out, settings.line_name[index], settings.qn[index])
+        dv_base = settings.vel_width_base_30m[index].astype(float)
+        dv = settings.vel_width_30m[index].astype(float)
+        vel_win = "{0:.2f}  {1:.2f}".format(vlsr - dv_base, vlsr + dv_base)
+        vel_ext = "{0:.2f}  {1:.2f}".format(vlsr - dv, vlsr + dv)
+        # Define output
+        file_30m = get_30m_file(
+            source_out,
+            settings.line_name[index],
+            settings.qn[index],
+            settings.Lid[index],
+            merge=False,
+        )
+        # only the files that can have data for this line
+        if manifest is None:
+            inputfiles_line = inputfiles
+        else:
+            freq_find = settings.freq[index].astype(float) * 1e3 * freq_corr
+            inputfiles_line = [
+                inputfile
+                for inputfile in inputfiles
+                if file_matches(manifest[inputfile], source_find, freq_find)
+            ]
+        # fingerprint of the reduction of this line
+        script_line = io.StringIO()
+        if native:
+            script_line.write("! native reduction and gridding\n")
+        _script_30m_file(script_line, "", source_find)
+        _script_30m_line(
+            script_line,
+            index,
+            file_30m,
+            vel_ext,
+            vel_win,
+            freq_corr,
+            source_out,
+            ra0,
+            dec0,
+        )
+        _script_30m_grid(script_line, file_30m)
+        rows = [_line_catalogue_row(index), _source_catalogue_row(source_name)]
+        if scan_table is not None:
+            excluded = {name: scan_table[name]["excluded"] for name in inputfiles_line}
+            rows.append(json.dumps(excluded, sort_keys=True))
+        fingerprint_i = fingerprint(script_line.getvalue(), inputfiles_line, rows)
+        if not force and is_up_to_date(file_30m, fingerprint_i):
+            print(f"[INFO] Up to date: {file_30m}")
+            continue
+        line_params.append(
+            (index, file_30m, vel_ext, vel_win, inputfiles_line, fingerprint_i)
+        )
+    if len(line_params) == 0:
+        return 0
+
+    script = io.StringIO()
+    script.write("say [INFO] Removing old output file\n")
+    for _, file_30m, _, _, _, _ in line_params:
+        _remove_outputs([file_30m])
+        if native:
+            continue
+        script.write(f'say "[INFO] Making new output file: {file_30m}"\n')
+        script.write(f"file out {file_30m}  single\n")
+    if native:
+        for index, file_30m, vel_ext, vel_win, inputfiles_line, fp_i in line_params:
+            n_obs = _reduce_30m_native(
+                inputfiles_line,
+                index,
+                file_30m,
+                vel_ext,
+                vel_win,
+                freq_corr,
+                source_find,
+                source_out,
+                ra0,
+                dec0,
+                scan_table=scan_table,
+            )
+            if n_obs == 0:
+                print(f"[WARNING] No spectra to grid for: {file_30m}")
+            else:
+                grid_30m_file(file_30m, f"{file_30m[:-4]}.fits", ra0, dec0)
+            save_fingerprint(file_30m, fp_i)
+        return 0
     ####
     # Loop through files - one file per date
+    n_skipped = 0
     for inputfile in inputfiles:
-        # inputfile = os.path.join(inputdir, input_filename)
-        # check everyfile to be ignored if it is the current file
-        for ignorefile in ignorefiles:
-            if ignorefile in inputfile:
-                fb.write(f'say "[INFO] Ignoring file: {inputfile}"\n')
-                continue
-        fb.write(f'say "[INFO] Processing file: {inputfile}"\n')
-        # Load file and det defaults
-        fb.write(f'file in "{inputfile}"\n')
-        fb.write(f"set source {source_find}\n")
-        fb.write("set offset 0 0\n")
-        fb.write("set angle sec\n")
-        fb.write("set match 500\n")
-        fb.write("set tele *\n")
-        fb.write("set line *\n")
-        # Open and check file
-        # only observations with reference frequency
-        fb.write("find /frequency {0}\n".format(freq_i * freq_corr))
-        fb.write("set mode x auto\n")
-        fb.write("set unit v\n")
-        fb.write("get zero\n")
-        fb.write("sic message class s-i\n")
-        fb.write("for i 1 to found\n")
-        fb.write("  get next\n")
-        fb.write(f"  modify linename {name_str[index]}\n")
-        fb.write(f"  modify freq {freq_i}\n")
-        fb.write(f"  modify source {source_out}\n")
-        # RA and Dec centers are in hrs and degrees, respectively
-        fb.write(f"  modify projection = {ra0/15.0} {dec0} =\n")
-        fb.write("  modify telescope 30M-MRT\n")
-        fb.write(f"  extract {vel_ext} velocity\n")  # cut out spectra
-        fb.write(f"  set window {vel_win}\n")  # define baseline window
-        fb.write("  base 1\n")  # first order baseline
-        fb.write("  write\n")
-        fb.write("next\n")
-        # ! Toggle back screen informational messages
-        fb.write("sic message class s+i\n")
+        # only the lines that can have data in this file
+        line_params_file = [params for params in line_params if inputfile in params[4]]
+        if len(line_params_file) == 0:
+            n_skipped += 1
+            continue
+        _script_30m_file(script, inputfile, source_find)
+        for index, file_30m, vel_ext, vel_win, _, _ in line_params_file:
+            _script_30m_line(
+                script,
+                index,
+                file_30m,
+                vel_ext,
+                vel_win,
+                freq_corr,
+                source_out,
+                ra0,
+                dec0,
+                None if scan_table is None else scan_table.get(inputfile, None),
+            )
+    if n_skipped > 0:
+        print(f"[INFO] Skipped {n_skipped} files without data for the lines")
     # Now process the whole dataset available
     # Regrid and output to fits file
-    print(file_30m)
-    fb.write(f"file in {file_30m}\n")
-    fb.write("find /all\n")
-    fb.write("if found.eq.0 exit\n")
-    fb.write(f"table {file_30m[:-4]} new /nocheck\n")
-    fb.write(f"xy_map {file_30m[:-4]}\n")
-    fb.write("exit\n")
-    fb.flush()
-    os.system(f"rm -f {file_30m}")
-    os.system(f"class -nw @ {fb.name}")
-    fb.close()
+    for _, file_30m, _, _, _, _ in line_params:
+        print(file_30m)
+        _script_30m_grid(script, file_30m)
+    script.write("exit\n")
+    product = _batch_product(
+        source_out, "30m", [file_30m for _, file_30m, _, _, _, _ in line_params]
+    )
+    status = _run_gildas(
+        "class",
+        script.getvalue(),
+        product,
+        scratch_dir,
+        [file_30m for _, file_30m, _, _, _, _ in line_params],
+    )
+    if status == 0:
+        for _, file_30m, _, _, _, fingerprint_i in line_params:
+            save_fingerprint(file_30m, fingerprint_i)
+    return status
+
+
+def _continuum_windows(
+    header: UVHeader, Lid: str, vlsr: float, dv: float | None = None
+) -> tuple[list[int], list[tuple[float, float]]]:
+    """
+    Function to define the line windows of a NOEMA window UV table: every line of
+    the catalogue in the window (Lid) or within its frequency coverage, over
+    [vlsr - width, vlsr + width] around its rest frequency.
+
+    parameters:
+    -----------
+    header: UVHeader
+        Header of the window UV table.
+    Lid: str
+        Window unit for the NOEMA data, e.g., "L09".
+    vlsr: float
+        Velocity of the source in km/s.
+    dv: float | None
+        Velocity width (km/s) used for all the lines, instead of the value from
+        the line catalogue.
+    returns:
+    --------
+    indices: list[int]
+        Line catalogue index of each line.
+    windows: list[tuple[float, float]]
+        Velocity range of each line in the velocity axis of the table (km/s).
+    """
+    catalogue = get_line_catalogue()
+    frequency = header.frequency() * 1e-3
+    in_range = catalogue.in_range(float(np.min(frequency)), float(np.max(frequency)))
+    indices = sorted(set(catalogue.in_window(Lid)) | set(in_range))
+    windows = []
+    for index in indices:
+        width = dv if dv is not None else float(settings.vel_width[index])
+        rchan = change_rest_frequency(
+            header.restf, header.rchan, header.fres, float(settings.freq[index]) * 1e3
+        )
+        # velocity of the table channels minus the one referred to the line
+        shift = (rchan - header.rchan) * header.vres
+        windows.append((vlsr - width + shift, vlsr + width + shift))
+    return [int(index) for index in indices], windows
+
+
+def window_subtract_continuum(
+    source_name: str,
+    Lid: str,
+    selfcal: bool = False,
+    order: int = 0,
+    dv: float | None = None,
+    force: bool = False,
+) -> str:
+    """
+    Function to subtract the continuum of a NOEMA window natively, instead of
+    MAPPING 'uv_baseline order /range ... velocity' with hand-written ranges.
+    The line windows are built from the line catalogue (see _continuum_windows),
+    and the fits are done on the memory-mapped window table in chunks of rows
+    (see uv_table.subtract_continuum).
+    The input is the window file without '_uvsub' in the name, and the output
+    is the one with it (see get_uvt_window).
+
+    parameters:
+    -----------
+    source_name: str
+        Name of the source, e.g., "B5"
+    Lid: str
+        Window unit for the NOEMA data, e.g., "L09".
+    selfcal: bool
+        If True, the window files include '_sc' in the name.
+    order: int
+        Order of the polynomial continuum.
+    dv: float | None
+        Velocity width (km/s) masked around all the lines, [vlsr - dv, vlsr + dv],
+        instead of the value from the line catalogue.
+    force: bool
+        If True, the product is rebuilt even if it is up to date.
+    returns:
+    --------
+    file_contsub: str
+        UV table of the window after subtracting the continuum.
+    """
+    _, _, source_out, _, _, vlsr = get_source_param(source_name)
+    window_uvt = get_uvt_window(source_out, Lid, uvsub=False, selfcal=selfcal)
+    file_contsub = get_uvt_window(source_out, Lid, uvsub=True, selfcal=selfcal)
+    if not os.path.isfile(window_uvt):
+        raise ValueError(f"File not found: {window_uvt}")
+    with UVTable(window_uvt) as table:
+        header = table.header
+    indices, windows = _continuum_windows(header, Lid, vlsr, dv)
+    ranges = " ".join(f"{v_1:.3f} {v_2:.3f}" for v_1, v_2 in windows)
+    script = f"! native\nuv_baseline {order} /range {ranges} velocity\n"
+    catalogue_rows = [_line_catalogue_row(index) for index in indices]
+    catalogue_rows.append(_source_catalogue_row(source_name))
+    fingerprint_i = fingerprint(script, [window_uvt], catalogue_rows)
+    if not force and is_up_to_date(file_contsub, fingerprint_i):
+        print(f"[INFO] Up to date: {file_contsub}")
+        return file_contsub
+    print(f"[INFO] Subtracting the continuum of {window_uvt} ({len(indices)} lines)")
+    subtract_continuum(window_uvt, file_contsub, windows, order=order)
+    save_fingerprint(file_contsub, fingerprint_i)
+    return file_contsub
+
+
+def shift_uvt_batch(
+    source_name: str,
+    file_names: list[str],
+    in_place: bool = False,
+    force: bool = False,
+) -> list[str]:
+    """
+    Function to move the phase centre of several UV tables, e.g., the fields of
+    a mosaic, to the centre of the source in the region catalogue (RA0, Dec0),
+    as MAPPING 'uv_shift ra dec' followed by 'write uv {name}_shift.uvt' does for
+    each of them. The shifts are done natively (see uv_table.shift_phase_center),
+    without a MAPPING session per table.
+
+    parameters:
+    -----------
+    source_name: str
+        Name of the source in the region catalogue, e.g., "NGC1333"
+    file_names: list[str]
+        UV tables to shift.
+    in_place: bool
+        If True, the tables are modified in place (tables already at the centre
+        are not modified). Otherwise, the output of {name}.uvt is {name}_shift.uvt.
+    force: bool
+        If True, the tables are shifted even if the outputs are up to date.
+    returns:
+    --------
+    shifted: list[str]
+        Shifted UV table of each input table.
+    """
+    _, _, _, ra_cat, dec_cat, _ = get_source_param(source_name)
+    ra, dec = np.radians(ra_cat), np.radians(dec_cat)
+    script = f"! native\nuv_shift {ra_cat:.8f} {dec_cat:.8f} degrees\n"
+    catalogue_rows = [_source_catalogue_row(source_name)]
+    shifted = []
+    for file_name in file_names:
+        if not os.path.isfile(file_name):
+            raise ValueError(f"File not found: {file_name}")
+        if in_place:
+            with UVTable(file_name) as table:
+                centre = (table.header.ra, table.header.dec)
+            if not force and np.allclose(centre, (ra, dec), rtol=0.0, atol=1e-10):
+                print(f"[INFO] Already at the phase centre: {file_name}")
+            else:
+                print(f"[INFO] Shifting {file_name}")
+                shift_phase_center(file_name, ra, dec)
+            shifted.append(file_name)
+            continue
+        file_shift = f"{os.path.splitext(file_name)[0]}_shift.uvt"
+        fingerprint_i = fingerprint(script, [file_name], catalogue_rows)
+        if not force and is_up_to_date(file_shift, fingerprint_i):
+            print(f"[INFO] Up to date: {file_shift}")
+        else:
+            print(f"[INFO] Shifting {file_name} into {file_shift}")
+            shift_phase_center(file_name, ra, dec, file_shift)
+            save_fingerprint(file_shift, fingerprint_i)
+        shifted.append(file_shift)
+    return shifted
 
 
 def line_make_uvt(
@@ -459,7 +1494,10 @@ def line_make_uvt(
     dv: float | None = None,
     dv_min: float | None = None,
     dv_max: float | None = None,
-) -> None:
+    scratch_dir: str = ".",
+    force: bool = False,
+    native: bool = False,
+) -> int:
     """
     Function to perform an exision of a targeted molecular line, from NOEMA data already calibrated.
     It will ensure that the 30m data use the correct frequency.
@@ -483,21 +1521,75 @@ def line_make_uvt(
         Minimum velocity difference with respect to vlsr to use for the extraction in km/s. Used only if dv is not defined and if vmax is also provided.
     dv_max: float
         Maximum velocity difference with respect to vlsr to use for the extraction in km/s. Used only if dv is not defined and if vmax is also provided.
+    scratch_dir: str
+        Folder where the temporary MAPPING script is written.
+    force: bool
+        If True, the product is rebuilt even if it is up to date.
+    native: bool
+        If True, the channels are sliced natively from the memory-mapped window
+        table instead of running MAPPING. The window table is not modified.
+    returns:
+    --------
+    status: int
+        Exit status of the MAPPING session (-1 if it timed out),
+        0 if the product is up to date.
     """
     _, _, source_out, _, _, vlsr = get_source_param(source_name)
 
     print(f"[INFO] Reducing line: {line_i} with qn: {qn_i}")
     index = get_line_param(line_i, qn_i)
-    print(source_out, line_name[index], qn[index])
-    # Get frequency
-    Lid_i = Lid[index]
-    qn_name_i = qn[index]
-    line_name_i = line_name[index]
-    freq_i = freq[index].astype(float) * 1e3
+    print(source_out, settings.line_name[index], settings.qn[index])
+    window_uvt, file_uvt, vel_win = _uvt_line_params(
+        index, source_out, vlsr, uvsub, selfcal, dv, dv_min, dv_max
+    )
+    script = _script_uvt_line(index, window_uvt, file_uvt, vel_win, native)
+    catalogue_rows = [_line_catalogue_row(index), _source_catalogue_row(source_name)]
+    fingerprint_i = fingerprint(script, [window_uvt], catalogue_rows)
+    if not force and is_up_to_date(file_uvt, fingerprint_i):
+        print(f"[INFO] Up to date: {file_uvt}")
+        return 0
+    # remove previous version of the file
+    _remove_outputs([file_uvt])
+    if native:
+        _extract_uvt_native(window_uvt, [(index, file_uvt, vel_win)])
+        save_fingerprint(file_uvt, fingerprint_i)
+        return 0
+    status = _run_gildas("mapping", script, file_uvt, scratch_dir, [file_uvt])
+    if status == 0:
+        save_fingerprint(file_uvt, fingerprint_i)
+    return status
+
+
+def _uvt_line_params(
+    index: int,
+    source_out: str,
+    vlsr: float,
+    uvsub: bool,
+    selfcal: bool,
+    dv: float | None,
+    dv_min: float | None,
+    dv_max: float | None,
+) -> tuple[str, str, str]:
+    """
+    Function to define the window file, output file and velocity range of the
+    extraction of a line (see line_make_uvt).
+
+    returns:
+    --------
+    window_uvt: str
+        UV table of the NOEMA window that contains the line.
+    file_uvt: str
+        Output UV table of the line.
+    vel_win: str
+        Velocity range of the extraction, "v_min  v_max" in km/s.
+    """
+    Lid_i = settings.Lid[index]
+    qn_name_i = settings.qn[index]
+    line_name_i = settings.line_name[index]
     if dv is not None:
         dv_window = dv
     else:
-        dv_window = vel_width[index].astype(float)
+        dv_window = settings.vel_width[index].astype(float)
     #
     window_uvt = get_uvt_window(source_out, Lid_i, uvsub=uvsub, selfcal=selfcal)
     file_uvt = get_uvt_file(source_out, line_name_i, qn_name_i, Lid_i, merge=False)
@@ -505,18 +1597,176 @@ def line_make_uvt(
         vel_win = "{0:.2f}  {1:.2f}".format(vlsr - dv_min, vlsr + dv_max)
     else:
         vel_win = "{0:.2f}  {1:.2f}".format(vlsr - dv_window, vlsr + dv_window)
-    # remove previous version of the file
-    os.system(f"rm {file_uvt[:-4]}.*")
-    fb = tempfile.NamedTemporaryFile(delete=True, mode="w+", dir=".", suffix=".map")
-    fb.write(f'modify "{window_uvt}" /frequency {name_str[index]} {freq_i}\n')
-    fb.write(f'let name "{window_uvt[:-4]}"\n')
-    fb.write("let type uvt\n")
-    fb.write("go setup\n")
-    fb.write(f"uv_extract /range {vel_win} velocity\n")
-    fb.write(f'write uv "{file_uvt}" new\n')
-    fb.write("sic message mapping s-i\n")
-    fb.write("sic message mapping s+i\n")
-    fb.write("exit\n")
-    fb.flush()
-    os.system(f"mapping -nw @ {fb.name}")
-    fb.close()
+    return window_uvt, file_uvt, vel_win
+
+
+def _write_uvt_line(
+    script: TextIO, index: int, window_uvt: str, file_uvt: str, vel_win: str
+) -> None:
+    """
+    Function to write the MAPPING commands to extract a line from a window.
+    The rest frequency and the line name are only changed in the UV buffer
+    (SPECIFY), so the window file is never modified and several lines of the
+    same window can be extracted at the same time. The window is loaded once,
+    with 'read uv' only (no 'go setup').
+    """
+    freq_i = settings.freq[index].astype(float) * 1e3
+    script.write(f'read uv "{window_uvt}"\n')
+    script.write(f"specify linename {settings.name_str[index]}\n")
+    script.write(f"specify frequency {freq_i}\n")
+    script.write(f"uv_extract /range {vel_win} velocity\n")
+    script.write(f'write uv "{file_uvt}" new\n')
+
+
+def _script_uvt_line(
+    index: int, window_uvt: str, file_uvt: str, vel_win: str, native: bool
+) -> str:
+    """
+    Function to create the MAPPING script that extracts a single line. It is also
+    the script used to fingerprint the extraction of the line.
+    """
+    script = io.StringIO()
+    if native:
+        script.write("! native extraction\n")
+    _write_uvt_line(script, index, window_uvt, file_uvt, vel_win)
+    script.write("sic message mapping s-i\n")
+    script.write("sic message mapping s+i\n")
+    script.write("exit\n")
+    return script.getvalue()
+
+
+def _extract_uvt_native(
+    window_uvt: str, extractions: list[tuple[int, str, str]]
+) -> None:
+    """
+    Function to extract several lines from a window UV table natively,
+    reading the window once (see uv_table.extract_velocities).
+
+    parameters:
+    -----------
+    window_uvt: str
+        UV table of the NOEMA window.
+    extractions: list[tuple[int, str, str]]
+        (line catalogue index, output file, vel_win) of each line.
+    """
+    for _, file_uvt, _ in extractions:
+        os.makedirs(os.path.dirname(file_uvt) or ".", exist_ok=True)
+    extract_velocities(
+        window_uvt,
+        [
+            (
+                file_uvt,
+                # same (rounded) range as the MAPPING script
+                *map(float, vel_win.split()),
+                settings.freq[index].astype(float) * 1e3,
+                str(settings.name_str[index]),
+            )
+            for index, file_uvt, vel_win in extractions
+        ],
+    )
+
+
+def line_make_uvt_batch(
+    source_name: str,
+    lines: list[tuple[str, str | None]],
+    uvsub: bool = True,
+    selfcal: bool = False,
+    dv: float | None = None,
+    scratch_dir: str = ".",
+    force: bool = False,
+    native: bool = False,
+) -> int:
+    """
+    Function to extract several lines from the NOEMA windows of a source.
+    The lines are grouped by window (Lid), and all the lines of a window are
+    extracted from a single read of the window UV table when native is True,
+    or in a single MAPPING session otherwise.
+    The extraction applied to each line is the same as in line_make_uvt, and
+    lines whose output is up to date are not extracted again.
+
+    parameters:
+    -----------
+    source_name: str
+        Name of the source to reduce, e.g., "B5"
+    lines: list[tuple[str, str | None]]
+        List of (line, qn) pairs to extract, e.g., [("DCO+", "3-2"), ("CCD", None)].
+    uvsub: bool
+        If True, the window files include '_uvsub' in the name.
+    selfcal: bool
+        If True, the window files include '_sc' in the name.
+    dv: float
+        Velocity width to use for the extraction of all the lines,
+        [vlsr - dv, vlsr + dv] in km/s, instead of the value from the line catalogue.
+    scratch_dir: str
+        Folder where the temporary MAPPING script is written.
+    force: bool
+        If True, all the lines are extracted even if they are up to date.
+    native: bool
+        If True, the channels are sliced natively from the memory-mapped window
+        tables instead of running MAPPING. The window tables are not modified.
+    returns:
+    --------
+    status: int
+        Exit status of the MAPPING session (-1 if it timed out),
+        0 if all the lines are up to date.
+    """
+    _, _, source_out, _, _, vlsr = get_source_param(source_name)
+    if len(lines) == 0:
+        raise ValueError(f"No lines to extract for source: {source_name}")
+    catalogue_source = _source_catalogue_row(source_name)
+    # lines to extract, grouped by window:
+    # {window_uvt: [(index, output file, vel_win, fingerprint)]}
+    windows: dict[str, list[tuple[int, str, str, str]]] = {}
+    for line_i, qn_i in lines:
+        print(f"[INFO] Reducing line: {line_i} with qn: {qn_i}")
+        index = get_line_param(line_i, qn_i)
+        print(source_out, settings.line_name[index], settings.qn[index])
+        window_uvt, file_uvt, vel_win = _uvt_line_params(
+            index, source_out, vlsr, uvsub, selfcal, dv, None, None
+        )
+        script_i = _script_uvt_line(index, window_uvt, file_uvt, vel_win, native)
+        catalogue_rows = [_line_catalogue_row(index), catalogue_source]
+        fingerprint_i = fingerprint(script_i, [window_uvt], catalogue_rows)
+        if not force and is_up_to_date(file_uvt, fingerprint_i):
+            print(f"[INFO] Up to date: {file_uvt}")
+            continue
+        windows.setdefault(window_uvt, []).append(
+            (index, file_uvt, vel_win, fingerprint_i)
+        )
+    if len(windows) == 0:
+        return 0
+    for window_params in windows.values():
+        for _, file_uvt, _, _ in window_params:
+            _remove_outputs([file_uvt])
+    if native:
+        for window_uvt, window_params in windows.items():
+            print(f"[INFO] Extracting {len(window_params)} lines from: {window_uvt}")
+            _extract_uvt_native(
+                window_uvt,
+                [
+                    (index, file_uvt, vel_win)
+                    for index, file_uvt, vel_win, _ in window_params
+                ],
+            )
+            for _, file_uvt, _, fingerprint_i in window_params:
+                save_fingerprint(file_uvt, fingerprint_i)
+        return 0
+    script = io.StringIO()
+    for window_uvt, window_params in windows.items():
+        for index, file_uvt, vel_win, _ in window_params:
+            _write_uvt_line(script, index, window_uvt, file_uvt, vel_win)
+    script.write("sic message mapping s-i\n")
+    script.write("sic message mapping s+i\n")
+    script.write("exit\n")
+    outputs = [
+        file_uvt
+        for window_params in windows.values()
+        for _, file_uvt, _, _ in window_params
+    ]
+    product = _batch_product(source_out, "uvt", outputs)
+    status = _run_gildas("mapping", script.getvalue(), product, scratch_dir, outputs)
+    if status == 0:
+        for window_params in windows.values():
+            for _, file_uvt, _, fingerprint_i in window_params:
+                save_fingerprint(file_uvt, fingerprint_i)
+    return status
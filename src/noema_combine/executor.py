@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from . import data_handler
+
+# A job is (function name, source name, line, qn), e.g.
+# ("line_reduce_30m", "B5", "N2H+", "1-0")
+Job = tuple[str, str, str, str | None]
+
+job_functions: list[str] = ["line_reduce_30m", "line_make_uvt", "line_prepare_merge"]
+
+
+def make_jobs(
+    function: str,
+    sources: list[str],
+    lines: list[tuple[str, str | None]] | None = None,
+) -> list[Job]:
+    """
+    Function to generate the list of jobs for all the combinations of sources and lines.
+
+    parameters:
+    -----------
+    function: str
+        Name of the data_handler function to run, e.g., "line_reduce_30m".
+    sources: list[str]
+        Names of the sources in the region catalogue, e.g., ["B5", "NGC1333"]
+    lines: list[tuple[str, str | None]] | None
+        List of (line, qn) pairs. If None, the lines covered by the 30m
+        observations of each source are used (see data_handler.get_30m_lines).
+    returns:
+    --------
+    jobs: list[Job]
+        List of (function, source, line, qn) jobs.
+    """
+    if function not in job_functions:
+        raise ValueError(
+            f"Function '{function}' is not supported, use one of: {job_functions}"
+        )
+    jobs: list[Job] = []
+    for source_name in sources:
+        if lines is None:
+            lines_source = data_handler.get_30m_lines(source_name)
+        else:
+            lines_source = lines
+        for line_i, qn_i in lines_source:
+            jobs.append((function, source_name, line_i, qn_i))
+    return jobs
+
+
+def run_job(job: Job, scratch_root: str = ".") -> int:
+    """
+    Function to run a single job in its own scratch directory.
+    The scratch directory holds the temporary GILDAS script and is removed
+    once the job is finished.
+
+    parameters:
+    -----------
+    job: Job
+        (function, source, line, qn) to run.
+    scratch_root: str
+        Folder where the scratch directory of the job is created.
+    returns:
+    --------
+    status: int
+        Exit status of the GILDAS session, or -1 if the job raised an error.
+    """
+    function, source_name, line_i, qn_i = job
+    scratch_dir = tempfile.mkdtemp(prefix=f"{function}_", dir=scratch_root)
+    try:
+        status = getattr(data_handler, function)(
+            source_name, line_i, qn_i, scratch_dir=scratch_dir
+        )
+    except Exception as error:
+        print(f"[ERROR] Job {job} failed: {error}")
+        status = -1
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return status
+
+
+def run_jobs(
+    jobs: list[Job], n_workers: int | None = None, scratch_root: str = "."
+) -> list[tuple[Job, int]]:
+    """
+    Function to run a list of jobs over a pool of worker processes.
+    Each job runs its GILDAS session in a separate scratch directory.
+    Duplicated jobs are only run once, since they would write the same products.
+    The manifest and the table of bad scans of the raw 30m files are updated
+    before the jobs are dispatched.
+
+    parameters:
+    -----------
+    jobs: list[Job]
+        List of (function, source, line, qn) jobs, e.g., from make_jobs.
+    n_workers: int | None
+        Number of worker processes. If None, the number of CPUs is used.
+        If 1, the jobs are run sequentially in the current process.
+    scratch_root: str
+        Folder where the scratch directories of the jobs are created.
+    returns:
+    --------
+    results: list[tuple[Job, int]]
+        List of (job, exit status) in the same order as the unique jobs.
+    """
+    unique_jobs = list(dict.fromkeys(jobs))
+    for function, _, _, _ in unique_jobs:
+        if function not in job_functions:
+            raise ValueError(
+                f"Function '{function}' is not supported, use one of: {job_functions}"
+            )
+    if not os.path.exists(scratch_root):
+        os.makedirs(scratch_root)
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if any(function == "line_reduce_30m" for function, _, _, _ in unique_jobs):
+        # shared by all the jobs, which then only read it
+        try:
+            inputfiles = data_handler.get_30m_inputfiles()
+            data_handler.update_30m_manifest(inputfiles, scratch_dir=scratch_root)
+            data_handler.update_30m_scan_table(inputfiles)
+        except ValueError as error:
+            print(f"[WARNING] Raw 30m files not indexed: {error}")
+    print(f"[INFO] Running {len(unique_jobs)} jobs with {n_workers} workers")
+    if n_workers == 1:
+        status = [run_job(job, scratch_root) for job in unique_jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            status = list(
+                pool.map(run_job, unique_jobs, [scratch_root] * len(unique_jobs))
+            )
+    results = list(zip(unique_jobs, status))
+    n_failed = sum(1 for _, status_i in results if status_i != 0)
+    if n_failed > 0:
+        print(f"[WARNING] {n_failed} of {len(results)} jobs failed")
+    return results
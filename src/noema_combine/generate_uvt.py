@@ -1,8 +1,13 @@
-# import os
-from typing import TextIO, List, Dict, Any
+import io
+import json
+import os
+from typing import TextIO, List, Dict, Any, Optional, Tuple
 import yaml
 from datetime import datetime
 
+from .build_cache import fingerprint
+from .uv_table import append_uv_tables
+
 
 def make_header(file: TextIO) -> None:
     header = datetime.today().strftime("%Y-%m-%d")
@@ -20,14 +25,16 @@ def make_header(file: TextIO) -> None:
     return
 
 
-def make_uvt_names(sources: list[str], config: str) -> list[str]:
+def make_uvt_names(
+    sources: list[str], config: str, root: str = "../../uvts"
+) -> list[str]:
     # check that sources contains exactly two elements and that they are strings
     if len(sources) != 2:
         raise ValueError("Sources list must contain exactly two elements.")
 
     uvt_out = [
-        f"../../uvts/{sources[0]}/{config}config/{sources[0]}_{config}",
-        f"../../uvts/{sources[1]}/{config}config/{sources[1]}_{config}",
+        f"{root}/{sources[0]}/{config}config/{sources[0]}_{config}",
+        f"{root}/{sources[1]}/{config}config/{sources[1]}_{config}",
     ]
     return uvt_out
 
@@ -98,12 +105,21 @@ def calibration_type(
     return
 
 
-def look_spw(file: TextIO, high_res_parameters: Dict[str, int]) -> None:
+def look_spw(
+    file: TextIO,
+    high_res_parameters: Dict[str, int],
+    chunks: Optional[List[str]] = None,
+) -> None:
     # Get parameters with defaults from clic configuration file if not provided
     number_windows = high_res_parameters.get("number_windows", 38)
     LI_start = high_res_parameters.get("LI_start", 23)
     UI_start = high_res_parameters.get("UI_start", 32)
     UO_start = high_res_parameters.get("UO_start", 40)
+    # only the chunks in the list are made (see chunk_names), all if None
+    if chunks is None:
+        selected = set(chunk_names(high_res_parameters))
+    else:
+        selected = set(chunks)
     sb = "lsb"
     file.write("!\n")
     file.write("begin procedure loopspw\n")
@@ -111,19 +127,23 @@ def look_spw(file: TextIO, high_res_parameters: Dict[str, int]) -> None:
     file.write("!\n")
     file.write("!!!!!!!!! Wideband chunks\n")
     file.write("!\n")
-    file.write("  set selection line lsb l001 and l005 \n")
-    file.write("  @ makespw lo\n")
-    file.write("  !\n")
-    file.write("  set selection line lsb l002 and l006 \n")
-    file.write("  @ makespw li\n")
-    file.write("  !\n")
-    file.write("  !\n")
-    file.write("  set selection line usb l003 and l007 \n")
-    file.write("  @ makespw ui\n")
-    file.write("  !\n")
-    file.write("  set selection line usb l004 and l008 \n")
-    file.write("  @ makespw uo\n")
+    if "lo" in selected:
+        file.write("  set selection line lsb l001 and l005 \n")
+        file.write("  @ makespw lo\n")
+        file.write("  !\n")
+    if "li" in selected:
+        file.write("  set selection line lsb l002 and l006 \n")
+        file.write("  @ makespw li\n")
+        file.write("  !\n")
     file.write("  !\n")
+    if "ui" in selected:
+        file.write("  set selection line usb l003 and l007 \n")
+        file.write("  @ makespw ui\n")
+        file.write("  !\n")
+    if "uo" in selected:
+        file.write("  set selection line usb l004 and l008 \n")
+        file.write("  @ makespw uo\n")
+        file.write("  !\n")
     file.write("  !!!!!!!!! LO chunks\n")
     file.write("  !\n")
     for i in range(9, number_windows + 9 + 1):
@@ -140,6 +160,8 @@ def look_spw(file: TextIO, high_res_parameters: Dict[str, int]) -> None:
             file.write("  !\n")
             file.write("  !!!!!!!!! UO chunks\n")
             file.write("  !\n")
+        if f"l{i:03}l{i + number_windows + 1:03}" not in selected:
+            continue
         file.write(
             f"  set selection line {sb} l{i:03} and l{i + number_windows + 1:03} \n"
         )
@@ -149,6 +171,18 @@ def look_spw(file: TextIO, high_res_parameters: Dict[str, int]) -> None:
     return
 
 
+def partition_chunks(chunks: List[str], n_parts: int) -> List[List[str]]:
+    """
+    Split the chunks into n_parts lists of similar length, to be tabled by
+    separate CLIC processes. The chunks are dealt in turn to each part, so that
+    the wideband chunks are spread over the first parts.
+    """
+    if n_parts < 1:
+        raise ValueError(f"Number of parts must be at least 1, not {n_parts}")
+    parts = [chunks[k::n_parts] for k in range(n_parts)]
+    return [part for part in parts if len(part) > 0]
+
+
 def prepare_config(
     setup_name: str,
     sources: list[str],
@@ -156,14 +190,149 @@ def prepare_config(
     hpb_dict: List[Dict[str, Any]],
     high_res_parameters: Dict[str, int],
     config: str = "C",
-) -> None:
+    uvt_root: str = "../../uvts",
+    script_dir: str = ".",
+    chunks: Optional[List[str]] = None,
+    part: Optional[int] = None,
+    append: bool = False,
+) -> str:
     #
     print(f"Creating {config} configuration CLIC file for {setup_name}")
-    file_out = open(f"{setup_name}-{config}-uvts.clic", "w")
+    script = build_config_script(
+        sources,
+        receiver,
+        hpb_dict,
+        high_res_parameters,
+        config=config,
+        uvt_root=uvt_root,
+        chunks=chunks,
+        append=append,
+    )
+    return write_scripts({script_name(setup_name, config, part): script}, script_dir)[0]
+
+
+def script_name(setup_name: str, config: str, part: Optional[int] = None) -> str:
+    """
+    Name of the CLIC script of a configuration, or of one of its parts.
+    """
+    if part is None:
+        return f"{setup_name}-{config}-uvts.clic"
+    return f"{setup_name}-{config}-uvts-p{part}.clic"
+
+
+def build_config_script(
+    sources: list[str],
+    receiver: str,
+    hpb_dict: List[Dict[str, Any]],
+    high_res_parameters: Dict[str, int],
+    config: str = "C",
+    uvt_root: str = "../../uvts",
+    chunks: Optional[List[str]] = None,
+    append: bool = False,
+) -> str:
+    """
+    Build the CLIC script of a configuration in memory (see prepare_config).
+    """
+    script = io.StringIO()
+    _write_config(
+        script,
+        sources,
+        receiver,
+        hpb_dict,
+        high_res_parameters,
+        make_uvt_names(sources, config, root=uvt_root),
+        chunks,
+        append,
+    )
+    return script.getvalue()
+
+
+def write_scripts(scripts: Dict[str, str], script_dir: str = ".") -> List[str]:
+    """
+    Write a set of scripts into a folder at once: all the scripts are written
+    to temporary files first, and only renamed to their final names once all
+    of them have been written, so that a failure does not leave a partial set.
+
+    parameters:
+    -----------
+    scripts: Dict[str, str]
+        Text of each script, by file name.
+    script_dir: str
+        Folder where the scripts are written. It is created if needed.
+    returns:
+    --------
+    script_files: List[str]
+        Path of each script written.
+    """
+    os.makedirs(script_dir, exist_ok=True)
+    tmp_files: List[str] = []
+    try:
+        for name, script in scripts.items():
+            tmp_file = os.path.join(script_dir, f".{name}.tmp")
+            tmp_files.append(tmp_file)
+            with open(tmp_file, "w") as f:
+                f.write(script)
+    except BaseException:
+        for tmp_file in tmp_files:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        raise
+    script_files = [os.path.join(script_dir, name) for name in scripts]
+    for tmp_file, script_file in zip(tmp_files, script_files):
+        os.replace(tmp_file, script_file)
+    return script_files
+
+
+def prepare_config_parts(
+    setup_name: str,
+    sources: list[str],
+    receiver: str,
+    hpb_dict: List[Dict[str, Any]],
+    high_res_parameters: Dict[str, int],
+    n_parts: int,
+    config: str = "C",
+    uvt_root: str = "../../uvts",
+    script_dir: str = ".",
+) -> List[str]:
+    """
+    Write the CLIC script of a configuration split into n_parts scripts,
+    {setup}-{config}-uvts-p{k}.clic. Each script has the same calibration
+    blocks, and tables a subset of the chunks (see partition_chunks), so the
+    scripts can run at the same time and write different uv-tables.
+    """
+    parts = partition_chunks(chunk_names(high_res_parameters), n_parts)
+    return [
+        prepare_config(
+            setup_name=setup_name,
+            sources=sources,
+            receiver=receiver,
+            hpb_dict=hpb_dict,
+            high_res_parameters=high_res_parameters,
+            config=config,
+            uvt_root=uvt_root,
+            script_dir=script_dir,
+            chunks=chunks,
+            part=k,
+        )
+        for k, chunks in enumerate(parts)
+    ]
+
+
+def _write_config(
+    file_out: TextIO,
+    sources: list[str],
+    receiver: str,
+    hpb_dict: List[Dict[str, Any]],
+    high_res_parameters: Dict[str, int],
+    uvt_names: list[str],
+    chunks: Optional[List[str]] = None,
+    append: bool = False,
+) -> None:
     make_header(file_out)
-    uvt_names = make_uvt_names(sources, config)
+    if append:
+        file_out.write("!\n! append to the existing uv-tables\nlet new_file 0\n!\n")
     print_makespw(file_out, uvt_names, sources)
-    look_spw(file_out, high_res_parameters)
+    look_spw(file_out, high_res_parameters, chunks)
     for i, entry in enumerate(hpb_dict):
         file_name = entry.get("file", None)
         if file_name is None:
@@ -183,110 +352,431 @@ def prepare_config(
     return
 
 
-def process_source(setup_name: str, config_path: str = "clic_config_MIOP.yaml") -> None:
-    # Load configuration from YAML file
+def chunk_names(high_res_parameters: Dict[str, int]) -> List[str]:
+    """
+    Names of the chunk uv-tables written by the loopspw procedure (see look_spw),
+    e.g., ["lo", "li", "ui", "uo", "l009l048", ...].
+    """
+    number_windows = high_res_parameters.get("number_windows", 38)
+    names = ["lo", "li", "ui", "uo"]
+    for i in range(9, number_windows + 9 + 1):
+        names.append(f"l{i:03}l{i + number_windows + 1:03}")
+    return names
+
+
+# Single configurations, and the configurations combined from them
+# (in the order their files are calibrated)
+single_configs: List[str] = ["A", "B", "C", "D"]
+combined_configs: Dict[str, List[str]] = {
+    "CD": ["C", "D"],
+    "BCD": ["B", "C", "D"],
+    "ACD": ["C", "D", "A"],
+    "ABCD": ["A", "B", "C", "D"],
+}
+
+
+def clic_run_plan(
+    setup: Dict[str, Any], merge: bool = False
+) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, List[str]]]:
+    """
+    Work out the CLIC scripts needed for a setup.
+    A combined configuration is produced when all its single configurations
+    have files. Without merge, each combination is a CLIC run over the files of
+    all its configurations, so each hpb file is calibrated once per product.
+    With merge, only the single configurations are run in CLIC, and each
+    combination is built afterwards by appending their chunk uv-tables
+    (see merge_configurations).
+
+    returns:
+    --------
+    clic_runs: Dict[str, List[Dict[str, Any]]]
+        hpb entries to calibrate for each configuration run in CLIC.
+    merges: Dict[str, List[str]]
+        Single configurations appended to build each combined configuration.
+    """
+    files = {config: setup.get(f"{config}-files", []) for config in single_configs}
+    clic_runs = {
+        config: files[config] for config in single_configs if len(files[config]) > 0
+    }
+    merges: Dict[str, List[str]] = {}
+    for config, components in combined_configs.items():
+        if not all(component in clic_runs for component in components):
+            continue
+        if merge:
+            merges[config] = components
+        else:
+            clic_runs[config] = [
+                entry for component in components for entry in files[component]
+            ]
+    return clic_runs, merges
+
+
+def load_config(config_path: str) -> Dict[str, Any]:
+    """
+    Load the CLIC configuration file, with the C YAML parser when available.
+    """
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     with open(config_path, "r") as f:
-        config = yaml.safe_load(f)
-    # NOEMA Band 1 (3mm), Band 2 (2mm), Band 3 (1mm)
-    receiver = config.get("receiver", 3)
-    print(f"Using receiver: {receiver}")
+        return yaml.load(f, Loader=loader)
+
 
+def load_setup(
+    setup_name: str, config_path: str
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    # Load configuration from YAML file
+    config = load_config(config_path)
     setups = config.get("setups", {})
     setup = setups.get(setup_name, None)
     if not setup:
         print(f"No configuration found for setup: {setup_name}")
+        return config, None
+    return config, setup
+
+
+def process_source(
+    setup_name: str,
+    config_path: str = "clic_config_MIOP.yaml",
+    merge: bool = False,
+    n_parts: int = 1,
+    append: bool = False,
+) -> None:
+    config, setup = load_setup(setup_name, config_path)
+    # NOEMA Band 1 (3mm), Band 2 (2mm), Band 3 (1mm)
+    receiver = config.get("receiver", 3)
+    print(f"Using receiver: {receiver}")
+    if not setup:
         return
     high_res_parameters = config.get("highres_parameters", {})
     sources = setup.get("sources", [])
-    Afiles = setup.get("A-files", [])
-    Bfiles = setup.get("B-files", [])
-    Cfiles = setup.get("C-files", [])
-    Dfiles = setup.get("D-files", [])
-    do_Aconf = len(Afiles) > 0
-    do_Bconf = len(Bfiles) > 0
-    do_Cconf = len(Cfiles) > 0
-    do_Dconf = len(Dfiles) > 0
     #
-    # open an ascii file for writeout
-    # Create CLIC files for C, D, CD, and ACD configurations
+    # Create CLIC files for the single configurations (A, B, C, D), and for their
+    # combinations (CD, BCD, ACD, ABCD) unless they are merged afterwards
     #
-    if do_Aconf:
-        prepare_config(
-            setup_name=setup_name,
-            sources=sources,
-            receiver=receiver,
-            hpb_dict=Afiles,
-            config="A",
-            high_res_parameters=high_res_parameters,
+    # With n_parts > 1, each configuration is split into n_parts scripts that
+    # table different chunks (see partition_chunks)
+    # With append, the scripts only append the hpb files not tabled yet
+    # (see prepare_config_append)
+    #
+    clic_runs, merges = clic_run_plan(setup, merge=merge)
+    if not append:
+        write_scripts(build_setup_scripts(setup_name, config, merge, n_parts))
+    for config_i, hpb_dict in clic_runs.items() if append else []:
+        if n_parts > 1:
+            parts: List[Optional[List[str]]] = list(
+                partition_chunks(chunk_names(high_res_parameters), n_parts)
+            )
+        else:
+            parts = [None]
+        for k, chunks in enumerate(parts):
+            prepare_config_append(
+                setup_name=setup_name,
+                sources=sources,
+                receiver=receiver,
+                hpb_dict=hpb_dict,
+                high_res_parameters=high_res_parameters,
+                config=config_i,
+                chunks=chunks,
+                part=None if chunks is None else k,
+            )
+        print(
+            f"Run record_tabled for the {config_i} configuration "
+            "once its CLIC scripts have run"
         )
-    if do_Bconf:
-        prepare_config(
-            setup_name=setup_name,
-            sources=sources,
-            receiver=receiver,
-            hpb_dict=Bfiles,
-            config="B",
-            high_res_parameters=high_res_parameters,
+    for config_i, components in merges.items():
+        print(
+            f"{config_i} configuration will be merged from {components} "
+            "(run merge_configurations after CLIC)"
         )
+    return
 
-    if do_Cconf:
-        prepare_config(
-            setup_name=setup_name,
-            sources=sources,
-            receiver=receiver,
-            hpb_dict=Cfiles,
-            config="C",
-            high_res_parameters=high_res_parameters,
-        )
 
-    if do_Dconf:
-        prepare_config(
-            setup_name=setup_name,
-            sources=sources,
-            receiver=receiver,
-            hpb_dict=Dfiles,
-            config="D",
-            high_res_parameters=high_res_parameters,
-        )
-    # now combine configurations if more than one is present
-    if do_Cconf and do_Dconf:
-        prepare_config(
-            setup_name=setup_name,
-            sources=sources,
-            receiver=receiver,
-            hpb_dict=Cfiles + Dfiles,
-            config="CD",
-            high_res_parameters=high_res_parameters,
-        )
+def build_setup_scripts(
+    setup_name: str,
+    config: Dict[str, Any],
+    merge: bool = False,
+    n_parts: int = 1,
+    uvt_root: str = "../../uvts",
+) -> Dict[str, str]:
+    """
+    Build in memory the CLIC scripts of a setup (see process_source).
 
-    if do_Bconf and do_Cconf and do_Dconf:
-        prepare_config(
-            setup_name=setup_name,
-            sources=sources,
-            receiver=receiver,
-            hpb_dict=Bfiles + Cfiles + Dfiles,
-            config="BCD",
-            high_res_parameters=high_res_parameters,
+    parameters:
+    -----------
+    setup_name: str
+        Name of the setup in the configuration, e.g., "setup001".
+    config: Dict[str, Any]
+        Configuration, as loaded from the YAML file.
+    merge: bool
+        If True, no scripts are built for the combined configurations.
+    n_parts: int
+        Number of scripts each configuration is split into.
+    uvt_root: str
+        Folder of the uv-tables (see make_uvt_names).
+    returns:
+    --------
+    scripts: Dict[str, str]
+        Text of each script, by file name.
+    """
+    setup = config.get("setups", {}).get(setup_name, None)
+    if not setup:
+        raise ValueError(f"No configuration found for setup: {setup_name}")
+    receiver = config.get("receiver", 3)
+    high_res_parameters = config.get("highres_parameters", {})
+    sources = setup.get("sources", [])
+    if n_parts > 1:
+        parts: List[Optional[List[str]]] = list(
+            partition_chunks(chunk_names(high_res_parameters), n_parts)
         )
+    else:
+        parts = [None]
+    clic_runs, _ = clic_run_plan(setup, merge=merge)
+    scripts: Dict[str, str] = {}
+    for config_i, hpb_dict in clic_runs.items():
+        print(f"Creating {config_i} configuration CLIC file for {setup_name}")
+        for k, chunks in enumerate(parts):
+            name = script_name(setup_name, config_i, None if chunks is None else k)
+            scripts[name] = build_config_script(
+                sources,
+                receiver,
+                hpb_dict,
+                high_res_parameters,
+                config=config_i,
+                uvt_root=uvt_root,
+                chunks=chunks,
+            )
+    return scripts
 
-    if do_Aconf and do_Cconf and do_Dconf:
-        prepare_config(
-            setup_name=setup_name,
-            sources=sources,
-            receiver=receiver,
-            hpb_dict=Cfiles + Dfiles + Afiles,
-            config="ACD",
-            high_res_parameters=high_res_parameters,
-        )
 
-    if do_Aconf and do_Bconf and do_Cconf and do_Dconf:
-        prepare_config(
-            setup_name=setup_name,
-            sources=sources,
-            receiver=receiver,
-            hpb_dict=Afiles + Bfiles + Cfiles + Dfiles,
-            config="ABCD",
-            high_res_parameters=high_res_parameters,
-        )
+def process_all_setups(
+    config_path: str = "clic_config_MIOP.yaml",
+    script_dir: str = ".",
+    merge: bool = False,
+    n_parts: int = 1,
+) -> List[str]:
+    """
+    Write the CLIC scripts of all the setups in the configuration file
+    (see process_source). All the scripts are built in memory and written at
+    once into script_dir (see write_scripts).
 
-    return
+    returns:
+    --------
+    script_files: List[str]
+        Path of each script written.
+    """
+    config = load_config(config_path)
+    print(f"Using receiver: {config.get('receiver', 3)}")
+    scripts: Dict[str, str] = {}
+    for setup_name in config.get("setups", {}):
+        scripts.update(build_setup_scripts(setup_name, config, merge, n_parts))
+    return write_scripts(scripts, script_dir)
+
+
+def merge_configurations(
+    setup_name: str,
+    config_path: str = "clic_config_MIOP.yaml",
+    configs: Optional[List[str]] = None,
+    uvt_root: str = "../../uvts",
+) -> List[str]:
+    """
+    Build the combined configurations of a setup by appending the chunk
+    uv-tables of its single configurations, already produced by CLIC
+    (see process_source with merge=True), instead of calibrating the hpb files
+    again.
+
+    parameters:
+    -----------
+    setup_name: str
+        Name of the setup in the configuration file, e.g., "setup001".
+    config_path: str
+        Path to the configuration file.
+    configs: Optional[List[str]]
+        Combined configurations to build, e.g., ["CD"]. If None, all the
+        combinations available for the setup are built.
+    uvt_root: str
+        Folder of the uv-tables (see make_uvt_names).
+    returns:
+    --------
+    uvt_files: List[str]
+        uv-tables written.
+    """
+    config, setup = load_setup(setup_name, config_path)
+    if not setup:
+        return []
+    high_res_parameters = config.get("highres_parameters", {})
+    sources = setup.get("sources", [])
+    _, merges = clic_run_plan(setup, merge=True)
+    if configs is not None:
+        merges = {
+            config_i: components
+            for config_i, components in merges.items()
+            if config_i in configs
+        }
+    chunks = chunk_names(high_res_parameters)
+    uvt_files: List[str] = []
+    for config_i, components in merges.items():
+        print(f"Merging {components} into {config_i} configuration for {setup_name}")
+        uvt_out = make_uvt_names(sources, config_i, root=uvt_root)
+        uvt_in = [
+            make_uvt_names(sources, component, root=uvt_root)
+            for component in components
+        ]
+        for k in range(len(sources)):
+            os.makedirs(os.path.dirname(uvt_out[k]), exist_ok=True)
+            for chunk in chunks:
+                inputs = [f"{names[k]}_{chunk}.uvt" for names in uvt_in]
+                missing = [name for name in inputs if not os.path.isfile(name)]
+                if len(missing) > 0:
+                    raise ValueError(
+                        f"Missing single-configuration uv-tables: {missing}"
+                    )
+                append_uv_tables(inputs, f"{uvt_out[k]}_{chunk}.uvt")
+                uvt_files.append(f"{uvt_out[k]}_{chunk}.uvt")
+    return uvt_files
+
+
+def state_file(setup_name: str, config: str, state_dir: str = ".") -> str:
+    """
+    Name of the file recording the hpb files already tabled for a configuration.
+    """
+    return os.path.join(state_dir, f"{setup_name}-{config}-uvts.state.json")
+
+
+def read_tabled_state(file_name: str) -> Dict[str, str]:
+    """
+    Read the hpb files already tabled, as {hpb file: fingerprint}.
+    A missing state file means that nothing has been tabled.
+    """
+    if not os.path.isfile(file_name):
+        return {}
+    with open(file_name, "r") as f:
+        return json.load(f).get("files", {})
+
+
+def hpb_fingerprint(
+    entry: Dict[str, Any],
+    receiver: str,
+    uvt_names: list[str],
+    high_res_parameters: Dict[str, int],
+) -> str:
+    """
+    Fingerprint of tabling one hpb file: its calibration, the uv-tables and
+    chunks it is tabled into, and the state of the hpb file on disk.
+    """
+    file_name = entry["file"]
+    calibration = io.StringIO()
+    calibration_type(
+        calibration,
+        receiver,
+        file_name,
+        entry.get("phase calibration type", "antenna"),
+        entry.get("amplitude calibration type", "antenna"),
+        entry.get("RF calibration type", "antenna"),
+    )
+    # CLIC adds the .hpb extension when it is not given
+    hpb_file = file_name if os.path.isfile(file_name) else f"{file_name}.hpb"
+    script = "\n".join(
+        [calibration.getvalue()] + uvt_names + chunk_names(high_res_parameters)
+    )
+    return fingerprint(script, [hpb_file], [])
+
+
+def record_tabled(
+    setup_name: str,
+    sources: list[str],
+    receiver: str,
+    hpb_dict: List[Dict[str, Any]],
+    high_res_parameters: Dict[str, int],
+    config: str = "C",
+    uvt_root: str = "../../uvts",
+    state_dir: str = ".",
+) -> None:
+    """
+    Record the hpb files of a configuration as tabled, once its CLIC script
+    has run successfully (see prepare_config_append).
+    """
+    uvt_names = make_uvt_names(sources, config, root=uvt_root)
+    files = {
+        entry["file"]: hpb_fingerprint(entry, receiver, uvt_names, high_res_parameters)
+        for entry in hpb_dict
+        if entry.get("file", None) is not None
+    }
+    file_name = state_file(setup_name, config, state_dir)
+    tmp_file = f"{file_name}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump({"uv-tables": uvt_names, "files": files}, f, indent=2)
+    os.replace(tmp_file, file_name)
+
+
+def prepare_config_append(
+    setup_name: str,
+    sources: list[str],
+    receiver: str,
+    hpb_dict: List[Dict[str, Any]],
+    high_res_parameters: Dict[str, int],
+    config: str = "C",
+    uvt_root: str = "../../uvts",
+    script_dir: str = ".",
+    state_dir: str = ".",
+    chunks: Optional[List[str]] = None,
+    part: Optional[int] = None,
+) -> Optional[str]:
+    """
+    Write the CLIC script of a configuration that only appends the hpb files
+    not tabled yet (see record_tabled) to the existing chunk uv-tables.
+    The whole configuration is tabled again (as prepare_config does) if an
+    already tabled file changed, was removed from the list, or if a chunk
+    uv-table is missing.
+
+    returns:
+    --------
+    script_file: Optional[str]
+        CLIC script to run, or None if all the files are already tabled.
+    """
+    uvt_names = make_uvt_names(sources, config, root=uvt_root)
+    tabled = read_tabled_state(state_file(setup_name, config, state_dir))
+    entries = [entry for entry in hpb_dict if entry.get("file", None) is not None]
+    current = {
+        entry["file"]: hpb_fingerprint(entry, receiver, uvt_names, high_res_parameters)
+        for entry in entries
+    }
+    if chunks is None:
+        chunks = chunk_names(high_res_parameters)
+    missing_tables = [
+        name
+        for name in uvt_names
+        for chunk in chunks
+        if not os.path.isfile(f"{name}_{chunk}.uvt")
+    ]
+    changed = [
+        file_name
+        for file_name, fingerprint_i in tabled.items()
+        if current.get(file_name, None) != fingerprint_i
+    ]
+    if len(tabled) == 0 or len(changed) > 0 or len(missing_tables) > 0:
+        if len(tabled) > 0:
+            print(
+                f"Warning: {config} configuration of {setup_name} is tabled again "
+                f"(changed files: {changed}, missing uv-tables: {len(missing_tables)})"
+            )
+        new_entries = entries
+        append = False
+    else:
+        new_entries = [entry for entry in entries if entry["file"] not in tabled]
+        append = True
+    if len(new_entries) == 0:
+        print(f"{config} configuration of {setup_name} is up to date")
+        return None
+    print(f"Tabling {len(new_entries)} of {len(entries)} files (append: {append})")
+    return prepare_config(
+        setup_name=setup_name,
+        sources=sources,
+        receiver=receiver,
+        hpb_dict=new_entries,
+        high_res_parameters=high_res_parameters,
+        config=config,
+        uvt_root=uvt_root,
+        script_dir=script_dir,
+        chunks=chunks,
+        part=part,
+        append=append,
+    )
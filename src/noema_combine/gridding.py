@@ -0,0 +1,441 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .baseline import change_rest_frequency, resample_spectra
+from .class_file import ClassFile, spectrum_weights
+
+# 30m beam (FWHM, arcsec) at frequency f (GHz): beam_30m / f
+beam_30m = 2460.0
+# fraction of the beam used by default for the kernel FWHM and the pixel size,
+# as in CLASS xy_map
+kernel_beam_fraction = 1.0 / 3.0
+pixel_beam_fraction = 1.0 / 4.0
+# default support radius of the kernel, in units of the kernel FWHM
+support_fwhm = 1.5
+fwhm_to_sigma = 1.0 / np.sqrt(8.0 * np.log(2.0))
+# memory (bytes) used by each thread for a chunk of channels
+chunk_bytes = 256 * 1024**2
+arcsec = np.pi / (180.0 * 3600.0)
+
+
+def grid_axes(
+    x: NDArray[np.float64],
+    y: NDArray[np.float64],
+    pixel: float,
+    margin: float = 0.0,
+) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Function to define a regular grid covering a set of offsets.
+    The x axis decreases with the pixel index, as Right Ascension in a map,
+    and both axes include the offset (0, 0) at a pixel centre.
+
+    parameters:
+    -----------
+    x, y: NDArray[np.float64]
+        Offsets of the spectra.
+    pixel: float
+        Pixel size, in the same units as the offsets.
+    margin: float
+        Extra space added around the offsets.
+    returns:
+    --------
+    x_axis, y_axis: NDArray[np.float64]
+        Offset of the centre of each pixel column and row.
+    """
+    i_min = int(np.floor((np.min(x) - margin) / pixel))
+    i_max = int(np.ceil((np.max(x) + margin) / pixel))
+    j_min = int(np.floor((np.min(y) - margin) / pixel))
+    j_max = int(np.ceil((np.max(y) + margin) / pixel))
+    x_axis = np.arange(i_max, i_min - 1, -1) * pixel
+    y_axis = np.arange(j_min, j_max + 1) * pixel
+    return x_axis, y_axis
+
+
+def kernel_pairs(
+    x: NDArray[np.float64],
+    y: NDArray[np.float64],
+    x_axis: NDArray[np.float64],
+    y_axis: NDArray[np.float64],
+    pixel: float,
+    kernel_fwhm: float,
+    support: float,
+    weights: NDArray[np.float64] | None = None,
+) -> tuple[NDArray[np.int64], NDArray[np.int64], NDArray[np.float64]]:
+    """
+    Function to find the pixels reached by each spectrum, and the kernel weight
+    of each (pixel, spectrum) pair.
+    Each spectrum is assigned to its nearest pixel, and only the pixels within
+    the support radius around it are evaluated. The pairs are returned sorted
+    by pixel, so that the contributions to each pixel are contiguous.
+
+    returns:
+    --------
+    pixel_index: NDArray[np.int64]
+        Flattened pixel index (row * nx + column) of each pair, sorted.
+    spectrum_index: NDArray[np.int64]
+        Spectrum of each pair.
+    pair_weight: NDArray[np.float64]
+        Kernel weight, times the spectrum weight, of each pair.
+    """
+    nx, ny = len(x_axis), len(y_axis)
+    # nearest pixel of each spectrum (x decreases with the column)
+    column = np.rint((x_axis[0] - x) / pixel).astype(np.int64)
+    row = np.rint((y - y_axis[0]) / pixel).astype(np.int64)
+    radius = int(np.ceil(support / pixel))
+    sigma = kernel_fwhm * fwhm_to_sigma
+    spectra = np.arange(len(x))
+    pixel_parts: list[NDArray[np.int64]] = []
+    spectrum_parts: list[NDArray[np.int64]] = []
+    weight_parts: list[NDArray[np.float64]] = []
+    for d_row in range(-radius, radius + 1):
+        for d_col in range(-radius, radius + 1):
+            col_i = column + d_col
+            row_i = row + d_row
+            inside = (col_i >= 0) & (col_i < nx) & (row_i >= 0) & (row_i < ny)
+            dist2 = (x_axis[np.clip(col_i, 0, nx - 1)] - x) ** 2 + (
+                y_axis[np.clip(row_i, 0, ny - 1)] - y
+            ) ** 2
+            select = inside & (dist2 <= support**2)
+            if not np.any(select):
+                continue
+            weight = np.exp(-0.5 * dist2[select] / sigma**2)
+            if weights is not None:
+                weight = weight * weights[select]
+            pixel_parts.append(row_i[select] * nx + col_i[select])
+            spectrum_parts.append(spectra[select])
+            weight_parts.append(weight)
+    if len(pixel_parts) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    pixel_index = np.concatenate(pixel_parts)
+    spectrum_index = np.concatenate(spectrum_parts)
+    pair_weight = np.concatenate(weight_parts)
+    order = np.argsort(pixel_index, kind="stable")
+    return pixel_index[order], spectrum_index[order], pair_weight[order]
+
+
+def grid_spectra(
+    spectra: NDArray[np.floating],
+    x: NDArray[np.float64],
+    y: NDArray[np.float64],
+    x_axis: NDArray[np.float64],
+    y_axis: NDArray[np.float64],
+    pixel: float,
+    kernel_fwhm: float,
+    support: float | None = None,
+    weights: NDArray[np.float64] | None = None,
+    bad: float | None = None,
+    chunk_channels: int = 64,
+    n_threads: int | None = None,
+) -> tuple[NDArray[np.float32], NDArray[np.float32]]:
+    """
+    Function to grid spectra observed at arbitrary offsets (e.g., On-The-Fly maps)
+    onto a regular grid, convolving them with a Gaussian kernel.
+    The spectral axis is processed in chunks of channels, spread over threads,
+    so that the memory used does not depend on the number of channels.
+    Blanked channels do not contribute to the cube.
+
+    parameters:
+    -----------
+    spectra: NDArray
+        Spectra, with shape (n_spectra, nchan). It can be a memory map.
+    x, y: NDArray[np.float64]
+        Offsets of the spectra.
+    x_axis, y_axis: NDArray[np.float64]
+        Offsets of the pixel centres (see grid_axes).
+    pixel: float
+        Pixel size, in the units of the offsets.
+    kernel_fwhm: float
+        FWHM of the Gaussian kernel, in the units of the offsets.
+    support: float | None
+        Radius beyond which the kernel is truncated. If None, 1.5 kernel FWHM.
+    weights: NDArray[np.float64] | None
+        Weight of each spectrum (e.g., 1/rms^2). If None, equal weights.
+    bad: float | None
+        Value of the blanked channels, besides NaN.
+    chunk_channels: int
+        Maximum number of channels gridded at once by each thread. It is reduced
+        for large maps, to keep the memory of each thread below chunk_bytes.
+    n_threads: int | None
+        Number of threads. If None, the number of CPUs.
+    returns:
+    --------
+    cube: NDArray[np.float32]
+        Gridded cube, with shape (nchan, ny, nx); NaN where no spectrum contributes.
+    weight_map: NDArray[np.float32]
+        Sum of the kernel weights in each pixel (channels without blanking).
+    """
+    if support is None:
+        support = support_fwhm * kernel_fwhm
+    n_spectra, nchan = spectra.shape
+    nx, ny = len(x_axis), len(y_axis)
+    pixel_index, spectrum_index, pair_weight = kernel_pairs(
+        x, y, x_axis, y_axis, pixel, kernel_fwhm, support, weights
+    )
+    cube = np.full((nchan, ny * nx), np.nan, dtype=np.float32)
+    weight_map = np.bincount(pixel_index, weights=pair_weight, minlength=ny * nx)
+    if len(pixel_index) == 0:
+        return cube.reshape(nchan, ny, nx), weight_map.reshape(ny, nx).astype(
+            np.float32
+        )
+    # start of the pairs of each pixel
+    pixels, starts = np.unique(pixel_index, return_index=True)
+    norm_all = np.add.reduceat(pair_weight, starts)
+    pair_weight_32 = pair_weight.astype(np.float32)[:, None]
+    # bound the memory of the (pairs, channels) products of each thread
+    chunk_channels = max(
+        1, min(chunk_channels, chunk_bytes // (len(pixel_index) * 4 * 2))
+    )
+
+    def grid_chunk(first: int) -> None:
+        last = min(first + chunk_channels, nchan)
+        block = np.array(spectra[:, first:last], dtype=np.float32)
+        valid = np.isfinite(block)
+        if bad is not None:
+            valid &= block != bad
+        if np.all(valid):
+            values_sum = np.add.reduceat(
+                block[spectrum_index] * pair_weight_32, starts, axis=0
+            )
+            result = values_sum / norm_all[:, None]
+        else:
+            block[~valid] = 0.0
+            values_sum = np.add.reduceat(
+                block[spectrum_index] * pair_weight_32, starts, axis=0
+            )
+            norm_sum = np.add.reduceat(
+                valid[spectrum_index] * pair_weight_32, starts, axis=0
+            )
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result = np.where(norm_sum > 0, values_sum / norm_sum, np.nan)
+        cube[first:last, pixels] = result.T
+
+    if n_threads is None:
+        n_threads = os.cpu_count() or 1
+    chunks = range(0, nchan, chunk_channels)
+    if n_threads == 1:
+        for first in chunks:
+            grid_chunk(first)
+    else:
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            list(pool.map(grid_chunk, chunks))
+    return cube.reshape(nchan, ny, nx), weight_map.reshape(ny, nx).astype(np.float32)
+
+
+def write_fits_cube(
+    fits_file: str,
+    cube: NDArray[np.float32],
+    ra0: float,
+    dec0: float,
+    pixel: float,
+    x_axis: NDArray[np.float64],
+    y_axis: NDArray[np.float64],
+    velocity: NDArray[np.float64],
+    restf: float,
+    beam: float,
+    source: str = "",
+    line: str = "",
+) -> None:
+    """
+    Function to write a gridded cube to a FITS file.
+
+    parameters:
+    -----------
+    fits_file: str
+        Output FITS file. It is overwritten if it exists.
+    cube: NDArray[np.float32]
+        Cube, with shape (nchan, ny, nx).
+    ra0, dec0: float
+        Projection centre in degrees.
+    pixel: float
+        Pixel size in degrees.
+    x_axis, y_axis: NDArray[np.float64]
+        Offsets of the pixel centres in degrees (x_axis decreasing).
+    velocity: NDArray[np.float64]
+        Velocity of each channel in km/s.
+    restf: float
+        Rest frequency in MHz.
+    beam: float
+        Angular resolution of the cube (FWHM) in degrees.
+    """
+    from astropy.io import fits  # type: ignore
+
+    header = fits.Header()
+    header["BUNIT"] = "K"
+    header["CTYPE1"] = "RA---SIN"
+    header["CRVAL1"] = ra0
+    header["CDELT1"] = -pixel
+    header["CRPIX1"] = 1.0 + x_axis[0] / pixel
+    header["CUNIT1"] = "deg"
+    header["CTYPE2"] = "DEC--SIN"
+    header["CRVAL2"] = dec0
+    header["CDELT2"] = pixel
+    header["CRPIX2"] = 1.0 - y_axis[0] / pixel
+    header["CUNIT2"] = "deg"
+    header["CTYPE3"] = "VRAD"
+    header["CRVAL3"] = velocity[0] * 1e3
+    header["CDELT3"] = (velocity[1] - velocity[0]) * 1e3 if len(velocity) > 1 else 1.0
+    header["CRPIX3"] = 1.0
+    header["CUNIT3"] = "m/s"
+    header["SPECSYS"] = "LSRK"
+    header["RESTFRQ"] = restf * 1e6
+    header["BMAJ"] = beam
+    header["BMIN"] = beam
+    header["BPA"] = 0.0
+    header["RADESYS"] = "ICRS"
+    header["EQUINOX"] = 2000.0
+    if source != "":
+        header["OBJECT"] = source
+    if line != "":
+        header["LINE"] = line
+    fits.PrimaryHDU(data=cube, header=header).writeto(fits_file, overwrite=True)
+
+
+def _common_axis(
+    axes: NDArray[np.float64],
+) -> tuple[int, float, float, float]:
+    """
+    Function to define a velocity axis covering several axes, with the finest
+    velocity resolution among them.
+
+    parameters:
+    -----------
+    axes: NDArray[np.float64]
+        (nchan, rchan, vres, voff) of each axis, with shape (n_axes, 4).
+    returns:
+    --------
+    axis: tuple[int, float, float, float]
+        (nchan, rchan, vres, voff) of the common axis.
+    """
+    nchan, rchan, vres, voff = axes.T
+    v_first = voff + (1.0 - rchan) * vres
+    v_last = voff + (nchan - rchan) * vres
+    v_min = float(np.min(np.minimum(v_first, v_last)))
+    v_max = float(np.max(np.maximum(v_first, v_last)))
+    vres_out = float(vres[np.argmin(np.abs(vres))])
+    nchan_out = int(np.rint((v_max - v_min) / abs(vres_out))) + 1
+    voff_out = v_min if vres_out > 0 else v_max
+    return nchan_out, 1.0, vres_out, voff_out
+
+
+def grid_30m_file(
+    file_30m: str,
+    fits_file: str,
+    ra0: float,
+    dec0: float,
+    kernel_fwhm: float | None = None,
+    pixel: float | None = None,
+    chunk_channels: int = 64,
+    n_threads: int | None = None,
+) -> tuple[int, int, int]:
+    """
+    Function to grid the reduced spectra of a line into a FITS cube,
+    replacing the CLASS 'table' and 'xy_map' steps.
+    Spectra with different velocity axes (e.g., from different backends or
+    tunings) are resampled onto a common axis covering all of them, with the
+    finest velocity resolution (see _common_axis), as CLASS 'table' does.
+    Each spectrum is weighted by time * |fres| / Tsys^2, as in 'table'
+    (see class_file.spectrum_weights).
+
+    parameters:
+    -----------
+    file_30m: str
+        CLASS file with the reduced spectra, e.g., "30m/B5_N2H+_1_0.30m".
+    fits_file: str
+        Output FITS cube.
+    ra0, dec0: float
+        Projection centre of the spectra offsets, in degrees.
+    kernel_fwhm: float | None
+        FWHM of the Gaussian kernel in arcsec. If None, 1/3 of the 30m beam.
+    pixel: float | None
+        Pixel size in arcsec. If None, 1/4 of the 30m beam.
+    chunk_channels: int
+        Number of channels gridded at once by each thread.
+    n_threads: int | None
+        Number of threads. If None, the number of CPUs.
+    returns:
+    --------
+    shape: tuple[int, int, int]
+        Shape of the cube (nchan, ny, nx).
+    """
+    with ClassFile(file_30m) as class_file:
+        if len(class_file) == 0:
+            raise ValueError(f"No spectra to grid in: {file_30m}")
+        headers = class_file.headers()
+        restf = float(headers["restf"][0])
+        bad = float(headers["bad"][0])
+        # velocity axis of each spectrum at the rest frequency of the first one
+        rchan = change_rest_frequency(
+            headers["restf"], headers["rchan"], headers["fres"], restf
+        )
+        keys = np.stack(
+            [headers["nchan"], rchan, headers["vres"], headers["voff"]], axis=1
+        )
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        if len(unique) == 1:
+            nchan, rchan_0, vres, voff = unique[0]
+            nchan = int(nchan)
+            spectra = class_file.spectra_block()
+        else:
+            nchan, rchan_0, vres, voff = _common_axis(unique)
+            print(
+                f"[INFO] Resampling {len(unique)} spectral axes onto "
+                f"{nchan} channels of {abs(vres):.4f} km/s"
+            )
+            spectra = np.full((len(class_file), nchan), bad, dtype=np.float32)
+            for g, (nchan_g, rchan_g, vres_g, voff_g) in enumerate(unique):
+                members = np.flatnonzero(inverse == g)
+                block = class_file.spectra_block(members).astype(np.float64)
+                bad_g = float(headers["bad"][members[0]])
+                valid = np.isfinite(block) & (block != bad_g)
+                resampled, coverage = resample_spectra(
+                    block,
+                    (int(nchan_g), rchan_g, vres_g, voff_g),
+                    (nchan, rchan_0, vres, voff),
+                    valid,
+                )
+                spectra[members] = np.where(coverage >= 0.5, resampled, bad)
+        x = headers["off1"].astype(np.float64) / arcsec
+        y = headers["off2"].astype(np.float64) / arcsec
+        beam = beam_30m / (restf * 1e-3)
+        if kernel_fwhm is None:
+            kernel_fwhm = beam * kernel_beam_fraction
+        if pixel is None:
+            pixel = beam * pixel_beam_fraction
+        support = support_fwhm * kernel_fwhm
+        x_axis, y_axis = grid_axes(x, y, pixel, margin=support)
+        cube, _ = grid_spectra(
+            spectra,
+            x,
+            y,
+            x_axis,
+            y_axis,
+            pixel,
+            kernel_fwhm,
+            support=support,
+            weights=spectrum_weights(headers),
+            bad=bad,
+            chunk_channels=chunk_channels,
+            n_threads=n_threads,
+        )
+        velocity = voff + (np.arange(1, nchan + 1) - rchan_0) * vres
+        write_fits_cube(
+            fits_file,
+            cube,
+            ra0,
+            dec0,
+            pixel / 3600.0,
+            x_axis / 3600.0,
+            y_axis / 3600.0,
+            velocity,
+            restf,
+            np.sqrt(beam**2 + kernel_fwhm**2) / 3600.0,
+            source=str(headers["source"][0]),
+            line=str(headers["line"][0]),
+        )
+    print(f"[INFO] Gridded {len(spectra)} spectra into {fits_file} {cube.shape}")
+    return cube.shape  # type: ignore
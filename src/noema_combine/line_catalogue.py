@@ -0,0 +1,102 @@
+import numpy as np
+from numpy.typing import NDArray
+
+
+class LineCatalogue:
+    """
+    Index of the line catalogue, built once from its columns.
+
+    Lines are looked up by (name, qn), by name, or by NOEMA window (Lid) through
+    dictionaries, and by frequency through a sorted frequency index.
+    All the methods return row indices of the catalogue columns.
+
+    parameters:
+    -----------
+    line_name: NDArray[np.str_]
+        Name of the lines, e.g., "N2H+".
+    qn_str: NDArray[np.str_]
+        Quantum numbers as given in the catalogue, e.g., "1-0".
+    freq: NDArray
+        Rest frequencies in GHz.
+    Lid: NDArray[np.str_]
+        NOEMA window of the lines, e.g., "L16".
+    """
+
+    def __init__(
+        self,
+        line_name: NDArray[np.str_],
+        qn_str: NDArray[np.str_],
+        freq: NDArray,
+        Lid: NDArray[np.str_],
+    ):
+        self.line_name = line_name
+        self.qn_str = qn_str
+        self.freq = np.asarray(freq, dtype=float)
+        self.Lid = Lid
+        self._by_name_qn: dict[tuple[str, str], int] = {}
+        self._by_name: dict[str, list[int]] = {}
+        self._by_lid: dict[str, list[int]] = {}
+        for i, (name, qn, lid) in enumerate(zip(line_name, qn_str, Lid)):
+            # the first entry is kept for duplicated (name, qn) pairs
+            self._by_name_qn.setdefault((str(name), str(qn)), i)
+            self._by_name.setdefault(str(name), []).append(i)
+            self._by_lid.setdefault(str(lid), []).append(i)
+        self._freq_order = np.argsort(self.freq, kind="stable")
+        self._freq_sorted = self.freq[self._freq_order]
+
+    def __len__(self) -> int:
+        return len(self.line_name)
+
+    def index(self, line_name_i: str, qn_i: str | None) -> int:
+        """
+        Find the index of a line. If the quantum number is not given, the line
+        name must have a single entry in the catalogue.
+        """
+        if qn_i is None:
+            idx = self._by_name.get(line_name_i, [])
+            if len(idx) > 1:
+                raise ValueError(
+                    f"Line name is not unique: {line_name_i}, add the Quantum number (qn)."
+                )
+            if len(idx) == 1:
+                return idx[0]
+        elif (line_name_i, qn_i) in self._by_name_qn:
+            return self._by_name_qn[(line_name_i, qn_i)]
+        raise ValueError(f"Line not found in the catalogue: {line_name_i}")
+
+    def indices(self, lines: list[tuple[str, str | None]]) -> NDArray[np.int_]:
+        """
+        Find the indices of a list of (line, qn) pairs, with the same rules as index.
+        """
+        return np.array([self.index(line_i, qn_i) for line_i, qn_i in lines], dtype=int)
+
+    def with_name(self, line_name_i: str) -> NDArray[np.int_]:
+        """
+        Indices of all the entries of a line name, in catalogue order.
+        """
+        return np.array(self._by_name.get(line_name_i, []), dtype=int)
+
+    def in_window(self, Lid_i: str) -> NDArray[np.int_]:
+        """
+        Indices of all the lines in a NOEMA window, e.g., "L16", in catalogue order.
+        """
+        return np.array(self._by_lid.get(Lid_i, []), dtype=int)
+
+    def in_range(self, freq_min: float, freq_max: float) -> NDArray[np.int_]:
+        """
+        Indices of all the lines with freq_min <= freq <= freq_max (GHz),
+        sorted by frequency.
+        """
+        start = np.searchsorted(self._freq_sorted, freq_min, side="left")
+        end = np.searchsorted(self._freq_sorted, freq_max, side="right")
+        return self._freq_order[start:end]
+
+    def count_in_ranges(
+        self, freq_min: NDArray[np.float64], freq_max: NDArray[np.float64]
+    ) -> NDArray[np.int_]:
+        """
+        Number of lines in each of a set of frequency ranges (GHz).
+        """
+        start = np.searchsorted(self._freq_sorted, freq_min, side="left")
+        end = np.searchsorted(self._freq_sorted, freq_max, side="right")
+        return np.maximum(end - start, 0)
@@ -0,0 +1,335 @@
+import io
+import json
+import os
+import re
+import tempfile
+from collections.abc import Callable
+from fnmatch import fnmatch, translate
+
+import numpy as np
+
+from .class_file import ClassFile
+from .runner import run_gildas
+
+# Manifest entry for each raw 30m file:
+# {"size": int, "mtime": float, "nobs": int, "nscan": int,
+#  "sources": [str], "backends": {telescope: [fmin, fmax]}}
+# frequencies in MHz.
+ManifestEntry = dict[str, object]
+
+manifest_version = 1
+
+
+def read_30m_file(inputfile: str) -> ManifestEntry:
+    """
+    Function to summarise a 30m file with the native CLASS reader.
+    Only the index and the spectroscopic sections are read, not the spectra.
+    A ValueError is raised if the file format is not supported.
+    """
+    with ClassFile(inputfile) as class_file:
+        headers = class_file.headers()
+        f_min, f_max = class_file.frequency_range()
+        backends: dict[str, list[float]] = {}
+        for telescope in np.unique(headers["telescope"]):
+            select = (headers["telescope"] == telescope) & np.isfinite(f_min)
+            if np.any(select):
+                backends[str(telescope)] = [
+                    float(np.min(f_min[select])),
+                    float(np.max(f_max[select])),
+                ]
+        sources = list(dict.fromkeys(str(source) for source in headers["source"]))
+        return {
+            "nobs": len(class_file),
+            "nscan": len(np.unique(headers["scan"])),
+            "sources": sources,
+            "backends": backends,
+        }
+
+
+def scan_30m_files(
+    inputfiles: list[str], scratch_dir: str = ".", log_file: str = "manifest.class.log"
+) -> dict[str, ManifestEntry]:
+    """
+    Function to read the headers of all the observations in a list of 30m files.
+    The files are read with the native CLASS reader; files it cannot read
+    are scanned with CLASS (see scan_30m_files_class).
+
+    parameters:
+    -----------
+    inputfiles: list[str]
+        List of 30m files to scan.
+    scratch_dir: str
+        Folder where the temporary CLASS script and listing are written.
+    log_file: str
+        File where the output of CLASS is stored.
+    returns:
+    --------
+    entries: dict[str, ManifestEntry]
+        Manifest entry for each file (without size and mtime).
+    """
+    entries: dict[str, ManifestEntry] = {}
+    unsupported: list[str] = []
+    for inputfile in inputfiles:
+        try:
+            entries[inputfile] = read_30m_file(inputfile)
+        except ValueError as error:
+            print(f"[WARNING] {error}, using CLASS")
+            unsupported.append(inputfile)
+    if len(unsupported) > 0:
+        entries.update(
+            scan_30m_files_class(
+                unsupported, scratch_dir=scratch_dir, log_file=log_file
+            )
+        )
+    return entries
+
+
+def scan_30m_files_class(
+    inputfiles: list[str], scratch_dir: str = ".", log_file: str = "manifest.class.log"
+) -> dict[str, ManifestEntry]:
+    """
+    Function to read the headers of all the observations in a list of 30m files.
+    A single CLASS session lists the scan, source, telescope and frequency axis
+    of every observation, which is then summarised for each file.
+
+    parameters:
+    -----------
+    inputfiles: list[str]
+        List of 30m files to scan.
+    scratch_dir: str
+        Folder where the temporary CLASS script and listing are written.
+    log_file: str
+        File where the output of CLASS is stored.
+    returns:
+    --------
+    entries: dict[str, ManifestEntry]
+        Manifest entry for each file (without size and mtime).
+    """
+    fd, listing = tempfile.mkstemp(dir=scratch_dir, suffix=".txt")
+    os.close(fd)
+    fb = io.StringIO()
+    fb.write(f'sic output "{listing}" new\n')
+    fb.write("set source *\n")
+    fb.write("set tele *\n")
+    fb.write("set line *\n")
+    for inputfile in inputfiles:
+        fb.write(f'say "FILE {inputfile}"\n')
+        fb.write(f'file in "{inputfile}"\n')
+        fb.write("find /all\n")
+        fb.write("get zero\n")
+        fb.write("sic message class s-i\n")
+        fb.write("for i 1 to found\n")
+        fb.write("  get next\n")
+        fb.write(
+            "  say OBS 'r%head%gen%scan' 'r%head%pos%sourc' 'r%head%gen%teles' "
+            "'r%head%spe%restf' 'r%head%spe%nchan' 'r%head%spe%rchan' "
+            "'r%head%spe%fres'\n"
+        )
+        fb.write("next\n")
+        fb.write("sic message class s+i\n")
+    fb.write("sic output\n")
+    fb.write("exit\n")
+    run_gildas("class", fb.getvalue(), log_file, scratch_dir=scratch_dir, check=True)
+    with open(listing, "r") as fh:
+        entries = parse_scan_listing(fh.read())
+    os.remove(listing)
+    return entries
+
+
+def parse_scan_listing(listing: str) -> dict[str, ManifestEntry]:
+    """
+    Function to summarise the observation listing written by scan_30m_files_class.
+    Each file starts with a 'FILE path' line followed by one
+    'OBS scan source telescope restf nchan rchan fres' line per observation.
+    """
+    entries: dict[str, ManifestEntry] = {}
+    current: str | None = None
+    scans: dict[str, set[int]] = {}
+    for line in listing.splitlines():
+        line = line.strip()
+        if line.startswith("FILE "):
+            current = line[5:].strip()
+            entries[current] = {"nobs": 0, "nscan": 0, "sources": [], "backends": {}}
+            scans[current] = set()
+            continue
+        if not line.startswith("OBS ") or current is None:
+            continue
+        values = line.split()
+        if len(values) != 8:
+            continue
+        scan, source, telescope = int(float(values[1])), values[2], values[3]
+        restf, nchan, rchan, fres = (float(value) for value in values[4:])
+        f_first = restf + (1 - rchan) * fres
+        f_last = restf + (nchan - rchan) * fres
+        entry = entries[current]
+        entry["nobs"] += 1  # type: ignore
+        scans[current].add(scan)
+        if source not in entry["sources"]:  # type: ignore
+            entry["sources"].append(source)  # type: ignore
+        backends: dict[str, list[float]] = entry["backends"]  # type: ignore
+        f_min, f_max = min(f_first, f_last), max(f_first, f_last)
+        if telescope in backends:
+            f_min = min(f_min, backends[telescope][0])
+            f_max = max(f_max, backends[telescope][1])
+        backends[telescope] = [f_min, f_max]
+    for name, entry in entries.items():
+        entry["nscan"] = len(scans[name])
+    return entries
+
+
+def load_manifest(manifest_file: str) -> dict[str, ManifestEntry]:
+    """
+    Function to load the manifest of raw 30m files. An empty manifest is returned
+    if the file does not exist or was written by a different version.
+    """
+    if not os.path.isfile(manifest_file):
+        return {}
+    with open(manifest_file, "r") as fh:
+        manifest = json.load(fh)
+    if manifest.get("version", None) != manifest_version:
+        return {}
+    return manifest["files"]
+
+
+def save_manifest(manifest_file: str, files: dict[str, ManifestEntry]) -> None:
+    """
+    Function to write the manifest of raw 30m files, replacing the previous one
+    atomically.
+    """
+    manifest_folder = os.path.dirname(manifest_file)
+    if manifest_folder != "" and not os.path.exists(manifest_folder):
+        os.makedirs(manifest_folder)
+    # unique temporary file, so that concurrent writers do not replace each
+    # other's partial output
+    fd, tmp_file = tempfile.mkstemp(
+        prefix=f"{os.path.basename(manifest_file)}.",
+        suffix=".tmp",
+        dir=manifest_folder or ".",
+    )
+    try:
+        with os.fdopen(fd, "w") as fh:
+            json.dump({"version": manifest_version, "files": files}, fh, indent=1)
+        os.replace(tmp_file, manifest_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def update_manifest(
+    inputfiles: list[str],
+    manifest_file: str,
+    scratch_dir: str = ".",
+    log_file: str = "manifest.class.log",
+) -> dict[str, ManifestEntry]:
+    """
+    Function to update the manifest of raw 30m files.
+    Only files that are new, or whose size or modification time changed, are scanned.
+    Entries of files that no longer exist are removed.
+
+    parameters:
+    -----------
+    inputfiles: list[str]
+        List of 30m files that should be in the manifest.
+    manifest_file: str
+        JSON file where the manifest is stored.
+    scratch_dir: str
+        Folder where the temporary CLASS script is written.
+    log_file: str
+        File where the output of CLASS is stored.
+    returns:
+    --------
+    files: dict[str, ManifestEntry]
+        The updated manifest, with one entry per file.
+    """
+    files = load_manifest(manifest_file)
+    removed = [name for name in files if not os.path.isfile(name)]
+    for name in removed:
+        del files[name]
+    to_scan: list[str] = []
+    for inputfile in inputfiles:
+        stat = os.stat(inputfile)
+        entry = files.get(inputfile, None)
+        if (
+            entry is None
+            or entry["size"] != stat.st_size
+            or entry["mtime"] != stat.st_mtime
+        ):
+            to_scan.append(inputfile)
+    if len(to_scan) > 0:
+        print(f"[INFO] Scanning {len(to_scan)} new or modified 30m files")
+        scanned = scan_30m_files(to_scan, scratch_dir=scratch_dir, log_file=log_file)
+        for inputfile in to_scan:
+            stat = os.stat(inputfile)
+            entry = scanned.get(
+                inputfile, {"nobs": 0, "nscan": 0, "sources": [], "backends": {}}
+            )
+            entry["size"] = stat.st_size
+            entry["mtime"] = stat.st_mtime
+            files[inputfile] = entry
+    if len(to_scan) > 0 or len(removed) > 0:
+        save_manifest(manifest_file, files)
+    return files
+
+
+def file_matches(entry: ManifestEntry, source_find: str, freq_find: float) -> bool:
+    """
+    Function to check if a raw 30m file can contain data for a source and frequency.
+
+    parameters:
+    -----------
+    entry: ManifestEntry
+        Manifest entry of the file.
+    source_find: str
+        Source name(s) as used in CLASS 'set source', e.g., "B5*" or "B5-Box1 B5-Box2".
+    freq_find: float
+        Frequency in MHz as used in CLASS 'find /frequency'.
+    """
+    patterns = [pattern.upper() for pattern in source_find.split()]
+    sources = [source.upper() for source in entry["sources"]]  # type: ignore
+    if not any(fnmatch(source, pattern) for source in sources for pattern in patterns):
+        return False
+    backends: dict[str, list[float]] = entry["backends"]  # type: ignore
+    return any(f_min <= freq_find <= f_max for f_min, f_max in backends.values())
+
+
+def ignore_matcher(patterns: list[str]) -> Callable[[str], bool]:
+    """
+    Function to compile the ignorefiles entries of the configuration file into
+    a single matcher of raw file names. Each entry can be:
+    - a name without folder nor wildcard, e.g., "FTSOdp20220220", matching any
+      file whose path contains it (as in earlier versions),
+    - a path, e.g., "raw_data/FTSOdp20220220.30m", matching that file or any
+      file whose path ends with it (on a folder boundary),
+    - a glob, e.g., "raw_data/FTSOdp2022*.30m", matching in the same way,
+    - a regular expression prefixed by "re:", e.g., "re:FTSOdp2022(02|07).*",
+      searched anywhere in the path.
+
+    returns:
+    --------
+    matcher: Callable[[str], bool]
+        Function returning True for the files to ignore.
+    """
+    parts: list[str] = []
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if pattern == "":
+            continue
+        if pattern.startswith("re:"):
+            expression = pattern[3:]
+            try:
+                re.compile(expression)
+            except re.error as error:
+                raise ValueError(f"Invalid ignorefiles pattern '{pattern}': {error}")
+            parts.append(f".*?(?:{expression})")
+            continue
+        pattern = os.path.normpath(pattern)
+        if any(char in pattern for char in "*?["):
+            parts.append(f"(?:.*/)?{translate(pattern)}")
+        elif "/" not in pattern:
+            parts.append(f".*?{re.escape(pattern)}")
+        else:
+            parts.append(f"(?:.*/)?{re.escape(pattern)}\\Z")
+    if len(parts) == 0:
+        return lambda file_name: False
+    expression = re.compile("|".join(f"(?:{part})" for part in parts), re.DOTALL)
+    return lambda file_name: (expression.match(os.path.normpath(file_name)) is not None)
@@ -0,0 +1,393 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .class_file import ClassFile, kind_spectrum, section_general, section_spectro
+
+# Scan-exclusion entry for each raw 30m file:
+# {"size": int, "mtime": float, "telescopes": [str],
+#  "excluded": [[telescope, scan, subscan, reason]]}
+# subscan 0 excludes the whole scan of that telescope (backend and polarisation).
+# Rows can also be added by hand (e.g., reason "manual"); they are kept until
+# the file changes.
+ScanTableEntry = dict[str, object]
+
+scan_table_version = 1
+
+# statistics used to flag the spectra, compared within each telescope
+quality_statistics: tuple[str, ...] = ("rms", "slope", "spikes", "tsys")
+
+
+def spectrum_statistics(
+    spectra: NDArray[np.floating],
+    bad: float | None = None,
+    spike_sigma: float = 8.0,
+) -> dict[str, NDArray[np.float64]]:
+    """
+    Function to compute quality statistics of a block of spectra with the same
+    number of channels.
+    The noise is estimated from the channel-to-channel differences (median
+    absolute deviation), so that line emission and baselines do not bias it.
+
+    parameters:
+    -----------
+    spectra: NDArray
+        Block of spectra, with shape (n_spectra, nchan).
+    bad: float | None
+        Value of the blanked channels (CLASS 'bad' header value).
+    spike_sigma: float
+        Threshold, in units of the noise, of a channel deviating in the same
+        direction from both its neighbours to be counted as a spike.
+    returns:
+    --------
+    statistics: dict[str, NDArray[np.float64]]
+        For each spectrum: 'rms' (noise), 'slope' (absolute linear baseline
+        slope, change over half of the spectrum), 'spikes' (number of spike
+        channels) and 'blank' (fraction of blanked channels).
+    """
+    values = np.atleast_2d(spectra).astype(np.float64)
+    n_spectra, nchan = values.shape
+    blanked = ~np.isfinite(values)
+    if bad is not None:
+        blanked |= values == bad
+    values[blanked] = np.nan
+    blank = np.mean(blanked, axis=1) if nchan > 0 else np.ones(n_spectra)
+    rms = np.full(n_spectra, np.nan)
+    slope = np.full(n_spectra, np.nan)
+    spikes = np.zeros(n_spectra)
+    valid = blank < 1.0
+    if nchan < 3 or not np.any(valid):
+        return {"rms": rms, "slope": slope, "spikes": spikes, "blank": blank}
+    block = values[valid]
+    with np.errstate(invalid="ignore"):
+        diff = np.diff(block, axis=1)
+        mad = np.nanmedian(np.abs(diff - np.nanmedian(diff, axis=1)[:, None]), axis=1)
+        rms[valid] = 1.4826 * mad / np.sqrt(2.0)
+        # linear slope over the channels scaled to [-1, 1]
+        x = np.linspace(-1.0, 1.0, nchan)
+        weight = np.isfinite(block)
+        centred = block - np.nanmean(block, axis=1)[:, None]
+        x_centred = (
+            x[None, :]
+            - np.sum(np.where(weight, x, 0.0), axis=1)[:, None]
+            / np.sum(weight, axis=1)[:, None]
+        )
+        slope[valid] = np.abs(
+            np.nansum(centred * x_centred, axis=1)
+            / np.sum(np.where(weight, x_centred**2, 0.0), axis=1)
+        )
+        # single-channel spikes: above (or below) both neighbours
+        threshold = (spike_sigma * rms[valid] * np.sqrt(2.0))[:, None]
+        left = block[:, 1:-1] - block[:, :-2]
+        right = block[:, 1:-1] - block[:, 2:]
+        spike = ((left > threshold) & (right > threshold)) | (
+            (left < -threshold) & (right < -threshold)
+        )
+        spikes[valid] = np.sum(spike, axis=1)
+    return {"rms": rms, "slope": slope, "spikes": spikes, "blank": blank}
+
+
+def robust_outliers(
+    values: NDArray[np.floating], n_sigma: float = 5.0, floor: float = 0.0
+) -> NDArray[np.bool_]:
+    """
+    Function to find the values above the bulk of a distribution: values more than
+    n_sigma robust standard deviations (1.4826 times the median absolute deviation,
+    at least floor) above the median. NaN values are not outliers.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    outliers = np.zeros(len(values), dtype=bool)
+    finite = np.isfinite(values)
+    if np.sum(finite) < 3:
+        return outliers
+    median = np.median(values[finite])
+    scale = 1.4826 * np.median(np.abs(values[finite] - median))
+    scale = max(scale, floor, 1e-6 * abs(median), np.finfo(float).tiny)
+    outliers[finite] = values[finite] > median + n_sigma * scale
+    return outliers
+
+
+def detect_bad_scans(
+    inputfile: str,
+    n_sigma: float = 5.0,
+    bad_fraction: float = 0.5,
+    spike_sigma: float = 8.0,
+    batch_size: int = 4096,
+) -> ScanTableEntry:
+    """
+    Function to flag the bad scans and subscans of a raw 30m file with the native
+    CLASS reader.
+    The statistics of each spectrum (see spectrum_statistics, and the system
+    temperature) are compared with those of all the spectra of the same telescope
+    in the file. A spectrum is bad if it is mostly blanked, or if any statistic
+    is an outlier (see robust_outliers). A subscan of a telescope is excluded
+    if at least bad_fraction of its spectra are bad, and a whole scan if all
+    its subscans are excluded.
+
+    parameters:
+    -----------
+    inputfile: str
+        Raw 30m file (CLASS Type 2 format).
+    n_sigma: float
+        Threshold of the outliers, in robust standard deviations.
+    bad_fraction: float
+        Fraction of bad spectra to exclude a subscan.
+    spike_sigma: float
+        Threshold of the spike channels (see spectrum_statistics).
+    batch_size: int
+        Number of spectra whose statistics are computed at once.
+    returns:
+    --------
+    entry: ScanTableEntry
+        Telescopes in the file and excluded scans (without size and mtime).
+    """
+    with ClassFile(inputfile) as class_file:
+        headers = class_file.headers()
+        n_obs = len(class_file)
+        statistics = {name: np.full(n_obs, np.nan) for name in quality_statistics}
+        blank = np.zeros(n_obs)
+        spectra = np.flatnonzero(
+            (headers["kind"] == kind_spectrum) & (headers["nchan"] > 0)
+        )
+        tsys = headers["tsys"][spectra]
+        statistics["tsys"][spectra] = np.where(tsys > 0, tsys, np.nan)
+        # spectra with the same number of channels are processed as blocks
+        for nchan in np.unique(headers["nchan"][spectra]):
+            members = spectra[headers["nchan"][spectra] == nchan]
+            for start in range(0, len(members), batch_size):
+                batch = members[start : start + batch_size]
+                block_stats = spectrum_statistics(
+                    class_file.spectra_block(batch),
+                    bad=float(headers["bad"][batch[0]]),
+                    spike_sigma=spike_sigma,
+                )
+                for name, values in block_stats.items():
+                    if name == "blank":
+                        blank[batch] = values
+                    else:
+                        statistics[name][batch] = values
+        telescopes = [str(name) for name in np.unique(headers["telescope"][spectra])]
+        flagged = blank[spectra] > 0.5
+        reasons = np.where(flagged, "blank", "").astype(object)
+        for telescope in telescopes:
+            select = headers["telescope"][spectra] == telescope
+            for name in quality_statistics:
+                floor = 1.0 if name == "spikes" else 0.0
+                outliers = robust_outliers(
+                    statistics[name][spectra[select]], n_sigma=n_sigma, floor=floor
+                )
+                new = np.flatnonzero(select)[outliers & ~flagged[select]]
+                reasons[new] = name
+                flagged[new] = True
+        keys = np.rec.fromarrays(
+            [
+                headers["telescope"][spectra],
+                headers["scan"][spectra],
+                headers["subscan"][spectra],
+            ],
+            names="telescope,scan,subscan",
+        )
+        unique, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        scans: dict[tuple[str, int], list[tuple[int, str]]] = {}
+        n_subscans: dict[tuple[str, int], int] = {}
+        for k, key in enumerate(unique):
+            telescope, scan, subscan = str(key[0]), int(key[1]), int(key[2])
+            n_subscans[(telescope, scan)] = n_subscans.get((telescope, scan), 0) + 1
+            members = np.flatnonzero(inverse == k)
+            if np.mean(flagged[members]) < bad_fraction:
+                continue
+            names, counts = np.unique(
+                reasons[members][flagged[members]].astype(str), return_counts=True
+            )
+            scans.setdefault((telescope, scan), []).append(
+                (subscan, str(names[np.argmax(counts)]))
+            )
+        excluded: list[list[object]] = []
+        for (telescope, scan), subscans in scans.items():
+            if len(subscans) == n_subscans[(telescope, scan)]:
+                excluded.append([telescope, scan, 0, subscans[0][1]])
+            else:
+                for subscan, reason in subscans:
+                    excluded.append([telescope, scan, subscan, reason])
+    return {"telescopes": telescopes, "excluded": excluded}
+
+
+def excluded_mask(entry: ScanTableEntry, headers: dict[str, NDArray]) -> NDArray:
+    """
+    Function to select the observations of a file excluded by its scan-exclusion
+    entry.
+
+    parameters:
+    -----------
+    entry: ScanTableEntry
+        Entry of the file in the scan-exclusion table.
+    headers: dict[str, NDArray]
+        Headers of the observations (see ClassFile.headers).
+    returns:
+    --------
+    excluded: NDArray[np.bool_]
+        True for the excluded observations.
+    """
+    excluded = np.zeros(len(headers["scan"]), dtype=bool)
+    for telescope, scan, subscan, _ in entry.get("excluded", []):  # type: ignore
+        select = (headers["telescope"] == telescope) & (headers["scan"] == scan)
+        if subscan != 0:
+            select &= headers["subscan"] == subscan
+        excluded |= select
+    return excluded
+
+
+def good_ranges(excluded: list[int]) -> list[tuple[int, int | None]]:
+    """
+    Function to list the ranges of scan (or subscan) numbers, starting at 1,
+    that avoid the excluded ones. The last range is open (None).
+    """
+    ranges: list[tuple[int, int | None]] = []
+    first = 1
+    for number in sorted(set(excluded)):
+        if number > first:
+            ranges.append((first, number - 1))
+        first = max(first, number + 1)
+    ranges.append((first, None))
+    return ranges
+
+
+def exclusions_by_telescope(
+    entry: ScanTableEntry,
+) -> dict[str, tuple[list[int], dict[int, list[int]]]]:
+    """
+    Function to group the excluded scans of a file by telescope.
+
+    returns:
+    --------
+    exclusions: dict[str, tuple[list[int], dict[int, list[int]]]]
+        For each telescope of the file, the excluded scans and, for each scan
+        with some excluded subscans, the excluded subscans. If the telescopes of
+        the file are unknown (file not read natively), a single '*' group
+        excludes the listed scans of all the telescopes.
+    """
+    telescopes = entry.get("telescopes", [])
+    excluded = entry.get("excluded", [])
+    if len(telescopes) == 0 and len(excluded) > 0:  # type: ignore
+        print(
+            "[WARNING] Unknown telescopes, excluding the listed scans "
+            "of all the telescopes"
+        )
+    exclusions: dict[str, tuple[list[int], dict[int, list[int]]]] = {
+        str(telescope): ([], {})
+        for telescope in telescopes  # type: ignore
+    }
+    for telescope, scan, subscan, _ in excluded:  # type: ignore
+        if len(telescopes) == 0:  # type: ignore
+            telescope = "*"
+        scans, subscans = exclusions.setdefault(str(telescope), ([], {}))
+        if subscan == 0:
+            scans.append(int(scan))
+        else:
+            subscans.setdefault(int(scan), []).append(int(subscan))
+    return exclusions
+
+
+def load_scan_table(table_file: str) -> dict[str, ScanTableEntry]:
+    """
+    Function to load the scan-exclusion table of raw 30m files. An empty table is
+    returned if the file does not exist or was written by a different version.
+    """
+    if not os.path.isfile(table_file):
+        return {}
+    with open(table_file, "r") as fh:
+        table = json.load(fh)
+    if table.get("version", None) != scan_table_version:
+        return {}
+    return table["files"]
+
+
+def save_scan_table(table_file: str, files: dict[str, ScanTableEntry]) -> None:
+    """
+    Function to write the scan-exclusion table of raw 30m files, replacing the
+    previous one atomically.
+    """
+    table_folder = os.path.dirname(table_file)
+    if table_folder != "" and not os.path.exists(table_folder):
+        os.makedirs(table_folder)
+    # unique temporary file, so that concurrent writers do not replace each
+    # other's partial output
+    fd, tmp_file = tempfile.mkstemp(
+        prefix=f"{os.path.basename(table_file)}.",
+        suffix=".tmp",
+        dir=table_folder or ".",
+    )
+    try:
+        with os.fdopen(fd, "w") as fh:
+            json.dump({"version": scan_table_version, "files": files}, fh, indent=1)
+        os.replace(tmp_file, table_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def update_scan_table(
+    inputfiles: list[str],
+    table_file: str,
+    n_sigma: float = 5.0,
+    bad_fraction: float = 0.5,
+) -> dict[str, ScanTableEntry]:
+    """
+    Function to update the scan-exclusion table of raw 30m files.
+    Only files that are new, or whose size or modification time changed, are
+    checked (see detect_bad_scans). Files that cannot be read natively get an
+    entry without exclusions. Entries of files that no longer exist are removed.
+
+    parameters:
+    -----------
+    inputfiles: list[str]
+        List of 30m files that should be in the table.
+    table_file: str
+        JSON file where the table is stored.
+    n_sigma: float
+        Threshold of the outliers (see detect_bad_scans).
+    bad_fraction: float
+        Fraction of bad spectra to exclude a subscan (see detect_bad_scans).
+    returns:
+    --------
+    files: dict[str, ScanTableEntry]
+        The updated table, with one entry per file.
+    """
+    files = load_scan_table(table_file)
+    removed = [name for name in files if not os.path.isfile(name)]
+    for name in removed:
+        del files[name]
+    to_check: list[str] = []
+    for inputfile in inputfiles:
+        stat = os.stat(inputfile)
+        entry = files.get(inputfile, None)
+        if (
+            entry is None
+            or entry["size"] != stat.st_size
+            or entry["mtime"] != stat.st_mtime
+        ):
+            to_check.append(inputfile)
+    if len(to_check) > 0:
+        print(f"[INFO] Checking the scans of {len(to_check)} new or modified 30m files")
+    for inputfile in to_check:
+        try:
+            entry = detect_bad_scans(
+                inputfile, n_sigma=n_sigma, bad_fraction=bad_fraction
+            )
+        except ValueError as error:
+            print(f"[WARNING] {error}, scans not checked")
+            entry = {"telescopes": [], "excluded": []}
+        n_excluded = len(entry["excluded"])  # type: ignore
+        if n_excluded > 0:
+            print(f"[INFO] Excluding {n_excluded} scans or subscans of {inputfile}")
+        stat = os.stat(inputfile)
+        entry["size"] = stat.st_size
+        entry["mtime"] = stat.st_mtime
+        files[inputfile] = entry
+    if len(to_check) > 0 or len(removed) > 0:
+        save_scan_table(table_file, files)
+    return files
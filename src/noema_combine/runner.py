@@ -0,0 +1,146 @@
+import os
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+script_suffix: dict[str, str] = {"class": ".class", "mapping": ".map", "clic": ".clic"}
+
+
+@dataclass
+class GildasResult:
+    """
+    Outcome of a GILDAS session run by run_gildas.
+    """
+
+    program: str
+    log_file: str
+    returncode: int
+    attempts: int
+    timed_out: bool
+    elapsed: float
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+
+class GildasError(RuntimeError):
+    """
+    Error raised when a GILDAS session fails after all the retries.
+    """
+
+    def __init__(self, result: GildasResult):
+        self.result = result
+        if result.timed_out:
+            reason = "timed out"
+        else:
+            reason = f"exited with status {result.returncode}"
+        super().__init__(
+            f"{result.program} {reason} after {result.attempts} attempt(s), "
+            f"see log: {result.log_file}"
+        )
+
+
+def run_gildas(
+    program: str,
+    script: str,
+    log_file: str,
+    scratch_dir: str = ".",
+    timeout: float | None = None,
+    retries: int = 0,
+    cwd: str | None = None,
+    check: bool = False,
+    cleanup: Callable[[], None] | None = None,
+) -> GildasResult:
+    """
+    Function to run a GILDAS program (class, mapping, clic) on a script.
+    The script is written to a temporary file in scratch_dir, and the program
+    output is appended to log_file.
+
+    parameters:
+    -----------
+    program: str
+        GILDAS program to run, e.g., "class" or "mapping".
+    script: str
+        Text of the script to run. It should end with 'exit'.
+    log_file: str
+        File where the output of the program is stored.
+    scratch_dir: str
+        Folder where the temporary script is written.
+    timeout: float | None
+        Wall-clock time limit in seconds for each attempt. If None, no limit.
+    retries: int
+        Number of times a failed or timed out session is run again. The whole
+        script is run again, so a script that is not idempotent (e.g., appending
+        to an output file) needs a cleanup function.
+    cwd: str | None
+        Working directory of the program. If None, the current directory.
+    check: bool
+        If True, raise GildasError when the session fails after all the retries.
+    cleanup: Callable[[], None] | None
+        Function called before each retry to remove the outputs of the failed
+        attempt. If None, the script is run again as it is.
+    returns:
+    --------
+    result: GildasResult
+        Exit status, number of attempts, and log file of the session.
+    """
+    log_folder = os.path.dirname(log_file)
+    if log_folder != "" and not os.path.exists(log_folder):
+        os.makedirs(log_folder)
+    start = time.monotonic()
+    returncode = -1
+    timed_out = False
+    attempt = 0
+    with (
+        tempfile.NamedTemporaryFile(
+            delete=True,
+            mode="w+",
+            dir=scratch_dir,
+            suffix=script_suffix.get(program, ".gildas"),
+        ) as fb,
+        open(log_file, "a") as log,
+    ):
+        fb.write(script)
+        fb.flush()
+        command = [program, "-nw", "@", os.path.abspath(fb.name)]
+        for attempt in range(1, retries + 2):
+            if attempt > 1 and cleanup is not None:
+                cleanup()
+            log.write(f"[INFO] {' '.join(command)} (attempt {attempt})\n")
+            log.flush()
+            timed_out = False
+            try:
+                completed = subprocess.run(
+                    command,
+                    stdin=subprocess.DEVNULL,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    cwd=cwd,
+                    timeout=timeout,
+                )
+                returncode = completed.returncode
+            except subprocess.TimeoutExpired:
+                timed_out = True
+                returncode = -1
+                log.write(f"[ERROR] Timed out after {timeout} s\n")
+            except OSError as error:
+                returncode = -1
+                log.write(f"[ERROR] {error}\n")
+            if returncode == 0:
+                break
+    result = GildasResult(
+        program=program,
+        log_file=log_file,
+        returncode=returncode,
+        attempts=attempt,
+        timed_out=timed_out,
+        elapsed=time.monotonic() - start,
+    )
+    if not result.ok:
+        print(f"[ERROR] {program} failed, see log: {log_file}")
+        if check:
+            raise GildasError(result)
+    return result
@@ -0,0 +1,279 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .class_table import read_class_table, table_bad
+from .gridding import (
+    arcsec,
+    beam_30m,
+    chunk_bytes,
+    grid_axes,
+    grid_spectra,
+    kernel_beam_fraction,
+    pixel_beam_fraction,
+    support_fwhm,
+)
+from .uv_table import (
+    UVHeader,
+    UVTable,
+    _same_spectral_axis,
+    create_uv_table,
+    mosaic_columns,
+    speed_of_light,
+)
+
+# Short-spacing pseudo-visibilities from the 30m data, as MAPPING 'uv_short':
+# the 30m spectra are gridded into a cube, the 30m beam is deconvolved in the
+# uv plane (up to uv_max), each NOEMA field is multiplied by its primary beam,
+# and the Fourier transform is sampled on a regular uv grid within uv_max.
+# The pseudo-visibilities share the spectral axis and columns of the NOEMA
+# uv-table, so the two tables can be concatenated (see uv_table.append_uv_tables).
+
+diameter_noema = 15.0  # m
+diameter_30m = 30.0  # m
+# NOEMA primary beam (FWHM, arcsec) at frequency f (GHz): beam_noema / f
+beam_noema = 5060.0
+boltzmann = 1.380649e-23  # J/K
+# number of visibilities read to estimate the weights of the NOEMA data
+weight_rows = 10000
+
+
+def noema_fields(table: UVTable) -> list[tuple[float, float]]:
+    """
+    Function to list the pointing offsets (radians) of the fields of a NOEMA
+    uv-table. Mosaics have the offsets of each visibility in the leading columns
+    after the antenna numbers (mosaic_columns); other tables have a single field
+    at the phase centre.
+    """
+    if table.header.ndaps <= max(mosaic_columns) or table.header.nvis == 0:
+        return [(0.0, 0.0)]
+    offsets = np.unique(
+        np.asarray(table.daps[:, list(mosaic_columns)], dtype=np.float64), axis=0
+    )
+    return [(float(dx), float(dy)) for dx, dy in offsets]
+
+
+def uv_sampling(
+    n: int, pixel: float, wavelength: float, uv_max: float
+) -> tuple[NDArray[np.int64], NDArray[np.int64], NDArray[np.float64]]:
+    """
+    Function to select the points of the Fourier grid of an n x n image within
+    a uv distance, keeping one point of each pair (u, v), (-u, -v).
+
+    parameters:
+    -----------
+    n: int
+        Size of the image, in pixels.
+    pixel: float
+        Pixel size in radians.
+    wavelength: float
+        Wavelength in m.
+    uv_max: float
+        Largest uv distance in m.
+    returns:
+    --------
+    row, column: NDArray[np.int64]
+        Indices (v, u) of the selected points in the Fourier grid.
+    uv: NDArray[np.float64]
+        (u, v) of each point in wavelengths, with shape (n_points, 2).
+    """
+    freq = np.fft.fftfreq(n, d=pixel)
+    u_grid, v_grid = np.meshgrid(freq, freq)
+    half = (v_grid > 0) | ((v_grid == 0) & (u_grid >= 0))
+    select = half & (np.hypot(u_grid, v_grid) * wavelength <= uv_max)
+    row, column = np.nonzero(select)
+    return row, column, np.stack([u_grid[select], v_grid[select]], axis=1)
+
+
+def short_spacing_uvt(
+    table_file: str,
+    uvt_file: str,
+    out_file: str,
+    fields: list[tuple[float, float]] | None = None,
+    uv_max: float | None = None,
+    uv_cell: float | None = None,
+    weight_factor: float = 1.0,
+    chunk_channels: int = 16,
+    n_threads: int | None = None,
+) -> UVHeader:
+    """
+    Function to compute the short-spacing pseudo-visibilities of a line from its
+    30m table, regridded onto the spectral axis of the NOEMA uv-table
+    (see data_handler.line_prepare_merge).
+    The cube is processed in chunks of channels spread over threads, and the
+    output table is filled in place, so that the memory used does not depend
+    on the number of channels.
+
+    parameters:
+    -----------
+    table_file: str
+        CLASS table of the 30m spectra in Tmb, with the spectral axis of the
+        uv-table.
+    uvt_file: str
+        NOEMA uv-table, giving the phase centre, spectral axis, fields and weights.
+    out_file: str
+        Output uv-table of pseudo-visibilities. It is overwritten if it exists.
+    fields: list[tuple[float, float]] | None
+        Pointing offsets (radians) of the NOEMA fields. If None, they are read
+        from the uv-table (see noema_fields).
+    uv_max: float | None
+        Largest uv distance (m) of the pseudo-visibilities. If None, the
+        difference of the 30m and NOEMA antenna diameters.
+    uv_cell: float | None
+        Largest spacing (m) of the uv grid. If None, half the NOEMA diameter.
+    weight_factor: float
+        Weight of the pseudo-visibilities relative to the median weight of the
+        NOEMA visibilities of each channel.
+    chunk_channels: int
+        Maximum number of channels transformed at once by each thread. It is
+        reduced for large images, to keep the memory of each thread below
+        gridding.chunk_bytes.
+    n_threads: int | None
+        Number of threads. If None, the number of CPUs.
+    returns:
+    --------
+    header: UVHeader
+        Header of the output table.
+    """
+    if uv_max is None:
+        uv_max = diameter_30m - diameter_noema
+    if uv_cell is None:
+        uv_cell = 0.5 * diameter_noema
+    with UVTable(uvt_file) as noema:
+        target = noema.header
+        raw_header = noema.raw_header
+        if fields is None:
+            fields = noema_fields(noema)
+        daps = np.zeros(target.ndaps, dtype=np.float32)
+        noema_weight = np.full(target.nchan, np.nan)
+        if target.nvis > 0:
+            daps[:] = noema.daps[0]
+            rows = np.unique(
+                np.linspace(0, target.nvis - 1, min(target.nvis, weight_rows))
+            ).astype(np.int64)
+            weights = np.asarray(noema.visibilities()[rows, :, 2], dtype=np.float64)
+            noema_weight = np.array(
+                [
+                    np.median(column[column > 0]) if np.any(column > 0) else np.nan
+                    for column in weights.T
+                ]
+            )
+    table_header, table = read_class_table(table_file)
+    same_columns = replace(table_header, ndaps=target.ndaps, natom=target.natom)
+    if not _same_spectral_axis(same_columns, target):
+        raise ValueError(f"Spectral axis of {table_file} does not match {uvt_file}")
+    noema_weight = np.where(np.isfinite(noema_weight), noema_weight, 1.0)
+
+    wavelength = speed_of_light / (target.restf * 1e6)
+    beam = beam_30m / (target.restf * 1e-3)
+    kernel = beam * kernel_beam_fraction
+    pixel = min(beam * pixel_beam_fraction, 0.5 * wavelength / uv_max / arcsec)
+    support = support_fwhm * kernel
+    primary_beam = beam_noema / (target.restf * 1e-3) * arcsec
+    # map covering the spectra and the primary beams of the fields
+    x = table[:, 0].astype(np.float64) / arcsec
+    y = table[:, 1].astype(np.float64) / arcsec
+    field_x = np.array([dx for dx, _ in fields]) / arcsec
+    field_y = np.array([dy for _, dy in fields]) / arcsec
+    reach = primary_beam / arcsec
+    x_axis, y_axis = grid_axes(
+        np.concatenate([x, field_x - reach, field_x + reach]),
+        np.concatenate([y, field_y - reach, field_y + reach]),
+        pixel,
+        margin=support,
+    )
+    cube, _ = grid_spectra(
+        table[:, 3:],
+        x,
+        y,
+        x_axis,
+        y_axis,
+        pixel,
+        kernel,
+        support=support,
+        weights=table[:, 2].astype(np.float64),
+        bad=table_bad,
+        n_threads=n_threads,
+    )
+    nchan, ny, nx = cube.shape
+    # image size giving a uv grid spacing of at most uv_cell
+    pixel_rad = pixel * arcsec
+    n = max(nx, ny, int(np.ceil(wavelength / (uv_cell * pixel_rad))))
+    n += n % 2
+    # image coordinates (radians), increasing with the index (east and north)
+    l_axis = (x_axis[-1] + pixel * np.arange(n)) * arcsec
+    m_axis = (y_axis[0] + pixel * np.arange(n)) * arcsec
+    row, column, uv = uv_sampling(n, pixel_rad, wavelength, uv_max)
+    n_points = len(row)
+    origin = np.exp(-2j * np.pi * (uv[:, 0] * l_axis[0] + uv[:, 1] * m_axis[0]))
+    # deconvolution of the 30m beam and the gridding kernel, up to uv_max
+    freq = np.fft.fftfreq(n, d=pixel_rad)
+    rho = np.hypot(freq[None, :], freq[:, None])
+    resolution = np.hypot(beam, kernel) * arcsec
+    deconvolution = np.where(
+        rho * wavelength <= uv_max,
+        np.exp((np.pi * resolution * rho) ** 2 / (4.0 * np.log(2.0))),
+        0.0,
+    )
+    # Jy per K of each pixel, at the frequency of each channel
+    frequency = target.frequency() * 1e6
+    jy_per_k = 2.0 * boltzmann * frequency**2 / speed_of_light**2 * pixel_rad**2
+    jy_per_k *= 1e26
+
+    header = replace(target, nvis=len(fields) * n_points)
+    out = create_uv_table(out_file, header, raw_header)
+    try:
+        for k, (dx, dy) in enumerate(fields):
+            rows_k = slice(k * n_points, (k + 1) * n_points)
+            out.data[rows_k, : target.ndaps] = daps
+            out.data[rows_k, 0] = uv[:, 0] * wavelength
+            out.data[rows_k, 1] = uv[:, 1] * wavelength
+            out.data[rows_k, 2] = 0.0  # scan
+            out.data[rows_k, 5:7] = 0.0  # antennas
+            if target.ndaps > max(mosaic_columns):
+                out.data[rows_k, mosaic_columns[0]] = dx
+                out.data[rows_k, mosaic_columns[1]] = dy
+        chunk_channels = max(1, min(chunk_channels, chunk_bytes // (n * n * 16 * 3)))
+
+        def transform_chunk(first: int) -> None:
+            last = min(first + chunk_channels, nchan)
+            block = np.zeros((last - first, n, n))
+            sub_cube = cube[first:last, :, ::-1]
+            valid = np.any(np.isfinite(sub_cube), axis=(1, 2))
+            block[:, :ny, :nx] = np.nan_to_num(sub_cube, nan=0.0)
+            image = np.fft.ifft2(np.fft.fft2(block) * deconvolution).real
+            weight = np.where(valid, weight_factor * noema_weight[first:last], 0.0)
+            visibilities = out.visibilities(first, last)
+            for k, (dx, dy) in enumerate(fields):
+                beam_x = np.exp(
+                    -4.0 * np.log(2.0) * ((l_axis - dx) / primary_beam) ** 2
+                )
+                beam_y = np.exp(
+                    -4.0 * np.log(2.0) * ((m_axis - dy) / primary_beam) ** 2
+                )
+                field = np.fft.fft2(image * (beam_y[:, None] * beam_x[None, :]))
+                vis = field[:, row, column] * origin * jy_per_k[first:last, None]
+                rows_k = slice(k * n_points, (k + 1) * n_points)
+                visibilities[rows_k, :, 0] = vis.real.T
+                visibilities[rows_k, :, 1] = vis.imag.T
+                visibilities[rows_k, :, 2] = weight[None, :]
+
+        if n_threads is None:
+            n_threads = os.cpu_count() or 1
+        chunks = range(0, nchan, chunk_channels)
+        if n_threads == 1:
+            for first in chunks:
+                transform_chunk(first)
+        else:
+            with ThreadPoolExecutor(max_workers=n_threads) as pool:
+                list(pool.map(transform_chunk, chunks))
+    finally:
+        out.close()
+    print(
+        f"[INFO] Wrote {header.nvis} pseudo-visibilities ({len(fields)} fields) "
+        f"into {out_file}"
+    )
+    return header
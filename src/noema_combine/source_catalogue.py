@@ -0,0 +1,139 @@
+import numpy as np
+from numpy.typing import NDArray
+
+# Formats of the coordinates in the region catalogue:
+# - "sexagesimal": RA0 "03:47:41.6", Dec0 "32:51:43.7" (hours and degrees)
+# - "units": RA0 "03h47m41.6s", Dec0 "32d51m43.7s"
+# - "degrees": RA0 "56.92", Dec0 "32.86"
+coordinate_formats: tuple[str, ...] = ("sexagesimal", "units", "degrees")
+
+# Parsed entry of a region: (source_30m, source_out, ra0, dec0, vlsr)
+SourceEntry = tuple[str, str, float, float, float]
+
+
+def coordinate_format(ra: str, dec: str) -> str:
+    """
+    Function to identify the format of the coordinates of a region.
+    """
+    if (":" in ra) and (":" in dec):
+        return "sexagesimal"
+    if ("h" in ra) and ("d" in dec):
+        return "units"
+    return "degrees"
+
+
+def _skycoord(ra: list[str], dec: list[str], fmt: str) -> tuple[NDArray, NDArray]:
+    from astropy.coordinates import SkyCoord  # type: ignore
+    import astropy.units as u  # type: ignore
+
+    if fmt == "sexagesimal":
+        skycoord = SkyCoord(
+            [f"{ra_i} {dec_i}" for ra_i, dec_i in zip(ra, dec)],
+            frame="icrs",
+            unit=(u.hourangle, u.deg),  # type: ignore
+        )
+    elif fmt == "units":
+        skycoord = SkyCoord(ra=ra, dec=dec, frame="icrs")
+    else:
+        skycoord = SkyCoord(
+            ra=[float(ra_i) for ra_i in ra],
+            dec=[float(dec_i) for dec_i in dec],
+            frame="icrs",
+            unit=(u.deg, u.deg),  # type: ignore
+        )
+    return (
+        np.atleast_1d(skycoord.ra.degree),  # type: ignore
+        np.atleast_1d(skycoord.dec.degree),  # type: ignore
+    )
+
+
+def parse_coordinates(
+    ra: list[str], dec: list[str]
+) -> tuple[NDArray[np.float64], NDArray[np.float64], dict[int, str]]:
+    """
+    Function to convert the coordinates of a list of regions to degrees.
+    The coordinates are grouped by format, and each group is converted with a
+    single SkyCoord call. If a group cannot be converted at once, its entries
+    are converted one by one, so that an invalid entry only affects itself.
+
+    parameters:
+    -----------
+    ra: list[str]
+        Right Ascension of the regions, as given in the catalogue.
+    dec: list[str]
+        Declination of the regions, as given in the catalogue.
+    returns:
+    --------
+    ra_deg: NDArray[np.float64]
+        Right Ascension in degrees (NaN for invalid entries).
+    dec_deg: NDArray[np.float64]
+        Declination in degrees (NaN for invalid entries).
+    errors: dict[int, str]
+        Error message for each invalid entry, by position in the list.
+    """
+    ra_deg = np.full(len(ra), np.nan)
+    dec_deg = np.full(len(ra), np.nan)
+    errors: dict[int, str] = {}
+    formats = [coordinate_format(ra_i, dec_i) for ra_i, dec_i in zip(ra, dec)]
+    for fmt in coordinate_formats:
+        idx = [i for i, fmt_i in enumerate(formats) if fmt_i == fmt]
+        if len(idx) == 0:
+            continue
+        try:
+            ra_group, dec_group = _skycoord(
+                [ra[i] for i in idx], [dec[i] for i in idx], fmt
+            )
+            ra_deg[idx] = ra_group
+            dec_deg[idx] = dec_group
+        except Exception:
+            for i in idx:
+                try:
+                    ra_i, dec_i = _skycoord([ra[i]], [dec[i]], fmt)
+                    ra_deg[i], dec_deg[i] = ra_i[0], dec_i[0]
+                except Exception as error:
+                    errors[i] = str(error)
+    return ra_deg, dec_deg, errors
+
+
+def build_source_table(
+    region_catalogue: dict[str, dict[str, str]],
+) -> tuple[dict[str, SourceEntry], dict[str, str]]:
+    """
+    Function to parse the region catalogue into a table of source parameters.
+
+    parameters:
+    -----------
+    region_catalogue: dict[str, dict[str, str]]
+        Region catalogue, as loaded from the YAML file.
+    returns:
+    --------
+    table: dict[str, SourceEntry]
+        (source_30m, source_out, ra0, dec0, vlsr) for each valid region,
+        with coordinates in degrees and velocity in km/s.
+    errors: dict[str, str]
+        Error message for each region that could not be parsed.
+    """
+    names = list(region_catalogue.keys())
+    ra = [str(region_catalogue[name].get("RA0", "")) for name in names]
+    dec = [str(region_catalogue[name].get("Dec0", "")) for name in names]
+    ra_deg, dec_deg, coord_errors = parse_coordinates(ra, dec)
+    table: dict[str, SourceEntry] = {}
+    errors: dict[str, str] = {}
+    for i, name in enumerate(names):
+        if i in coord_errors:
+            errors[name] = coord_errors[i]
+            continue
+        entry = region_catalogue[name]
+        try:
+            table[name] = (
+                entry["source_30m"],
+                entry["source_out"],
+                float(ra_deg[i]),
+                float(dec_deg[i]),
+                float(entry["Vlsr"]),
+            )
+        except KeyError as error:
+            errors[name] = f"missing key {error}"
+        except (TypeError, ValueError) as error:
+            errors[name] = f"invalid Vlsr: {error}"
+    return table, errors
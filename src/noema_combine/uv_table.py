@@ -0,0 +1,758 @@
+import os
+from dataclasses import dataclass, replace
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .baseline import change_rest_frequency, extract_channels, fit_baseline, window_mask
+from .gridding import chunk_bytes
+
+# Native access to GILDAS UV tables (.uvt, GDF version 1).
+#
+# The file starts with a header of `header_blocks` blocks of 512 bytes, followed
+# by the data: a float32 matrix with one row per visibility, Fortran dims
+# (ncol, nvis). Each row holds the `ndaps` leading columns (u, v, scan, date,
+# time, iant, jant) followed by (real, imaginary, weight) for each channel.
+#
+# The spectral axis of the table is described by the reference channel, the
+# velocity at that channel (voff) and the velocity resolution (vres) stored in
+# the conversion formula of the first axis, and by the rest frequency (restf)
+# and frequency resolution (fres) of the spectroscopic section.
+#
+# Only the header words used here are decoded; the others are kept as they are
+# when a table is copied.
+
+block_size = 512
+header_blocks = 2
+uv_codes: dict[bytes, str] = {b"GILDAS_UVFIL": "<", b"GILDAS_UVSOR": "<"}
+form_real = -11
+ndaps_default = 7
+# leading columns with the pointing offsets (radians) of the fields of mosaics
+mosaic_columns = (7, 8)
+speed_of_light = 299792458.0  # m/s
+# memory of the continuum fits of a row (copy of the row, real and imaginary
+# parts, and the float64 work arrays of baseline.fit_baseline), in units of
+# the size of the row
+contsub_row_factor = 12
+# largest difference of the phase centres of tables that are appended (radians)
+phase_center_tolerance = np.radians(0.01 / 3600.0)
+
+# (name, format, byte offset) of the decoded header words
+header_fields: list[tuple[str, str, int]] = [
+    ("code", "S12", 0),
+    ("form", "i4", 12),
+    ("nvb", "i4", 16),
+    ("gene", "i4", 40),
+    ("ndim", "i4", 44),
+    ("dim", "(4,)i4", 48),
+    ("ref1", "f8", 64),
+    ("val1", "f8", 72),
+    ("inc1", "f8", 80),
+    ("ref2", "f8", 88),
+    ("val2", "f8", 96),
+    ("inc2", "f8", 104),
+    ("blan_words", "i4", 160),
+    ("bval", "f4", 164),
+    ("eval", "f4", 168),
+    ("desc_words", "i4", 216),
+    ("unit", "S12", 220),
+    ("code1", "S12", 232),
+    ("code2", "S12", 244),
+    ("syst", "S12", 280),
+    ("posi_words", "i4", 292),
+    ("source", "S12", 296),
+    ("ra", "f8", 308),
+    ("dec", "f8", 316),
+    ("epoch", "f4", 340),
+    ("proj_words", "i4", 344),
+    ("a0", "f8", 348),
+    ("d0", "f8", 356),
+    ("pang", "f8", 364),
+    ("ptyp", "i4", 372),
+    ("spec_words", "i4", 384),
+    ("line", "S12", 388),
+    ("fres", "f8", 400),
+    ("fima", "f8", 408),
+    ("restf", "f8", 416),
+    ("vres", "f4", 424),
+    ("voff", "f4", 428),
+    ("faxi", "i4", 432),
+    ("uvda_words", "i4", 512),
+    ("nchan", "i4", 516),
+    ("nvisi", "i8", 520),
+    ("nstokes", "i4", 528),
+    ("natom", "i4", 532),
+    ("ndaps", "i4", 536),
+]
+header_size = header_blocks * block_size
+
+
+def header_dtype(byteorder: str = "<") -> np.dtype:
+    return np.dtype(
+        {
+            "names": [name for name, _, _ in header_fields],
+            "formats": [
+                np.dtype(fmt).newbyteorder(byteorder) for _, fmt, _ in header_fields
+            ],
+            "offsets": [offset for _, _, offset in header_fields],
+            "itemsize": header_size,
+        }
+    )
+
+
+@dataclass
+class UVHeader:
+    """
+    Description of a GILDAS UV table.
+    Frequencies are in MHz, velocities in km/s, coordinates in radians.
+    The velocity of channel i (1-based) is voff + (i - rchan) * vres, and its
+    frequency is restf + (i - rchan) * fres.
+    """
+
+    nvis: int
+    nchan: int
+    rchan: float
+    restf: float
+    fres: float
+    vres: float
+    voff: float
+    source: str = ""
+    line: str = ""
+    ra: float = 0.0
+    dec: float = 0.0
+    ndaps: int = ndaps_default
+    natom: int = 3
+
+    @property
+    def ncol(self) -> int:
+        return self.ndaps + self.natom * self.nchan
+
+    def velocity(self) -> NDArray[np.float64]:
+        """
+        Velocity of each channel in km/s.
+        """
+        return self.voff + (np.arange(1, self.nchan + 1) - self.rchan) * self.vres
+
+    def frequency(self) -> NDArray[np.float64]:
+        """
+        Rest frequency of each channel in MHz.
+        """
+        return self.restf + (np.arange(1, self.nchan + 1) - self.rchan) * self.fres
+
+
+class UVTable:
+    """
+    Memory-mapped GILDAS UV table.
+
+    parameters:
+    -----------
+    file_name: str
+        UV table, e.g., "D/L09/B5_L09_contsub.uvt".
+    mode: str
+        "r" for read-only access, "r+" to modify the data in place.
+    """
+
+    def __init__(self, file_name: str, mode: str = "r"):
+        self.file_name = file_name
+        if os.path.getsize(file_name) < header_size:
+            raise ValueError(f"File too short for a GILDAS UV table: {file_name}")
+        with open(file_name, "rb") as fh:
+            self.raw_header = fh.read(header_size)
+        code = self.raw_header[:12]
+        if code not in uv_codes:
+            raise ValueError(
+                f"Unsupported GILDAS UV table (code {code!r}): {file_name}"
+            )
+        self.byteorder = uv_codes[code]
+        values = np.frombuffer(self.raw_header, dtype=header_dtype(self.byteorder))[0]
+        if values["form"] != form_real:
+            raise ValueError(f"Unsupported data format {values['form']}: {file_name}")
+        ndaps = int(values["ndaps"]) if values["ndaps"] > 0 else ndaps_default
+        natom = int(values["natom"]) if values["natom"] > 0 else 3
+        ncol, nvis = int(values["dim"][0]), int(values["dim"][1])
+        self.header = UVHeader(
+            nvis=nvis,
+            nchan=(ncol - ndaps) // natom,
+            rchan=float(values["ref1"]),
+            voff=float(values["val1"]),
+            vres=float(values["inc1"]),
+            restf=float(values["restf"]),
+            fres=float(values["fres"]),
+            source=values["source"].decode("latin-1").strip(),
+            line=values["line"].decode("latin-1").strip(),
+            ra=float(values["ra"]),
+            dec=float(values["dec"]),
+            ndaps=ndaps,
+            natom=natom,
+        )
+        if ncol != self.header.ncol:
+            raise ValueError(f"Inconsistent UV table columns: {file_name}")
+        if header_size + 4 * ncol * nvis > os.path.getsize(file_name):
+            raise ValueError(f"Truncated GILDAS UV table: {file_name}")
+        self.data = np.memmap(
+            file_name,
+            dtype=np.dtype("f4").newbyteorder(self.byteorder),
+            mode=mode,
+            offset=header_size,
+            shape=(nvis, ncol),
+        )
+
+    def __enter__(self) -> "UVTable":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Flush the changes (if opened with mode "r+") and release the memory map.
+        """
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+        self.data = np.empty((0, self.header.ncol), dtype=np.float32)
+
+    @property
+    def daps(self) -> NDArray[np.float32]:
+        """
+        Leading columns (u, v, scan, date, time, iant, jant), as a view.
+        """
+        return self.data[:, : self.header.ndaps]
+
+    def visibilities(
+        self, first: int = 0, last: int | None = None
+    ) -> NDArray[np.float32]:
+        """
+        View of the (real, imaginary, weight) of a range of channels, with shape
+        (nvis, last - first, natom). Channels are 0-based, last is exclusive.
+        """
+        if last is None:
+            last = self.header.nchan
+        start = self.header.ndaps + self.header.natom * first
+        end = self.header.ndaps + self.header.natom * last
+        return self.data[:, start:end].reshape(
+            self.header.nvis, last - first, self.header.natom
+        )
+
+    def channel_range(self, v_min: float, v_max: float) -> tuple[int, int]:
+        """
+        Channels within a velocity range, as MAPPING 'uv_extract /range v_min v_max
+        velocity' selects them.
+
+        returns:
+        --------
+        first: int
+            First channel (0-based).
+        last: int
+            Last channel (0-based, exclusive).
+        """
+        header = self.header
+        return extract_channels(
+            header.nchan, header.rchan, header.vres, header.voff, v_min, v_max
+        )
+
+
+def _encode(text: str) -> bytes:
+    return text.encode("ascii")[:12].ljust(12)
+
+
+def _make_header(
+    header: UVHeader, raw_header: bytes | None = None, byteorder: str = "<"
+) -> bytes:
+    """
+    Function to encode the header of a UV table. If raw_header is given, the words
+    that are not decoded by this module are kept from it.
+    """
+    dtype = header_dtype(byteorder)
+    if raw_header is None:
+        values = np.zeros(1, dtype=dtype)
+        values["code"] = b"GILDAS_UVFIL"
+        values["form"] = form_real
+        values["gene"] = 29
+        values["ndim"] = 2
+        values["blan_words"] = 2
+        values["desc_words"] = 18
+        values["code1"] = _encode("RANDOM")
+        values["code2"] = _encode("UV-RAW")
+        values["syst"] = _encode("EQUATORIAL")
+        values["posi_words"] = 12
+        values["epoch"] = 2000.0
+        values["proj_words"] = 9
+        values["ptyp"] = 3  # azimuthal projection
+        values["spec_words"] = 12
+        values["faxi"] = 1
+        values["uvda_words"] = 18
+        values["nstokes"] = 1
+        values["ref2"] = 1.0
+        values["inc2"] = 1.0
+    else:
+        values = np.frombuffer(raw_header, dtype=dtype).copy()
+    values["dim"][0][0] = header.ncol
+    values["dim"][0][1] = header.nvis
+    values["dim"][0][2:] = 1
+    values["nvb"] = header_blocks + -(-4 * header.ncol * header.nvis // block_size)
+    values["ref1"] = header.rchan
+    values["val1"] = header.voff
+    values["inc1"] = header.vres
+    values["restf"] = header.restf
+    values["fres"] = header.fres
+    values["vres"] = header.vres
+    values["voff"] = header.voff
+    values["source"] = _encode(header.source)
+    values["line"] = _encode(header.line)
+    values["ra"] = header.ra
+    values["dec"] = header.dec
+    values["a0"] = header.ra
+    values["d0"] = header.dec
+    values["nchan"] = header.nchan
+    values["nvisi"] = header.nvis
+    values["natom"] = header.natom
+    values["ndaps"] = header.ndaps
+    return values.tobytes()
+
+
+def write_uv_table(
+    file_name: str,
+    header: UVHeader,
+    data: NDArray[np.floating],
+    raw_header: bytes | None = None,
+) -> None:
+    """
+    Function to write a GILDAS UV table.
+
+    parameters:
+    -----------
+    file_name: str
+        Output UV table. It is overwritten if it exists.
+    header: UVHeader
+        Description of the table.
+    data: NDArray
+        Visibilities, with shape (nvis, ncol).
+    raw_header: bytes | None
+        Header of the table the data come from, whose other words are kept.
+    """
+    if data.shape != (header.nvis, header.ncol):
+        raise ValueError(
+            f"Data shape {data.shape} does not match the header "
+            f"({header.nvis}, {header.ncol})"
+        )
+    tmp_file = f"{file_name}.tmp"
+    with open(tmp_file, "wb") as fh:
+        fh.write(_make_header(header, raw_header))
+        np.ascontiguousarray(data, dtype="<f4").tofile(fh)
+    os.replace(tmp_file, file_name)
+
+
+def create_uv_table(
+    file_name: str, header: UVHeader, raw_header: bytes | None = None
+) -> UVTable:
+    """
+    Function to create a GILDAS UV table of the size given by its header, filled
+    with zeros, and open it for writing (mode "r+"), so that large tables can be
+    filled in parts without holding them in memory.
+
+    parameters:
+    -----------
+    file_name: str
+        Output UV table. It is overwritten if it exists.
+    header: UVHeader
+        Description of the table.
+    raw_header: bytes | None
+        Header of the table the data come from, whose other words are kept.
+    """
+    with open(file_name, "wb") as fh:
+        fh.write(_make_header(header, raw_header))
+        fh.truncate(header_size + 4 * header.ncol * header.nvis)
+    return UVTable(file_name, mode="r+")
+
+
+def _subset_header(
+    src: UVHeader, first: int, last: int, restf: float | None, line: str | None
+) -> UVHeader:
+    if not 0 <= first < last <= src.nchan:
+        raise ValueError(f"Invalid channel range [{first}, {last}) for {src.nchan}")
+    rchan = src.rchan
+    if restf is not None:
+        rchan = change_rest_frequency(src.restf, src.rchan, src.fres, restf)
+    return UVHeader(
+        nvis=src.nvis,
+        nchan=last - first,
+        rchan=rchan - first,
+        restf=src.restf if restf is None else restf,
+        fres=src.fres,
+        vres=src.vres,
+        voff=src.voff,
+        source=src.source,
+        line=src.line if line is None else line,
+        ra=src.ra,
+        dec=src.dec,
+        ndaps=src.ndaps,
+        natom=src.natom,
+    )
+
+
+def write_channel_subsets(
+    table: UVTable,
+    subsets: list[tuple[str, int, int, float | None, str | None]],
+    rows_per_chunk: int = 65536,
+) -> list[UVHeader]:
+    """
+    Function to write several channel ranges of a UV table to new tables,
+    reading the input table once: each chunk of rows is read from the memory map
+    and its channel ranges are appended to all the outputs.
+    If a rest frequency is given, the velocity axis of the output is referred to
+    it, as MAPPING 'modify /frequency' does (the frequency axis is unchanged).
+
+    parameters:
+    -----------
+    table: UVTable
+        Input table.
+    subsets: list[tuple[str, int, int, float | None, str | None]]
+        (output file, first, last, restf, line) of each output table: channel
+        range (0-based, last exclusive), new rest frequency (MHz) and line name
+        (None to keep the ones of the input table).
+        Output files are overwritten if they exist.
+    rows_per_chunk: int
+        Number of visibilities read at once.
+    returns:
+    --------
+    headers: list[UVHeader]
+        Header of each output table.
+    """
+    src = table.header
+    headers = [
+        _subset_header(src, first, last, restf, line)
+        for _, first, last, restf, line in subsets
+    ]
+    handles = [open(f"{file_name}.tmp", "wb") for file_name, _, _, _, _ in subsets]
+    try:
+        for fh, header in zip(handles, headers):
+            fh.write(_make_header(header, table.raw_header, table.byteorder))
+        for row in range(0, src.nvis, rows_per_chunk):
+            rows = table.data[row : row + rows_per_chunk]
+            for fh, header, (_, first, last, _, _) in zip(handles, headers, subsets):
+                start = src.ndaps + src.natom * first
+                end = src.ndaps + src.natom * last
+                chunk = np.empty((len(rows), header.ncol), dtype="<f4")
+                chunk[:, : src.ndaps] = rows[:, : src.ndaps]
+                chunk[:, src.ndaps :] = rows[:, start:end]
+                chunk.tofile(fh)
+    finally:
+        for fh in handles:
+            fh.close()
+    for file_name, _, _, _, _ in subsets:
+        os.replace(f"{file_name}.tmp", file_name)
+    return headers
+
+
+def write_channel_subset(
+    table: UVTable,
+    file_name: str,
+    first: int,
+    last: int,
+    restf: float | None = None,
+    line: str | None = None,
+    rows_per_chunk: int = 65536,
+) -> UVHeader:
+    """
+    Function to write the channels [first, last) of a UV table to a new table
+    (see write_channel_subsets).
+
+    returns:
+    --------
+    header: UVHeader
+        Header of the output table.
+    """
+    return write_channel_subsets(
+        table, [(file_name, first, last, restf, line)], rows_per_chunk
+    )[0]
+
+
+def extract_velocities(
+    window_file: str,
+    extractions: list[tuple[str, float, float, float | None, str | None]],
+    rows_per_chunk: int = 65536,
+) -> list[UVHeader]:
+    """
+    Function to cut several velocity ranges out of a UV table in a single read,
+    as MAPPING 'modify /frequency line restf' followed by 'uv_extract /range
+    v_min v_max velocity' does for each of them, without modifying the input table.
+
+    parameters:
+    -----------
+    window_file: str
+        Input UV table, e.g., the NOEMA window of the lines.
+    extractions: list[tuple[str, float, float, float | None, str | None]]
+        (output file, v_min, v_max, restf, line) of each output table: velocity
+        range in km/s referred to restf, rest frequency (MHz) of the line and
+        its name (None to keep the ones of the input table).
+    rows_per_chunk: int
+        Number of visibilities read at once.
+    returns:
+    --------
+    headers: list[UVHeader]
+        Header of each output table.
+    """
+    with UVTable(window_file) as table:
+        src = table.header
+        subsets: list[tuple[str, int, int, float | None, str | None]] = []
+        for file_name, v_min, v_max, restf, line in extractions:
+            rchan = src.rchan
+            if restf is not None:
+                rchan = change_rest_frequency(src.restf, src.rchan, src.fres, restf)
+            first, last = extract_channels(
+                src.nchan, rchan, src.vres, src.voff, v_min, v_max
+            )
+            subsets.append((file_name, first, last, restf, line))
+        return write_channel_subsets(table, subsets, rows_per_chunk)
+
+
+def extract_velocity(
+    window_file: str,
+    file_name: str,
+    v_min: float,
+    v_max: float,
+    restf: float | None = None,
+    line: str | None = None,
+) -> UVHeader:
+    """
+    Function to cut a velocity range out of a UV table (see extract_velocities).
+
+    returns:
+    --------
+    header: UVHeader
+        Header of the output table.
+    """
+    return extract_velocities(window_file, [(file_name, v_min, v_max, restf, line)])[0]
+
+
+def _same_spectral_axis(header: UVHeader, other: UVHeader) -> bool:
+    return (
+        header.nchan == other.nchan
+        and header.ncol == other.ncol
+        and bool(
+            np.allclose(
+                [header.rchan, header.restf, header.fres, header.vres, header.voff],
+                [other.rchan, other.restf, other.fres, other.vres, other.voff],
+                rtol=1e-6,
+                atol=1e-6,
+            )
+        )
+    )
+
+
+def append_uv_tables(
+    file_names: list[str], out_file: str, rows_per_chunk: int = 65536
+) -> UVHeader:
+    """
+    Function to concatenate the visibilities of several UV tables with the same
+    spectral axis and phase centre into a new table, as appending with CLIC
+    'table' does.
+    The header of the first table is used for the output.
+
+    parameters:
+    -----------
+    file_names: list[str]
+        Input UV tables, e.g., the same chunk from different configurations.
+    out_file: str
+        Output UV table. It is overwritten if it exists.
+    rows_per_chunk: int
+        Number of visibilities copied at once.
+    returns:
+    --------
+    header: UVHeader
+        Header of the output table.
+    """
+    if len(file_names) == 0:
+        raise ValueError("No UV tables to append")
+    tables = [UVTable(file_name) for file_name in file_names]
+    try:
+        first = tables[0]
+        for table in tables[1:]:
+            if not _same_spectral_axis(first.header, table.header):
+                raise ValueError(
+                    f"Spectral axis of {table.file_name} does not match "
+                    f"{first.file_name}"
+                )
+            offset = phase_center_offset(
+                first.header.ra, first.header.dec, table.header.ra, table.header.dec
+            )
+            if np.hypot(*offset) > phase_center_tolerance:
+                raise ValueError(
+                    f"Phase centre of {table.file_name} does not match "
+                    f"{first.file_name}, shift it first (see shift_phase_center)"
+                )
+        header = replace(first.header, nvis=sum(table.header.nvis for table in tables))
+        tmp_file = f"{out_file}.tmp"
+        with open(tmp_file, "wb") as fh:
+            fh.write(_make_header(header, first.raw_header, first.byteorder))
+            for table in tables:
+                for row in range(0, table.header.nvis, rows_per_chunk):
+                    rows = table.data[row : row + rows_per_chunk]
+                    np.asarray(rows, dtype="<f4").tofile(fh)
+        os.replace(tmp_file, out_file)
+    finally:
+        for table in tables:
+            table.close()
+    return header
+
+
+def subtract_continuum(
+    in_file: str,
+    out_file: str,
+    windows: list[tuple[float, float]],
+    order: int = 0,
+    chunk_bytes: int = chunk_bytes,
+) -> UVHeader:
+    """
+    Function to subtract the continuum of each visibility of a UV table, as MAPPING
+    'uv_baseline order /range v_min v_max velocity' does: a polynomial is fitted to
+    the real and imaginary parts of each visibility over the channels outside the
+    line windows, and subtracted from all the channels.
+    The table is read in chunks of rows, and all the fits of a chunk are solved
+    at once (see baseline.fit_baseline). The number of rows of a chunk is set
+    by a memory budget, so that the memory used does not depend on the number
+    of visibilities nor of channels. Channels with a weight <= 0 are not used in the
+    fits and are copied unchanged.
+
+    parameters:
+    -----------
+    in_file: str
+        Input UV table, e.g., the NOEMA window of the lines.
+    out_file: str
+        Output UV table. It is overwritten if it exists.
+    windows: list[tuple[float, float]]
+        Velocity ranges (km/s, in the velocity axis of the table) of the line
+        emission, excluded from the fits.
+    order: int
+        Order of the polynomial continuum.
+    chunk_bytes: int
+        Memory budget of a chunk of rows, including the work arrays of the fits
+        (contsub_row_factor times the size of the rows).
+    returns:
+    --------
+    header: UVHeader
+        Header of the output table.
+    """
+    with UVTable(in_file) as table:
+        header = table.header
+        if header.natom < 3:
+            raise ValueError(f"UV table without weights: {in_file}")
+        velocity = header.velocity()
+        n_fit = int(np.sum(window_mask(velocity, windows)))
+        if n_fit <= order:
+            raise ValueError(
+                f"Only {n_fit} line-free channels to fit the continuum of {in_file}"
+            )
+        tmp_file = f"{out_file}.tmp"
+        with open(tmp_file, "wb") as fh:
+            fh.write(_make_header(header, table.raw_header, table.byteorder))
+            row_bytes = 4 * header.ncol * contsub_row_factor
+            rows_per_chunk = max(1, chunk_bytes // row_bytes)
+            for row in range(0, header.nvis, rows_per_chunk):
+                chunk = np.array(table.data[row : row + rows_per_chunk], dtype="<f4")
+                n_rows = len(chunk)
+                vis = chunk[:, header.ndaps :].reshape(n_rows, header.nchan, -1)
+                flagged = vis[:, :, 2] <= 0
+                parts = np.concatenate([vis[:, :, 0], vis[:, :, 1]])
+                parts[np.concatenate([flagged, flagged])] = np.nan
+                reduced, _, _ = fit_baseline(parts, velocity, windows, order=order)
+                vis[:, :, 0] = np.where(flagged, vis[:, :, 0], reduced[:n_rows])
+                vis[:, :, 1] = np.where(flagged, vis[:, :, 1], reduced[n_rows:])
+                chunk.tofile(fh)
+        os.replace(tmp_file, out_file)
+    return header
+
+
+def phase_center_offset(
+    ra: float, dec: float, ra_new: float, dec_new: float
+) -> tuple[float, float]:
+    """
+    Function to compute the direction cosines (l, m) of a new phase centre in the
+    projection around the current one. Coordinates are in radians.
+    """
+    d_ra = ra_new - ra
+    l_0 = np.cos(dec_new) * np.sin(d_ra)
+    m_0 = np.sin(dec_new) * np.cos(dec) - np.cos(dec_new) * np.sin(dec) * np.cos(d_ra)
+    return float(l_0), float(m_0)
+
+
+def _shift_rows(
+    rows: NDArray[np.float32], header: UVHeader, l_0: float, m_0: float
+) -> None:
+    """
+    Function to rotate the phases of a chunk of rows in place, for all the
+    channels at once, and to refer the field offsets of mosaics to the new centre.
+    """
+    # (u l_0 + v m_0) in m, times the wavenumber of each channel
+    path = rows[:, 0].astype(np.float64) * l_0 + rows[:, 1].astype(np.float64) * m_0
+    wavenumber = 2.0 * np.pi * header.frequency() * 1e6 / speed_of_light
+    phase = np.exp(1j * path[:, None] * wavenumber[None, :])
+    vis = rows[:, header.ndaps :].reshape(len(rows), header.nchan, header.natom)
+    shifted = (vis[:, :, 0] + 1j * vis[:, :, 1]) * phase
+    vis[:, :, 0] = shifted.real
+    vis[:, :, 1] = shifted.imag
+    if header.ndaps > max(mosaic_columns):
+        rows[:, mosaic_columns[0]] -= l_0
+        rows[:, mosaic_columns[1]] -= m_0
+
+
+def shift_phase_center(
+    in_file: str,
+    ra: float,
+    dec: float,
+    out_file: str | None = None,
+    rows_per_chunk: int = 65536,
+) -> UVHeader:
+    """
+    Function to move the phase centre of a UV table, as MAPPING 'uv_shift ra dec'
+    does: the phase of each visibility is rotated by 2 pi (u l_0 + v m_0) / lambda
+    at the wavelength of each channel, where (l_0, m_0) are the direction cosines
+    of the new centre (see phase_center_offset). The pointing offsets of the
+    fields of mosaics (mosaic_columns) are referred to the new centre.
+    The u, v coordinates are not reprojected to the new tangent point, which is
+    accurate for shifts of a few arcminutes.
+    The table is processed in chunks of rows, either in place or into a new table.
+
+    parameters:
+    -----------
+    in_file: str
+        Input UV table.
+    ra, dec: float
+        Coordinates of the new phase centre in radians.
+    out_file: str | None
+        Output UV table, overwritten if it exists. If None, the input table is
+        modified in place.
+    rows_per_chunk: int
+        Number of visibilities processed at once.
+    returns:
+    --------
+    header: UVHeader
+        Header of the shifted table.
+    """
+    table = UVTable(in_file, mode="r+" if out_file is None else "r")
+    try:
+        src = table.header
+        if src.natom < 2:
+            raise ValueError(f"UV table without complex visibilities: {in_file}")
+        header = replace(src, ra=ra, dec=dec)
+        l_0, m_0 = phase_center_offset(src.ra, src.dec, ra, dec)
+        if out_file is None:
+            for row in range(0, src.nvis, rows_per_chunk):
+                rows = np.array(table.data[row : row + rows_per_chunk], dtype="<f4")
+                _shift_rows(rows, src, l_0, m_0)
+                table.data[row : row + rows_per_chunk] = rows
+            table.close()
+            with open(in_file, "r+b") as fh:
+                fh.write(_make_header(header, table.raw_header, table.byteorder))
+        else:
+            tmp_file = f"{out_file}.tmp"
+            with open(tmp_file, "wb") as fh:
+                fh.write(_make_header(header, table.raw_header, table.byteorder))
+                for row in range(0, src.nvis, rows_per_chunk):
+                    rows = np.array(table.data[row : row + rows_per_chunk], dtype="<f4")
+                    _shift_rows(rows, src, l_0, m_0)
+                    rows.tofile(fh)
+            os.replace(tmp_file, out_file)
+    finally:
+        table.close()
+    return header
@@ -0,0 +1,329 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any
+
+from . import generate_uvt
+from .runner import run_gildas
+
+
+@dataclass
+class UVTJob:
+    """
+    Step in producing the uv-tables of a setup: a CLIC run over the hpb files
+    of a configuration ("clic"), or a merge of the uv-tables of single
+    configurations into a combined configuration ("merge").
+    """
+
+    setup_name: str
+    config: str
+    kind: str
+    hpb_dict: list[dict[str, Any]] = field(default_factory=list)
+    depends: list[str] = field(default_factory=list)
+    chunks: list[str] | None = None
+    part: int | None = None
+
+    @property
+    def name(self) -> str:
+        if self.part is None:
+            return f"{self.setup_name}-{self.config}"
+        return f"{self.setup_name}-{self.config}-p{self.part}"
+
+
+def plan_uvt_jobs(
+    config_path: str,
+    setups: list[str] | None = None,
+    merge: bool = True,
+    n_parts: int = 1,
+) -> list[UVTJob]:
+    """
+    Function to build the dependency graph of the uv-table production of
+    several setups (see generate_uvt.clic_run_plan). Setups are independent of
+    each other. Within a setup, the single configurations are CLIC runs without
+    dependencies. With merge, each combined configuration depends on the CLIC
+    runs of its single configurations. Without merge, it is a CLIC run of its own.
+
+    parameters:
+    -----------
+    config_path: str
+        Path to the CLIC configuration file, e.g., "clic_config_MIOP.yaml".
+    setups: list[str] | None
+        Setups to process. If None, all the setups in the configuration file.
+    merge: bool
+        If True, the combined configurations are merged from the single ones.
+    n_parts: int
+        Number of CLIC jobs each configuration is split into, each tabling a
+        subset of the chunks (see generate_uvt.partition_chunks).
+    returns:
+    --------
+    jobs: list[UVTJob]
+        Jobs in an order compatible with their dependencies.
+    """
+    config = generate_uvt.load_config(config_path)
+    all_setups = config.get("setups", {})
+    if setups is None:
+        setups = list(all_setups.keys())
+    if n_parts > 1:
+        parts: list[list[str] | None] = list(
+            generate_uvt.partition_chunks(
+                generate_uvt.chunk_names(config.get("highres_parameters", {})),
+                n_parts,
+            )
+        )
+    else:
+        parts = [None]
+    jobs: list[UVTJob] = []
+    for setup_name in setups:
+        if setup_name not in all_setups:
+            raise ValueError(f"Setup '{setup_name}' not found in {config_path}")
+        clic_runs, merges = generate_uvt.clic_run_plan(
+            all_setups[setup_name], merge=merge
+        )
+        clic_jobs: dict[str, list[str]] = {}
+        for config_i, hpb_dict in clic_runs.items():
+            for k, chunks in enumerate(parts):
+                job = UVTJob(
+                    setup_name,
+                    config_i,
+                    "clic",
+                    hpb_dict=hpb_dict,
+                    chunks=chunks,
+                    part=None if chunks is None else k,
+                )
+                jobs.append(job)
+                clic_jobs.setdefault(config_i, []).append(job.name)
+        for config_i, components in merges.items():
+            depends = [
+                name for component in components for name in clic_jobs[component]
+            ]
+            jobs.append(UVTJob(setup_name, config_i, "merge", depends=depends))
+    return jobs
+
+
+def _absolute_hpb(hpb_dict: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    # hpb files are given relative to the folder where the jobs are started
+    return [
+        {**entry, "file": os.path.abspath(entry["file"])}
+        if entry.get("file", None) is not None
+        else entry
+        for entry in hpb_dict
+    ]
+
+
+def run_uvt_job(
+    job: UVTJob,
+    config_path: str,
+    work_root: str,
+    log_dir: str,
+    uvt_root: str,
+    timeout: float | None = None,
+    retries: int = 0,
+    append: bool = False,
+) -> int:
+    """
+    Function to run a single job. CLIC jobs write their script and run in their
+    own working directory, {work_root}/{job name}, and their output is stored
+    in {log_dir}/{job name}.clic.log.
+    All the paths given to CLIC are absolute, so that jobs do not depend on
+    their working directory.
+    With append, the CLIC script only appends the hpb files not tabled yet
+    (see generate_uvt.prepare_config_append), whose state is kept in work_root.
+
+    returns:
+    --------
+    status: int
+        Exit status of the CLIC session, or -1 if the job raised an error.
+    """
+    try:
+        if job.kind == "merge":
+            generate_uvt.merge_configurations(
+                job.setup_name, config_path, configs=[job.config], uvt_root=uvt_root
+            )
+            return 0
+        config = generate_uvt.load_config(config_path)
+        setup = config["setups"][job.setup_name]
+        sources = setup.get("sources", [])
+        for name in generate_uvt.make_uvt_names(sources, job.config, root=uvt_root):
+            os.makedirs(os.path.dirname(name), exist_ok=True)
+        work_dir = os.path.join(work_root, job.name)
+        os.makedirs(work_dir, exist_ok=True)
+        hpb_dict = _absolute_hpb(job.hpb_dict)
+        if append:
+            script_file = generate_uvt.prepare_config_append(
+                setup_name=job.setup_name,
+                sources=sources,
+                receiver=config.get("receiver", 3),
+                hpb_dict=hpb_dict,
+                high_res_parameters=config.get("highres_parameters", {}),
+                config=job.config,
+                uvt_root=uvt_root,
+                script_dir=work_dir,
+                state_dir=work_root,
+                chunks=job.chunks,
+                part=job.part,
+            )
+            if script_file is None:
+                return 0
+        else:
+            script_file = generate_uvt.prepare_config(
+                setup_name=job.setup_name,
+                sources=sources,
+                receiver=config.get("receiver", 3),
+                hpb_dict=hpb_dict,
+                high_res_parameters=config.get("highres_parameters", {}),
+                config=job.config,
+                uvt_root=uvt_root,
+                script_dir=work_dir,
+                chunks=job.chunks,
+                part=job.part,
+            )
+        with open(script_file, "r") as f:
+            script = f.read()
+        result = run_gildas(
+            "clic",
+            script + "exit\n",
+            log_file=os.path.join(log_dir, f"{job.name}.clic.log"),
+            scratch_dir=work_dir,
+            timeout=timeout,
+            retries=retries,
+            cwd=work_dir,
+        )
+        return result.returncode
+    except Exception as error:
+        print(f"[ERROR] Job {job.name} failed: {error}")
+        return -1
+
+
+def run_uvt_jobs(
+    config_path: str,
+    setups: list[str] | None = None,
+    merge: bool = True,
+    n_workers: int | None = None,
+    work_root: str = "uvt_jobs",
+    log_dir: str = "logs",
+    uvt_root: str = "../../uvts",
+    timeout: float | None = None,
+    retries: int = 0,
+    n_parts: int = 1,
+    append: bool = False,
+) -> dict[str, int]:
+    """
+    Function to produce the uv-tables of several setups, running the CLIC jobs
+    (see plan_uvt_jobs) in parallel. A job starts as soon as all its
+    dependencies have finished successfully. Jobs that depend on a failed job
+    are not run.
+
+    parameters:
+    -----------
+    config_path: str
+        Path to the CLIC configuration file, e.g., "clic_config_MIOP.yaml".
+    setups: list[str] | None
+        Setups to process. If None, all the setups in the configuration file.
+    merge: bool
+        If True, the combined configurations are merged from the single ones
+        instead of being calibrated again in CLIC.
+    n_workers: int | None
+        Maximum number of jobs running at the same time. If None, the number
+        of CPUs is used.
+    work_root: str
+        Folder where the working directory of each job is created.
+    log_dir: str
+        Folder where the log of each CLIC job is stored.
+    uvt_root: str
+        Folder of the uv-tables (see generate_uvt.make_uvt_names). Relative
+        paths, and the hpb files in the configuration file, are relative to the
+        current directory.
+    timeout: float | None
+        Wall-clock time limit in seconds for each CLIC session.
+    retries: int
+        Number of times a failed CLIC session is run again.
+    n_parts: int
+        Number of CLIC jobs each configuration is split into (see plan_uvt_jobs).
+    append: bool
+        If True, only the hpb files not tabled yet are appended to the existing
+        uv-tables. The files are recorded as tabled once all the CLIC jobs of
+        their configuration have finished successfully.
+    returns:
+    --------
+    status: dict[str, int]
+        Exit status of each job by name ({setup}-{config}, followed by -p{part}
+        for split jobs), -1 for jobs that failed with an error or were not run.
+    """
+    jobs = plan_uvt_jobs(config_path, setups=setups, merge=merge, n_parts=n_parts)
+    config_path = os.path.abspath(config_path)
+    work_root = os.path.abspath(work_root)
+    log_dir = os.path.abspath(log_dir)
+    uvt_root = os.path.abspath(uvt_root)
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    print(f"[INFO] Running {len(jobs)} uv-table jobs with {n_workers} workers")
+    status: dict[str, int] = {}
+    pending = list(jobs)
+    running: dict[Future[int], UVTJob] = {}
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        while len(pending) > 0 or len(running) > 0:
+            n_pending = len(pending)
+            for job in list(pending):
+                if any(status.get(name, 0) != 0 for name in job.depends):
+                    print(f"[WARNING] Skipping {job.name}: a dependency failed")
+                    status[job.name] = -1
+                    pending.remove(job)
+                elif all(name in status for name in job.depends):
+                    future = pool.submit(
+                        run_uvt_job,
+                        job,
+                        config_path,
+                        work_root,
+                        log_dir,
+                        uvt_root,
+                        timeout,
+                        retries,
+                        append,
+                    )
+                    running[future] = job
+                    pending.remove(job)
+            if len(running) == 0:
+                if len(pending) == n_pending:
+                    names = [job.name for job in pending]
+                    raise ValueError(f"Jobs with unresolved dependencies: {names}")
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                status[running.pop(future).name] = future.result()
+    if append:
+        _record_tabled_jobs(jobs, status, config_path, work_root, uvt_root)
+    n_failed = sum(1 for status_i in status.values() if status_i != 0)
+    if n_failed > 0:
+        print(f"[WARNING] {n_failed} of {len(status)} jobs failed")
+    return status
+
+
+def _record_tabled_jobs(
+    jobs: list[UVTJob],
+    status: dict[str, int],
+    config_path: str,
+    state_dir: str,
+    uvt_root: str,
+) -> None:
+    """
+    Function to record the hpb files of the configurations whose CLIC jobs
+    (all their parts) finished successfully.
+    """
+    config = generate_uvt.load_config(config_path)
+    groups: dict[tuple[str, str], list[UVTJob]] = {}
+    for job in jobs:
+        if job.kind == "clic":
+            groups.setdefault((job.setup_name, job.config), []).append(job)
+    for (setup_name, config_i), group in groups.items():
+        if any(status.get(job.name, -1) != 0 for job in group):
+            continue
+        generate_uvt.record_tabled(
+            setup_name,
+            config["setups"][setup_name].get("sources", []),
+            config.get("receiver", 3),
+            _absolute_hpb(group[0].hpb_dict),
+            config.get("highres_parameters", {}),
+            config=config_i,
+            uvt_root=uvt_root,
+            state_dir=state_dir,
+        )
@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+
+from noema_combine.baseline import (
+    change_rest_frequency,
+    extract_channels,
+    fit_baseline,
+    reduce_block,
+    resample_band,
+    resample_spectra,
+    velocity_axis,
+)
+
+
+def make_block(n_spectra: int = 20, nchan: int = 200, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    velocity = velocity_axis(nchan, 100.5, -0.2, 10.0)
+    line = np.exp(-0.5 * ((velocity - 10.0) / 0.5) ** 2)
+    slope = rng.normal(size=(n_spectra, 1))
+    offset = rng.normal(size=(n_spectra, 1))
+    spectra = offset + slope * velocity[None, :] / 20.0 + line[None, :]
+    return spectra.astype(np.float32), velocity, line
+
+
+def test_change_rest_frequency():
+    """Test the reference channel after changing the rest frequency"""
+    assert change_rest_frequency(100000.0, 10.0, 0.5, 100001.0) == 12.0
+
+
+def test_extract_channels():
+    """Test the channels kept within a velocity range"""
+    # v(i) = 10 + (i - 100.5) * (-0.2), channel 1-based
+    first, last = extract_channels(200, 100.5, -0.2, 10.0, 8.0, 12.0)
+    velocity = velocity_axis(200, 100.5, -0.2, 10.0)[first:last]
+    assert velocity.max() == pytest.approx(12.0, abs=0.1)
+    assert velocity.min() == pytest.approx(8.0, abs=0.1)
+    assert extract_channels(200, 100.5, -0.2, 10.0, -100.0, 100.0) == (0, 200)
+    with pytest.raises(ValueError, match="outside the spectrum"):
+        extract_channels(200, 100.5, -0.2, 10.0, 100.0, 200.0)
+
+
+def test_fit_baseline_block():
+    """Test that the baselines of a block are removed, keeping the line"""
+    spectra, velocity, line = make_block()
+    reduced, coefficients, rms = fit_baseline(spectra, velocity, [(7.0, 13.0)])
+    assert coefficients.shape == (20, 2)
+    np.testing.assert_allclose(reduced, np.broadcast_to(line, reduced.shape), atol=1e-4)
+    np.testing.assert_allclose(rms, 0.0, atol=1e-4)
+
+
+def test_fit_baseline_matches_single_fits():
+    """Test that the batched fit gives the same result as one fit per spectrum"""
+    spectra, velocity, _ = make_block(n_spectra=5)
+    spectra = spectra + np.random.default_rng(2).normal(size=spectra.shape) * 0.1
+    reduced, _, rms = fit_baseline(spectra, velocity, [(7.0, 13.0)], order=2)
+    for i in range(5):
+        reduced_i, _, rms_i = fit_baseline(spectra[i], velocity, [(7.0, 13.0)], order=2)
+        np.testing.assert_allclose(reduced[i], reduced_i[0], atol=1e-5)
+        np.testing.assert_allclose(rms[i], rms_i[0])
+
+
+def test_fit_baseline_blanked():
+    """Test that blanked channels are ignored and kept blanked"""
+    spectra, velocity, line = make_block(n_spectra=3)
+    spectra[1, :50] = -1000.0
+    spectra[2, 150:] = np.nan
+    reduced, _, _ = fit_baseline(spectra, velocity, [(7.0, 13.0)], bad=-1000.0)
+    assert np.all(reduced[1, :50] == -1000.0)
+    assert np.all(np.isnan(reduced[2, 150:]))
+    np.testing.assert_allclose(reduced[1, 50:], line[50:], atol=1e-4)
+    np.testing.assert_allclose(reduced[2, :150], line[:150], atol=1e-4)
+    # all the baseline channels blanked: spectrum unchanged
+    spectra[0, :] = -1000.0
+    reduced, _, rms = fit_baseline(spectra, velocity, [(7.0, 13.0)], bad=-1000.0)
+    assert np.all(reduced[0] == -1000.0)
+    assert np.isnan(rms[0])
+
+
+def test_reduce_block():
+    """Test the velocity cut and baseline subtraction of a block"""
+    spectra, velocity, line = make_block()
+    reduced, rchan, _ = reduce_block(
+        spectra, 200, 100.5, -0.2, 10.0, (5.0, 15.0), [(8.0, 12.0)]
+    )
+    velocity_new = velocity_axis(reduced.shape[1], rchan, -0.2, 10.0)
+    assert velocity_new.min() == pytest.approx(4.9)
+    assert velocity_new.max() == pytest.approx(14.9)
+    line_new = np.exp(-0.5 * ((velocity_new - 10.0) / 0.5) ** 2)
+    np.testing.assert_allclose(reduced[0], line_new, atol=1e-4)
+
+
+def dense_overlap(axis_in, axis_out):
+    v_in = velocity_axis(*axis_in)
+    v_out = velocity_axis(*axis_out)
+    half_in = 0.5 * abs(axis_in[2])
+    half_out = 0.5 * abs(axis_out[2])
+    low = np.maximum((v_out - half_out)[:, None], (v_in - half_in)[None, :])
+    high = np.minimum((v_out + half_out)[:, None], (v_in + half_in)[None, :])
+    return np.clip(high - low, 0.0, None) / (2.0 * half_out)
+
+
+def test_resample_band():
+    """Test that the band holds all the overlaps of the dense matrix"""
+    axis_in = (100, 50.5, 0.1, 0.0)
+    for axis_out in [
+        (40, 20.5, -0.2, 0.05),
+        (10, 1.0, 0.1, 4.5),
+        (300, 150.0, 0.033, -1.0),
+        (5, 1.0, 0.1, -20.0),
+    ]:
+        first, band = resample_band(axis_in, axis_out)
+        assert band.shape[1] <= int(np.ceil(abs(axis_out[2] / axis_in[2]))) + 1
+        matrix = np.zeros((axis_out[0], axis_in[0]))
+        for k in range(band.shape[1]):
+            inside = first + k < axis_in[0]
+            matrix[np.flatnonzero(inside), (first + k)[inside]] += band[inside, k]
+        np.testing.assert_allclose(matrix, dense_overlap(axis_in, axis_out))
+
+
+def test_resample_spectra():
+    """Test the overlap resampling onto a coarser and shifted velocity axis"""
+    axis_in = (100, 50.5, 0.1, 0.0)
+    velocity = velocity_axis(*axis_in)
+    # two input channels per output channel, inverted axis
+    axis_out = (40, 20.5, -0.2, 0.05)
+    line = np.exp(-0.5 * (velocity / 1.0) ** 2)
+    slope = 2.0 + 0.3 * velocity
+    resampled, coverage = resample_spectra(np.stack([line, slope]), axis_in, axis_out)
+    np.testing.assert_allclose(coverage, 1.0)
+    v_out = velocity_axis(*axis_out)
+    # linear spectra are kept exactly
+    np.testing.assert_allclose(resampled[1], 2.0 + 0.3 * v_out, atol=1e-12)
+    np.testing.assert_allclose(resampled[0], np.exp(-0.5 * v_out**2), atol=0.01)
+    # output channels outside the input spectrum are not covered
+    resampled, coverage = resample_spectra(slope, axis_in, (10, 1.0, 0.1, 4.5))
+    np.testing.assert_allclose(coverage[0], [1.0] * 5 + [0.5] + [0.0] * 4)
+    assert np.all(np.isnan(resampled[0, 6:]))
+    # invalid channels are not used
+    valid = np.ones((1, 100), dtype=bool)
+    valid[0, 50] = False
+    resampled, coverage = resample_spectra(slope, axis_in, axis_out, valid)
+    assert coverage[0, 20] == pytest.approx(0.75)
+    assert np.sum(coverage < 0.99) == 2
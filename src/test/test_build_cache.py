@@ -0,0 +1,59 @@
+import os
+
+from noema_combine.build_cache import (
+    fingerprint,
+    fingerprint_file,
+    is_up_to_date,
+    save_fingerprint,
+)
+
+
+# Tests for fingerprint
+def test_fingerprint_changes_with_inputs(tmp_path):
+    """Test that the fingerprint depends on script, inputs and catalogue"""
+    file_in = str(tmp_path / "a.30m")
+    with open(file_in, "w") as fh:
+        fh.write("data")
+    fp = fingerprint("find /all\n", [file_in], ["CO,1_0"])
+    assert fp == fingerprint("find /all\n", [file_in], ["CO,1_0"])
+    assert fp != fingerprint("find /all\nexit\n", [file_in], ["CO,1_0"])
+    assert fp != fingerprint("find /all\n", [file_in], ["CO,2_1"])
+    with open(file_in, "a") as fh:
+        fh.write("more data")
+    assert fp != fingerprint("find /all\n", [file_in], ["CO,1_0"])
+
+
+def test_fingerprint_content_hash(tmp_path):
+    """Test that content hashing ignores the modification time"""
+    file_in = str(tmp_path / "a.30m")
+    with open(file_in, "w") as fh:
+        fh.write("data")
+    fp = fingerprint("", [file_in], [], content_hash=True)
+    os.utime(file_in, (1.0, 1.0))
+    assert fp == fingerprint("", [file_in], [], content_hash=True)
+    assert fp != fingerprint("", [file_in], [], content_hash=False)
+
+
+def test_fingerprint_missing_input(tmp_path):
+    """Test that missing inputs are accepted"""
+    file_in = str(tmp_path / "missing.uvt")
+    fp = fingerprint("", [file_in], [])
+    with open(file_in, "w") as fh:
+        fh.write("data")
+    assert fp != fingerprint("", [file_in], [])
+
+
+# Tests for is_up_to_date and save_fingerprint
+def test_is_up_to_date(tmp_path):
+    """Test that a product is up to date only with the same fingerprint"""
+    product = str(tmp_path / "B5_CO_1_0.30m")
+    assert not is_up_to_date(product, "abc")
+    with open(product, "w") as fh:
+        fh.write("data")
+    assert not is_up_to_date(product, "abc")
+    save_fingerprint(product, "abc")
+    assert os.path.isfile(fingerprint_file(product))
+    assert is_up_to_date(product, "abc")
+    assert not is_up_to_date(product, "abd")
+    os.remove(product)
+    assert not is_up_to_date(product, "abc")
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from noema_combine.class_file import (
+    ClassFile,
+    ClassObservation,
+    section_general,
+    spectrum_weights,
+    write_class_file,
+)
+
+
+def make_observations(n_obs: int, nchan: int = 64) -> list[ClassObservation]:
+    return [
+        ClassObservation(
+            source="B5-N" if i % 2 == 0 else "L1448",
+            line="N2H+",
+            telescope="30ME0HLI-F01" if i < n_obs // 2 else "30ME0VLI-F02",
+            scan=100 + i // 4,
+            restf=93173.7637,
+            fres=-0.195,
+            rchan=nchan / 2,
+            vres=0.63,
+            off1=i * 1e-5,
+            off2=-i * 1e-5,
+            lam=0.99,
+            bet=0.57,
+            tsys=100.0 + i,
+            data=np.arange(nchan, dtype=np.float32) + i,
+        )
+        for i in range(n_obs)
+    ]
+
+
+def test_round_trip(tmp_path):
+    """Test reading headers and spectra written by write_class_file"""
+    file_name = str(tmp_path / "test.30m")
+    observations = make_observations(10)
+    write_class_file(file_name, observations)
+    with ClassFile(file_name) as class_file:
+        assert len(class_file) == 10
+        headers = class_file.headers()
+        assert list(headers["num"]) == list(range(1, 11))
+        assert list(headers["scan"][:5]) == [100, 100, 100, 100, 101]
+        assert headers["source"][1] == "L1448"
+        assert headers["telescope"][9] == "30ME0VLI-F02"
+        np.testing.assert_allclose(headers["restf"], 93173.7637)
+        assert set(headers["nchan"]) == {64}
+        obs = class_file.observation(3)
+        assert obs.source == "L1448"
+        assert obs.tsys == 103.0
+        assert obs.lam == 0.99
+        np.testing.assert_allclose(obs.off1, 3e-5, rtol=1e-6)
+        np.testing.assert_array_equal(obs.data, observations[3].data)
+        np.testing.assert_allclose(obs.frequency(), observations[3].frequency())
+
+
+def test_section_headers(tmp_path):
+    """Test that the sections of all the observations are decoded at once"""
+    file_name = str(tmp_path / "test.30m")
+    observations = make_observations(30, nchan=8)
+    observations[4].time = 20.0
+    write_class_file(file_name, observations, reclen=128, lex1=4)
+    with ClassFile(file_name) as class_file:
+        headers = class_file.headers()
+        np.testing.assert_allclose(headers["tsys"], 100.0 + np.arange(30))
+        np.testing.assert_allclose(headers["lam"], 0.99)
+        np.testing.assert_allclose(headers["bad"], -1000.0)
+        assert class_file.section(7, section_general)["tsys"] == 107.0
+        # weights are only known for spectra with an integration time
+        weights = spectrum_weights(headers)
+        assert weights[4] == pytest.approx(20.0 * 0.195 / 104.0**2)
+        np.testing.assert_array_equal(np.delete(weights, 4), 1.0)
+        for i in (0, 17, 29):
+            obs = class_file.observation(i)
+            expected = observations[i]
+            for name in ("source", "telescope", "scan", "tsys", "time", "bad"):
+                assert getattr(obs, name) == getattr(expected, name)
+            np.testing.assert_allclose(obs.off1, expected.off1, rtol=1e-6)
+            np.testing.assert_array_equal(obs.data, expected.data)
+
+
+def test_spectra_are_views(tmp_path):
+    """Test that the spectra are read-only views of the memory map"""
+    file_name = str(tmp_path / "test.30m")
+    write_class_file(file_name, make_observations(5))
+    class_file = ClassFile(file_name)
+    spectrum = class_file.spectrum(2)
+    assert not spectrum.flags.owndata
+    assert not spectrum.flags.writeable
+    assert np.shares_memory(spectrum, class_file._map)
+    batches = list(class_file.spectra(batch_size=2))
+    assert [len(indices) for indices, _ in batches] == [2, 2, 1]
+    assert batches[2][1][0][0] == 4.0
+
+
+def test_index_extensions(tmp_path):
+    """Test files whose index is split in several extensions"""
+    file_name = str(tmp_path / "test.30m")
+    write_class_file(file_name, make_observations(25, nchan=8), reclen=128, lex1=4)
+    with ClassFile(file_name) as class_file:
+        assert len(class_file) == 25
+        assert class_file.observation(24).data[0] == 24.0
+        assert list(class_file.headers()["num"]) == list(range(1, 26))
+
+
+def test_find(tmp_path):
+    """Test the selection of observations as in CLASS"""
+    file_name = str(tmp_path / "test.30m")
+    write_class_file(file_name, make_observations(8))
+    with ClassFile(file_name) as class_file:
+        assert list(class_file.find(source="b5*")) == [0, 2, 4, 6]
+        assert list(class_file.find(source="L1448 B5-N", telescope="*VLI*")) == [
+            4,
+            5,
+            6,
+            7,
+        ]
+        f_min, f_max = class_file.frequency_range()
+        assert f_min[0] < 93173.7637 < f_max[0]
+        assert len(class_file.find(frequency=93173.7637)) == 8
+        assert len(class_file.find(frequency=86754.0)) == 0
+
+
+def test_unsupported_file(tmp_path):
+    """Test that files in another format raise an error"""
+    file_name = str(tmp_path / "old.30m")
+    with open(file_name, "wb") as fh:
+        fh.write(b"1A  " + b"\0" * 508)
+    with pytest.raises(ValueError, match="Unsupported CLASS file format"):
+        ClassFile(file_name)
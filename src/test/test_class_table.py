@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from noema_combine.class_table import (
+    read_class_table,
+    ruze_efficiency,
+    table_ndaps,
+    tmb_factor,
+    write_class_table,
+)
+from noema_combine.uv_table import UVHeader
+
+
+def test_ruze_efficiency():
+    """Test the Ruze fit against the IRAM 30m efficiencies"""
+    assert float(ruze_efficiency(86000.0, 0.863, 0.066)) == pytest.approx(
+        0.81, abs=0.01
+    )
+    assert float(ruze_efficiency(230000.0, 0.863, 0.066)) == pytest.approx(
+        0.59, abs=0.02
+    )
+    factor = tmb_factor(np.array([86000.0, 230000.0]))
+    np.testing.assert_allclose(factor, [0.95 / 0.81, 0.92 / 0.59], rtol=0.05)
+
+
+def test_round_trip(tmp_path):
+    """Test reading the header and data written by write_class_table"""
+    file_name = str(tmp_path / "B5_N2H+_1_0_L09.tab")
+    header = UVHeader(
+        nvis=5,
+        nchan=30,
+        rchan=15.5,
+        restf=93173.7637,
+        fres=-0.0625,
+        vres=0.2,
+        voff=10.0,
+        source="B5",
+        line="N2H+",
+        ra=np.radians(56.9),
+        dec=np.radians(32.86),
+        ndaps=table_ndaps,
+        natom=1,
+    )
+    data = np.arange(5 * 33, dtype=np.float32).reshape(5, 33)
+    write_class_table(file_name, header, data)
+    header_read, data_read = read_class_table(file_name)
+    assert header_read == header
+    np.testing.assert_array_equal(data_read, data)
+    with pytest.raises(ValueError):
+        write_class_table(file_name, header, data[:, :-1])
@@ -1,55 +1,78 @@
+import io
+import os
 import pytest
 from unittest.mock import patch, MagicMock  # , mock_open, call
 import numpy as np
 
 
+from noema_combine.class_file import ClassFile, ClassObservation, write_class_file
+from noema_combine.class_table import read_class_table, tmb_factor
+from noema_combine.uv_table import (
+    UVHeader,
+    UVTable,
+    append_uv_tables,
+    extract_velocities,
+    shift_phase_center,
+    subtract_continuum,
+    write_uv_table,
+)
 from noema_combine.data_handler import (
     get_line_param,
     get_source_param,
     get_uvt_window,
     get_uvt_file,
     get_30m_file,
-    # line_prepare_merge,
+    line_prepare_merge,
+    line_make_short_spacing,
     # line_reduce_30m,
     line_make_uvt,
+    line_make_uvt_batch,
+    window_subtract_continuum,
+    shift_uvt_batch,
+    get_30m_inputfiles,
+    get_30m_lines,
+    line_reduce_30m_batch,
+    _script_30m_find,
 )
 
 
 # Tests for get_line_param
-@patch("noema_combine.data_handler.line_name", np.array(["CO", "13CO", "N2H+"]))
-@patch("noema_combine.data_handler.qn_str", np.array(["1-0", "1-0", "1-0"]))
+@patch(
+    "noema_combine.data_handler.settings.line_name", np.array(["CO", "13CO", "N2H+"])
+)
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0", "1-0", "1-0"]))
 def test_get_line_param_with_qn_found():
     """Test finding line index with quantum number"""
     index = get_line_param("CO", "1-0")
     assert index == 0
 
 
-@patch("noema_combine.data_handler.line_name", np.array(["CO", "13CO"]))
-@patch("noema_combine.data_handler.qn_str", np.array(["1-0", "1-0"]))
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO", "13CO"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0", "1-0"]))
 def test_get_line_param_without_qn_single_entry():
     """Test finding line index without QN when only one entry exists"""
     index = get_line_param("13CO", None)
     assert index == 1
 
 
-@patch("noema_combine.data_handler.line_name", np.array(["CO", "CO", "13CO"]))
-@patch("noema_combine.data_handler.qn_str", np.array(["1-0", "2-1", "1-0"]))
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO", "CO", "13CO"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0", "2-1", "1-0"]))
 def test_get_line_param_without_qn_multiple_entries_raises_error():
     """Test that error is raised when multiple entries exist without QN"""
     with pytest.raises(ValueError, match="Line name is not unique"):
         get_line_param("CO", None)
 
 
-@patch("noema_combine.data_handler.line_name", np.array(["CO", "13CO"]))
-@patch("noema_combine.data_handler.qn_str", np.array(["1-0", "1-0"]))
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO", "13CO"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0", "1-0"]))
 def test_get_line_param_not_found():
     """Test that error is raised when line is not found"""
     with pytest.raises(ValueError, match="Line not found in the catalogue"):
         get_line_param("N2H+", "1-0")
 
 
-@patch("noema_combine.data_handler.line_name", np.array(["CO", "CO"]))
-@patch("noema_combine.data_handler.qn_str", np.array(["1-0", "2-1"]))
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO", "CO"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0", "2-1"]))
 def test_get_line_param_with_qn_second_entry():
     """Test finding second line entry with specific QN"""
     index = get_line_param("CO", "2-1")
@@ -58,7 +81,7 @@ def test_get_line_param_with_qn_second_entry():
 
 # Tests for get_source_param
 @patch.dict(
-    "noema_combine.data_handler.region_catalogue",
+    "noema_combine.data_handler.settings.region_catalogue",
     {
         "B5": {
             "source_30m": "B5",
@@ -77,7 +100,7 @@ def test_get_source_param_found():
 
 
 @patch.dict(
-    "noema_combine.data_handler.region_catalogue",
+    "noema_combine.data_handler.settings.region_catalogue",
     {
         "B5": {
             "source_30m": "b5",
@@ -129,7 +152,7 @@ def test_get_source_param_coordinates():
 
 
 @patch.dict(
-    "noema_combine.data_handler.region_catalogue",
+    "noema_combine.data_handler.settings.region_catalogue",
     {
         "B5": {
             "source_30m": "B5",
@@ -155,7 +178,7 @@ def test_get_source_param_second_source():
 
 
 @patch.dict(
-    "noema_combine.data_handler.region_catalogue",
+    "noema_combine.data_handler.settings.region_catalogue",
     {
         "B5": {
             "source_30m": "B5",
@@ -181,39 +204,39 @@ def test_get_source_param_not_found():
 
 
 # Tests for get_uvt_window
-@patch("noema_combine.data_handler.uvt_dir", "/path/to/uvt")
-@patch("noema_combine.data_handler.uvsub_ext", "_uvsub")
+@patch("noema_combine.data_handler.settings.uvt_dir", "/path/to/uvt")
+@patch("noema_combine.data_handler.settings.uvsub_ext", "_uvsub")
 def test_get_uvt_window_default():
     """Test default uvt window filename generation"""
     result = get_uvt_window("B5", "L09")
     assert result == "/path/to/uvt/L09/B5_L09_uvsub.uvt"
 
 
-@patch("noema_combine.data_handler.uvt_dir", "/path/to/uvt")
+@patch("noema_combine.data_handler.settings.uvt_dir", "/path/to/uvt")
 def test_get_uvt_window_no_uvsub():
     """Test uvt window filename without uvsub"""
     result = get_uvt_window("B5", "L09", uvsub=False)
     assert result == "/path/to/uvt/L09/B5_L09.uvt"
 
 
-@patch("noema_combine.data_handler.uvt_dir", "/path/to/uvt")
-@patch("noema_combine.data_handler.selfcal_ext", "_sc")
-@patch("noema_combine.data_handler.uvsub_ext", "_uvsub")
+@patch("noema_combine.data_handler.settings.uvt_dir", "/path/to/uvt")
+@patch("noema_combine.data_handler.settings.selfcal_ext", "_sc")
+@patch("noema_combine.data_handler.settings.uvsub_ext", "_uvsub")
 def test_get_uvt_window_with_selfcal():
     """Test uvt window filename with selfcal"""
     result = get_uvt_window("B5", "L09", selfcal=True)
     assert result == "/path/to/uvt/L09/B5_L09_sc_uvsub.uvt"
 
 
-@patch("noema_combine.data_handler.uvt_dir", "/path/to/uvt")
+@patch("noema_combine.data_handler.settings.uvt_dir", "/path/to/uvt")
 def test_get_uvt_window_no_uvsub_with_selfcal():
     """Test uvt window filename with selfcal but no uvsub"""
     result = get_uvt_window("B5", "L09", uvsub=False, selfcal=True)
     assert result == "/path/to/uvt/L09/B5_L09_sc.uvt"
 
 
-@patch("noema_combine.data_handler.uvt_dir", "/data/uvt")
-@patch("noema_combine.data_handler.uvsub_ext", "_uvsub")
+@patch("noema_combine.data_handler.settings.uvt_dir", "/data/uvt")
+@patch("noema_combine.data_handler.settings.uvsub_ext", "_uvsub")
 def test_get_uvt_window_different_lid():
     """Test uvt window filename with different Lid"""
     result = get_uvt_window("NGC1333", "L11", uvsub=True, selfcal=False)
@@ -221,21 +244,21 @@ def test_get_uvt_window_different_lid():
 
 
 # Tests for get_uvt_file
-@patch("noema_combine.data_handler.uvt_dir", "/path/to/uvt")
+@patch("noema_combine.data_handler.settings.uvt_dir", "/path/to/uvt")
 def test_get_uvt_file_no_merge():
     """Test uvt filename generation without merge"""
     result = get_uvt_file("B5", "CO", "1-0", "L09", merge=False)
     assert result == "/path/to/uvt/L09/B5_CO_1-0_L09.uvt"
 
 
-@patch("noema_combine.data_handler.uvt_dir_out", "/path/to/uvt_out")
+@patch("noema_combine.data_handler.settings.uvt_dir_out", "/path/to/uvt_out")
 def test_get_uvt_file_with_merge():
     """Test uvt filename generation with merge"""
     result = get_uvt_file("B5", "CO", "1-0", "L09", merge=True)
     assert result == "/path/to/uvt_out/L09/B5_CO_1-0_L09.uvt"
 
 
-@patch("noema_combine.data_handler.uvt_dir", "/data/uvt")
+@patch("noema_combine.data_handler.settings.uvt_dir", "/data/uvt")
 def test_get_uvt_file_complex_qn():
     """Test uvt filename with complex quantum number"""
     result = get_uvt_file("B5", "N2H+", "J=1-0,F=2-1", "L09", merge=False)
@@ -243,21 +266,21 @@ def test_get_uvt_file_complex_qn():
 
 
 # Tests for get_30m_file
-@patch("noema_combine.data_handler.dir_30m", "/path/to/30m")
+@patch("noema_combine.data_handler.settings.dir_30m", "/path/to/30m")
 def test_get_30m_file_no_merge():
     """Test 30m filename generation without merge"""
     result = get_30m_file("B5", "CO", "1-0", "L09", merge=False)
     assert result == "/path/to/30m/B5_CO_1-0.30m"
 
 
-@patch("noema_combine.data_handler.dir_30m", "/path/to/30m")
+@patch("noema_combine.data_handler.settings.dir_30m", "/path/to/30m")
 def test_get_30m_file_with_merge():
     """Test 30m filename generation with merge"""
     result = get_30m_file("B5", "CO", "1-0", "L09", merge=True)
     assert result == "/path/to/30m/B5_CO_1-0_L09.30m"
 
 
-@patch("noema_combine.data_handler.dir_30m", "/data/30m")
+@patch("noema_combine.data_handler.settings.dir_30m", "/data/30m")
 def test_get_30m_file_different_molecule():
     """Test 30m filename with different molecule"""
     result = get_30m_file("NGC1333", "13CO", "2-1", "L11", merge=False)
@@ -266,7 +289,7 @@ def test_get_30m_file_different_molecule():
 
 # Tests for line_make_uvt
 @patch.dict(
-    "noema_combine.data_handler.region_catalogue",
+    "noema_combine.data_handler.settings.region_catalogue",
     {
         "B5": {
             "source_30m": "b5",
@@ -281,17 +304,15 @@ def test_get_30m_file_different_molecule():
 @patch("noema_combine.data_handler.get_line_param")
 @patch("noema_combine.data_handler.get_uvt_window")
 @patch("noema_combine.data_handler.get_uvt_file")
-@patch("noema_combine.data_handler.line_name", np.array(["CO"]))
-@patch("noema_combine.data_handler.qn", np.array(["1-0"]))
-@patch("noema_combine.data_handler.Lid", np.array(["L09"]))
-@patch("noema_combine.data_handler.freq", np.array(["115.271"]))
-@patch("noema_combine.data_handler.vel_width", np.array(["5.0"]))
-@patch("noema_combine.data_handler.name_str", np.array(["CO(1-0)"]))
-@patch("os.system")
-@patch("tempfile.NamedTemporaryFile")
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1-0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09"]))
+@patch("noema_combine.data_handler.settings.freq", np.array(["115.271"]))
+@patch("noema_combine.data_handler.settings.vel_width", np.array(["5.0"]))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["CO(1-0)"]))
+@patch("noema_combine.data_handler.run_gildas")
 def test_line_make_uvt_default_parameters(
-    mock_temp: MagicMock,
-    mock_os: MagicMock,
+    mock_run: MagicMock,
     mock_get_uvt_file: MagicMock,
     mock_get_uvt_window: MagicMock,
     mock_get_line: MagicMock,
@@ -300,15 +321,17 @@ def test_line_make_uvt_default_parameters(
     mock_get_line.return_value = 0
     mock_get_uvt_window.return_value = "/uvt/L09/B5_L09_uvsub.uvt"
     mock_get_uvt_file.return_value = "/uvt/L09/B5_CO_1-0_L09.uvt"
-    mock_file = MagicMock()
-    mock_temp.return_value.__enter__.return_value = mock_file
-    mock_file.name = "temp.map"
     line_make_uvt("B5", "CO", "1-0")
     mock_get_line.assert_called_once_with("CO", "1-0")
+    assert mock_run.call_args.args[0] == "mapping"
+    script = mock_run.call_args.args[1]
+    assert "modify" not in script
+    assert "uv_extract /range 5.00  15.00 velocity" in script
+    assert 'write uv "/uvt/L09/B5_CO_1-0_L09.uvt" new' in script
 
 
 @patch.dict(
-    "noema_combine.data_handler.region_catalogue",
+    "noema_combine.data_handler.settings.region_catalogue",
     {
         "B5": {
             "source_30m": "b5",
@@ -323,17 +346,15 @@ def test_line_make_uvt_default_parameters(
 @patch("noema_combine.data_handler.get_line_param")
 @patch("noema_combine.data_handler.get_uvt_window")
 @patch("noema_combine.data_handler.get_uvt_file")
-@patch("noema_combine.data_handler.line_name", np.array(["CO"]))
-@patch("noema_combine.data_handler.qn", np.array(["1-0"]))
-@patch("noema_combine.data_handler.Lid", np.array(["L09"]))
-@patch("noema_combine.data_handler.freq", np.array(["115.271"]))
-@patch("noema_combine.data_handler.vel_width", np.array(["5.0"]))
-@patch("noema_combine.data_handler.name_str", np.array(["CO(1-0)"]))
-@patch("os.system")
-@patch("tempfile.NamedTemporaryFile")
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1-0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09"]))
+@patch("noema_combine.data_handler.settings.freq", np.array(["115.271"]))
+@patch("noema_combine.data_handler.settings.vel_width", np.array(["5.0"]))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["CO(1-0)"]))
+@patch("noema_combine.data_handler.run_gildas")
 def test_line_make_uvt_with_custom_dv(
-    mock_temp: MagicMock,
-    mock_os: MagicMock,
+    mock_run: MagicMock,
     mock_get_uvt_file: MagicMock,
     mock_get_uvt_window: MagicMock,
     mock_get_line: MagicMock,
@@ -342,18 +363,14 @@ def test_line_make_uvt_with_custom_dv(
     mock_get_line.return_value = 0
     mock_get_uvt_window.return_value = "/uvt/L09/B5_L09_uvsub.uvt"
     mock_get_uvt_file.return_value = "/uvt/L09/B5_CO_1-0_L09.uvt"
-    mock_file = MagicMock()
-    mock_temp.return_value.__enter__.return_value = mock_file
-    mock_file.name = "temp.map"
-
     line_make_uvt("B5", "CO", "1-0", dv=7.0)
-
-    # mock_get_source.assert_called_once_with("B5")
-    # assert mock_file.write.called
+    script = mock_run.call_args.args[1]
+    assert "modify" not in script
+    assert "uv_extract /range 3.00  17.00 velocity" in script
 
 
 @patch.dict(
-    "noema_combine.data_handler.region_catalogue",
+    "noema_combine.data_handler.settings.region_catalogue",
     {
         "B5": {
             "source_30m": "b5",
@@ -368,17 +385,15 @@ def test_line_make_uvt_with_custom_dv(
 @patch("noema_combine.data_handler.get_line_param")
 @patch("noema_combine.data_handler.get_uvt_window")
 @patch("noema_combine.data_handler.get_uvt_file")
-@patch("noema_combine.data_handler.line_name", np.array(["CO"]))
-@patch("noema_combine.data_handler.qn", np.array(["1-0"]))
-@patch("noema_combine.data_handler.Lid", np.array(["L09"]))
-@patch("noema_combine.data_handler.freq", np.array(["115.271"]))
-@patch("noema_combine.data_handler.vel_width", np.array(["5.0"]))
-@patch("noema_combine.data_handler.name_str", np.array(["CO(1-0)"]))
-@patch("os.system")
-@patch("tempfile.NamedTemporaryFile")
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1-0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09"]))
+@patch("noema_combine.data_handler.settings.freq", np.array(["115.271"]))
+@patch("noema_combine.data_handler.settings.vel_width", np.array(["5.0"]))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["CO(1-0)"]))
+@patch("noema_combine.data_handler.run_gildas")
 def test_line_make_uvt_with_dv_min_max(
-    mock_temp: MagicMock,
-    mock_os: MagicMock,
+    mock_run: MagicMock,
     mock_get_uvt_file: MagicMock,
     mock_get_uvt_window: MagicMock,
     mock_get_line: MagicMock,
@@ -387,17 +402,14 @@ def test_line_make_uvt_with_dv_min_max(
     mock_get_line.return_value = 0
     mock_get_uvt_window.return_value = "/uvt/L09/B5_L09_uvsub.uvt"
     mock_get_uvt_file.return_value = "/uvt/L09/B5_CO_1-0_L09.uvt"
-    mock_file = MagicMock()
-    mock_temp.return_value.__enter__.return_value = mock_file
-    mock_file.name = "temp.map"
-
     line_make_uvt("B5", "CO", "1-0", dv_min=3.0, dv_max=8.0)
-
-    # assert mock_file.write.called
+    script = mock_run.call_args.args[1]
+    assert "modify" not in script
+    assert "uv_extract /range 7.00  18.00 velocity" in script
 
 
 @patch.dict(
-    "noema_combine.data_handler.region_catalogue",
+    "noema_combine.data_handler.settings.region_catalogue",
     {
         "B5": {
             "source_30m": "b5",
@@ -412,17 +424,15 @@ def test_line_make_uvt_with_dv_min_max(
 @patch("noema_combine.data_handler.get_line_param")
 @patch("noema_combine.data_handler.get_uvt_window")
 @patch("noema_combine.data_handler.get_uvt_file")
-@patch("noema_combine.data_handler.line_name", np.array(["CO"]))
-@patch("noema_combine.data_handler.qn", np.array(["1-0"]))
-@patch("noema_combine.data_handler.Lid", np.array(["L09"]))
-@patch("noema_combine.data_handler.freq", np.array(["115.271"]))
-@patch("noema_combine.data_handler.vel_width", np.array(["5.0"]))
-@patch("noema_combine.data_handler.name_str", np.array(["CO(1-0)"]))
-@patch("os.system")
-@patch("tempfile.NamedTemporaryFile")
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1-0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09"]))
+@patch("noema_combine.data_handler.settings.freq", np.array(["115.271"]))
+@patch("noema_combine.data_handler.settings.vel_width", np.array(["5.0"]))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["CO(1-0)"]))
+@patch("noema_combine.data_handler.run_gildas")
 def test_line_make_uvt_with_selfcal(
-    mock_temp: MagicMock,
-    mock_os: MagicMock,
+    mock_run: MagicMock,
     mock_get_uvt_file: MagicMock,
     mock_get_uvt_window: MagicMock,
     mock_get_line: MagicMock,
@@ -431,12 +441,784 @@ def test_line_make_uvt_with_selfcal(
     mock_get_line.return_value = 0
     mock_get_uvt_window.return_value = "/uvt/L09/B5_L09_uvsub_sc.uvt"
     mock_get_uvt_file.return_value = "/uvt/L09/B5_CO_1-0_L09.uvt"
-    mock_file = MagicMock()
-    mock_temp.return_value.__enter__.return_value = mock_file
-    mock_file.name = "temp.map"
-
     line_make_uvt("B5", "CO", "1-0", selfcal=True)
-
     mock_get_uvt_window.assert_called_once_with(
         "B5_out", "L09", uvsub=True, selfcal=True
     )
+    script = mock_run.call_args.args[1]
+    assert "modify" not in script
+    assert 'read uv "/uvt/L09/B5_L09_uvsub_sc.uvt"' in script
+    assert "uv_extract" in script
+
+
+# Tests for get_30m_lines
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "B5": {"source_30m": "b5", "source_out": "B5_out"},
+        "B5_S1": {"source_30m": "b5", "source_out": "B5_out", "setup_30m": "Setup1"},
+    },
+    clear=True,
+)
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO", "HCN", "HNCO"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0", "1-0", "4-3"]))
+@patch(
+    "noema_combine.data_handler.settings.setup_30m", np.array(["Setup1", "Setup2", ""])
+)
+def test_get_30m_lines():
+    """Test that only lines covered by the 30m setups are selected"""
+    assert get_30m_lines("B5") == [("CO", "1-0"), ("HCN", "1-0")]
+    assert get_30m_lines("B5_S1") == [("CO", "1-0")]
+    with pytest.raises(ValueError, match="not found in region_catalogue"):
+        get_30m_lines("Unknown")
+
+
+# Tests for line_reduce_30m_batch
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "B5": {
+            "source_30m": "b5",
+            "source_out": "B5_out",
+            "RA0": "50.5",
+            "Dec0": "30.2",
+            "Vlsr": "10.0",
+        }
+    },
+    clear=True,
+)
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO", "HCN"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0", "1-0"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1_0", "1_0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09", "L21"]))
+@patch("noema_combine.data_handler.settings.freq", np.array(["115.271", "88.6316"]))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["CO", "HCN"]))
+@patch("noema_combine.data_handler.settings.vel_width_30m", np.array(["20", "20"]))
+@patch("noema_combine.data_handler.settings.vel_width_base_30m", np.array(["5", "5"]))
+@patch("noema_combine.data_handler.settings.dir_30m", "30m")
+@patch("noema_combine.data_handler.settings.ignorefiles", [])
+@patch("noema_combine.data_handler.settings.manifest_file", "")
+@patch("noema_combine.data_handler.get_30m_inputfiles")
+@patch("os.system")
+@patch("noema_combine.data_handler.run_gildas")
+def test_line_reduce_30m_batch_opens_files_once(
+    mock_run: MagicMock, mock_os: MagicMock, mock_inputfiles: MagicMock
+):
+    """Test that each input file is opened once for all the lines"""
+    mock_inputfiles.return_value = ["raw/a.30m", "raw/b.30m"]
+    line_reduce_30m_batch("B5", [("CO", "1-0"), ("HCN", "1-0")])
+    script = mock_run.call_args.args[1]
+    assert script.count('file in "raw/a.30m"') == 1
+    assert script.count('file in "raw/b.30m"') == 1
+    assert script.count("file out 30m/B5_out_CO_1_0.30m  single") == 1
+    assert script.count("file out 30m/B5_out_HCN_1_0.30m\n") == 2
+    assert script.count("find /frequency") == 4
+    assert "xy_map 30m/B5_out_CO_1_0" in script
+    assert "xy_map 30m/B5_out_HCN_1_0" in script
+    # single CLASS session
+    mock_run.assert_called_once()
+    assert mock_run.call_args.args[0] == "class"
+    # log of this job, not shared with other jobs of the source
+    log_file = os.path.basename(mock_run.call_args.kwargs["log_file"])
+    assert log_file == "B5_out_30m_batch_B5_out_CO_1_0_B5_out_HCN_1_0.class.log"
+    line_reduce_30m_batch("B5", [("HCN", "1-0")])
+    log_file = os.path.basename(mock_run.call_args.kwargs["log_file"])
+    assert log_file == "B5_out_HCN_1_0.class.log"
+
+
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "B5": {
+            "source_30m": "b5*",
+            "source_out": "B5_out",
+            "RA0": "50.5",
+            "Dec0": "30.2",
+            "Vlsr": "0.0",
+        }
+    },
+    clear=True,
+)
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO", "HCN"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0", "1-0"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1_0", "1_0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09", "L21"]))
+@patch("noema_combine.data_handler.settings.freq", np.array(["115.271", "88.6316"]))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["CO", "HCN"]))
+@patch("noema_combine.data_handler.settings.vel_width_30m", np.array(["20", "20"]))
+@patch("noema_combine.data_handler.settings.vel_width_base_30m", np.array(["5", "5"]))
+@patch("noema_combine.data_handler.settings.dir_30m", "30m")
+@patch("noema_combine.data_handler.settings.ignorefiles", [])
+@patch("noema_combine.data_handler.settings.manifest_file", "manifest.json")
+@patch("noema_combine.data_handler.update_manifest")
+@patch("noema_combine.data_handler.get_30m_inputfiles")
+@patch("os.system")
+@patch("noema_combine.data_handler.run_gildas")
+def test_line_reduce_30m_batch_uses_manifest(
+    mock_run: MagicMock,
+    mock_os: MagicMock,
+    mock_inputfiles: MagicMock,
+    mock_manifest: MagicMock,
+):
+    """Test that files without data for the source or line are not read"""
+    mock_inputfiles.return_value = ["raw/a.30m", "raw/b.30m", "raw/c.30m"]
+    mock_manifest.return_value = {
+        "raw/a.30m": {"sources": ["B5-N"], "backends": {"E0": [115000.0, 116000.0]}},
+        "raw/b.30m": {"sources": ["B5-N"], "backends": {"E0": [88000.0, 89000.0]}},
+        "raw/c.30m": {"sources": ["L1448"], "backends": {"E0": [88000.0, 89000.0]}},
+    }
+    line_reduce_30m_batch("B5", [("CO", "1-0"), ("HCN", "1-0")])
+    script = mock_run.call_args.args[1]
+    assert script.count('file in "raw/a.30m"') == 1
+    assert script.count('file in "raw/b.30m"') == 1
+    assert 'file in "raw/c.30m"' not in script
+    assert script.count("find /frequency") == 2
+
+
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "B5": {
+            "source_30m": "b5",
+            "source_out": "B5_out",
+            "RA0": "50.5",
+            "Dec0": "30.2",
+            "Vlsr": "10.0",
+        }
+    },
+    clear=True,
+)
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO", "HCN"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0", "1-0"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1_0", "1_0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09", "L21"]))
+@patch("noema_combine.data_handler.settings.freq", np.array(["115.271", "88.6316"]))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["CO", "HCN"]))
+@patch("noema_combine.data_handler.settings.vel_width_30m", np.array(["20", "20"]))
+@patch("noema_combine.data_handler.settings.vel_width_base_30m", np.array(["5", "5"]))
+@patch("noema_combine.data_handler.settings.dir_30m", "30m")
+@patch("noema_combine.data_handler.settings.ignorefiles", [])
+@patch("noema_combine.data_handler.settings.manifest_file", "")
+@patch("noema_combine.data_handler.save_fingerprint")
+@patch("noema_combine.data_handler.is_up_to_date")
+@patch("noema_combine.data_handler.get_30m_inputfiles")
+@patch("os.system")
+@patch("noema_combine.data_handler.run_gildas")
+def test_line_reduce_30m_batch_skips_up_to_date(
+    mock_run: MagicMock,
+    mock_os: MagicMock,
+    mock_inputfiles: MagicMock,
+    mock_up_to_date: MagicMock,
+    mock_save: MagicMock,
+):
+    """Test that only stale lines are reduced and their fingerprint saved"""
+    mock_inputfiles.return_value = ["raw/a.30m"]
+    mock_run.return_value.returncode = 0
+    # nothing to do
+    mock_up_to_date.return_value = True
+    status = line_reduce_30m_batch("B5", [("CO", "1-0"), ("HCN", "1-0")])
+    assert status == 0
+    mock_run.assert_not_called()
+    # only HCN is stale
+    mock_up_to_date.side_effect = lambda product, fp: "CO" in product
+    line_reduce_30m_batch("B5", [("CO", "1-0"), ("HCN", "1-0")])
+    script = mock_run.call_args.args[1]
+    assert "B5_out_CO_1_0" not in script
+    assert "xy_map 30m/B5_out_HCN_1_0" in script
+    mock_save.assert_called_once()
+    assert mock_save.call_args.args[0] == "30m/B5_out_HCN_1_0.30m"
+    # forced rebuild
+    mock_save.reset_mock()
+    line_reduce_30m_batch("B5", [("CO", "1-0"), ("HCN", "1-0")], force=True)
+    assert mock_save.call_count == 2
+
+
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "B5": {
+            "source_30m": "b5",
+            "source_out": "B5_out",
+            "RA0": "50.5",
+            "Dec0": "30.2",
+            "Vlsr": "10.0",
+        }
+    },
+    clear=True,
+)
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1_0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09"]))
+@patch("noema_combine.data_handler.settings.freq", np.array(["115.271"]))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["CO"]))
+@patch("noema_combine.data_handler.settings.vel_width_30m", np.array(["20"]))
+@patch("noema_combine.data_handler.settings.vel_width_base_30m", np.array(["5"]))
+@patch("noema_combine.data_handler.settings.dir_30m", "30m")
+@patch("noema_combine.data_handler.settings.ignorefiles", [])
+@patch("noema_combine.data_handler.settings.manifest_file", "")
+@patch("noema_combine.data_handler.settings.bad_scans_file", "bad_scans.json")
+@patch("noema_combine.data_handler.update_scan_table")
+@patch("noema_combine.data_handler.get_30m_inputfiles")
+@patch("os.system")
+@patch("noema_combine.data_handler.run_gildas")
+def test_line_reduce_30m_batch_excludes_bad_scans(
+    mock_run: MagicMock,
+    mock_os: MagicMock,
+    mock_inputfiles: MagicMock,
+    mock_scan_table: MagicMock,
+):
+    """Test that the bad scans are skipped with scan ranges, without a copy"""
+    mock_inputfiles.return_value = ["raw/a.30m", "raw/b.30m"]
+    mock_scan_table.return_value = {
+        "raw/a.30m": {
+            "telescopes": ["30ME0HLI-F01", "30ME0VLI-F02"],
+            "excluded": [
+                ["30ME0HLI-F01", 3, 0, "rms"],
+                ["30ME0VLI-F02", 7, 2, "tsys"],
+            ],
+        },
+        "raw/b.30m": {"telescopes": ["30ME0HLI-F01"], "excluded": []},
+    }
+    line_reduce_30m_batch("B5", [("CO", "1-0")])
+    script = mock_run.call_args.args[1]
+    block_a = script[script.index('file in "raw/a.30m"') : script.index("raw/b.30m")]
+    find = "/frequency {0}".format(115271.0 * (1 - 10.0 / 3e5))
+    expected = [
+        "set telescope 30ME0HLI-F01",
+        "set scan 1 2",
+        f"find {find}",
+        "set scan 4 *",
+        f"find append {find}",
+        "set telescope 30ME0VLI-F02",
+        "set scan 1 6",
+        f"find append {find}",
+        "set scan 8 *",
+        f"find append {find}",
+        "set scan 7 7",
+        "set subscan 1 1",
+        f"find append {find}",
+        "set subscan 3 *",
+        f"find append {find}",
+        "set subscan 0 *",
+        "set telescope *",
+        "set scan 0 *",
+    ]
+    lines = block_a.splitlines()
+    start = lines.index(expected[0])
+    assert lines[start : start + len(expected)] == expected
+    # files without bad scans use a single find
+    block_b = script[script.index('file in "raw/b.30m"') :]
+    assert block_b.count("find /frequency") == 1
+    assert "set scan" not in block_b
+
+
+def test_script_30m_find_unknown_telescopes():
+    """Test that manual exclusions keep all the telescopes of an unread file"""
+    script = io.StringIO()
+    entry = {"telescopes": [], "excluded": [["30ME0HLI-F01", 3, 0, "manual"]]}
+    _script_30m_find(script, "/all", entry)
+    assert script.getvalue().splitlines() == [
+        "set telescope *",
+        "set scan 1 2",
+        "find /all",
+        "set scan 4 *",
+        "find append /all",
+        "set telescope *",
+        "set scan 0 *",
+    ]
+
+
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "B5": {
+            "source_30m": "b5*",
+            "source_out": "B5_out",
+            "RA0": "50.5",
+            "Dec0": "30.2",
+            "Vlsr": "10.0",
+        }
+    },
+    clear=True,
+)
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO", "HCN"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0", "1-0"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1_0", "1_0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09", "L21"]))
+@patch("noema_combine.data_handler.settings.freq", np.array(["115.271", "88.6316"]))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["CO", "HCN"]))
+@patch("noema_combine.data_handler.settings.vel_width_30m", np.array(["20", "20"]))
+@patch("noema_combine.data_handler.settings.vel_width_base_30m", np.array(["5", "5"]))
+@patch("noema_combine.data_handler.settings.ignorefiles", [])
+@patch("noema_combine.data_handler.settings.manifest_file", "")
+@patch("noema_combine.data_handler.get_30m_inputfiles")
+@patch("os.system")
+@patch("noema_combine.data_handler.run_gildas")
+def test_line_reduce_30m_batch_native(
+    mock_run: MagicMock, mock_os: MagicMock, mock_inputfiles: MagicMock, tmp_path
+):
+    """Test that the native reduction and gridding do not use CLASS"""
+    raw_file = str(tmp_path / "a.30m")
+    nchan = 1000
+    velocity = 10.0 + (np.arange(1, nchan + 1) - 500.5) * 0.26
+    line = np.exp(-0.5 * ((velocity - 10.0) / 1.0) ** 2)
+    observations = [
+        ClassObservation(
+            source=source,
+            line="CO",
+            telescope="30ME0HLI-F01",
+            scan=1,
+            restf=115271.0,
+            fres=-0.1,
+            rchan=500.5,
+            vres=0.26,
+            voff=10.0,
+            lam=np.radians(50.5),
+            bet=np.radians(30.2),
+            off1=i * 1e-5,
+            data=(line + 0.5 + 0.01 * i * velocity).astype(np.float32),
+        )
+        for i, source in enumerate(["B5-N", "B5-N", "L1448"])
+    ]
+    write_class_file(raw_file, observations)
+    mock_inputfiles.return_value = [raw_file]
+    mock_run.return_value.returncode = 0
+    with patch("noema_combine.data_handler.settings.dir_30m", str(tmp_path)):
+        status = line_reduce_30m_batch("B5", [("CO", "1-0")], native=True)
+    assert status == 0
+    mock_run.assert_not_called()
+    assert os.path.isfile(tmp_path / "B5_out_CO_1_0.fits")
+    assert os.path.isfile(tmp_path / "B5_out_CO_1_0.30m.fingerprint")
+    with ClassFile(str(tmp_path / "B5_out_CO_1_0.30m")) as class_file:
+        assert len(class_file) == 2
+        obs = class_file.observation(1)
+        assert obs.source == "B5_out"
+        assert obs.telescope == "30M-MRT"
+        np.testing.assert_allclose(obs.off1, 1e-5, rtol=1e-3)
+        v_obs = obs.voff + (np.arange(1, obs.nchan + 1) - obs.rchan) * obs.vres
+        assert v_obs.min() == pytest.approx(-10.0, abs=0.3)
+        assert v_obs.max() == pytest.approx(30.0, abs=0.3)
+        line_obs = np.exp(-0.5 * ((v_obs - 10.0) / 1.0) ** 2)
+        np.testing.assert_allclose(obs.data, line_obs, atol=0.02)
+
+
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "B5": {
+            "source_30m": "b5",
+            "source_out": "B5_out",
+            "RA0": "50.5",
+            "Dec0": "30.2",
+            "Vlsr": "10.0",
+        }
+    },
+    clear=True,
+)
+@patch("noema_combine.data_handler.get_line_param")
+@patch("noema_combine.data_handler.get_uvt_window")
+@patch("noema_combine.data_handler.get_uvt_file")
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1-0"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09"]))
+@patch("noema_combine.data_handler.settings.freq", np.array(["115.271"]))
+@patch("noema_combine.data_handler.settings.vel_width", np.array(["2.0"]))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["CO(1-0)"]))
+@patch("noema_combine.data_handler.run_gildas")
+def test_line_make_uvt_native(
+    mock_run: MagicMock,
+    mock_get_uvt_file: MagicMock,
+    mock_get_uvt_window: MagicMock,
+    mock_get_line: MagicMock,
+    tmp_path,
+):
+    """Test that the native extraction does not use MAPPING nor modify the window"""
+    window_uvt = str(tmp_path / "B5_out_L09_uvsub.uvt")
+    file_uvt = str(tmp_path / "L09" / "B5_out_CO_1-0_L09.uvt")
+    header = UVHeader(
+        nvis=20,
+        nchan=200,
+        rchan=100.0,
+        restf=115270.0,
+        fres=-0.1,
+        vres=0.26,
+        voff=0.0,
+    )
+    write_uv_table(window_uvt, header, np.ones((20, header.ncol), dtype=np.float32))
+    raw_window = open(window_uvt, "rb").read()
+    mock_get_line.return_value = 0
+    mock_get_uvt_window.return_value = window_uvt
+    mock_get_uvt_file.return_value = file_uvt
+    assert line_make_uvt("B5", "CO", "1-0", native=True) == 0
+    mock_run.assert_not_called()
+    assert open(window_uvt, "rb").read() == raw_window
+    assert os.path.isfile(f"{file_uvt}.fingerprint")
+    with UVTable(file_uvt) as table:
+        assert table.header.restf == pytest.approx(115271.0)
+        assert table.header.line == "CO(1-0)"
+        velocity = table.header.velocity()
+        assert velocity[0] == pytest.approx(8.0, abs=0.2)
+        assert velocity[-1] == pytest.approx(12.0, abs=0.2)
+    # up to date on the second call
+    assert line_make_uvt("B5", "CO", "1-0", native=True) == 0
+
+
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "NGC1333": {
+            "source_30m": "NGC1333",
+            "source_out": "NGC1333",
+            "RA0": "52.2916667",
+            "Dec0": "31.2333333",
+            "Vlsr": "7.5",
+        }
+    },
+    clear=True,
+)
+def test_shift_uvt_batch(tmp_path):
+    """Test that all the fields are shifted to the catalogue centre in one call"""
+    file_names = []
+    for k, (d_ra, d_dec) in enumerate([(-30.0, 20.0), (35.0, -15.0)]):
+        header = UVHeader(
+            nvis=10,
+            nchan=8,
+            rchan=4.5,
+            restf=93173.7637,
+            fres=-2.0,
+            vres=6.4,
+            voff=7.5,
+            ra=np.radians(52.2916667 + d_ra / 3600.0),
+            dec=np.radians(31.2333333 + d_dec / 3600.0),
+        )
+        file_names.append(str(tmp_path / f"NGC1333_P{k + 1}-L01L05.uvt"))
+        data = np.ones((header.nvis, header.ncol), dtype=np.float32)
+        write_uv_table(file_names[-1], header, data)
+    with patch(
+        "noema_combine.data_handler.shift_phase_center", wraps=shift_phase_center
+    ) as mock_shift:
+        shifted = shift_uvt_batch("NGC1333", file_names)
+        assert shifted == [f"{file_name[:-4]}_shift.uvt" for file_name in file_names]
+        for file_name in shifted:
+            with UVTable(file_name) as table:
+                assert np.degrees(table.header.ra) == pytest.approx(52.2916667)
+                assert np.degrees(table.header.dec) == pytest.approx(31.2333333)
+        # up to date on the second call
+        assert shift_uvt_batch("NGC1333", file_names) == shifted
+        assert mock_shift.call_count == 2
+        # in place, tables already at the centre are not modified
+        assert shift_uvt_batch("NGC1333", shifted, in_place=True) == shifted
+        assert mock_shift.call_count == 2
+        assert shift_uvt_batch("NGC1333", file_names, in_place=True) == file_names
+        assert mock_shift.call_count == 4
+        with UVTable(file_names[0]) as table, UVTable(shifted[0]) as reference:
+            np.testing.assert_array_equal(table.data, reference.data)
+    with pytest.raises(ValueError, match="File not found"):
+        shift_uvt_batch("NGC1333", [str(tmp_path / "missing.uvt")])
+
+
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "B5": {
+            "source_30m": "b5",
+            "source_out": "B5_out",
+            "RA0": "50.5",
+            "Dec0": "30.2",
+            "Vlsr": "10.0",
+        }
+    },
+    clear=True,
+)
+@patch("noema_combine.data_handler.settings.line_name", np.array(["A", "B", "C", "D"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1-0"] * 4))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0"] * 4))
+@patch(
+    "noema_combine.data_handler.settings.Lid", np.array(["L09", "L09", "L11", "L11"])
+)
+@patch(
+    "noema_combine.data_handler.settings.freq",
+    np.array(["115.270", "115.268", "88.0", "115.275"]),
+)
+@patch(
+    "noema_combine.data_handler.settings.vel_width",
+    np.array(["2.0", "1.0", "2.0", "1.0"]),
+)
+@patch("noema_combine.data_handler.settings.name_str", np.array(["A", "B", "C", "D"]))
+@patch("noema_combine.data_handler.settings.selfcal_ext", "_sc")
+@patch("noema_combine.data_handler.settings.uvsub_ext", "_uvsub")
+@patch("noema_combine.data_handler.run_gildas")
+def test_window_subtract_continuum(mock_run: MagicMock, tmp_path):
+    """Test the line windows from the catalogue and the native continuum subtraction"""
+    header = UVHeader(
+        nvis=30, nchan=200, rchan=100.0, restf=115270.0, fres=-0.1, vres=0.26, voff=0.0
+    )
+    os.makedirs(tmp_path / "L09")
+    window_uvt = str(tmp_path / "L09" / "B5_out_L09_sc.uvt")
+    data = np.zeros((header.nvis, header.ncol), dtype=np.float32)
+    vis = data[:, header.ndaps :].reshape(header.nvis, header.nchan, 3)
+    vis[:, :, 0] = np.linspace(1.0, 2.0, header.nvis)[:, None]
+    vis[:, :, 1] = -0.5
+    vis[:, :, 2] = 1.0
+    write_uv_table(window_uvt, header, data)
+    with (
+        patch("noema_combine.data_handler.settings.uvt_dir", str(tmp_path)),
+        patch(
+            "noema_combine.data_handler.subtract_continuum", wraps=subtract_continuum
+        ) as mock_subtract,
+    ):
+        file_contsub = window_subtract_continuum("B5", "L09", selfcal=True)
+        assert file_contsub == str(tmp_path / "L09" / "B5_out_L09_sc_uvsub.uvt")
+        mock_run.assert_not_called()
+        # lines A, B of the window and D within its frequency coverage
+        windows = mock_subtract.call_args.args[2]
+        np.testing.assert_allclose(
+            windows, [(8.0, 12.0), (14.2, 16.2), (-4.0, -2.0)], atol=1e-9
+        )
+        with UVTable(file_contsub) as table:
+            result = table.visibilities()
+            np.testing.assert_allclose(result[:, :, :2], 0.0, atol=1e-5)
+            np.testing.assert_array_equal(result[:, :, 2], 1.0)
+        # up to date on the second call
+        window_subtract_continuum("B5", "L09", selfcal=True)
+        assert mock_subtract.call_count == 1
+        with pytest.raises(ValueError, match="File not found"):
+            window_subtract_continuum("B5", "L11")
+
+
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "B5": {
+            "source_30m": "b5",
+            "source_out": "B5_out",
+            "RA0": "50.5",
+            "Dec0": "30.2",
+            "Vlsr": "10.0",
+        }
+    },
+    clear=True,
+)
+@patch("noema_combine.data_handler.settings.line_name", np.array(["A", "B", "C"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1-0", "1-0", "1-0"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0", "1-0", "1-0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09", "L09", "L11"]))
+@patch(
+    "noema_combine.data_handler.settings.freq",
+    np.array(["115.270", "115.268", "88.0"]),
+)
+@patch("noema_combine.data_handler.settings.vel_width", np.array(["2.0"] * 3))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["A", "B", "C"]))
+@patch("os.system")
+@patch("noema_combine.data_handler.run_gildas")
+def test_line_make_uvt_batch(mock_run: MagicMock, mock_os: MagicMock, tmp_path):
+    """Test that the lines are grouped by window, each window being read once"""
+    for Lid, restf in [("L09", 115270.0), ("L11", 88000.0)]:
+        header = UVHeader(
+            nvis=20, nchan=200, rchan=100.0, restf=restf, fres=-0.1, vres=0.3, voff=0.0
+        )
+        window_uvt = str(tmp_path / f"B5_out_{Lid}_uvsub.uvt")
+        data = np.ones((20, header.ncol), dtype=np.float32)
+        write_uv_table(window_uvt, header, data)
+        os.makedirs(tmp_path / Lid)
+    lines = [("A", "1-0"), ("C", "1-0"), ("B", "1-0")]
+    with (
+        patch("noema_combine.data_handler.settings.uvt_dir", str(tmp_path)),
+        patch("noema_combine.data_handler.settings.uvt_dir_out", str(tmp_path)),
+        patch(
+            "noema_combine.data_handler.get_uvt_window",
+            side_effect=lambda source, Lid, **kwargs: str(
+                tmp_path / f"{source}_{Lid}_uvsub.uvt"
+            ),
+        ),
+        patch(
+            "noema_combine.data_handler.extract_velocities",
+            wraps=extract_velocities,
+        ) as mock_extract,
+    ):
+        # MAPPING: one session for all the lines
+        mock_run.return_value.returncode = 0
+        assert line_make_uvt_batch("B5", lines) == 0
+        assert mock_run.call_count == 1
+        script = mock_run.call_args.args[1]
+        assert script.count("write uv") == 3
+        assert script.count("exit") == 1
+        assert "_uvt_batch_B5_out_A_1-0_L09" in mock_run.call_args.kwargs["log_file"]
+        # native: one read per window
+        assert line_make_uvt_batch("B5", lines, native=True, force=True) == 0
+        assert mock_run.call_count == 1
+        assert mock_extract.call_count == 2
+        assert [len(call.args[1]) for call in mock_extract.call_args_list] == [2, 1]
+        with UVTable(str(tmp_path / "L09" / "B5_out_B_1-0_L09.uvt")) as table:
+            assert table.header.restf == pytest.approx(115268.0)
+            assert table.header.line == "B"
+        # all the lines are up to date
+        assert line_make_uvt_batch("B5", lines, native=True) == 0
+        assert mock_extract.call_count == 2
+
+
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "B5": {
+            "source_30m": "b5",
+            "source_out": "B5_out",
+            "RA0": "50.5",
+            "Dec0": "30.2",
+            "Vlsr": "10.0",
+        }
+    },
+    clear=True,
+)
+@patch("noema_combine.data_handler.get_line_param")
+@patch("noema_combine.data_handler.get_uvt_window")
+@patch("noema_combine.data_handler.get_uvt_file")
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1-0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09"]))
+@patch("noema_combine.data_handler.settings.freq", np.array(["115.271"]))
+@patch("noema_combine.data_handler.settings.vel_width", np.array(["5.0"]))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["CO(1-0)"]))
+@patch("noema_combine.data_handler.run_gildas")
+def test_line_make_uvt_does_not_modify_window(
+    mock_run: MagicMock,
+    mock_get_uvt_file: MagicMock,
+    mock_get_uvt_window: MagicMock,
+    mock_get_line: MagicMock,
+):
+    """Test that the frequency is only changed in the UV buffer"""
+    mock_get_line.return_value = 0
+    mock_get_uvt_window.return_value = "/uvt/L09/B5_L09_uvsub.uvt"
+    mock_get_uvt_file.return_value = "/uvt/L09/B5_CO_1-0_L09.uvt"
+    mock_run.return_value.returncode = 1
+    line_make_uvt("B5", "CO", "1-0")
+    script = mock_run.call_args.args[1]
+    assert "modify" not in script
+    assert script.count('read uv "/uvt/L09/B5_L09_uvsub.uvt"') == 1
+    assert "go setup" not in script
+    assert "let name" not in script
+    assert "specify frequency 115271.0" in script
+    assert script.index("specify") < script.index("uv_extract")
+
+
+def test_get_30m_inputfiles_ignorefiles(tmp_path, capsys):
+    """Test that ignored files are excluded from the input list"""
+    raw_dir = tmp_path / "raw_data"
+    os.makedirs(raw_dir)
+    for name in ["FTSOdp20220220.30m", "FTSOdp20220731.30m", "B5_H13COp10.30m"]:
+        (raw_dir / name).write_bytes(bytes(1000))
+    ignorefiles = ["raw_data/FTSOdp20220220.30m", "re:H13COp"]
+    with (
+        patch("noema_combine.data_handler.settings.inputdir", [str(raw_dir)]),
+        patch("noema_combine.data_handler.settings.ignorefiles", ignorefiles),
+    ):
+        inputfiles = get_30m_inputfiles()
+    assert inputfiles == [str(raw_dir / "FTSOdp20220731.30m")]
+    assert "Ignoring 2 files" in capsys.readouterr().out
+
+
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "B5": {
+            "source_30m": "b5",
+            "source_out": "B5_out",
+            "RA0": "50.5",
+            "Dec0": "30.2",
+            "Vlsr": "10.0",
+        }
+    },
+    clear=True,
+)
+@patch("noema_combine.data_handler.settings.line_name", np.array(["CO"]))
+@patch("noema_combine.data_handler.settings.qn_str", np.array(["1-0"]))
+@patch("noema_combine.data_handler.settings.qn", np.array(["1_0"]))
+@patch("noema_combine.data_handler.settings.Lid", np.array(["L09"]))
+@patch("noema_combine.data_handler.settings.freq", np.array(["115.271"]))
+@patch("noema_combine.data_handler.settings.name_str", np.array(["CO(1-0)"]))
+@patch("noema_combine.data_handler.run_gildas")
+def test_line_prepare_merge_native(mock_run: MagicMock, tmp_path):
+    """Test the Tmb scaling and regridding onto the uv-table channels"""
+    restf = 115271.0
+    # reduced 30m spectra, 0.1 km/s channels, at two rest frequencies
+    nchan = 400
+    velocity = 10.0 + (np.arange(1, nchan + 1) - 200.5) * 0.1
+    line = np.exp(-0.5 * ((velocity - 10.0) / 1.5) ** 2)
+    observations = [
+        ClassObservation(
+            source="B5_out",
+            line="CO(1-0)",
+            telescope="30M-MRT",
+            scan=1,
+            restf=restf,
+            fres=-restf * 0.1 / 299792.458,
+            rchan=200.5,
+            vres=0.1,
+            voff=10.0,
+            off1=i * 1e-5,
+            off2=-i * 1e-5,
+            tsys=200.0,
+            time=10.0,
+            data=((1.0 + i) * line).astype(np.float32),
+        )
+        for i in range(3)
+    ]
+    observations[2].data = observations[2].data.copy()
+    observations[2].data[:200] = -1000.0
+    with patch.multiple(
+        "noema_combine.data_handler.settings",
+        dir_30m=str(tmp_path / "30m"),
+        uvt_dir=str(tmp_path / "D"),
+        uvt_dir_out=str(tmp_path / "D30m"),
+    ):
+        os.makedirs(tmp_path / "30m")
+        os.makedirs(tmp_path / "D" / "L09")
+        write_class_file(str(tmp_path / "30m" / "B5_out_CO_1_0.30m"), observations)
+        # uv-table with 0.3 km/s channels, from 6 to 14 km/s
+        header = UVHeader(
+            nvis=4,
+            nchan=27,
+            rchan=1.0,
+            restf=restf,
+            fres=-restf * 0.3 / 299792.458,
+            vres=0.3,
+            voff=6.0,
+            source="B5_out",
+            line="CO(1-0)",
+        )
+        file_uvt = str(tmp_path / "D" / "L09" / "B5_out_CO_1_0_L09.uvt")
+        write_uv_table(file_uvt, header, np.zeros((4, header.ncol), np.float32))
+        status = line_prepare_merge("B5", "CO", "1-0", native=True)
+        table_file = tmp_path / "D30m" / "L09" / "B5_out_CO_1_0_L09.tab"
+        assert status == 0
+        mock_run.assert_not_called()
+        assert os.path.isfile(tmp_path / "D30m" / "L09" / "B5_out_CO_1_0_L09.uvt")
+        assert os.path.isfile(f"{table_file}.fingerprint")
+        table_header, data = read_class_table(str(table_file))
+        # up to date
+        assert line_prepare_merge("B5", "CO", "1-0", native=True) == 0
+        # pseudo-visibilities, concatenated with the NOEMA data
+        file_short = line_make_short_spacing("B5", "CO", "1-0", n_threads=1)
+        assert file_short == str(
+            tmp_path / "D30m" / "L09" / "B5_out_CO_1_0_L09_short.uvt"
+        )
+        assert os.path.isfile(f"{file_short}.fingerprint")
+        merge_uvt = str(tmp_path / "D30m" / "L09" / "B5_out_CO_1_0_L09.uvt")
+        combined = append_uv_tables([merge_uvt, file_short], str(tmp_path / "all.uvt"))
+        assert combined.nvis > 4
+    assert table_header.nvis == 3
+    assert table_header.nchan == 27
+    assert table_header.vres == pytest.approx(0.3)
+    np.testing.assert_allclose(data[:, 0], [0.0, 1e-5, 2e-5], rtol=1e-5)
+    np.testing.assert_allclose(data[:, 2], 10.0 * abs(observations[0].fres) / 200**2)
+    v_out = header.velocity()
+    expected = np.exp(-0.5 * ((v_out - 10.0) / 1.5) ** 2) * float(tmb_factor(restf))
+    np.testing.assert_allclose(data[0, 3:], expected, atol=0.01)
+    np.testing.assert_allclose(data[1, 3:], 2 * expected, atol=0.02)
+    # blanked channels stay blanked
+    assert np.all(data[2, 3:][v_out < 9.9] == -1000.0)
+    np.testing.assert_allclose(
+        data[2, 3:][v_out > 10.1], 3 * expected[v_out > 10.1], atol=0.03
+    )
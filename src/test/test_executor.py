@@ -0,0 +1,92 @@
+import os
+import pytest
+from unittest.mock import patch, MagicMock
+
+from noema_combine.executor import make_jobs, run_job, run_jobs
+
+
+# Tests for make_jobs
+def test_make_jobs_with_lines():
+    """Test jobs for all combinations of sources and lines"""
+    jobs = make_jobs("line_make_uvt", ["B5", "L1448N"], [("CO", "1-0"), ("HCN", None)])
+    assert len(jobs) == 4
+    assert jobs[0] == ("line_make_uvt", "B5", "CO", "1-0")
+    assert jobs[-1] == ("line_make_uvt", "L1448N", "HCN", None)
+
+
+@patch("noema_combine.data_handler.get_30m_lines")
+def test_make_jobs_from_catalogue(mock_lines: MagicMock):
+    """Test that lines are taken from the catalogue when not given"""
+    mock_lines.return_value = [("N2H+", "1-0")]
+    jobs = make_jobs("line_reduce_30m", ["B5"])
+    assert jobs == [("line_reduce_30m", "B5", "N2H+", "1-0")]
+    mock_lines.assert_called_once_with("B5")
+
+
+def test_make_jobs_unknown_function():
+    """Test that unknown functions are rejected"""
+    with pytest.raises(ValueError, match="is not supported"):
+        make_jobs("os.system", ["B5"], [("CO", "1-0")])
+
+
+# Tests for run_job and run_jobs
+@patch("noema_combine.data_handler.line_reduce_30m")
+def test_run_job_scratch_dir(mock_reduce: MagicMock, tmp_path):
+    """Test that the job runs in its own scratch directory, removed afterwards"""
+    scratch_dirs: list[str] = []
+
+    def fake_reduce(source, line, qn, scratch_dir="."):
+        assert os.path.isdir(scratch_dir)
+        scratch_dirs.append(scratch_dir)
+        return 0
+
+    mock_reduce.side_effect = fake_reduce
+    status = run_job(("line_reduce_30m", "B5", "CO", "1-0"), str(tmp_path))
+    assert status == 0
+    assert os.path.dirname(scratch_dirs[0]) == str(tmp_path)
+    assert not os.path.exists(scratch_dirs[0])
+
+
+@patch("noema_combine.data_handler.line_make_uvt")
+def test_run_jobs_sequential_collects_status(mock_uvt: MagicMock, tmp_path):
+    """Test that exit status and errors are collected for each job"""
+    mock_uvt.side_effect = [0, 256, ValueError("bad line")]
+    jobs = make_jobs("line_make_uvt", ["B5"], [("CO", "1-0"), ("HCN", "1-0")])
+    jobs += [("line_make_uvt", "B5", "HNC", "1-0"), jobs[0]]
+    results = run_jobs(jobs, n_workers=1, scratch_root=str(tmp_path))
+    assert [status for _, status in results] == [0, 256, -1]
+    assert mock_uvt.call_count == 3
+    assert os.listdir(tmp_path) == []
+
+
+def test_run_jobs_parallel(tmp_path):
+    """Test that jobs run in worker processes and failures are reported"""
+    jobs = make_jobs("line_reduce_30m", ["Unknown1", "Unknown2"], [("CO", "1-0")])
+    results = run_jobs(jobs, n_workers=2, scratch_root=str(tmp_path))
+    assert [status for _, status in results] == [-1, -1]
+    assert [job for job, _ in results] == jobs
+
+
+@patch("noema_combine.data_handler.get_30m_inputfiles")
+@patch("noema_combine.data_handler.update_30m_scan_table")
+@patch("noema_combine.data_handler.update_30m_manifest")
+@patch("noema_combine.data_handler.line_reduce_30m")
+def test_run_jobs_updates_30m_tables_once(
+    mock_reduce: MagicMock,
+    mock_manifest: MagicMock,
+    mock_scans: MagicMock,
+    mock_inputs: MagicMock,
+    tmp_path,
+):
+    """Test that the 30m tables are updated before the 30m jobs, not by each job"""
+    mock_reduce.return_value = 0
+    mock_inputs.return_value = ["a.30m"]
+    jobs = make_jobs("line_reduce_30m", ["B5"], [("CO", "1-0"), ("HCN", "1-0")])
+    run_jobs(jobs, n_workers=1, scratch_root=str(tmp_path))
+    mock_manifest.assert_called_once()
+    mock_scans.assert_called_once_with(["a.30m"])
+    mock_manifest.reset_mock()
+    with patch("noema_combine.data_handler.line_make_uvt", return_value=0):
+        jobs = make_jobs("line_make_uvt", ["B5"], [("CO", "1-0")])
+        run_jobs(jobs, n_workers=1, scratch_root=str(tmp_path))
+    mock_manifest.assert_not_called()
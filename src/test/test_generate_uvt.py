@@ -1,4 +1,7 @@
+import os
+import numpy as np
 import pytest
+import yaml
 from io import StringIO
 from typing import Dict
 from datetime import datetime
@@ -9,9 +12,20 @@ from noema_combine.generate_uvt import (
     print_makespw,
     calibration_type,
     look_spw,
-    # prepare_config,  # TODO
+    prepare_config,
+    chunk_names,
+    clic_run_plan,
+    merge_configurations,
+    partition_chunks,
+    prepare_config_parts,
+    prepare_config_append,
+    record_tabled,
+    build_config_script,
+    write_scripts,
+    process_all_setups,
     # process_source,  # TODO
 )
+from noema_combine.uv_table import UVHeader, UVTable, write_uv_table
 
 
 # Tests for make_header
@@ -489,3 +503,212 @@ def test_multiple_configs_workflow():
 
     # Each config should produce different paths
     assert len(set([tuple(r) for r in results])) == len(configs)
+
+
+def test_chunk_names_match_look_spw():
+    """Test that chunk_names lists the tables written by loopspw"""
+    for parameters in [{}, {"number_windows": 10}]:
+        mock_file = StringIO()
+        look_spw(mock_file, parameters)
+        names = [
+            line.split()[-1]
+            for line in mock_file.getvalue().splitlines()
+            if "@ makespw" in line
+        ]
+        assert chunk_names(parameters) == names
+
+
+def test_clic_run_plan():
+    """Test the CLIC runs needed with and without merging configurations"""
+    setup = {
+        "A-files": [{"file": "a1"}],
+        "C-files": [{"file": "c1"}],
+        "D-files": [{"file": "d1"}, {"file": "d2"}],
+    }
+    clic_runs, merges = clic_run_plan(setup)
+    assert list(clic_runs) == ["A", "C", "D", "CD", "ACD"]
+    assert [entry["file"] for entry in clic_runs["ACD"]] == ["c1", "d1", "d2", "a1"]
+    assert merges == {}
+    clic_runs, merges = clic_run_plan(setup, merge=True)
+    assert list(clic_runs) == ["A", "C", "D"]
+    assert merges == {"CD": ["C", "D"], "ACD": ["C", "D", "A"]}
+
+
+def test_merge_configurations(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    """Test building the CD configuration from the C and D chunk uv-tables"""
+    work_dir = tmp_path / "clic" / "setup001"
+    os.makedirs(work_dir)
+    monkeypatch.chdir(work_dir)
+    sources = ["SRC1", "SRC2"]
+    parameters = {"number_windows": 2}
+    config = {
+        "highres_parameters": parameters,
+        "setups": {
+            "setup001": {
+                "sources": sources,
+                "C-files": [{"file": "c1"}],
+                "D-files": [{"file": "d1"}],
+            }
+        },
+    }
+    with open("config.yml", "w") as f:
+        yaml.safe_dump(config, f)
+    header = UVHeader(
+        nvis=3, nchan=4, rchan=2.0, restf=9e4, fres=-0.5, vres=1.6, voff=0.0
+    )
+    for n_vis, config_i in [(3, "C"), (5, "D")]:
+        for name in make_uvt_names(sources, config_i):
+            os.makedirs(os.path.dirname(name), exist_ok=True)
+            for chunk in chunk_names(parameters):
+                data = np.full((n_vis, header.ncol), n_vis, dtype=np.float32)
+                header.nvis = n_vis
+                write_uv_table(f"{name}_{chunk}.uvt", header, data)
+    uvt_files = merge_configurations("setup001", "config.yml")
+    assert len(uvt_files) == 2 * len(chunk_names(parameters))
+    with UVTable(f"{make_uvt_names(sources, 'CD')[1]}_li.uvt") as table:
+        assert table.header.nvis == 8
+        np.testing.assert_array_equal(table.data[:, 0], [3] * 3 + [5] * 5)
+    # the single configurations must be produced first
+    os.remove(f"{make_uvt_names(sources, 'D')[0]}_lo.uvt")
+    with pytest.raises(ValueError, match="Missing"):
+        merge_configurations("setup001", "config.yml")
+
+
+def test_partition_chunks():
+    """Test that the chunks are split into disjoint parts"""
+    chunks = chunk_names({})
+    parts = partition_chunks(chunks, 4)
+    assert len(parts) == 4
+    assert sorted(sum(parts, [])) == sorted(chunks)
+    assert [part[0] for part in parts] == ["lo", "li", "ui", "uo"]
+    assert len(partition_chunks(["lo", "li"], 4)) == 2
+    with pytest.raises(ValueError):
+        partition_chunks(chunks, 0)
+
+
+def test_prepare_config_parts(tmp_path):
+    """Test that the split scripts table each chunk once, with the same calibration"""
+    hpb_dict = [{"file": "hpb1"}, {"file": "hpb2"}]
+    full = prepare_config(
+        "setup001", ["S1", "S2"], "3", hpb_dict, {}, script_dir=str(tmp_path)
+    )
+    scripts = prepare_config_parts(
+        "setup001", ["S1", "S2"], "3", hpb_dict, {}, 3, script_dir=str(tmp_path)
+    )
+    assert [os.path.basename(name) for name in scripts] == [
+        f"setup001-C-uvts-p{k}.clic" for k in range(3)
+    ]
+
+    def split(name: str) -> tuple[list[str], list[str]]:
+        with open(name) as f:
+            lines = f.read().splitlines()
+        chunk_lines = [
+            line for line in lines if "@ makespw" in line or "set selection" in line
+        ]
+        # the separators between chunks are not compared
+        other = [line for line in lines if line not in chunk_lines + ["  !"]]
+        return chunk_lines, other
+
+    full_chunks, full_other = split(full)
+    part_chunks: list[str] = []
+    for name in scripts:
+        chunks_k, other_k = split(name)
+        assert other_k == full_other
+        part_chunks += chunks_k
+    assert sorted(part_chunks) == sorted(full_chunks)
+
+
+def test_prepare_config_append(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    """Test that only the new hpb files are appended to the existing uv-tables"""
+    monkeypatch.chdir(tmp_path)
+    sources = ["S1", "S2"]
+    parameters = {"number_windows": 2}
+    for name in ["hpb1.hpb", "hpb2.hpb", "hpb3.hpb"]:
+        (tmp_path / name).write_text(name)
+    hpb_dict = [{"file": "hpb1"}, {"file": "hpb2"}]
+    args = (sources, "3")
+
+    def script_files(script_file: str) -> list[str]:
+        with open(script_file) as f:
+            return [line for line in f.read().splitlines() if "file in" in line]
+
+    # nothing tabled yet: full script
+    script_file = prepare_config_append("setup001", *args, hpb_dict, parameters)
+    assert script_file is not None
+    assert script_files(script_file) == ["file in hpb1", "file in hpb2"]
+    assert "append to the existing" not in open(script_file).read()
+    record_tabled("setup001", *args, hpb_dict, parameters)
+    for name in make_uvt_names(sources, "C"):
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        for chunk in chunk_names(parameters):
+            open(f"{name}_{chunk}.uvt", "w").close()
+    assert prepare_config_append("setup001", *args, hpb_dict, parameters) is None
+    # new delivery: only the new file, appended
+    hpb_dict.append({"file": "hpb3"})
+    script_file = prepare_config_append("setup001", *args, hpb_dict, parameters)
+    assert script_file is not None
+    assert script_files(script_file) == ["file in hpb3"]
+    script = open(script_file).read()
+    assert script.index("let new_file 0") < script.index("begin procedure makespw")
+    record_tabled("setup001", *args, hpb_dict, parameters)
+    assert prepare_config_append("setup001", *args, hpb_dict, parameters) is None
+    # a tabled file changed: full script
+    (tmp_path / "hpb1.hpb").write_text("reduced again")
+    script_file = prepare_config_append("setup001", *args, hpb_dict, parameters)
+    assert script_file is not None
+    assert len(script_files(script_file)) == 3
+
+
+def test_build_config_script(tmp_path):
+    """Test that the script built in memory is the one written by prepare_config"""
+    hpb_dict = [{"file": "hpb1"}, {"file": "hpb2", "RF calibration type": "baseline"}]
+    script = build_config_script(["S1", "S2"], "3", hpb_dict, {}, config="D")
+    script_file = prepare_config(
+        "setup001",
+        ["S1", "S2"],
+        "3",
+        hpb_dict,
+        {},
+        config="D",
+        script_dir=str(tmp_path),
+    )
+    with open(script_file) as f:
+        assert f.read() == script
+    assert script.count("@ loopspw") == 2
+
+
+def test_write_scripts_all_or_nothing(tmp_path):
+    """Test that no script is written if one of them fails"""
+    out_dir = tmp_path / "scripts"
+    with pytest.raises(TypeError):
+        write_scripts({"a.clic": "exit\n", "b.clic": None}, str(out_dir))  # type: ignore
+    assert os.listdir(out_dir) == []
+    files = write_scripts({"a.clic": "exit\n", "b.clic": "exit\n"}, str(out_dir))
+    assert sorted(os.listdir(out_dir)) == ["a.clic", "b.clic"]
+    assert files == [str(out_dir / "a.clic"), str(out_dir / "b.clic")]
+
+
+def test_process_all_setups(tmp_path):
+    """Test writing the scripts of all the setups at once"""
+    config = {
+        "setups": {
+            "setup001": {
+                "sources": ["S1", "S2"],
+                "C-files": [{"file": "c1"}],
+                "D-files": [{"file": "d1"}],
+            },
+            "setup002": {"sources": ["S3", "S4"], "D-files": [{"file": "d2"}]},
+        }
+    }
+    config_path = str(tmp_path / "config.yml")
+    with open(config_path, "w") as f:
+        yaml.safe_dump(config, f)
+    files = process_all_setups(config_path, str(tmp_path / "out"))
+    assert [os.path.basename(name) for name in files] == [
+        "setup001-C-uvts.clic",
+        "setup001-D-uvts.clic",
+        "setup001-CD-uvts.clic",
+        "setup002-D-uvts.clic",
+    ]
+    files = process_all_setups(config_path, str(tmp_path / "out2"), merge=True)
+    assert len(files) == 3
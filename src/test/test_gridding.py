@@ -0,0 +1,193 @@
+import numpy as np
+import pytest
+
+from noema_combine.baseline import velocity_axis
+from noema_combine.class_file import ClassFile, ClassObservation, write_class_file
+from noema_combine.gridding import grid_30m_file, grid_axes, grid_spectra, arcsec
+
+
+def make_otf(step: float = 3.0, nchan: int = 50):
+    # On-The-Fly rows along x, with a small jitter
+    x, y = np.meshgrid(np.arange(-60.0, 60.0, step), np.arange(-40.0, 40.0, step))
+    x = x.ravel() + 0.2 * np.sin(np.arange(x.size))
+    y = y.ravel()
+    # linear gradient across the map, scaled by the channel number
+    spectra = (1.0 + 0.01 * x)[:, None] * np.arange(1, nchan + 1)[None, :]
+    return spectra.astype(np.float32), x, y
+
+
+def test_grid_axes():
+    """Test that the grid covers the offsets, with RA decreasing"""
+    x_axis, y_axis = grid_axes(np.array([-10.0, 12.0]), np.array([0.0, 5.0]), 4.0)
+    assert x_axis[0] >= 12.0 and x_axis[-1] <= -10.0
+    assert np.all(np.diff(x_axis) == -4.0)
+    assert 0.0 in x_axis and 0.0 in y_axis
+    assert y_axis[0] <= 0.0 and y_axis[-1] >= 5.0
+
+
+def test_grid_spectra_linear_field():
+    """Test that a linear field is preserved by the gridding"""
+    spectra, x, y = make_otf()
+    x_axis, y_axis = grid_axes(x, y, 5.0)
+    cube, weight = grid_spectra(spectra, x, y, x_axis, y_axis, 5.0, 8.0)
+    assert cube.shape == (50, len(y_axis), len(x_axis))
+    assert weight.shape == (len(y_axis), len(x_axis))
+    # pixels well inside the map
+    inner_x = np.abs(x_axis) < 40.0
+    inner_y = np.abs(y_axis) < 25.0
+    expected = (1.0 + 0.01 * x_axis[inner_x])[None, None, :] * np.arange(1, 51)[
+        :, None, None
+    ]
+    np.testing.assert_allclose(
+        cube[:, inner_y][:, :, inner_x],
+        np.broadcast_to(expected, cube[:, inner_y][:, :, inner_x].shape),
+        rtol=0.02,
+    )
+    # far from the data there is no emission
+    empty_x, empty_y = np.array([200.0, -200.0]), np.array([0.0, 0.0])
+    x_axis, y_axis = grid_axes(empty_x, empty_y, 5.0)
+    cube, _ = grid_spectra(spectra[:1], x[:1] * 0, y[:1] * 0, x_axis, y_axis, 5.0, 8.0)
+    assert np.isnan(cube[0, 0, 0])
+
+
+def test_grid_spectra_chunks_and_threads():
+    """Test that the result does not depend on the channel chunks and threads"""
+    spectra, x, y = make_otf(step=5.0, nchan=37)
+    x_axis, y_axis = grid_axes(x, y, 6.0)
+    reference, _ = grid_spectra(
+        spectra, x, y, x_axis, y_axis, 6.0, 9.0, chunk_channels=37, n_threads=1
+    )
+    cube, _ = grid_spectra(
+        spectra, x, y, x_axis, y_axis, 6.0, 9.0, chunk_channels=5, n_threads=4
+    )
+    np.testing.assert_allclose(cube, reference, rtol=1e-6)
+
+
+def test_grid_spectra_blanked():
+    """Test that blanked channels do not contribute"""
+    spectra = np.ones((3, 4), dtype=np.float32)
+    spectra[0, 1] = -1000.0
+    spectra[1, 2] = np.nan
+    x = np.array([0.0, 1.0, -1.0])
+    y = np.zeros(3)
+    x_axis, y_axis = grid_axes(x, y, 2.0)
+    cube, _ = grid_spectra(spectra, x, y, x_axis, y_axis, 2.0, 3.0, bad=-1000.0)
+    np.testing.assert_allclose(cube[:, y_axis == 0.0][:, :, x_axis == 0.0], 1.0)
+
+
+def test_grid_30m_file(tmp_path):
+    """Test gridding a CLASS file into a FITS cube"""
+    from astropy.io import fits  # type: ignore
+
+    spectra, x, y = make_otf(step=8.0, nchan=20)
+    file_30m = str(tmp_path / "B5_CO_1_0.30m")
+    observations = [
+        ClassObservation(
+            source="B5",
+            line="CO",
+            telescope="30M-MRT",
+            scan=1,
+            restf=115271.0,
+            fres=-0.1,
+            rchan=10.0,
+            vres=0.26,
+            voff=10.0,
+            off1=x_i * arcsec,
+            off2=y_i * arcsec,
+            data=spectrum,
+        )
+        for spectrum, x_i, y_i in zip(spectra, x, y)
+    ]
+    write_class_file(file_30m, observations)
+    with ClassFile(file_30m) as class_file:
+        block = class_file.spectra_block()
+        assert not block.flags.owndata
+        np.testing.assert_array_equal(block, spectra)
+    fits_file = str(tmp_path / "B5_CO_1_0.fits")
+    shape = grid_30m_file(file_30m, fits_file, 50.5, 30.2, n_threads=2)
+    with fits.open(fits_file) as hdu:
+        assert hdu[0].data.shape == shape
+        header = hdu[0].header
+        assert header["CRVAL1"] == 50.5
+        assert header["CDELT1"] < 0
+        assert header["RESTFRQ"] == 115271.0e6
+        assert header["CRVAL3"] == (10.0 + (1 - 10.0) * 0.26) * 1e3
+
+
+def test_grid_30m_file_spectral_axes(tmp_path):
+    """Test that spectra with different velocity axes are resampled, not dropped"""
+    from astropy.io import fits  # type: ignore
+
+    _, x, y = make_otf(step=8.0)
+    file_30m = str(tmp_path / "B5_CO_1_0.30m")
+    # two backends: a fine axis and a coarser one extending to higher velocities
+    axes = [(20, 10.0, 0.26, 10.0), (14, 7.0, 0.52, 11.0)]
+    observations = []
+    for k, (x_i, y_i) in enumerate(zip(x, y)):
+        nchan, rchan, vres, voff = axes[k % 2]
+        velocity = velocity_axis(nchan, rchan, vres, voff)
+        observations.append(
+            ClassObservation(
+                source="B5",
+                line="CO",
+                telescope="30M-MRT",
+                scan=1,
+                restf=115271.0,
+                fres=-0.1 * vres / 0.26,
+                rchan=rchan,
+                vres=vres,
+                voff=voff,
+                off1=x_i * arcsec,
+                off2=y_i * arcsec,
+                data=(1.0 + 0.1 * velocity).astype(np.float32),
+            )
+        )
+    write_class_file(file_30m, observations)
+    fits_file = str(tmp_path / "B5_CO_1_0.fits")
+    shape = grid_30m_file(file_30m, fits_file, 50.5, 30.2, n_threads=1)
+    assert shape[0] == 28
+    with fits.open(fits_file) as hdu:
+        header = hdu[0].header
+        cube = hdu[0].data
+    assert header["CDELT3"] == pytest.approx(260.0)
+    velocity = (
+        header["CRVAL3"] + (np.arange(shape[0]) + 1 - header["CRPIX3"]) * 260.0
+    ) * 1e-3
+    assert velocity[0] == pytest.approx(10.0 - 9 * 0.26)
+    for channel, v in enumerate(velocity):
+        values = cube[channel][np.isfinite(cube[channel])]
+        # all the channels have data, from one or both backends, within half
+        # a coarse channel of the velocity gradient
+        assert len(values) > 0
+        np.testing.assert_allclose(values, 1.0 + 0.1 * v, atol=0.1 * 0.26)
+
+
+def test_grid_30m_file_weights(tmp_path):
+    """Test that overlapping spectra are averaged with time * |fres| / Tsys^2"""
+    from astropy.io import fits  # type: ignore
+
+    file_30m = str(tmp_path / "B5_CO_1_0.30m")
+    observations = [
+        ClassObservation(
+            source="B5",
+            line="CO",
+            telescope="30M-MRT",
+            scan=1,
+            restf=115271.0,
+            fres=-0.1,
+            rchan=5.0,
+            vres=0.26,
+            voff=10.0,
+            tsys=tsys,
+            time=10.0,
+            data=np.full(10, value, dtype=np.float32),
+        )
+        for tsys, value in [(100.0, 1.0), (200.0, 2.0)]
+    ]
+    write_class_file(file_30m, observations)
+    fits_file = str(tmp_path / "B5_CO_1_0.fits")
+    grid_30m_file(file_30m, fits_file, 50.5, 30.2, n_threads=1)
+    with fits.open(fits_file) as hdu:
+        cube = hdu[0].data
+    # weights 4:1, instead of the plain mean 1.5
+    np.testing.assert_allclose(cube[np.isfinite(cube)], (4.0 + 2.0) / 5.0, rtol=1e-5)
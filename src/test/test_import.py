@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import pytest
+
+import noema_combine
+from noema_combine.data_handler import LazySettings
+
+src_dir = os.path.dirname(os.path.dirname(noema_combine.__file__))
+
+import_script = """
+import sys, time
+start = time.perf_counter()
+import noema_combine
+elapsed = time.perf_counter() - start
+from noema_combine import data_handler
+print(elapsed)
+print("astropy" in sys.modules)
+print("region_catalogue" in vars(data_handler.settings))
+print("line_name" in vars(data_handler.settings))
+"""
+
+
+def run_import(cwd) -> list[str]:
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    completed = subprocess.run(
+        [sys.executable, "-c", import_script],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return completed.stdout.split()
+
+
+def test_import_is_lazy(tmp_path):
+    """Test that importing the package loads neither catalogues nor astropy"""
+    elapsed, astropy_loaded, regions_loaded, lines_loaded = run_import(tmp_path)
+    assert astropy_loaded == "False"
+    assert regions_loaded == "False"
+    assert lines_loaded == "False"
+    # regression benchmark: the import used to take ~1 s (astropy + catalogues)
+    assert float(elapsed) < 0.8
+
+
+def test_import_with_missing_catalogues(tmp_path):
+    """Test that missing catalogues only raise an error on first use"""
+    with open(tmp_path / "config.ini", "w") as fh:
+        fh.write(
+            "[folders]\nuvt_dir = D/\nuvt_dir_out = D30m/\ndir_30m = 30m/\n"
+            "inputdir = raw_data/\n[catalogues]\nline_catalogue = missing.csv\n"
+            "source_catalogue = missing.yml\n[file_handling]\n"
+        )
+    run_import(tmp_path)
+    settings = LazySettings(str(tmp_path / "config.ini"))
+    assert settings.uvt_dir == "D/"
+    with pytest.raises(FileNotFoundError, match="missing.yml"):
+        settings.region_catalogue
+    with pytest.raises(FileNotFoundError, match="missing.csv"):
+        settings.line_name
+
+
+def test_settings_reset():
+    """Test that cached values are discarded on reset"""
+    settings = LazySettings()
+    assert len(settings.line_name) == len(settings.freq)
+    assert "line_name" in vars(settings)
+    settings.reset()
+    assert "line_name" not in vars(settings)
+    assert "DCO+" in settings.line_name
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from noema_combine.line_catalogue import LineCatalogue
+from noema_combine.data_handler import get_line_catalogue, settings
+
+
+@pytest.fixture
+def catalogue():
+    return LineCatalogue(
+        np.array(["CO", "CO", "13CO", "N2H+", "HCN"]),
+        np.array(["1-0", "2-1", "1-0", "1-0", "1-0"]),
+        np.array(["115.271", "230.538", "110.201", "93.1737", "88.6316"]),
+        np.array(["L09", "L20", "L08", "L05", "L05"]),
+    )
+
+
+def test_index(catalogue):
+    """Test lookup by name and quantum number"""
+    assert catalogue.index("CO", "2-1") == 1
+    assert catalogue.index("13CO", None) == 2
+    with pytest.raises(ValueError, match="Line name is not unique"):
+        catalogue.index("CO", None)
+    with pytest.raises(ValueError, match="Line not found in the catalogue"):
+        catalogue.index("CO", "3-2")
+    with pytest.raises(ValueError, match="Line not found in the catalogue"):
+        catalogue.index("SiO", None)
+
+
+def test_batch_lookup(catalogue):
+    """Test batch lookup of (line, qn) pairs"""
+    idx = catalogue.indices([("HCN", "1-0"), ("CO", "1-0"), ("N2H+", None)])
+    np.testing.assert_array_equal(idx, [4, 0, 3])
+    assert catalogue.indices([]).shape == (0,)
+
+
+def test_window_and_name(catalogue):
+    """Test lookup of all the lines in a window or with a name"""
+    np.testing.assert_array_equal(catalogue.in_window("L05"), [3, 4])
+    assert len(catalogue.in_window("L99")) == 0
+    np.testing.assert_array_equal(catalogue.with_name("CO"), [0, 1])
+
+
+def test_frequency_range(catalogue):
+    """Test frequency range queries, inclusive and sorted by frequency"""
+    np.testing.assert_array_equal(catalogue.in_range(88.6316, 110.201), [4, 3, 2])
+    assert len(catalogue.in_range(120.0, 200.0)) == 0
+    counts = catalogue.count_in_ranges(
+        np.array([80.0, 100.0, 0.0]), np.array([95.0, 120.0, 1.0])
+    )
+    np.testing.assert_array_equal(counts, [2, 2, 0])
+
+
+def test_get_line_catalogue_is_cached():
+    """Test that the catalogue index is built once and rebuilt after reset"""
+    first = get_line_catalogue()
+    assert get_line_catalogue() is first
+    assert len(first) == len(settings.line_name)
+    settings.reset()
+    assert get_line_catalogue() is not first
@@ -0,0 +1,152 @@
+import os
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+import pytest
+
+from noema_combine.class_file import ClassObservation, write_class_file
+from noema_combine.manifest import (
+    parse_scan_listing,
+    scan_30m_files,
+    update_manifest,
+    load_manifest,
+    file_matches,
+    ignore_matcher,
+)
+
+listing = """FILE raw/a.30m
+OBS 10 B5-N 30ME0HLI-V01 93173.7637 1000 500.5 0.195
+OBS 10 B5-N 30ME0HLI-V01 93173.7637 1000 500.5 0.195
+OBS 11 B5-S 30ME0VLI-V02 86754.2884 1000 500.5 -0.195
+FILE raw/b.30m
+"""
+
+
+# Tests for parse_scan_listing
+def test_parse_scan_listing():
+    """Test the summary of the CLASS observation listing"""
+    entries = parse_scan_listing(listing)
+    assert set(entries) == {"raw/a.30m", "raw/b.30m"}
+    entry = entries["raw/a.30m"]
+    assert entry["nobs"] == 3
+    assert entry["nscan"] == 2
+    assert entry["sources"] == ["B5-N", "B5-S"]
+    f_min, f_max = entry["backends"]["30ME0HLI-V01"]  # type: ignore
+    assert f_min < 93173.7637 < f_max
+    f_min, f_max = entry["backends"]["30ME0VLI-V02"]  # type: ignore
+    assert f_min < f_max
+    assert entries["raw/b.30m"]["nobs"] == 0
+
+
+# Tests for file_matches
+def test_file_matches():
+    """Test the selection of files by source pattern and frequency"""
+    entry = parse_scan_listing(listing)["raw/a.30m"]
+    assert file_matches(entry, "B5*", 93173.0)
+    assert file_matches(entry, "b5-s", 86754.0)
+    assert file_matches(entry, "L1448 B5-N", 93173.0)
+    assert not file_matches(entry, "L1448*", 93173.0)
+    assert not file_matches(entry, "B5*", 110000.0)
+
+
+# Tests for update_manifest
+@patch("noema_combine.manifest.scan_30m_files")
+def test_update_manifest_incremental(mock_scan: MagicMock, tmp_path):
+    """Test that only new or modified files are scanned"""
+    file_a = str(tmp_path / "a.30m")
+    file_b = str(tmp_path / "b.30m")
+    for name in [file_a, file_b]:
+        with open(name, "wb") as fh:
+            fh.write(b"0" * 10)
+    manifest_file = str(tmp_path / "manifest.json")
+
+    def fake_scan(inputfiles, scratch_dir=".", log_file=""):
+        return {
+            name: {"nobs": 1, "nscan": 1, "sources": ["B5"], "backends": {}}
+            for name in inputfiles
+        }
+
+    mock_scan.side_effect = fake_scan
+    files = update_manifest([file_a, file_b], manifest_file)
+    assert set(files) == {file_a, file_b}
+    assert files[file_a]["size"] == 10
+    assert mock_scan.call_args.args[0] == [file_a, file_b]
+    # nothing changed
+    mock_scan.reset_mock()
+    update_manifest([file_a, file_b], manifest_file)
+    mock_scan.assert_not_called()
+    # modified file and deleted file
+    with open(file_a, "ab") as fh:
+        fh.write(b"1")
+    os.remove(file_b)
+    files = update_manifest([file_a], manifest_file)
+    assert mock_scan.call_args.args[0] == [file_a]
+    assert set(files) == {file_a}
+    assert load_manifest(manifest_file)[file_a]["size"] == 11
+    # no temporary files are left
+    assert sorted(os.listdir(tmp_path)) == ["a.30m", "manifest.json"]
+
+
+# Tests for scan_30m_files
+@patch("noema_combine.manifest.scan_30m_files_class")
+def test_scan_30m_files_native(mock_class: MagicMock, tmp_path):
+    """Test that CLASS files are read natively, and other files with CLASS"""
+    file_native = str(tmp_path / "a.30m")
+    file_other = str(tmp_path / "b.30m")
+    observations = [
+        ClassObservation(
+            source=source,
+            line="N2H+",
+            telescope=telescope,
+            scan=scan,
+            restf=93173.7637,
+            fres=0.195,
+            rchan=500.5,
+            data=np.zeros(1000, dtype=np.float32),
+        )
+        for source, telescope, scan in [
+            ("B5-N", "30ME0HLI-V01", 10),
+            ("B5-N", "30ME0HLI-V01", 10),
+            ("B5-S", "30ME0VLI-V02", 11),
+        ]
+    ]
+    write_class_file(file_native, observations)
+    with open(file_other, "wb") as fh:
+        fh.write(b"1A  " + b"\0" * 508)
+    mock_class.return_value = {file_other: {"nobs": 0}}
+    entries = scan_30m_files([file_native, file_other])
+    assert mock_class.call_args.args[0] == [file_other]
+    entry = entries[file_native]
+    assert entry["nobs"] == 3
+    assert entry["nscan"] == 2
+    assert entry["sources"] == ["B5-N", "B5-S"]
+    assert file_matches(entry, "B5*", 93173.0)
+    assert not file_matches(entry, "B5*", 110000.0)
+    assert entries[file_other] == {"nobs": 0}
+
+
+def test_ignore_matcher():
+    """Test exact paths, globs and regular expressions of ignorefiles"""
+    is_ignored = ignore_matcher(
+        [
+            "raw_data/FTSOdp20220220.30m",
+            "raw_data/B5_*.30m",
+            "re:FTSOdp2021(07|08)",
+        ]
+    )
+    assert is_ignored("/home/user/30m/raw_data/FTSOdp20220220.30m")
+    assert is_ignored("raw_data/FTSOdp20220220.30m")
+    assert not is_ignored("/home/user/30m/other_raw_data/FTSOdp20220220.30m")
+    assert not is_ignored("/home/user/30m/raw_data/FTSOdp20220220.30m.bak")
+    assert is_ignored("/data/raw_data/B5_H13COp10.30m")
+    assert not is_ignored("/data/raw_data/L1448_H13COp10.30m")
+    assert is_ignored("/data/raw_data/FTSOdp20210801.30m")
+    assert not is_ignored("/data/raw_data/FTSOdp20210901.30m")
+    assert not ignore_matcher([])("/data/raw_data/FTSOdp20210901.30m")
+    # names without folder nor wildcard match anywhere in the path
+    is_ignored = ignore_matcher(["FTSOdp20220731", "B5_H13COp10.30m"])
+    assert is_ignored("/data/raw_data/FTSOdp20220731.30m")
+    assert is_ignored("/data/raw_data/B5_H13COp10.30m.bak")
+    assert not is_ignored("/data/raw_data/FTSOdp20220220.30m")
+    with pytest.raises(ValueError, match="Invalid ignorefiles"):
+        ignore_matcher(["re:FTSO("])
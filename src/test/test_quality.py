@@ -0,0 +1,147 @@
+import os
+
+import numpy as np
+
+from noema_combine.class_file import ClassFile, ClassObservation, write_class_file
+from noema_combine.quality import (
+    spectrum_statistics,
+    robust_outliers,
+    detect_bad_scans,
+    excluded_mask,
+    good_ranges,
+    exclusions_by_telescope,
+    update_scan_table,
+    load_scan_table,
+    save_scan_table,
+)
+
+
+def make_observations(
+    n_scans: int = 10, n_subscans: int = 2, nchan: int = 256
+) -> list[ClassObservation]:
+    rng = np.random.default_rng(1)
+    observations = []
+    for scan in range(1, n_scans + 1):
+        for subscan in range(1, n_subscans + 1):
+            for telescope in ("30ME0HLI-F01", "30ME0VLI-F02"):
+                for _ in range(4):
+                    observations.append(
+                        ClassObservation(
+                            source="B5-N",
+                            line="N2H+",
+                            telescope=telescope,
+                            scan=scan,
+                            subscan=subscan,
+                            restf=93173.7637,
+                            fres=-0.195,
+                            rchan=nchan / 2,
+                            vres=0.63,
+                            tsys=100.0 + rng.normal(0.0, 1.0),
+                            data=rng.normal(0.0, 0.1, nchan).astype(np.float32),
+                        )
+                    )
+    return observations
+
+
+# Tests for spectrum_statistics and robust_outliers
+def test_spectrum_statistics():
+    """Test the noise, slope, spikes and blanked fraction of each spectrum"""
+    rng = np.random.default_rng(2)
+    nchan = 2000
+    x = np.linspace(-1.0, 1.0, nchan)
+    spectra = rng.normal(0.0, 0.1, (4, nchan))
+    spectra[1] += 2.0 * x
+    spectra[2, [100, 500, 900]] += 5.0
+    spectra[3, :1000] = -1000.0
+    # a line does not bias the noise
+    spectra[0] += 3.0 * np.exp(-0.5 * ((np.arange(nchan) - 1000) / 10.0) ** 2)
+    statistics = spectrum_statistics(spectra, bad=-1000.0)
+    np.testing.assert_allclose(statistics["rms"], 0.1, rtol=0.1)
+    np.testing.assert_allclose(statistics["slope"][1], 2.0, rtol=0.05)
+    assert statistics["slope"][0] < 0.1
+    assert statistics["spikes"][2] == 3
+    assert statistics["spikes"][0] == 0
+    np.testing.assert_allclose(statistics["blank"], [0.0, 0.0, 0.0, 0.5])
+
+
+def test_robust_outliers():
+    """Test that only the values far above the bulk are outliers"""
+    values = np.array([1.0, 1.1, 0.9, 1.05, 0.95, 10.0, -10.0, np.nan])
+    np.testing.assert_array_equal(
+        robust_outliers(values), [False] * 5 + [True, False, False]
+    )
+    # a floor on the scale of integer counts
+    counts = np.array([0, 0, 0, 0, 1, 3, 8])
+    np.testing.assert_array_equal(
+        robust_outliers(counts, n_sigma=5.0, floor=1.0), [False] * 6 + [True]
+    )
+
+
+# Tests for detect_bad_scans
+def test_detect_bad_scans(tmp_path):
+    """Test that the noisy scans and subscans of a telescope are excluded"""
+    observations = make_observations()
+    for obs in observations:
+        if obs.telescope == "30ME0HLI-F01" and obs.scan == 3:
+            obs.data = obs.data * 10.0
+        if obs.telescope == "30ME0VLI-F02" and obs.scan == 7 and obs.subscan == 2:
+            obs.tsys = 500.0
+    raw_file = str(tmp_path / "a.30m")
+    write_class_file(raw_file, observations)
+    entry = detect_bad_scans(raw_file)
+    assert entry["telescopes"] == ["30ME0HLI-F01", "30ME0VLI-F02"]
+    assert sorted(entry["excluded"]) == [  # type: ignore
+        ["30ME0HLI-F01", 3, 0, "rms"],
+        ["30ME0VLI-F02", 7, 2, "tsys"],
+    ]
+    with ClassFile(raw_file) as class_file:
+        headers = class_file.headers()
+        excluded = excluded_mask(entry, headers)
+    assert np.sum(excluded) == 8 + 4
+    assert set(headers["scan"][excluded]) == {3, 7}
+
+
+def test_good_ranges():
+    """Test the scan ranges around the excluded scans"""
+    assert good_ranges([]) == [(1, None)]
+    assert good_ranges([1, 2, 5]) == [(3, 4), (6, None)]
+    assert good_ranges([54, 3, 4]) == [(1, 2), (5, 53), (55, None)]
+    entry = {
+        "telescopes": ["A", "B", "C"],
+        "excluded": [["A", 3, 0, "rms"], ["B", 7, 2, "tsys"]],
+    }
+    assert exclusions_by_telescope(entry) == {
+        "A": ([3], {}),
+        "B": ([], {7: [2]}),
+        "C": ([], {}),
+    }
+    # unknown telescopes: a single block for all of them
+    entry = {
+        "telescopes": [],
+        "excluded": [["A", 3, 0, "manual"], ["B", 7, 2, "manual"]],
+    }
+    assert exclusions_by_telescope(entry) == {"*": ([3], {7: [2]})}
+
+
+def test_update_scan_table(tmp_path):
+    """Test that only new or modified files are checked"""
+    raw_file = str(tmp_path / "a.30m")
+    write_class_file(raw_file, make_observations(n_scans=4))
+    table_file = str(tmp_path / "30m" / "bad_scans.json")
+    table = update_scan_table([raw_file], table_file)
+    assert table[raw_file]["excluded"] == []
+    assert load_scan_table(table_file) == table
+    # manual exclusions are kept while the file is unchanged
+    table[raw_file]["excluded"] = [["30ME0HLI-F01", 1, 0, "manual"]]
+    save_scan_table(table_file, table)
+    table = update_scan_table([raw_file], table_file)
+    assert table[raw_file]["excluded"] == [["30ME0HLI-F01", 1, 0, "manual"]]
+    # modified and removed files
+    write_class_file(raw_file, make_observations(n_scans=5))
+    os.utime(raw_file, (0, 0))
+    table = update_scan_table([raw_file], table_file)
+    assert table[raw_file]["excluded"] == []
+    os.remove(raw_file)
+    assert update_scan_table([], table_file) == {}
+    # no temporary files are left
+    assert os.listdir(tmp_path / "30m") == ["bad_scans.json"]
@@ -0,0 +1,98 @@
+import os
+import stat
+import pytest
+
+from noema_combine.runner import run_gildas, GildasError
+
+
+def make_program(tmp_path, body: str) -> str:
+    """Write a fake GILDAS program: a shell script called as 'program -nw @ script'"""
+    program = str(tmp_path / "fakeclass")
+    with open(program, "w") as fh:
+        fh.write("#!/bin/sh\n" + body)
+    os.chmod(program, os.stat(program).st_mode | stat.S_IEXEC)
+    return program
+
+
+# Tests for run_gildas
+def test_run_gildas_success(tmp_path):
+    """Test that the script is passed to the program and output is logged"""
+    program = make_program(tmp_path, 'echo "args: $1 $2"\ncat "$3"\nexit 0\n')
+    log_file = str(tmp_path / "logs" / "B5_CO.class.log")
+    result = run_gildas(program, "find /all\nexit\n", log_file, str(tmp_path))
+    assert result.ok
+    assert result.attempts == 1
+    with open(log_file) as fh:
+        log = fh.read()
+    assert "args: -nw @" in log
+    assert "find /all" in log
+    # temporary script is removed
+    assert sorted(os.listdir(tmp_path)) == ["fakeclass", "logs"]
+
+
+def test_run_gildas_retries(tmp_path):
+    """Test that failed sessions are retried and recorded"""
+    program = make_program(tmp_path, "echo failing\nexit 3\n")
+    log_file = str(tmp_path / "fail.log")
+    result = run_gildas(program, "exit\n", log_file, str(tmp_path), retries=2)
+    assert not result.ok
+    assert result.returncode == 3
+    assert result.attempts == 3
+    with open(log_file) as fh:
+        assert fh.read().count("failing") == 3
+
+
+def test_run_gildas_retry_succeeds(tmp_path):
+    """Test that a session succeeding on retry is reported as successful"""
+    flag = tmp_path / "flag"
+    program = make_program(
+        tmp_path, f'if [ -f "{flag}" ]; then exit 0; fi\ntouch "{flag}"\nexit 1\n'
+    )
+    result = run_gildas(program, "exit\n", str(tmp_path / "a.log"), retries=1)
+    assert result.ok
+    assert result.attempts == 2
+
+
+def test_run_gildas_cleanup(tmp_path):
+    """Test that the outputs of a failed attempt are removed before a retry"""
+    output = tmp_path / "out.30m"
+    program = make_program(
+        tmp_path,
+        f'echo spectrum >> "{output}"\nif [ -f "{tmp_path}/flag" ]; '
+        f'then exit 0; fi\ntouch "{tmp_path}/flag"\nexit 1\n',
+    )
+    calls = []
+    result = run_gildas(
+        program,
+        "exit\n",
+        str(tmp_path / "a.log"),
+        retries=1,
+        cleanup=lambda: calls.append(output.unlink()),
+    )
+    assert result.ok
+    assert len(calls) == 1
+    assert output.read_text() == "spectrum\n"
+
+
+def test_run_gildas_log_error(tmp_path):
+    """Test that the temporary script is removed if the log cannot be opened"""
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    with pytest.raises(IsADirectoryError):
+        run_gildas("class", "exit\n", str(tmp_path), str(scratch))
+    assert os.listdir(scratch) == []
+
+
+def test_run_gildas_timeout_check(tmp_path):
+    """Test that hung sessions are stopped and raise an error when requested"""
+    program = make_program(tmp_path, "sleep 10\n")
+    log_file = str(tmp_path / "hung.log")
+    with pytest.raises(GildasError, match="timed out after 1 attempt"):
+        run_gildas(program, "exit\n", log_file, timeout=0.2, check=True)
+
+
+def test_run_gildas_missing_program(tmp_path):
+    """Test that a missing program is recorded as a failure"""
+    result = run_gildas(str(tmp_path / "missing"), "exit\n", str(tmp_path / "m.log"))
+    assert result.returncode == -1
+    assert not result.timed_out
@@ -0,0 +1,158 @@
+import numpy as np
+import pytest
+
+from noema_combine.class_table import table_ndaps, write_class_table
+from noema_combine.gridding import arcsec, beam_30m
+from noema_combine.short_spacing import (
+    beam_noema,
+    noema_fields,
+    boltzmann,
+    short_spacing_uvt,
+    speed_of_light,
+    uv_sampling,
+)
+from noema_combine.uv_table import UVHeader, UVTable, write_uv_table
+
+
+def make_inputs(tmp_path, source_fwhm: float = 40.0, nchan: int = 6):
+    restf = 100000.0
+    header = UVHeader(
+        nvis=20,
+        nchan=nchan,
+        rchan=1.0,
+        restf=restf,
+        fres=-0.1,
+        vres=0.3,
+        voff=0.0,
+        source="B5",
+        line="N2H+",
+    )
+    data = np.zeros((header.nvis, header.ncol), dtype=np.float32)
+    data[:, header.ndaps + 2 :: 3] = 4.0  # weights
+    uvt_file = str(tmp_path / "noema.uvt")
+    write_uv_table(uvt_file, header, data)
+    # 30m spectra of a Gaussian source convolved with the 30m beam,
+    # channel k with peak (k + 1) K
+    beam = beam_30m / (restf * 1e-3)
+    smoothed = np.hypot(source_fwhm, beam)
+    peak = (source_fwhm / smoothed) ** 2
+    grid = np.arange(-150.0, 151.0, 6.0)
+    x, y = [values.ravel() for values in np.meshgrid(grid, grid)]
+    profile = peak * np.exp(-4.0 * np.log(2.0) * (x**2 + y**2) / smoothed**2)
+    table = np.zeros((len(x), table_ndaps + nchan), dtype=np.float32)
+    table[:, 0] = x * arcsec
+    table[:, 1] = y * arcsec
+    table[:, 2] = 1.0
+    table[:, table_ndaps:] = profile[:, None] * (np.arange(nchan) + 1.0)[None, :]
+    table_file = str(tmp_path / "30m.tab")
+    write_class_table(
+        table_file,
+        UVHeader(
+            nvis=len(x),
+            nchan=nchan,
+            rchan=1.0,
+            restf=restf,
+            fres=-0.1,
+            vres=0.3,
+            voff=0.0,
+            ndaps=table_ndaps,
+            natom=1,
+        ),
+        table,
+    )
+    return header, uvt_file, table_file
+
+
+def test_uv_sampling():
+    """Test that one point of each symmetric pair is kept within uv_max"""
+    row, column, uv = uv_sampling(64, 5e-5, 0.003, 15.0)
+    freq = np.fft.fftfreq(64, d=5e-5)
+    np.testing.assert_allclose(uv[:, 0], freq[column])
+    np.testing.assert_allclose(uv[:, 1], freq[row])
+    assert np.all(np.hypot(uv[:, 0], uv[:, 1]) * 0.003 <= 15.0)
+    pairs = {tuple(point) for point in np.round(uv, 3)}
+    assert not any((-u, -v) in pairs for u, v in pairs if (u, v) != (0.0, 0.0))
+    assert (0.0, 0.0) in pairs
+
+
+@pytest.mark.parametrize("n_threads", [1, 3])
+def test_short_spacing_uvt(tmp_path, n_threads):
+    """Test the pseudo-visibilities of a Gaussian source"""
+    source_fwhm = 40.0
+    header, uvt_file, table_file = make_inputs(tmp_path, source_fwhm)
+    out_file = str(tmp_path / "short.uvt")
+    out_header = short_spacing_uvt(
+        table_file, uvt_file, out_file, chunk_channels=4, n_threads=n_threads
+    )
+    with UVTable(out_file) as table:
+        assert table.header == out_header
+        assert table.header.nchan == header.nchan
+        u, v = table.daps[:, 0].astype(float), table.daps[:, 1].astype(float)
+        assert np.max(np.hypot(u, v)) <= 15.0
+        vis = np.asarray(table.visibilities(), dtype=np.float64)
+    # source times the primary beam: Gaussian with this FWHM (radians)
+    restf = header.restf * 1e6
+    wavelength = speed_of_light / restf
+    pb = beam_noema / (header.restf * 1e-3)
+    fwhm = 1.0 / np.sqrt(1.0 / source_fwhm**2 + 1.0 / pb**2) * arcsec
+    rho = np.hypot(u, v) / wavelength
+    frequency = header.frequency() * 1e6
+    for k in range(header.nchan):
+        flux = (
+            2.0
+            * boltzmann
+            * frequency[k] ** 2
+            / speed_of_light**2
+            * (k + 1.0)
+            * np.pi
+            * fwhm**2
+            / (4.0 * np.log(2.0))
+            * 1e26
+        )
+        expected = flux * np.exp(-((np.pi * fwhm * rho) ** 2) / (4.0 * np.log(2.0)))
+        np.testing.assert_allclose(vis[:, k, 0], expected, atol=0.02 * flux)
+        np.testing.assert_allclose(vis[:, k, 1], 0.0, atol=0.02 * flux)
+    np.testing.assert_allclose(vis[:, :, 2], 4.0)
+
+
+def test_short_spacing_uvt_axis_mismatch(tmp_path):
+    """Test that the 30m table must have the spectral axis of the uv-table"""
+    _, uvt_file, table_file = make_inputs(tmp_path, nchan=6)
+    header = UVHeader(
+        nvis=1, nchan=5, rchan=1.0, restf=100000.0, fres=-0.1, vres=0.3, voff=0.0
+    )
+    write_uv_table(uvt_file, header, np.zeros((1, header.ncol), np.float32))
+    with pytest.raises(ValueError, match="Spectral axis"):
+        short_spacing_uvt(table_file, uvt_file, str(tmp_path / "short.uvt"))
+
+
+def test_noema_fields(tmp_path):
+    """Test that the fields of a mosaic get their own pseudo-visibilities"""
+    _, uvt_file, table_file = make_inputs(tmp_path, nchan=2)
+    header = UVHeader(
+        nvis=4,
+        nchan=2,
+        rchan=1.0,
+        restf=100000.0,
+        fres=-0.1,
+        vres=0.3,
+        voff=0.0,
+        ndaps=9,
+    )
+    data = np.zeros((4, header.ncol), dtype=np.float32)
+    data[2:, 7] = 20.0 * arcsec
+    data[:, 11::3] = 1.0
+    write_uv_table(uvt_file, header, data)
+    with UVTable(uvt_file) as table:
+        fields = noema_fields(table)
+    assert fields == [(0.0, 0.0), (pytest.approx(20.0 * arcsec), 0.0)]
+    out_file = str(tmp_path / "short.uvt")
+    out_header = short_spacing_uvt(table_file, uvt_file, out_file)
+    with UVTable(out_file) as table:
+        n_points = out_header.nvis // 2
+        offsets = np.asarray(table.daps[:, 7:9], dtype=np.float64)
+        vis = np.asarray(table.visibilities(), dtype=np.float64)
+    np.testing.assert_allclose(offsets[:n_points], 0.0)
+    np.testing.assert_allclose(offsets[n_points:, 0], 20.0 * arcsec, rtol=1e-6)
+    # the source is fainter away from the centre of the primary beam
+    assert vis[n_points, 0, 0] < vis[0, 0, 0]
@@ -0,0 +1,90 @@
+import numpy as np
+from unittest.mock import patch
+from noema_combine import source_catalogue
+from noema_combine.source_catalogue import (
+    build_source_table,
+    coordinate_format,
+    parse_coordinates,
+)
+from noema_combine.data_handler import get_source_table, settings
+
+
+def test_coordinate_format():
+    """Test the detection of the coordinate formats"""
+    assert coordinate_format("03:22:00", "30:12:00") == "sexagesimal"
+    assert coordinate_format("03h22m0s", "30d12m0s") == "units"
+    assert coordinate_format("50.5", "30.2") == "degrees"
+
+
+def test_parse_coordinates_one_call_per_format():
+    """Test that each coordinate format is converted with a single call"""
+    ra = ["50.5", "03h22m0s", "03:22:00", "52.3", "03h22m0s"]
+    dec = ["30.2", "30d12m0s", "30:12:00", "31.1", "30d12m0s"]
+    with patch.object(
+        source_catalogue, "_skycoord", wraps=source_catalogue._skycoord
+    ) as mock_skycoord:
+        ra_deg, dec_deg, errors = parse_coordinates(ra, dec)
+    assert mock_skycoord.call_count == 3
+    assert errors == {}
+    np.testing.assert_allclose(ra_deg, [50.5, 50.5, 50.5, 52.3, 50.5])
+    np.testing.assert_allclose(dec_deg, [30.2, 30.2, 30.2, 31.1, 30.2])
+
+
+def test_parse_coordinates_invalid_entry():
+    """Test that an invalid entry does not affect the rest of its group"""
+    ra_deg, dec_deg, errors = parse_coordinates(
+        ["50.5", "bad", "52.3"], ["30.2", "1", "31.1"]
+    )
+    assert list(errors.keys()) == [1]
+    assert np.isnan(ra_deg[1])
+    np.testing.assert_allclose(ra_deg[[0, 2]], [50.5, 52.3])
+
+
+def test_build_source_table():
+    """Test the parsed table of the region catalogue"""
+    catalogue = {
+        "B5": {
+            "source_30m": "B5*",
+            "source_out": "B5",
+            "RA0": "50.5",
+            "Dec0": "30.2",
+            "Vlsr": 10.0,
+        },
+        "bad": {
+            "source_30m": "X",
+            "source_out": "X",
+            "RA0": "1",
+            "Dec0": "2",
+            "Vlsr": "fast",
+        },
+    }
+    table, errors = build_source_table(catalogue)
+    assert table == {"B5": ("B5*", "B5", 50.5, 30.2, 10.0)}
+    assert list(errors.keys()) == ["bad"]
+
+
+@patch.dict(
+    "noema_combine.data_handler.settings.region_catalogue",
+    {
+        "B5": {
+            "source_30m": "B5",
+            "source_out": "B5",
+            "RA0": "50.5",
+            "Dec0": "30.2",
+            "Vlsr": "10.0",
+        }
+    },
+    clear=True,
+)
+def test_get_source_table_cached():
+    """Test that the table is parsed once and again after the catalogue changes"""
+    get_source_table()
+    with patch(
+        "noema_combine.data_handler.build_source_table", wraps=build_source_table
+    ) as mock_build:
+        get_source_table()
+        assert mock_build.call_count == 0
+        settings.region_catalogue["B5"]["Vlsr"] = "7.0"
+        table = get_source_table()
+        assert mock_build.call_count == 1
+    assert table["B5"][4] == 7.0
@@ -0,0 +1,246 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from noema_combine.uv_table import (
+    UVHeader,
+    UVTable,
+    append_uv_tables,
+    contsub_row_factor,
+    extract_velocities,
+    extract_velocity,
+    phase_center_offset,
+    shift_phase_center,
+    speed_of_light,
+    subtract_continuum,
+    write_uv_table,
+)
+
+
+def make_table(
+    file_name: str, nvis: int = 50, nchan: int = 120
+) -> tuple[UVHeader, np.ndarray]:
+    header = UVHeader(
+        nvis=nvis,
+        nchan=nchan,
+        rchan=60.5,
+        restf=93173.7637,
+        fres=-0.0625,
+        vres=0.2,
+        voff=10.0,
+        source="B5",
+        line="N2H+",
+        ra=np.radians(56.9),
+        dec=np.radians(32.86),
+    )
+    data = np.arange(nvis * header.ncol, dtype=np.float32).reshape(nvis, header.ncol)
+    write_uv_table(file_name, header, data)
+    return header, data
+
+
+def test_round_trip(tmp_path):
+    """Test reading the header and data written by write_uv_table"""
+    file_name = str(tmp_path / "window.uvt")
+    header, data = make_table(file_name)
+    with UVTable(file_name) as table:
+        assert table.header == header
+        np.testing.assert_array_equal(table.data, data)
+        np.testing.assert_array_equal(table.daps, data[:, :7])
+        vis = table.visibilities(10, 20)
+        assert vis.shape == (50, 10, 3)
+        np.testing.assert_array_equal(vis[:, 0, 0], data[:, 7 + 30])
+        # channel slices are views of the memory map
+        assert np.shares_memory(vis, table.data)
+
+
+def test_invalid_file(tmp_path):
+    """Test that files that are not UV tables are rejected"""
+    file_name = tmp_path / "other.uvt"
+    file_name.write_bytes(b"GILDAS_IMAGE" + bytes(2000))
+    with pytest.raises(ValueError, match="Unsupported GILDAS UV table"):
+        UVTable(str(file_name))
+    file_name.write_bytes(b"GILDAS_UVFIL")
+    with pytest.raises(ValueError, match="too short"):
+        UVTable(str(file_name))
+
+
+def test_channel_range(tmp_path):
+    """Test the channels selected by a velocity range"""
+    file_name = str(tmp_path / "window.uvt")
+    header, _ = make_table(file_name)
+    with UVTable(file_name) as table:
+        first, last = table.channel_range(9.0, 11.0)
+        velocity = header.velocity()[first:last]
+        assert velocity[0] == pytest.approx(9.0, abs=0.1)
+        assert velocity[-1] == pytest.approx(11.0, abs=0.1)
+        with pytest.raises(ValueError, match="outside"):
+            table.channel_range(100.0, 200.0)
+
+
+def test_extract_velocity(tmp_path):
+    """Test cutting a velocity range with a new rest frequency"""
+    window_file = str(tmp_path / "window.uvt")
+    out_file = str(tmp_path / "line.uvt")
+    header, data = make_table(window_file)
+    raw_header = open(window_file, "rb").read(1024)
+    # line 10 channels above the reference of the window
+    restf = header.restf + 10 * header.fres
+    out = extract_velocity(window_file, out_file, 9.0, 11.0, restf=restf, line="X")
+    with UVTable(out_file) as table:
+        assert table.header == out
+        assert out.line == "X"
+        assert out.restf == restf
+        assert out.nchan == 11
+        # same sky frequencies as the input channels
+        first = int(round(header.rchan + 10 - out.rchan))
+        np.testing.assert_allclose(
+            out.frequency(), header.frequency()[first : first + out.nchan]
+        )
+        np.testing.assert_allclose(out.velocity()[[0, -1]], [9.0, 11.0], atol=0.1)
+        np.testing.assert_array_equal(table.daps, data[:, :7])
+        np.testing.assert_array_equal(
+            table.visibilities(),
+            data[:, 7 + 3 * first : 7 + 3 * (first + 11)].reshape(50, 11, 3),
+        )
+    # the input window is not modified
+    assert open(window_file, "rb").read(1024) == raw_header
+
+
+def test_extract_velocities(tmp_path):
+    """Test cutting several lines in a single read"""
+    window_file = str(tmp_path / "window.uvt")
+    header, data = make_table(window_file)
+    extractions = [
+        (str(tmp_path / "a.uvt"), 9.0, 11.0, None, None),
+        (str(tmp_path / "b.uvt"), 0.0, 4.0, header.restf + 20 * header.fres, "B"),
+    ]
+    headers = extract_velocities(window_file, extractions, rows_per_chunk=7)
+    assert [out.nchan for out in headers] == [11, 21]
+    for (file_name, _, _, _, _), out in zip(extractions, headers):
+        with UVTable(file_name) as table:
+            assert table.header == out
+            first = int(round(header.rchan - out.rchan))
+            if out.line == "B":
+                first += 20
+            np.testing.assert_array_equal(
+                table.visibilities(),
+                header_slice(data, first, out.nchan),
+            )
+
+
+def header_slice(data: np.ndarray, first: int, nchan: int) -> np.ndarray:
+    return data[:, 7 + 3 * first : 7 + 3 * (first + nchan)].reshape(-1, nchan, 3)
+
+
+def test_append_uv_tables(tmp_path):
+    """Test appending tables with the same spectral axis"""
+    file_a = str(tmp_path / "a.uvt")
+    file_b = str(tmp_path / "b.uvt")
+    header, data_a = make_table(file_a, nvis=30)
+    _, data_b = make_table(file_b, nvis=12)
+    out = append_uv_tables([file_a, file_b], str(tmp_path / "ab.uvt"), rows_per_chunk=7)
+    assert out.nvis == 42
+    with UVTable(str(tmp_path / "ab.uvt")) as table:
+        assert table.header == out
+        np.testing.assert_array_equal(table.data, np.vstack([data_a, data_b]))
+    # tables with a different spectral axis cannot be appended
+    make_table(file_b, nchan=100)
+    with pytest.raises(ValueError, match="Spectral axis"):
+        append_uv_tables([file_a, file_b], str(tmp_path / "ab.uvt"))
+    # nor tables with a different phase centre
+    header_b = replace(header, nvis=12, dec=header.dec + np.radians(1.0 / 3600.0))
+    write_uv_table(file_b, header_b, data_b)
+    with pytest.raises(ValueError, match="Phase centre"):
+        append_uv_tables([file_a, file_b], str(tmp_path / "ab.uvt"))
+    shift_phase_center(file_b, header.ra, header.dec)
+    assert append_uv_tables([file_a, file_b], str(tmp_path / "ab.uvt")).nvis == 42
+
+
+def test_subtract_continuum(tmp_path):
+    """Test the continuum fits of all the visibilities, streamed in chunks"""
+    file_in = str(tmp_path / "window.uvt")
+    file_out = str(tmp_path / "window_uvsub.uvt")
+    header, data = make_table(file_in, nvis=25)
+    rng = np.random.default_rng(3)
+    velocity = header.velocity()
+    line = 5.0 * np.exp(-0.5 * ((velocity - 12.0) / 0.5) ** 2)
+    vis = data[:, header.ndaps :].reshape(header.nvis, header.nchan, 3)
+    offset = rng.normal(0.0, 1.0, (header.nvis, 2))
+    slope = rng.normal(0.0, 0.1, (header.nvis, 2))
+    vis[:, :, 0] = offset[:, :1] + slope[:, :1] * velocity + line
+    vis[:, :, 1] = offset[:, 1:] + slope[:, 1:] * velocity
+    vis[:, :, 2] = 1.0
+    # flagged channels are neither fitted nor modified
+    vis[3, 10, :] = [1e6, 1e6, 0.0]
+    write_uv_table(file_in, header, data)
+    # a memory budget of 7 rows
+    budget = 7 * 4 * header.ncol * contsub_row_factor
+    out = subtract_continuum(
+        file_in, file_out, [(10.0, 14.0)], order=1, chunk_bytes=budget
+    )
+    assert out == header
+    with UVTable(file_out) as table:
+        np.testing.assert_array_equal(table.daps, data[:, : header.ndaps])
+        result = np.array(table.visibilities())
+    expected = vis.copy()
+    expected[:, :, 0] = line
+    expected[:, :, 1] = 0.0
+    expected[3, 10, :2] = 1e6
+    np.testing.assert_allclose(result, expected, atol=1e-4)
+    # same result as a single chunk
+    file_single = str(tmp_path / "window_single.uvt")
+    subtract_continuum(file_in, file_single, [(10.0, 14.0)], order=1)
+    with UVTable(file_single) as table:
+        np.testing.assert_allclose(table.visibilities(), result, atol=1e-6)
+    with pytest.raises(ValueError, match="line-free channels"):
+        subtract_continuum(file_in, file_out, [(-100.0, 100.0)])
+
+
+def test_shift_phase_center(tmp_path):
+    """Test that a point source at the new phase centre has a zero phase"""
+    file_in = str(tmp_path / "field.uvt")
+    file_out = str(tmp_path / "field_shift.uvt")
+    header = UVHeader(
+        nvis=40,
+        nchan=16,
+        rchan=8.5,
+        restf=93173.7637,
+        fres=-2.0,
+        vres=6.4,
+        voff=10.0,
+        ra=np.radians(52.25),
+        dec=np.radians(31.2),
+        ndaps=9,
+    )
+    ra_new = header.ra + np.radians(40.0 / 3600.0)
+    dec_new = header.dec - np.radians(25.0 / 3600.0)
+    l_0, m_0 = phase_center_offset(header.ra, header.dec, ra_new, dec_new)
+    assert l_0 > 0 and m_0 < 0
+    rng = np.random.default_rng(4)
+    data = np.zeros((header.nvis, header.ncol), dtype=np.float32)
+    data[:, :2] = rng.uniform(-500.0, 500.0, (header.nvis, 2))
+    data[:, 7] = 1e-4
+    vis = data[:, header.ndaps :].reshape(header.nvis, header.nchan, 3)
+    wavelength = speed_of_light / (header.frequency() * 1e6)
+    path = data[:, :1] * l_0 + data[:, 1:2] * m_0
+    vis[:, :, 0] = np.cos(2.0 * np.pi * path / wavelength)
+    vis[:, :, 1] = -np.sin(2.0 * np.pi * path / wavelength)
+    vis[:, :, 2] = 2.0
+    write_uv_table(file_in, header, data)
+    out = shift_phase_center(file_in, ra_new, dec_new, file_out, rows_per_chunk=7)
+    assert (out.ra, out.dec) == (ra_new, dec_new)
+    with UVTable(file_out) as table:
+        assert table.header == out
+        result = np.array(table.visibilities())
+        np.testing.assert_array_equal(table.daps[:, :7], data[:, :7])
+        np.testing.assert_allclose(table.daps[:, 7], 1e-4 - l_0, rtol=1e-5)
+        np.testing.assert_allclose(table.daps[:, 8], -m_0, rtol=1e-5)
+    np.testing.assert_allclose(result[:, :, 0], 1.0, atol=1e-4)
+    np.testing.assert_allclose(result[:, :, 1], 0.0, atol=1e-4)
+    np.testing.assert_array_equal(result[:, :, 2], 2.0)
+    # in place, the input table is the shifted one
+    shift_phase_center(file_in, ra_new, dec_new)
+    with UVTable(file_in) as table, UVTable(file_out) as shifted:
+        assert table.header == out
+        np.testing.assert_array_equal(table.data, shifted.data)
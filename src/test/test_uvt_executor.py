@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+import pytest
+import yaml
+from unittest.mock import patch, MagicMock
+
+from noema_combine.runner import GildasResult
+from noema_combine.uvt_executor import plan_uvt_jobs, run_uvt_jobs
+
+
+def write_config(tmp_path) -> str:
+    config = {
+        "receiver": 3,
+        "highres_parameters": {"number_windows": 2},
+        "setups": {
+            "setup001": {
+                "sources": ["SRC1", "SRC2"],
+                "C-files": [{"file": "../hpbs/c1"}],
+                "D-files": [{"file": "../hpbs/d1"}, {"file": "../hpbs/d2"}],
+            },
+            "setup002": {
+                "sources": ["SRC3", "SRC4"],
+                "D-files": [{"file": "../hpbs/d3"}],
+            },
+        },
+    }
+    config_path = str(tmp_path / "config.yml")
+    with open(config_path, "w") as f:
+        yaml.safe_dump(config, f)
+    return config_path
+
+
+def test_plan_uvt_jobs(tmp_path):
+    """Test the dependency graph of the uv-table jobs"""
+    config_path = write_config(tmp_path)
+    jobs = plan_uvt_jobs(config_path)
+    assert [(job.name, job.kind) for job in jobs] == [
+        ("setup001-C", "clic"),
+        ("setup001-D", "clic"),
+        ("setup001-CD", "merge"),
+        ("setup002-D", "clic"),
+    ]
+    assert jobs[2].depends == ["setup001-C", "setup001-D"]
+    jobs = plan_uvt_jobs(config_path, setups=["setup001"], merge=False)
+    assert [job.name for job in jobs] == ["setup001-C", "setup001-D", "setup001-CD"]
+    assert len(jobs[2].hpb_dict) == 3
+    jobs = plan_uvt_jobs(config_path, setups=["setup001"], n_parts=2)
+    assert [job.name for job in jobs] == [
+        "setup001-C-p0",
+        "setup001-C-p1",
+        "setup001-D-p0",
+        "setup001-D-p1",
+        "setup001-CD",
+    ]
+    assert jobs[-1].depends == [job.name for job in jobs[:-1]]
+    assert jobs[0].chunks is not None and "lo" in jobs[0].chunks
+    with pytest.raises(ValueError, match="not found"):
+        plan_uvt_jobs(config_path, setups=["setup003"])
+
+
+@patch("noema_combine.uvt_executor.generate_uvt.merge_configurations")
+@patch("noema_combine.uvt_executor.run_gildas")
+def test_run_uvt_jobs(
+    mock_run: MagicMock, mock_merge: MagicMock, tmp_path, monkeypatch
+):
+    """Test that CLIC jobs run in parallel in their own folder, merges after them"""
+    config_path = write_config(tmp_path)
+    lock = threading.Lock()
+    active: list[int] = [0, 0]
+    finished: list[str] = []
+
+    def fake_run(program, script, log_file, scratch_dir, timeout, retries, cwd):
+        with lock:
+            active[0] += 1
+            active[1] = max(active)
+        time.sleep(0.1)
+        with lock:
+            active[0] -= 1
+            finished.append(os.path.basename(cwd))
+        assert program == "clic"
+        assert script.endswith("exit\n")
+        assert f"file in {tmp_path / 'hpbs'}/" in script
+        assert f'"{tmp_path / "uvts"}/' in script
+        returncode = 1 if os.path.basename(cwd) == "setup002-D" else 0
+        return GildasResult(program, log_file, returncode, 1, False, 0.1)
+
+    mock_run.side_effect = fake_run
+    mock_merge.side_effect = lambda *args, **kwargs: finished.append("merge")
+    os.makedirs(tmp_path / "clic")
+    monkeypatch.chdir(tmp_path / "clic")
+    status = run_uvt_jobs(config_path, n_workers=3, uvt_root="../uvts")
+    assert status == {
+        "setup001-C": 0,
+        "setup001-D": 0,
+        "setup001-CD": 0,
+        "setup002-D": 1,
+    }
+    # the three CLIC jobs are independent
+    assert active[1] == 3
+    assert finished.index("merge") > finished.index("setup001-C")
+    assert finished.index("merge") > finished.index("setup001-D")
+    mock_merge.assert_called_once_with(
+        "setup001", config_path, configs=["CD"], uvt_root=str(tmp_path / "uvts")
+    )
+    assert os.path.isfile(
+        tmp_path / "clic" / "uvt_jobs" / "setup001-C" / "setup001-C-uvts.clic"
+    )
+    assert os.path.isdir(tmp_path / "uvts" / "SRC1" / "Cconfig")
+    log_files = [call.kwargs["log_file"] for call in mock_run.call_args_list]
+    assert str(tmp_path / "clic" / "logs" / "setup002-D.clic.log") in log_files
+
+
+@patch("noema_combine.uvt_executor.generate_uvt.merge_configurations")
+@patch("noema_combine.uvt_executor.run_gildas")
+def test_run_uvt_jobs_failed_dependency(
+    mock_run: MagicMock, mock_merge: MagicMock, tmp_path, monkeypatch
+):
+    """Test that merges are not run when a single configuration fails"""
+    monkeypatch.chdir(tmp_path)
+    config_path = write_config(tmp_path)
+    mock_run.return_value = GildasResult("clic", "a.log", 1, 1, False, 0.0)
+    status = run_uvt_jobs(config_path, setups=["setup001"], n_workers=1)
+    assert status["setup001-CD"] == -1
+    mock_merge.assert_not_called()
+
+
+@patch("noema_combine.uvt_executor.run_gildas")
+def test_run_uvt_jobs_append(mock_run: MagicMock, tmp_path, monkeypatch):
+    """Test that configurations already tabled are not run again"""
+    monkeypatch.chdir(tmp_path)
+    config_path = write_config(tmp_path)
+    mock_run.return_value = GildasResult("clic", "a.log", 0, 1, False, 0.0)
+    status = run_uvt_jobs(
+        config_path, setups=["setup002"], append=True, uvt_root="uvts"
+    )
+    assert status == {"setup002-D": 0}
+    assert mock_run.call_count == 1
+    assert os.path.isfile(tmp_path / "uvt_jobs" / "setup002-D-uvts.state.json")
+    # CLIC would have written the chunk uv-tables
+    for source in ["SRC3", "SRC4"]:
+        for chunk in ["lo", "li", "ui", "uo", "l009l012", "l010l013", "l011l014"]:
+            open(
+                tmp_path / "uvts" / source / "Dconfig" / f"{source}_D_{chunk}.uvt", "w"
+            ).close()
+    status = run_uvt_jobs(
+        config_path, setups=["setup002"], append=True, uvt_root="uvts"
+    )
+    assert status == {"setup002-D": 0}
+    assert mock_run.call_count == 1